@@ -4,7 +4,7 @@
  * Экспортируемые функции:
  * - checkUser, getCandidates, joinUser, updateGender
  * - sendLike, sendDislike, sendSuperLike
- * - getMatches, fetchLikesReceived
+ * - getMatches, fetchLikesReceived, fetchLikesReceivedCount
  * - sendGift, sendPush
  * - fetchGoals, saveGoals
  * - fetchLastLogin
@@ -82,7 +82,8 @@ async function request(endpoint, options = {}) {
 
 // Users
 export const checkUser = (userId) => request(`/user?userId=${userId}`);
-export const getCandidates = (userId, oppositeGender) => request(`/candidates?userId=${userId}&oppositeGender=${oppositeGender}`);
+export const getCandidates = (userId, oppositeGender, cursor = null, limit = 20) =>
+  request(`/candidates?userId=${userId}&oppositeGender=${oppositeGender}&limit=${limit}${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''}`);
 export const joinUser = (userData) => request('/join', { method: 'POST', body: JSON.stringify(userData) });
 export const updateGender = (userId, gender) => request('/updateGender', { method: 'POST', body: JSON.stringify({ userId, gender }) });
 
@@ -101,6 +102,7 @@ export const getMatches = (userId) => {
   return request(`/matches?userId=${userId}`);
 };
 export const fetchLikesReceived = (userId) => request(`/likesReceived?userId=${userId}`);
+export const fetchLikesReceivedCount = (userId) => request(`/likesReceivedCount?userId=${userId}`);
 
 // Gifts
 export const sendGift = (data) => request('/specialPush', { method: 'POST', body: JSON.stringify(data) });
@@ -646,9 +646,10 @@ if (profileEditBackBtn) {
           Number(c.needPhoto || 0) === 0
         );
         currentIndex = 0;
-        // Синхронизируем с window для swipe.js
+        // Синхронизируем с window для swipe.js (следующие страницы догружает swipe.js по курсору)
         window.candidates = candidates;
         window.currentIndex = currentIndex;
+        window.candidatesCursor = json.nextCursor || null;
       }
       window.showCandidate && window.showCandidate();
       updateMatchesCount();
@@ -1154,17 +1155,17 @@ async function renderMatchesOld() {
     async function checkIfRegistered() {
       if (isLocal) return false;
       try {
-        const resp = await fetch(`${API_URL}/users`);
+        // Запрашиваем только текущего пользователя: /api/users отдает список постранично
+        const resp = await fetch(`${API_URL}/getUser?userId=${encodeURIComponent(currentUser.userId)}`);
+        if (resp.status === 404) return false;
         const result = await resp.json();
         
-        if (!result.success || !Array.isArray(result.data)) {
+        if (!result.success || !result.data) {
           console.warn("❌ checkIfRegistered: неверный формат ответа");
           return false;
         }
         
-        const found = result.data.find(u => String(u.userId) === currentUser.userId);
-        
-        if (!found) return false;
+        const found = result.data;
 
         // Заполняем currentUser данными из БД
         currentUser.registered = true;
@@ -1180,8 +1181,8 @@ async function renderMatchesOld() {
         }
         currentUser.photoUrl  = currentUser.photos[0];
         currentUser.username  = found.username || currentUser.username;
-        currentUser.likes     = JSON.parse(found.likes || "[]");
-        currentUser.dislikes  = JSON.parse(found.dislikes || "[]");
+        currentUser.likes     = Array.isArray(found.likes) ? found.likes : [];
+        currentUser.dislikes  = Array.isArray(found.dislikes) ? found.dislikes : [];
         currentUser.badge     = found.badge || "";
         currentUser.needPhoto = Number(found.needPhoto || 0);
 
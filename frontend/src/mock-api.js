@@ -789,6 +789,11 @@ window.fetch = async function(resource, options = {}) {
         const url = new URL(resource, window.location.origin);
         const userId = url.searchParams.get('userId');
         response = await window.mockApi.getLikesReceived(userId);
+      } else if (path.endsWith('/likesReceivedCount') && method === 'GET') {
+        const url = new URL(resource, window.location.origin);
+        const userId = url.searchParams.get('userId');
+        const likesReceived = await window.mockApi.getLikesReceived(userId);
+        response = { success: true, count: likesReceived.count || 0 };
       } else if (path.startsWith('/last-login/') && method === 'GET') {
         // Извлекаем userId из пути /last-login/{userId}
         const userId = path.split('/last-login/')[1];
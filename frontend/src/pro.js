@@ -1,7 +1,7 @@
 // ========== PRO Module ==========
 // Модуль для работы с PRO-функционалом
 
-import { fetchLikesReceived } from './api.js';
+import { fetchLikesReceivedCount } from './api.js';
 
 /**
  * Рендерит PRO-бейдж в заголовке свайпа
@@ -152,7 +152,7 @@ function renderProLikesStats(currentUser) {
       </span>
     </div>
   `;
-  fetchLikesReceived(currentUser.userId)
+  fetchLikesReceivedCount(currentUser.userId)
     .then(js => {
       if (!js) return;
       if (js.success) {
@@ -217,7 +217,7 @@ function renderProSwipeStats(currentUser) {
       </span>
     </div>
   `;
-  fetchLikesReceived(currentUser.userId)
+  fetchLikesReceivedCount(currentUser.userId)
     .then(js => {
       if (!js) return;
       if (js.success) {
@@ -282,7 +282,7 @@ function renderProMatchesStats(currentUser) {
       </span>
     </div>
   `;
-  fetchLikesReceived(currentUser.userId)
+  fetchLikesReceivedCount(currentUser.userId)
     .then(js => {
       if (!js) return;
       if (js.success) {
@@ -6,7 +6,7 @@ const SWIPE_MODULE_VERSION = '2025-01-27-invite-screen-fix-v3';
 // - onMutualLike, onSuperMatch, onSuperPending, onSuperRejected
 // - handleLikeClick, attachLikeHandler, handleDislikeClick, attachDislikeHandler
 // - openChat, showToast, customRenderPaginator, cyclePhoto, setupSwipeHandlers, updateSwipeScreen
-// - updateMatchesCount, loadCandidates, loadUserData, initSwipeScreen
+// - updateMatchesCount, loadCandidates, loadMoreCandidates, loadUserData, initSwipeScreen
 
 // Логика свайпа и кандидатов, вынесенная из main.js
 import { hideBadges, renderPaginator } from './utils.js';
@@ -34,6 +34,12 @@ window.swipeHistoryIndex = -1; // -1 означает, что мы не в ис
 
 window.currentIndex = 0;
 
+// Постраничная загрузка кандидатов: курсор следующей страницы от бэкенда
+const CANDIDATES_PAGE_SIZE = 20;
+const CANDIDATES_PREFETCH_THRESHOLD = 5; // Догружаем, когда в колоде осталось столько карточек
+window.candidatesCursor = null;
+let isLoadingMoreCandidates = false;
+
 // Флаги для предотвращения множественных вызовов
 let isShowingCandidate = false;
 let isLoadingLikesReceived = false;
@@ -1139,6 +1145,13 @@ export async function moveToNextCandidate(direction = 'right') {
       window.swipeHistory.push({ candidate: currentCandidate, index: window.currentIndex, action });
       window.swipeHistoryIndex = -1; // Выходим из истории, так как переходим к новому кандидату
             window.candidates.splice(window.currentIndex, 1);
+      // Колода заканчивается - догружаем следующую страницу заранее
+      if (window.candidatesCursor && window.candidates.length - window.currentIndex <= CANDIDATES_PREFETCH_THRESHOLD) {
+        const loadingMore = loadMoreCandidates();
+        if (window.candidates.length === 0) {
+          await loadingMore;
+        }
+      }
       // КРИТИЧНО: Проверяем, остались ли кандидаты после удаления
       if (window.candidates.length === 0) {
         window.currentIndex = 0;
@@ -2337,7 +2350,8 @@ export async function loadCandidates() {
   try {
     // Определяем противоположный пол
     const opposite = gender === "male" ? "female" : "male";
-    const url = `${window.API_URL}/candidates?userId=${userId}&oppositeGender=${opposite}`;
+    const url = `${window.API_URL}/candidates?userId=${userId}&oppositeGender=${opposite}&limit=${CANDIDATES_PAGE_SIZE}`;
+    window.candidatesCursor = null;
     const resp = await fetch(url);
     const json = await resp.json();
     if (!json || !json.success) {
@@ -2368,6 +2382,7 @@ export async function loadCandidates() {
     );
     
     window.candidates = filtered;
+    window.candidatesCursor = json.nextCursor || null;
     
     // КРИТИЧНО: Восстанавливаем индекс, если мы в mutual match режиме
     if (window.inMutualMatch && savedIndex !== null && savedIndex < window.candidates.length) {
@@ -2405,6 +2420,36 @@ export async function loadCandidates() {
   }
 }
 
+// Догрузить следующую страницу кандидатов (по курсору) в конец колоды
+export async function loadMoreCandidates() {
+  const userId = window.currentUser?.userId;
+  const gender = window.currentUser?.gender;
+  if (!window.candidatesCursor || isLoadingMoreCandidates || !userId || !gender) return;
+  
+  isLoadingMoreCandidates = true;
+  try {
+    const opposite = gender === "male" ? "female" : "male";
+    const cursor = encodeURIComponent(window.candidatesCursor);
+    const url = `${window.API_URL}/candidates?userId=${userId}&oppositeGender=${opposite}&limit=${CANDIDATES_PAGE_SIZE}&cursor=${cursor}`;
+    const resp = await fetch(url);
+    const json = await resp.json();
+    if (!json || !json.success) return;
+    
+    // Пропускаем тех, кто уже в колоде или уже лайкнут/дизлайкнут
+    const seen = new Set((window.candidates || []).map(c => String(c.id || c.userId)));
+    (window.currentUser?.likes || []).forEach(id => seen.add(String(id)));
+    (window.currentUser?.dislikes || []).forEach(id => seen.add(String(id)));
+    const page = (json.data || []).filter(c => !seen.has(String(c.id || c.userId)));
+    
+    window.candidates.push(...page);
+    window.candidatesCursor = json.nextCursor || null;
+  } catch (e) {
+    console.error('[loadMoreCandidates] error:', e);
+  } finally {
+    isLoadingMoreCandidates = false;
+  }
+}
+
 export async function initSwipeScreen() {
     showSwipeSkeleton();
   // setTimeout(() => { hideSwipeSkeleton(); }, 2000); // УБРАНО: отладочный таймаут
@@ -2620,6 +2665,7 @@ window.onSuperPending = onSuperPending;
 window.onSuperRejected = onSuperRejected;
 window.updateMatchesCount = updateMatchesCount;
 window.loadCandidates = loadCandidates;
+window.loadMoreCandidates = loadMoreCandidates;
 window.initSwipeScreen = initSwipeScreen;
 window.updateSwipeScreen = updateSwipeScreen;
 window.showPreviousCandidate = showPreviousCandidate;
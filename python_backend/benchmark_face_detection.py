@@ -0,0 +1,95 @@
+"""
+Бенчмарк детекции лиц: исходный размер против декодирования в уменьшенном виде
+Для каждого размера (длинная сторона) замеряются p50/p99 и совпадение результата.
+
+Набор фото - директория с изображениями. Если в ней есть поддиректории face/ и no_face/,
+точность считается по этой разметке, иначе - по совпадению с детекцией на исходном размере.
+
+Запуск: python benchmark_face_detection.py [директория с фото] [размеры через запятую]
+Пример: python benchmark_face_detection.py ./fixtures/faces 0,1200,800,640
+"""
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from opencv_utils import detect_faces, opencv_available
+from config import IMAGES_DIR
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def load_fixtures(directory: Path) -> List[Tuple[str, bytes, Optional[bool]]]:
+    """Загрузить фото: (путь, байты, есть ли лицо по разметке или None)"""
+    fixtures = []
+    for path in sorted(directory.rglob("*")):
+        if path.suffix.lower() not in IMAGE_EXTENSIONS or not path.is_file():
+            continue
+        relative = path.relative_to(directory).parts
+        label = None
+        if relative[0] == "face":
+            label = True
+        elif relative[0] == "no_face":
+            label = False
+        fixtures.append((str(path), path.read_bytes(), label))
+    return fixtures
+
+
+def run(max_side: int, fixtures: List[Tuple[str, bytes, Optional[bool]]]) -> Dict[str, bool]:
+    """Прогнать детекцию на всех фото, вернуть путь -> найдено ли лицо"""
+    latencies = []
+    results = {}
+    for path, content, _ in fixtures:
+        started = time.perf_counter()
+        try:
+            faces = detect_faces(content, max_side)
+        except ValueError:
+            faces = []
+        latencies.append((time.perf_counter() - started) * 1000)
+        results[path] = len(faces) > 0
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    found = sum(results.values())
+    name = "исходный" if max_side == 0 else f"{max_side}px"
+    print(f"{name:10} | p50 {p50:8.2f} мс | p99 {p99:8.2f} мс | всего {sum(latencies) / 1000:7.2f} сек | с лицом {found}/{len(fixtures)}", end="")
+    return results
+
+
+def main():
+    directory = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(IMAGES_DIR)
+    sizes = [int(size) for size in sys.argv[2].split(",")] if len(sys.argv) > 2 else [0, 1200, 800, 640]
+
+    if not opencv_available:
+        print("❌ OpenCV недоступен")
+        return
+
+    fixtures = load_fixtures(directory)
+    if not fixtures:
+        print(f"❌ В {directory} нет изображений")
+        return
+
+    labeled = [item for item in fixtures if item[2] is not None]
+    print("=" * 80)
+    print(f"🏁 Бенчмарк детекции лиц: {len(fixtures)} фото из {directory}")
+    print(f"   Точность: {'по разметке face/no_face' if labeled else 'совпадение с исходным размером'}")
+    print("=" * 80)
+
+    baseline = None
+    for max_side in sizes:
+        results = run(max_side, fixtures)
+        if labeled:
+            correct = sum(1 for path, _, label in labeled if results[path] == label)
+            print(f" | точность {correct / len(labeled):6.1%}")
+        else:
+            if baseline is None:
+                baseline = results
+            same = sum(1 for path in results if results[path] == baseline[path])
+            print(f" | совпадение {same / len(results):6.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Бенчмарк очереди фоновых задач (services/jobs.py) на локальной PostgreSQL
+Ставит N пустых задач и несколько падающих, запускает воркер и замеряет пропускную способность.
+Проверяется, что каждая задача выполнена ровно один раз, а падающие повторяются и уходят в failed.
+
+Запуск: python benchmark_jobs.py [кол-во задач] [падающих задач]
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from db_utils import db_get, db_all, db_run
+from database import init_database, close_database
+from services import jobs
+
+KIND_NOOP = "bench_noop"
+KIND_FAIL = "bench_fail"
+FAIL_ATTEMPTS = 3
+
+executed = {}
+
+
+@jobs.job(KIND_NOOP)
+async def noop_job(payload):
+    executed[payload["n"]] = executed.get(payload["n"], 0) + 1
+
+
+@jobs.job(KIND_FAIL, max_attempts=FAIL_ATTEMPTS)
+async def fail_job(payload):
+    raise RuntimeError("bench failure")
+
+
+async def cleanup():
+    await db_run("DELETE FROM jobs WHERE kind IN (?, ?)", [KIND_NOOP, KIND_FAIL])
+
+
+async def wait_finished(total: int, timeout: float) -> bool:
+    """Ждать, пока все задачи бенчмарка не перейдут в done/failed"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        row = await db_get(
+            "SELECT COUNT(*) AS cnt FROM jobs WHERE kind IN (?, ?) AND status IN ('done', 'failed')",
+            [KIND_NOOP, KIND_FAIL]
+        )
+        if row and row["cnt"] >= total:
+            return True
+        await asyncio.sleep(0.1)
+    return False
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    failing = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    await init_database()
+    # Повторы без задержки, чтобы падающие задачи быстро дошли до failed
+    jobs.JOB_RETRY_BASE = 0
+    print("=" * 60)
+    print(f"🏁 Бенчмарк очереди задач: {count} задач, {failing} падающих, воркер до {jobs.JOB_CONCURRENCY} задач")
+    print("=" * 60)
+    try:
+        await cleanup()
+
+        started = time.perf_counter()
+        for n in range(count):
+            await jobs.enqueue(KIND_NOOP, {"n": n})
+        for n in range(failing):
+            await jobs.enqueue(KIND_FAIL, {"n": n})
+        enqueue_elapsed = time.perf_counter() - started
+        print(f"enqueue    | {(count + failing) / enqueue_elapsed:8.1f} задач/сек")
+
+        # Повторная постановка с тем же dedupe_key не создает вторую задачу
+        first = await jobs.enqueue(KIND_NOOP, {"n": -1}, delay=3600, dedupe_key="bench_dedupe")
+        second = await jobs.enqueue(KIND_NOOP, {"n": -1}, delay=3600, dedupe_key="bench_dedupe")
+        print(f"dedupe     | {'✅' if first == second else '❌'} id {first} / {second}")
+
+        started = time.perf_counter()
+        jobs.start()
+        finished = await wait_finished(count + failing, timeout=max(60, count / 10))
+        elapsed = time.perf_counter() - started
+        await jobs.stop()
+        print(f"execute    | {count / elapsed:8.1f} задач/сек ({elapsed:.2f} сек){'' if finished else ' ⚠️ таймаут'}")
+
+        duplicates = sum(1 for runs in executed.values() if runs > 1)
+        missing = count - len(executed)
+        print(f"exactly-once | {'✅' if not duplicates and not missing else '❌'} повторов {duplicates}, пропущено {missing}")
+
+        failed = await db_all(
+            "SELECT status, attempts, last_error FROM jobs WHERE kind = ?",
+            [KIND_FAIL]
+        )
+        ok = all(row["status"] == "failed" and row["attempts"] == FAIL_ATTEMPTS for row in failed)
+        print(f"retries    | {'✅' if ok and len(failed) == failing else '❌'} {len(failed)} задач failed после {FAIL_ATTEMPTS} попыток")
+        print(f"stats      | {jobs.get_stats()['kinds']}")
+    finally:
+        await jobs.stop()
+        await cleanup()
+        await close_database()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
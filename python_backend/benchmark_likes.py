@@ -0,0 +1,107 @@
+"""
+Бенчмарк /api/like: старый многошаговый путь против атомарной функции swipe_like
+Оба пользователя пары лайкают друг друга конкурентно, замеряются p50/p99 и пропускная способность.
+Проверяется, что при встречных лайках мэтч не теряется.
+
+Запуск: python benchmark_likes.py [кол-во пар] [параллельность]
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from db_utils import db_get, db_all, db_run
+from database import init_database, close_database
+from services import edges
+
+USER_PREFIX = "bench_like_"
+
+
+async def legacy_like(from_user: str, to_user: str) -> bool:
+    """Многошаговый путь: отдельные запросы на проверку, лайк, взаимность и мэтч"""
+    rows = await db_all("SELECT userId FROM users WHERE userId IN (?, ?)", [from_user, to_user])
+    if len(rows) < 2:
+        return False
+    await edges.add_edge(from_user, to_user, edges.KIND_LIKE)
+    is_match = await edges.has_edge(to_user, from_user, edges.KIND_LIKE)
+    if is_match:
+        await edges.add_match(from_user, to_user)
+    return is_match
+
+
+async def atomic_like(from_user: str, to_user: str) -> bool:
+    """Один запрос: функция swipe_like"""
+    result = await edges.like(from_user, to_user)
+    return result["is_match"]
+
+
+async def create_users(pairs: int):
+    """Создать тестовых пользователей (по два на пару)"""
+    for i in range(pairs * 2):
+        await db_run(
+            "INSERT OR IGNORE INTO users (userId, name, gender) VALUES (?, ?, ?)",
+            [f"{USER_PREFIX}{i}", f"Bench {i}", "male" if i % 2 == 0 else "female"]
+        )
+
+
+async def cleanup():
+    """Удалить тестовых пользователей и их связи"""
+    await db_run("DELETE FROM user_edges WHERE from_user LIKE ? OR to_user LIKE ?", [f"{USER_PREFIX}%", f"{USER_PREFIX}%"])
+    await db_run("DELETE FROM users WHERE userId LIKE ?", [f"{USER_PREFIX}%"])
+
+
+async def run(name: str, like_fn, pairs: int, concurrency: int):
+    """Прогнать встречные лайки для всех пар и вывести статистику"""
+    await db_run("DELETE FROM user_edges WHERE from_user LIKE ?", [f"{USER_PREFIX}%"])
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def timed(from_user: str, to_user: str):
+        async with semaphore:
+            started = time.perf_counter()
+            await like_fn(from_user, to_user)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    tasks = []
+    for i in range(pairs):
+        a, b = f"{USER_PREFIX}{i * 2}", f"{USER_PREFIX}{i * 2 + 1}"
+        tasks.append(timed(a, b))
+        tasks.append(timed(b, a))
+
+    started = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    matches_row = await db_get(
+        "SELECT COUNT(*) AS cnt FROM user_edges WHERE kind = 'match' AND from_user LIKE ?",
+        [f"{USER_PREFIX}%"]
+    )
+    matched_pairs = (matches_row.get("cnt", 0) if matches_row else 0) // 2
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:10} | {len(latencies) / elapsed:8.1f} лайков/сек | p50 {p50:7.2f} мс | p99 {p99:7.2f} мс | мэтчей {matched_pairs}/{pairs}")
+
+
+async def main():
+    pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    await init_database()
+    print("=" * 60)
+    print(f"🏁 Бенчмарк лайков: {pairs} пар, параллельность {concurrency}")
+    print("=" * 60)
+    try:
+        await create_users(pairs)
+        await run("legacy", legacy_like, pairs, concurrency)
+        await run("atomic", atomic_like, pairs, concurrency)
+    finally:
+        await cleanup()
+        await close_database()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
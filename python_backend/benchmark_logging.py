@@ -0,0 +1,81 @@
+"""
+Бенчмарк логирования на горячем пути /api/getUser:
+все отладочные сообщения синхронно в файл (как прежние print) против INFO через очередь.
+Замеряются пропускная способность, p50/p99 и объем записанных логов.
+
+Запуск: python benchmark_logging.py [кол-во запросов] [параллельность]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from db_utils import db_run
+from database import init_database, close_database
+from log_config import setup_logging, stop_logging
+from routes.users import get_user_frontend
+
+USER_ID = "bench_log_user"
+
+MODES = [
+    # (название, уровень, через очередь)
+    ("debug-sync", "DEBUG", False),
+    ("info-queue", "INFO", True),
+]
+
+
+async def run(name: str, level: str, use_queue: bool, requests: int, concurrency: int):
+    """Прогнать запросы профиля с заданной настройкой логов и вывести статистику"""
+    with tempfile.NamedTemporaryFile("w", suffix=".log", delete=False, encoding="utf-8") as log_file:
+        setup_logging(level=level, stream=log_file, use_queue=use_queue)
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def timed():
+            async with semaphore:
+                started = time.perf_counter()
+                await get_user_frontend(userId=USER_ID)
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(timed() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+        # Дописываем очередь до замера размера файла
+        stop_logging()
+        log_file.flush()
+        log_size = os.path.getsize(log_file.name)
+    os.unlink(log_file.name)
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:10} | {len(latencies) / elapsed:8.1f} запр/сек | p50 {p50:7.2f} мс | p99 {p99:7.2f} мс | лог {log_size / 1024:8.1f} КБ")
+
+
+async def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    await init_database()
+    print("=" * 60)
+    print(f"🏁 Бенчмарк логирования: {requests} запросов /api/getUser, параллельность {concurrency}")
+    print("=" * 60)
+    try:
+        await db_run(
+            "INSERT OR IGNORE INTO users (userId, name, gender) VALUES (?, ?, ?)",
+            [USER_ID, "Bench", "male"]
+        )
+        for name, level, use_queue in MODES:
+            await run(name, level, use_queue, requests, concurrency)
+    finally:
+        setup_logging()
+        await db_run("DELETE FROM users WHERE userId = ?", [USER_ID])
+        await close_database()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
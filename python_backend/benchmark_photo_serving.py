@@ -0,0 +1,165 @@
+"""
+Бенчмарк отдачи фото: StaticFiles против PhotoServer (ASGI) и выделенного сервера (os.sendfile)
+Каждый сервер запускается в отдельном процессе и отдает одни и те же файлы размера карточки.
+Клиент держит N keep-alive соединений и в течение заданного времени запрашивает случайные фото,
+затем повторяет прогон с If-None-Match (повторные показы карточек из кэша браузера).
+Замеряются запросы в секунду, p50/p99 и МБ/с.
+
+Запуск: python benchmark_photo_serving.py [кол-во фото] [соединений] [секунд на прогон]
+Пример: python benchmark_photo_serving.py 500 64 10
+"""
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+HOST = "127.0.0.1"
+BASE_PORT = 18700
+CARD_BYTES = 60 * 1024  # Типичный WebP 720px (PHOTO_CARD_SIZE)
+MODES = ["staticfiles", "photo_server", "dedicated"]
+
+
+def create_fixtures(directory: Path, count: int) -> List[str]:
+    """Создать фото размера карточки в структуре хранилища, вернуть URL пути"""
+    paths = []
+    for i in range(count):
+        digest = f"{i:064x}"
+        path = directory / "blobs" / digest[:2] / f"{digest}_card.webp"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(os.urandom(CARD_BYTES))
+        paths.append(f"/data/img/blobs/{digest[:2]}/{digest}_card.webp")
+    return paths
+
+
+def run_server(mode: str, directory: str, port: int) -> None:
+    """Процесс сервера"""
+    import uvicorn
+    from services import photo_server
+
+    if mode == "dedicated":
+        asyncio.run(photo_server.serve(directory, HOST, port))
+        return
+
+    from fastapi import FastAPI
+    from fastapi.staticfiles import StaticFiles
+    app = FastAPI()
+    if mode == "staticfiles":
+        app.mount("/data/img", StaticFiles(directory=directory), name="images")
+    else:
+        app.mount("/data/img", photo_server.PhotoServer(directory), name="images")
+    uvicorn.run(app, host=HOST, port=port, log_level="warning", access_log=False)
+
+
+async def fetch(reader, writer, path: str, etag: Optional[str]) -> Dict[str, str]:
+    """Один запрос по keep-alive соединению, вернуть заголовки ответа"""
+    request = f"GET {path} HTTP/1.1\r\nhost: {HOST}\r\n"
+    if etag:
+        request += f"if-none-match: {etag}\r\n"
+    writer.write((request + "\r\n").encode("latin-1"))
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    headers = {"status": lines[0].split()[1]}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name:
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", "0"))
+    if length:
+        await reader.readexactly(length)
+    headers["bytes"] = str(length)
+    return headers
+
+
+async def load(port: int, paths: List[str], connections: int, duration: float, etags: Optional[Dict[str, str]]):
+    """Прогон нагрузки, вернуть (задержки мс, байт, статусы, ETag по пути)"""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    seen_etags: Dict[str, str] = {}
+    total_bytes = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal total_bytes
+        reader, writer = await asyncio.open_connection(HOST, port)
+        try:
+            while time.perf_counter() < deadline:
+                path = random.choice(paths)
+                started = time.perf_counter()
+                headers = await fetch(reader, writer, path, etags.get(path) if etags else None)
+                latencies.append((time.perf_counter() - started) * 1000)
+                statuses[headers["status"]] = statuses.get(headers["status"], 0) + 1
+                total_bytes += int(headers["bytes"])
+                if "etag" in headers:
+                    seen_etags[path] = headers["etag"]
+        finally:
+            writer.close()
+
+    await asyncio.gather(*[worker() for _ in range(connections)])
+    return latencies, total_bytes, statuses, seen_etags
+
+
+async def wait_port(port: int, timeout: float = 15.0) -> None:
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(HOST, port)
+            writer.close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def report(name: str, latencies: List[float], total_bytes: int, statuses: Dict[str, int], duration: float) -> None:
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{name:26} | {len(latencies) / duration:9.0f} req/s | p50 {p50:7.2f} мс | p99 {p99:7.2f} мс"
+        f" | {total_bytes / duration / 1024 / 1024:8.1f} МБ/с | {statuses}"
+    )
+
+
+async def bench(mode: str, port: int, paths: List[str], connections: int, duration: float) -> None:
+    await wait_port(port)
+    # Прогрев: кэш страниц ОС и ETag для условных запросов
+    _, _, _, etags = await load(port, paths, connections, 1.0, None)
+    latencies, total_bytes, statuses, _ = await load(port, paths, connections, duration, None)
+    report(f"{mode}", latencies, total_bytes, statuses, duration)
+    latencies, total_bytes, statuses, _ = await load(port, paths, connections, duration, etags)
+    report(f"{mode} (If-None-Match)", latencies, total_bytes, statuses, duration)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    connections = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    duration = float(sys.argv[3]) if len(sys.argv) > 3 else 10.0
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = create_fixtures(Path(directory), count)
+        print("=" * 100)
+        print(f"🏁 Бенчмарк отдачи фото: {count} файлов по {CARD_BYTES // 1024} КБ, {connections} соединений, {duration:.0f} сек")
+        print("=" * 100)
+
+        context = multiprocessing.get_context("spawn")
+        for index, mode in enumerate(MODES):
+            port = BASE_PORT + index
+            server = context.Process(target=run_server, args=(mode, directory, port), daemon=True)
+            server.start()
+            try:
+                asyncio.run(bench(mode, port, paths, connections, duration))
+            finally:
+                server.terminate()
+                server.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Бенчмарк кэша профилей на /api/getUser: без кэша (каждый запрос читает users из БД)
+против кэша в памяти процесса. Замеряются пропускная способность, p50/p99 и доля попаданий.
+
+Запуск: python benchmark_profile_cache.py [кол-во запросов] [параллельность]
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from db_utils import db_run
+from database import init_database, close_database
+from routes.users import get_user_frontend
+from services import profile_cache
+from config import PROFILE_CACHE_MAX_USERS, PROFILE_CACHE_TTL
+
+USER_ID = "bench_profile_user"
+
+
+async def run(name: str, backend, requests: int, concurrency: int):
+    """Прогнать запросы профиля с заданным бэкендом кэша и вывести статистику"""
+    profile_cache.set_backend(backend)
+    hits_before = profile_cache.get_stats()["hits"]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def timed():
+        async with semaphore:
+            started = time.perf_counter()
+            await get_user_frontend(userId=USER_ID)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    hit_rate = (profile_cache.get_stats()["hits"] - hits_before) / requests if backend else 0.0
+    print(f"{name:8} | {len(latencies) / elapsed:8.1f} запр/сек | p50 {p50:7.2f} мс | p99 {p99:7.2f} мс | попадания {hit_rate:6.1%}")
+
+
+async def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    await init_database()
+    print("=" * 60)
+    print(f"🏁 Бенчмарк кэша профилей: {requests} запросов /api/getUser, параллельность {concurrency}")
+    print("=" * 60)
+    try:
+        await db_run(
+            "INSERT OR IGNORE INTO users (userId, name, gender) VALUES (?, ?, ?)",
+            [USER_ID, "Bench", "male"]
+        )
+        await run("no-cache", None, requests, concurrency)
+        await run("memory", profile_cache.MemoryBackend(max(PROFILE_CACHE_MAX_USERS, 1), PROFILE_CACHE_TTL), requests, concurrency)
+    finally:
+        await db_run("DELETE FROM users WHERE userId = ?", [USER_ID])
+        await close_database()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -4,7 +4,9 @@ Telegram бот для SeligerTinder
 """
 import os
 import asyncio
-import httpx
+import functools
+import json
+import time
 from pathlib import Path
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo, LabeledPrice, MenuButtonWebApp
 from telegram.ext import (
@@ -17,17 +19,69 @@ from telegram.ext import (
     ContextTypes
 )
 from telegram.ext.filters import BaseFilter
+from telegram.request import HTTPXRequest
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # Импортируем конфигурацию
-from config import BOT_TOKEN, WEB_APP_URL, DEV_CHAT_ID
+from config import BOT_TOKEN, WEB_APP_URL, DEV_CHAT_ID, TELEGRAM_MAX_CONNECTIONS, HTTP2_ENABLED
+from services import badges, broadcast, http_clients, photo_store, pro, stats
+from services import users as users_service
+from services.admin_help import ADMIN_HELP
+from services.badges import InvalidBadge
+from services.users import UserNotFound
+from middleware.auth import is_admin_telegram_id
+import metrics
 
 API_URL = f"{WEB_APP_URL}/api" if WEB_APP_URL else ""
 # Состояния пользователей
 user_states = {}
 
+BOT_HANDLER_SECONDS = metrics.histogram("bot_handler_duration_seconds", "Время обработчиков бота", ["handler"])
+BOT_HANDLER_ERRORS = metrics.counter("bot_handler_errors_total", "Исключения в обработчиках бота", ["handler"])
+TELEGRAM_API_REQUESTS = metrics.counter(
+    "telegram_bot_api_requests_total", "Вызовы Bot API ботом по методу и результату", ["method", "status"]
+)
+TELEGRAM_API_SECONDS = metrics.histogram(
+    "telegram_bot_api_duration_seconds", "Время вызовов Bot API ботом по методу", ["method"]
+)
+
+
+class MeteredRequest(HTTPXRequest):
+    """HTTPXRequest со счетчиками вызовов Bot API: скорость отправки сообщений, ошибки, задержки"""
+
+    async def do_request(self, url, *args, **kwargs):
+        # Метод Bot API - последний сегмент URL (sendMessage, sendPhoto, ...), токен в метку не попадает
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, *args, **kwargs)
+        except Exception:
+            TELEGRAM_API_REQUESTS.inc(api_method, "error")
+            raise
+        TELEGRAM_API_SECONDS.observe(time.perf_counter() - started, api_method)
+        TELEGRAM_API_REQUESTS.inc(api_method, f"{code // 100}xx")
+        return code, payload
+
+
+def metered_handler(callback):
+    """Обертка обработчика бота: время и исключения по имени функции"""
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            BOT_HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            BOT_HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+
+    return wrapper
+
 
 # Кастомный фильтр для WebApp данных
 class WebAppDataFilter(BaseFilter):
@@ -141,26 +195,15 @@ async def grantpro_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{API_URL}/grantPro",
-                json={"userId": target_user_id, "days": days}
-            )
-            response.raise_for_status()
-            result = response.json()
-            
-            if result.get("success"):
-                end_date = result.get("end", result.get("pro_end"))
-                await update.message.reply_text(
-                    f"✅ PRO-подписка выдана пользователю {target_user_id} на {days} дней (до {end_date})."
-                )
-                # Отправляем уведомление пользователю
-                await context.bot.send_message(
-                    chat_id=target_user_id,
-                    text=f"🎉 Вам выдан PRO на {days} дней! Подписка активна до {end_date}."
-                )
-            else:
-                await update.message.reply_text(f"❌ Не удалось выдать PRO: {result.get('error')}")
+        end_date = await pro.extend_pro(target_user_id, days)
+        await update.message.reply_text(
+            f"✅ PRO-подписка выдана пользователю {target_user_id} на {days} дней (до {end_date})."
+        )
+        # Отправляем уведомление пользователю
+        await context.bot.send_message(
+            chat_id=target_user_id,
+            text=f"🎉 Вам выдан PRO на {days} дней! Подписка активна до {end_date}."
+        )
     except Exception as e:
         print(f"❌ /grantpro ошибка: {e}")
         await update.message.reply_text("❌ Ошибка при выдаче PRO. Попробуйте позже.")
@@ -168,7 +211,7 @@ async def grantpro_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def addbadge_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /addbadge - установка бейджа"""
-    if DEV_CHAT_ID and update.effective_user.id != DEV_CHAT_ID:
+    if (DEV_CHAT_ID and update.effective_user.id != DEV_CHAT_ID) or not is_admin_telegram_id(update.effective_user.id):
         await update.message.reply_text("❌ Команда /addbadge доступна только администратору.")
         return
     
@@ -184,27 +227,17 @@ async def addbadge_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Badge должен быть одним из: P, S, L, DN, LV")
         return
     
-    badge_url = f"/label/{badge_letter}.svg"
-    
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{API_URL}/updateBadge",
-                json={"userId": target_user_id, "badge": badge_url}
-            )
-            response.raise_for_status()
-            result = response.json()
-            
-            if result.get("success"):
-                names = {"S": "Seliger City", "P": "Пик", "L": "Любовь и голуби", "DN": "DN", "LV": "LV"}
-                badge_name = names.get(badge_letter, badge_letter)
-                await update.message.reply_text("Бэйдж обновлён успешно!")
-                await context.bot.send_message(
-                    chat_id=target_user_id,
-                    text=f"Бэйдж «{badge_name}» успешно добавлен"
-                )
-            else:
-                await update.message.reply_text(f"Ошибка: {result.get('error')}")
+        await badges.update_badge(target_user_id, badge_letter)
+        names = {"S": "Seliger City", "P": "Пик", "L": "Любовь и голуби", "DN": "DN", "LV": "LV"}
+        badge_name = names.get(badge_letter, badge_letter)
+        await update.message.reply_text("Бэйдж обновлён успешно!")
+        await context.bot.send_message(
+            chat_id=target_user_id,
+            text=f"Бэйдж «{badge_name}» успешно добавлен"
+        )
+    except UserNotFound:
+        await update.message.reply_text("Ошибка: Пользователь не найден")
     except Exception as e:
         print(f"❌ Ошибка /addbadge: {e}")
         await update.message.reply_text("❌ Ошибка при обновлении бейджа.")
@@ -217,19 +250,11 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{API_URL}/statsDay")
-            response.raise_for_status()
-            result = response.json()
-            
-            if result.get("success"):
-                visits_24h = result.get("visits24h", 0)
-                await update.message.reply_text(
-                    f"За последние 24 часа зашли {visits_24h} пользователей (по telegramID).",
-                    reply_markup=get_start_keyboard()
-                )
-            else:
-                await update.message.reply_text("❌ Не удалось получить статистику.")
+        visits_24h = await stats.count_visits_24h()
+        await update.message.reply_text(
+            f"За последние 24 часа зашли {visits_24h} пользователей (по telegramID).",
+            reply_markup=get_start_keyboard()
+        )
     except Exception as e:
         print(f"❌ Ошибка /stats: {e}")
         await update.message.reply_text("❌ Ошибка при получении статистики.")
@@ -241,45 +266,24 @@ async def prostats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = update.effective_user.username if update.effective_user else None
     print(f"🔵 [BOT] Команда /prostats от пользователя {user_id} (@{username})")
     
-    if DEV_CHAT_ID and update.effective_user.id != DEV_CHAT_ID:
+    if (DEV_CHAT_ID and update.effective_user.id != DEV_CHAT_ID) or not is_admin_telegram_id(update.effective_user.id):
         await update.message.reply_text("❌ Команда /prostats доступна только администратору.")
         return
-    
+
     try:
-        # Получаем Telegram ID для авторизации
-        telegram_id = str(update.effective_user.id)
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{API_URL}/pro-stats",
-                headers={"X-Telegram-User-Id": telegram_id}
-            )
-            response.raise_for_status()
-            result = response.json()
-            
-            if result.get("success"):
-                stats = result.get("stats", {})
-                total_pro = stats.get("total_pro", 0)
-                active_pro = stats.get("active_pro", 0)
-                expired_pro = stats.get("expired_pro", 0)
-                total_users = stats.get("total_users", 0)
-                pro_percentage = stats.get("pro_percentage", 0)
-                active_pro_percentage = stats.get("active_pro_percentage", 0)
-                
-                message = (
-                    f"📊 Статистика PRO пользователей:\n\n"
-                    f"👥 Всего пользователей: {total_users}\n"
-                    f"⭐ Всего PRO: {total_pro} ({pro_percentage}%)\n"
-                    f"✅ Активных PRO: {active_pro} ({active_pro_percentage}%)\n"
-                    f"❌ Истекших PRO: {expired_pro}"
-                )
-                
-                await update.message.reply_text(
-                    message,
-                    reply_markup=get_start_keyboard()
-                )
-            else:
-                await update.message.reply_text("❌ Не удалось получить статистику PRO.")
+        pro_stats = await pro.get_pro_stats()
+        message = (
+            f"📊 Статистика PRO пользователей:\n\n"
+            f"👥 Всего пользователей: {pro_stats['total_users']}\n"
+            f"⭐ Всего PRO: {pro_stats['total_pro']} ({pro_stats['pro_percentage']}%)\n"
+            f"✅ Активных PRO: {pro_stats['active_pro']} ({pro_stats['active_pro_percentage']}%)\n"
+            f"❌ Истекших PRO: {pro_stats['expired_pro']}"
+        )
+
+        await update.message.reply_text(
+            message,
+            reply_markup=get_start_keyboard()
+        )
     except Exception as e:
         print(f"❌ Ошибка /prostats: {e}")
         import traceback
@@ -298,47 +302,40 @@ async def stats_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{API_URL}/stats/users")
-            response.raise_for_status()
-            result = response.json()
-            
-            if result.get("success"):
-                data = result.get("data", [])
-                total_users = result.get("total", 0)
-                
-                if not data:
-                    await update.message.reply_text("❌ Данные не найдены.")
-                    return
-                
-                message = "📊 **Статистика пользователей по полу:**\n\n"
-                counted = 0
-                for item in data:
-                    gender = item.get("name", "Не указан")
-                    count = item.get("count", 0)
-                    counted += count
-                    # Переводим пол на русский
-                    if gender == "male":
-                        gender_ru = "👨 Мужчины"
-                    elif gender == "female":
-                        gender_ru = "👩 Женщины"
-                    elif gender == "Не указан":
-                        gender_ru = "❓ Не указан"
-                    else:
-                        gender_ru = f"❓ {gender}"
-                    message += f"{gender_ru}: {count}\n"
-                
-                message += f"\n👥 **Всего пользователей:** {total_users}"
-                if counted != total_users:
-                    message += f"\n⚠️ **В группировке:** {counted} (разница: {total_users - counted})"
-                
-                await update.message.reply_text(
-                    message,
-                    parse_mode="Markdown",
-                    reply_markup=get_start_keyboard()
-                )
+        result = await stats.get_users_by_gender()
+        data = result["data"]
+        total_users = result["total"]
+
+        if not data:
+            await update.message.reply_text("❌ Данные не найдены.")
+            return
+
+        message = "📊 **Статистика пользователей по полу:**\n\n"
+        counted = 0
+        for item in data:
+            gender = item.get("name", "Не указан")
+            count = item.get("count", 0)
+            counted += count
+            # Переводим пол на русский
+            if gender == "male":
+                gender_ru = "👨 Мужчины"
+            elif gender == "female":
+                gender_ru = "👩 Женщины"
+            elif gender == "Не указан":
+                gender_ru = "❓ Не указан"
             else:
-                await update.message.reply_text("❌ Не удалось получить статистику.")
+                gender_ru = f"❓ {gender}"
+            message += f"{gender_ru}: {count}\n"
+
+        message += f"\n👥 **Всего пользователей:** {total_users}"
+        if counted != total_users:
+            message += f"\n⚠️ **В группировке:** {counted} (разница: {total_users - counted})"
+
+        await update.message.reply_text(
+            message,
+            parse_mode="Markdown",
+            reply_markup=get_start_keyboard()
+        )
     except Exception as e:
         print(f"❌ Ошибка /stats_users: {e}")
         import traceback
@@ -412,80 +409,65 @@ async def admin_help_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     username = update.effective_user.username if update.effective_user else None
     print(f"🔵 [BOT] Команда /admin_help от пользователя {user_id} (@{username})")
     
-    if DEV_CHAT_ID and update.effective_user.id != DEV_CHAT_ID:
+    if (DEV_CHAT_ID and update.effective_user.id != DEV_CHAT_ID) or not is_admin_telegram_id(update.effective_user.id):
         await update.message.reply_text("❌ Команда /admin_help доступна только администратору.")
         return
-    
+
     try:
-        # Получаем Telegram ID для авторизации
-        telegram_id = str(update.effective_user.id)
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{API_URL}/admin_help",
-                headers={"X-Telegram-User-Id": telegram_id}
+        bot_commands = ADMIN_HELP.get("bot_commands", [])
+        api_endpoints = ADMIN_HELP.get("api_endpoints", [])
+
+        # Формируем сообщение с командами бота
+        message = "📋 **Команды бота для администратора:**\n\n"
+
+        for cmd in bot_commands:
+            command = cmd.get("command", "")
+            description = cmd.get("description", "")
+            usage = cmd.get("usage", "")
+            example = cmd.get("example", "")
+            note = cmd.get("note", "")
+
+            message += f"**{command}**\n"
+            message += f"_{description}_\n"
+            if usage:
+                message += f"Использование: `{usage}`\n"
+            if example:
+                message += f"Пример: `{example}`\n"
+            if note:
+                message += f"ℹ️ {note}\n"
+            message += "\n"
+
+        # Добавляем информацию об API эндпоинтах
+        message += "\n📡 **API эндпоинты:**\n"
+        message += f"Всего эндпоинтов: {len(api_endpoints)}\n"
+        message += "Для получения полной информации используйте:\n"
+        message += f"`GET {API_URL}/admin_help`\n\n"
+        message += "Основные эндпоинты:\n"
+        for endpoint in api_endpoints[:5]:  # Показываем первые 5
+            method = endpoint.get("method", "")
+            ep = endpoint.get("endpoint", "")
+            desc = endpoint.get("description", "")
+            message += f"• `{method} {ep}`\n  {desc}\n"
+
+        # Разбиваем на части, если сообщение слишком длинное (Telegram лимит 4096 символов)
+        if len(message) > 4000:
+            # Отправляем первую часть
+            await update.message.reply_text(
+                message[:4000],
+                parse_mode="Markdown",
+                reply_markup=get_start_keyboard()
+            )
+            # Отправляем остальное
+            await update.message.reply_text(
+                message[4000:],
+                parse_mode="Markdown"
+            )
+        else:
+            await update.message.reply_text(
+                message,
+                parse_mode="Markdown",
+                reply_markup=get_start_keyboard()
             )
-            response.raise_for_status()
-            result = response.json()
-            
-            if result.get("success"):
-                help_data = result.get("help", {})
-                bot_commands = help_data.get("bot_commands", [])
-                api_endpoints = help_data.get("api_endpoints", [])
-                
-                # Формируем сообщение с командами бота
-                message = "📋 **Команды бота для администратора:**\n\n"
-                
-                for cmd in bot_commands:
-                    command = cmd.get("command", "")
-                    description = cmd.get("description", "")
-                    usage = cmd.get("usage", "")
-                    example = cmd.get("example", "")
-                    note = cmd.get("note", "")
-                    
-                    message += f"**{command}**\n"
-                    message += f"_{description}_\n"
-                    if usage:
-                        message += f"Использование: `{usage}`\n"
-                    if example:
-                        message += f"Пример: `{example}`\n"
-                    if note:
-                        message += f"ℹ️ {note}\n"
-                    message += "\n"
-                
-                # Добавляем информацию об API эндпоинтах
-                message += "\n📡 **API эндпоинты:**\n"
-                message += f"Всего эндпоинтов: {len(api_endpoints)}\n"
-                message += "Для получения полной информации используйте:\n"
-                message += f"`GET {API_URL}/admin/admin_help`\n\n"
-                message += "Основные эндпоинты:\n"
-                for endpoint in api_endpoints[:5]:  # Показываем первые 5
-                    method = endpoint.get("method", "")
-                    ep = endpoint.get("endpoint", "")
-                    desc = endpoint.get("description", "")
-                    message += f"• `{method} {ep}`\n  {desc}\n"
-                
-                # Разбиваем на части, если сообщение слишком длинное (Telegram лимит 4096 символов)
-                if len(message) > 4000:
-                    # Отправляем первую часть
-                    await update.message.reply_text(
-                        message[:4000],
-                        parse_mode="Markdown",
-                        reply_markup=get_start_keyboard()
-                    )
-                    # Отправляем остальное
-                    await update.message.reply_text(
-                        message[4000:],
-                        parse_mode="Markdown"
-                    )
-                else:
-                    await update.message.reply_text(
-                        message,
-                        parse_mode="Markdown",
-                        reply_markup=get_start_keyboard()
-                    )
-            else:
-                await update.message.reply_text("❌ Не удалось получить список команд.")
     except Exception as e:
         print(f"❌ Ошибка /admin_help: {e}")
         import traceback
@@ -510,21 +492,16 @@ async def delete_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         target_user_id = args[0]
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{API_URL}/delete_user",
-                json={"userId": target_user_id}
+        await users_service.enqueue_delete_user(target_user_id)
+        if target_user_id == str(user_id):
+            await update.message.reply_text(
+                "✅ Запрос на удаление профиля принят, профиль будет удалён в течение нескольких минут. "
+                "Чтобы начать заново после удаления, отправьте /start"
             )
-            response.raise_for_status()
-            result = response.json()
-            
-            if result.get("success"):
-                if target_user_id == str(user_id):
-                    await update.message.reply_text("✅ Ваш профиль удалён. Чтобы начать заново, отправьте /start")
-                else:
-                    await update.message.reply_text(f"✅ Профиль пользователя {target_user_id} удалён.")
-            else:
-                await update.message.reply_text(f"❌ Не удалось удалить профиль: {result.get('error')}")
+        else:
+            await update.message.reply_text(f"✅ Удаление профиля пользователя {target_user_id} поставлено в очередь.")
+    except UserNotFound:
+        await update.message.reply_text("❌ Не удалось удалить профиль: пользователь не найден")
     except Exception as e:
         print(f"❌ Ошибка /delete_user: {e}")
         await update.message.reply_text("❌ Ошибка при удалении профиля.")
@@ -547,21 +524,11 @@ async def clear_photos_command(update: Update, context: ContextTypes.DEFAULT_TYP
         target_user_id = args[0]
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{API_URL}/photos/clear",
-                json={"userId": target_user_id}
-            )
-            response.raise_for_status()
-            result = response.json()
-            
-            if result.get("success"):
-                if target_user_id == str(user_id):
-                    await update.message.reply_text("✅ Все ваши фотографии удалены.")
-                else:
-                    await update.message.reply_text(f"✅ Фотографии пользователя {target_user_id} удалены.")
-            else:
-                await update.message.reply_text(f"❌ Не удалось очистить фото: {result.get('error')}")
+        await photo_store.clear_user_photos(target_user_id)
+        if target_user_id == str(user_id):
+            await update.message.reply_text("✅ Все ваши фотографии удалены.")
+        else:
+            await update.message.reply_text(f"✅ Фотографии пользователя {target_user_id} удалены.")
     except Exception as e:
         print(f"❌ Ошибка /clear_photos: {e}")
         await update.message.reply_text("❌ Ошибка при очистке фотографий.")
@@ -573,7 +540,7 @@ async def masssend_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = update.effective_user.username if update.effective_user else None
     print(f"🔵 [BOT] Команда /masssend от пользователя {user_id} (@{username})")
     
-    if DEV_CHAT_ID and update.effective_user.id != DEV_CHAT_ID:
+    if (DEV_CHAT_ID and update.effective_user.id != DEV_CHAT_ID) or not is_admin_telegram_id(update.effective_user.id):
         await update.message.reply_text("❌ Команда /masssend доступна только администратору.")
         return
     
@@ -597,99 +564,13 @@ async def masssend_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print(f"🔵 [BOT] Текст сообщения для рассылки (первые 100 символов): {message_text[:100]}...")
     
     try:
-        async with httpx.AsyncClient() as client:
-            # Получаем список всех пользователей через админский эндпоинт
-            telegram_id = str(update.effective_user.id)
-            print(f"🔵 [BOT] Запрос списка пользователей из API: {API_URL}/get-all-users-for-admin")
-            response = await client.get(
-                f"{API_URL}/get-all-users-for-admin",
-                headers={"X-Telegram-User-Id": telegram_id}
-            )
-            response.raise_for_status()
-            users_result = response.json()
-            
-            if not users_result.get("success"):
-                print(f"❌ [BOT] API вернул ошибку: {users_result}")
-                await update.message.reply_text("❌ Не удалось получить список пользователей.")
-                return
-            
-            users = users_result.get("users", [])
-            if not users:
-                print(f"⚠️ [BOT] Список пользователей пуст")
-                await update.message.reply_text("❌ Пользователи не найдены.")
-                return
-            
-            print(f"✅ [BOT] Получено {len(users)} пользователей для рассылки")
-            
-            # Отправляем сообщение каждому пользователю
-            success_count = 0
-            error_count = 0
-            blocked_count = 0
-            invalid_count = 0
-            
-            status_message = await update.message.reply_text(
-                f"📤 Начинаю рассылку сообщения {len(users)} пользователям...\n"
-                f"⏳ Отправлено: 0/{len(users)}"
-            )
-            
-            for index, user in enumerate(users, 1):
-                user_id_str = str(user.get("userId", ""))
-                if not user_id_str or not user_id_str.isdigit():
-                    print(f"⚠️ [BOT] Пропущен пользователь с невалидным ID: {user_id_str}")
-                    invalid_count += 1
-                    continue
-                
-                try:
-                    user_id_int = int(user_id_str)
-                    await context.bot.send_message(
-                        chat_id=user_id_int,
-                        text=message_text
-                    )
-                    success_count += 1
-                    if index % 10 == 0:  # Обновляем статус каждые 10 сообщений
-                        try:
-                            await status_message.edit_text(
-                                f"📤 Рассылка в процессе...\n"
-                                f"✅ Отправлено: {success_count}/{len(users)}\n"
-                                f"❌ Ошибок: {error_count}"
-                            )
-                        except:
-                            pass  # Игнорируем ошибки обновления статуса
-                except Exception as e:
-                    error_msg = str(e).lower()
-                    # Проверяем тип ошибки
-                    if "blocked" in error_msg or "chat not found" in error_msg:
-                        blocked_count += 1
-                        print(f"⚠️ [BOT] Пользователь {user_id_str} заблокировал бота или чат не найден")
-                    else:
-                        error_count += 1
-                        print(f"⚠️ [BOT] Ошибка отправки сообщения пользователю {user_id_str}: {e}")
-                
-                # Небольшая задержка, чтобы не превысить лимиты Telegram (30 сообщений в секунду)
-                await asyncio.sleep(0.05)
-            
-            # Финальное сообщение с детальной статистикой
-            final_message = (
-                f"✅ Рассылка завершена!\n\n"
-                f"📊 Статистика:\n"
-                f"✅ Успешно отправлено: {success_count}\n"
-            )
-            if blocked_count > 0:
-                final_message += f"🚫 Заблокировали бота: {blocked_count}\n"
-            if error_count > 0:
-                final_message += f"❌ Ошибок: {error_count}\n"
-            if invalid_count > 0:
-                final_message += f"⚠️ Невалидных ID: {invalid_count}\n"
-            
-            try:
-                await status_message.edit_text(final_message)
-            except:
-                await update.message.reply_text(final_message)
-            
-            print(f"✅ [BOT] Рассылка завершена: успешно={success_count}, ошибок={error_count}, заблокировали={blocked_count}, невалидных={invalid_count}")
-    except httpx.HTTPError as e:
-        print(f"❌ [BOT] HTTP ошибка при получении списка пользователей: {e}")
-        await update.message.reply_text(f"❌ Ошибка при получении списка пользователей: {e}")
+        # Рассылка идет в фоне (services/broadcast.py), прогресс обновляется в отдельном сообщении
+        broadcast_id = await broadcast.start(context.bot, message_text, update.effective_chat.id)
+        if broadcast_id is None:
+            print(f"⚠️ [BOT] Список пользователей пуст")
+            await update.message.reply_text("❌ Пользователи не найдены.")
+            return
+        print(f"✅ [BOT] Рассылка #{broadcast_id} запущена")
     except Exception as e:
         print(f"❌ [BOT] Критическая ошибка /masssend: {e}")
         import traceback
@@ -899,18 +780,13 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif data == "confirm_delete":
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{API_URL}/delete_user",
-                    json={"userId": str(user_id)}
-                )
-                response.raise_for_status()
-                result = response.json()
-                
-                if result.get("success"):
-                    await query.message.reply_text("✅ Ваш профиль удалён. Чтобы начать заново, отправьте /start")
-                else:
-                    await query.message.reply_text(f"❌ Не удалось удалить профиль: {result.get('error')}")
+            await users_service.enqueue_delete_user(str(user_id))
+            await query.message.reply_text(
+                "✅ Запрос на удаление профиля принят, профиль будет удалён в течение нескольких минут. "
+                "Чтобы начать заново после удаления, отправьте /start"
+            )
+        except UserNotFound:
+            await query.message.reply_text("❌ Не удалось удалить профиль: пользователь не найден")
         except Exception as e:
             print(f"Ошибка delete_user: {e}")
             await query.message.reply_text("❌ Ошибка при удалении профиля.")
@@ -1012,7 +888,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif data.startswith("grant_badge_"):
         # Администратор одобрил запрос на бейдж
         # Приводим к одному типу для сравнения (оба к int)
-        if DEV_CHAT_ID and int(user_id) != int(DEV_CHAT_ID):
+        if (DEV_CHAT_ID and int(user_id) != int(DEV_CHAT_ID)) or not is_admin_telegram_id(user_id):
             print(f"⚠️ [BOT] Попытка выдачи бейджа неавторизованным пользователем: user_id={user_id}, DEV_CHAT_ID={DEV_CHAT_ID}")
             await query.answer("❌ Только администратор может выдавать бейджи", show_alert=True)
             return
@@ -1026,49 +902,26 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         badge_letter = parts[3]
         names = {"S": "Seliger City", "P": "Пик", "L": "Любовь и голуби", "DN": "DN", "LV": "LV"}
         badge_name = names.get(badge_letter, badge_letter)
-        badge_url = f"/label/{badge_letter}.svg"
-        
         print(f"🔵 [BOT] Выдача бейджа: admin_id={user_id}, target_user_id={target_user_id}, badge={badge_letter}")
         
         try:
-            async with httpx.AsyncClient() as client:
-                # Передаем заголовок авторизации с Telegram ID администратора
-                print(f"🔵 [BOT] Вызов API /updateBadge с заголовком X-Telegram-User-Id: {user_id}")
-                response = await client.post(
-                    f"{API_URL}/updateBadge",
-                    json={"userId": target_user_id, "badge": badge_url},
-                    headers={"X-Telegram-User-Id": str(user_id)}
-                )
-                print(f"🔵 [BOT] Ответ API: status={response.status_code}")
-                response.raise_for_status()
-                result = response.json()
-                print(f"🔵 [BOT] Результат API: {result}")
-                
-                if result.get("success"):
-                    await query.edit_message_text(
-                        f"✅ Бейдж «{badge_name}» успешно выдан пользователю {target_user_id}"
-                    )
-                    # Уведомляем пользователя
-                    try:
-                        await context.bot.send_message(
-                            int(target_user_id),
-                            f"🎉 Бейдж «{badge_name}» успешно добавлен!"
-                        )
-                        print(f"✅ [BOT] Пользователь {target_user_id} уведомлен о выдаче бейджа")
-                    except Exception as e:
-                        print(f"⚠️ [BOT] Не удалось уведомить пользователя: {e}")
-                else:
-                    error_msg = result.get('error', 'Неизвестная ошибка')
-                    print(f"❌ [BOT] Ошибка API: {error_msg}")
-                    await query.answer(f"❌ Ошибка: {error_msg}", show_alert=True)
-        except httpx.HTTPStatusError as e:
-            error_text = ""
+            await badges.update_badge(target_user_id, badge_letter)
+            await query.edit_message_text(
+                f"✅ Бейдж «{badge_name}» успешно выдан пользователю {target_user_id}"
+            )
+            # Уведомляем пользователя
             try:
-                error_text = e.response.text
-            except:
-                pass
-            print(f"❌ [BOT] HTTP ошибка при выдаче бейджа: {e.response.status_code}, {error_text}")
-            await query.answer(f"❌ HTTP ошибка: {e.response.status_code}", show_alert=True)
+                await context.bot.send_message(
+                    int(target_user_id),
+                    f"🎉 Бейдж «{badge_name}» успешно добавлен!"
+                )
+                print(f"✅ [BOT] Пользователь {target_user_id} уведомлен о выдаче бейджа")
+            except Exception as e:
+                print(f"⚠️ [BOT] Не удалось уведомить пользователя: {e}")
+        except (UserNotFound, InvalidBadge) as e:
+            error_msg = "Пользователь не найден" if isinstance(e, UserNotFound) else str(e)
+            print(f"❌ [BOT] Ошибка выдачи бейджа: {error_msg}")
+            await query.answer(f"❌ Ошибка: {error_msg}", show_alert=True)
         except Exception as e:
             print(f"❌ [BOT] Ошибка при выдаче бейджа: {e}")
             import traceback
@@ -1239,6 +1092,14 @@ def create_bot_application():
         builder = builder.token(BOT_TOKEN)
         print("  - Токен установлен")
         
+        # По умолчанию у python-telegram-bot одно соединение на все вызовы API: запросы
+        # (рассылка, ответы разным пользователям) шли строго по очереди.
+        # Свой HTTPXRequest вместо connection_pool_size/http_version билдера - ради счетчиков вызовов
+        builder = builder.request(MeteredRequest(
+            connection_pool_size=TELEGRAM_MAX_CONNECTIONS,
+            http_version="2" if HTTP2_ENABLED and http_clients.http2_available else "1.1"
+        ))
+        
         print("  - Сборка Application...")
         application = builder.build()
         print("✅ Application создан успешно")
@@ -1338,30 +1199,23 @@ def create_bot_application():
                 
                 # Вызываем API для активации промокода
                 try:
-                    async with httpx.AsyncClient() as client:
-                        response = await client.post(
-                            f"{API_URL}/activatePromoCode",
-                            json={"userId": str(user_id), "promoCode": promo_code}
-                        )
-                        response.raise_for_status()
-                        result = response.json()
-                        
-                        if result.get("success"):
-                            days = result.get("days", 0)
-                            pro_end = result.get("pro_end", "")
-                            super_likes = result.get("superLikesCount", 0)
-                            message = result.get("message", f"✅ Промокод активирован! PRO подписка продлена на {days} дней.")
-                            reply_text = f"{message}\n\n"
-                            reply_text += f"📅 Подписка активна до: {pro_end}\n"
-                            if super_likes > 0:
-                                reply_text += f"⭐ Вам начислено {super_likes} суперлайков!\n"
-                            reply_text += f"\n✨ Откройте приложение, чтобы использовать PRO функции!"
-                            await update.message.reply_text(reply_text)
-                            print(f"✅ [BOT] Промокод активирован: user_id={user_id}, promo_code={promo_code}, days={days}, superLikesCount={super_likes}")
-                        else:
-                            error = result.get("error", "Неизвестная ошибка")
-                            await update.message.reply_text(f"❌ {error}")
-                            print(f"❌ [BOT] Ошибка активации промокода: user_id={user_id}, promo_code={promo_code}, error={error}")
+                    result = await pro.activate_promo_code(str(user_id), promo_code)
+                    if result.get("success"):
+                        days = result.get("days", 0)
+                        pro_end = result.get("pro_end", "")
+                        super_likes = result.get("superLikesCount", 0)
+                        message = result.get("message", f"✅ Промокод активирован! PRO подписка продлена на {days} дней.")
+                        reply_text = f"{message}\n\n"
+                        reply_text += f"📅 Подписка активна до: {pro_end}\n"
+                        if super_likes > 0:
+                            reply_text += f"⭐ Вам начислено {super_likes} суперлайков!\n"
+                        reply_text += f"\n✨ Откройте приложение, чтобы использовать PRO функции!"
+                        await update.message.reply_text(reply_text)
+                        print(f"✅ [BOT] Промокод активирован: user_id={user_id}, promo_code={promo_code}, days={days}, superLikesCount={super_likes}")
+                    else:
+                        error = result.get("error", "Неизвестная ошибка")
+                        await update.message.reply_text(f"❌ {error}")
+                        print(f"❌ [BOT] Ошибка активации промокода: user_id={user_id}, promo_code={promo_code}, error={error}")
                 except Exception as e:
                     print(f"❌ [BOT] Ошибка при активации промокода: {e}")
                     await update.message.reply_text("❌ Ошибка при активации промокода. Попробуйте позже.")
@@ -1431,6 +1285,11 @@ def create_bot_application():
         application.add_handler(MessageHandler(web_app_data_filter, web_app_data_handler))
         print("✅ WebAppDataHandler зарегистрирован")
         
+        # Метрики обработчиков: время и исключения (/metrics)
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                handler.callback = metered_handler(handler.callback)
+        
         bot_application = application
         print("=" * 70)
         print("✅ Все обработчики зарегистрированы")
@@ -1513,6 +1372,9 @@ async def start_bot():
             # Устанавливаем menu button URL программно
             await set_menu_button_url()
             
+            # Рассылки - фоновые задачи (прерванные перезапуском продолжатся сами)
+            broadcast.register_job(application.bot)
+            
             # КРИТИЧНО: start_polling() - НЕБЛОКИРУЮЩИЙ через asyncio.create_task()
             # Если запустить с await, сервер FastAPI никогда не запустится
             import asyncio
@@ -1559,7 +1421,9 @@ def main():
     """Запуск бота в отдельном процессе (для обратной совместимости)"""
     import sys
     import os
+    from log_config import setup_logging
     
+    setup_logging()
     print("=" * 70)
     print("🤖 ЗАПУСК TELEGRAM BOT (standalone)")
     print("=" * 70)
@@ -20,6 +20,19 @@ PGDATABASE = os.getenv("PGDATABASE", "railway")
 PGUSER = os.getenv("PGUSER", "postgres")
 PGPASSWORD = os.getenv("PGPASSWORD", "")
 
+# Пул соединений PostgreSQL (асинхронный, psycopg 3)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # Таймаут ожидания свободного соединения (сек)
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "600"))  # Закрывать простаивающие соединения (сек)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "512"))  # Кэш адаптированных SQL (кол-во запросов)
+DB_PREPARE_THRESHOLD = int(os.getenv("DB_PREPARE_THRESHOLD", "5"))  # После N выполнений запрос становится prepared (-1 = выкл)
+DB_LONG_TRANSACTION_SECONDS = float(os.getenv("DB_LONG_TRANSACTION_SECONDS", "30"))  # Транзакция дольше - "долгая" в /api/health/db
+DB_IDLE_IN_TRANSACTION_TIMEOUT = float(os.getenv("DB_IDLE_IN_TRANSACTION_TIMEOUT", "60"))  # idle_in_transaction_session_timeout (сек, 0 = выкл)
+DB_PIPELINE = os.getenv("DB_PIPELINE", "true").lower() == "true"  # Независимые чтения запроса одним pipeline (db_pipeline)
+DB_REQUEST_QUERIES_WARN = int(os.getenv("DB_REQUEST_QUERIES_WARN", "20"))  # Предупреждение в лог, если запросов к БД больше (0 = выкл)
+EDGES_BACKFILL_BATCH_SIZE = int(os.getenv("EDGES_BACKFILL_BATCH_SIZE", "500"))  # Перенос связей из JSONB (пользователей за транзакцию)
+
 # Telegram Bot
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 if not BOT_TOKEN:
@@ -76,10 +89,67 @@ RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", "100"))
 # File Upload
 MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE_MB", "10")) * 1024 * 1024  # По умолчанию 10 MB
 MAX_IMAGE_DIMENSION = int(os.getenv("MAX_IMAGE_DIMENSION", "10000"))  # Максимальный размер изображения
+UPLOAD_SNIFF_BYTES = int(os.getenv("UPLOAD_SNIFF_BYTES", "65536"))  # Формат и размеры проверяются по первым N байтам загрузки
+
+# Детекция лиц (пул процессов OpenCV)
+FACE_DETECT_WORKERS = int(os.getenv("FACE_DETECT_WORKERS", str(min(4, os.cpu_count() or 1))))  # Процессов в пуле
+FACE_DETECT_MAX_QUEUE = int(os.getenv("FACE_DETECT_MAX_QUEUE", "16"))  # Сверх этого заданий в очереди - 503
+FACE_DETECT_TIMEOUT = float(os.getenv("FACE_DETECT_TIMEOUT", "10"))  # Таймаут одной проверки (сек)
+FACE_DETECT_MAX_SIDE = int(os.getenv("FACE_DETECT_MAX_SIDE", "800"))  # Длинная сторона фото для детекции, 0 = без уменьшения
+
+# Варианты фото (WebP): длинная сторона в пикселях
+PHOTO_CARD_SIZE = int(os.getenv("PHOTO_CARD_SIZE", "720"))  # Карточка в ленте
+PHOTO_THUMB_SIZE = int(os.getenv("PHOTO_THUMB_SIZE", "320"))  # Превью в профиле
+PHOTO_AVATAR_SIZE = int(os.getenv("PHOTO_AVATAR_SIZE", "128"))  # Квадратный аватар
+PHOTO_WEBP_QUALITY = int(os.getenv("PHOTO_WEBP_QUALITY", "80"))
+
+# Хранилище фото по содержимому (/data/img/blobs)
+PHOTO_GC_INTERVAL = float(os.getenv("PHOTO_GC_INTERVAL", "3600"))  # Период сборки мусора (сек)
+PHOTO_GC_GRACE = float(os.getenv("PHOTO_GC_GRACE", "3600"))  # Файл без ссылок удаляется не раньше чем через (сек)
+
+# Отдача фото (/data/img)
+PHOTO_CACHE_MAX_AGE = int(os.getenv("PHOTO_CACHE_MAX_AGE", "86400"))  # Cache-Control для старых путей /data/img/<userId>/ (сек)
+PHOTO_SERVE_AVIF = os.getenv("PHOTO_SERVE_AVIF", "false").lower() == "true"  # Отдавать <имя>.avif рядом с фото при Accept: image/avif
+PHOTO_SERVER_PORT = int(os.getenv("PHOTO_SERVER_PORT", "0"))  # Выделенный сервер фото в отдельном потоке (0 = выкл)
 
 # HTTP Timeouts
 HTTP_TIMEOUT = int(os.getenv("HTTP_TIMEOUT", "30"))  # Таймаут для HTTP запросов
 HTTP_MAX_REDIRECTS = int(os.getenv("HTTP_MAX_REDIRECTS", "5"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))  # Таймаут установки соединения (сек)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))  # Соединений на общий клиент (хост)
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))  # Из них держать открытыми между запросами
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))  # Закрывать простаивающее соединение (сек)
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"  # HTTP/2, если установлен пакет h2
+TELEGRAM_MAX_CONNECTIONS = int(os.getenv("TELEGRAM_MAX_CONNECTIONS", "32"))  # Соединений к api.telegram.org
+
+# Фоновые задачи (таблица jobs)
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))  # Задач одновременно на процесс
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))  # Проверка очереди (сек)
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))  # Аренда задачи: после падения процесса задача вернется через (сек)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))  # Попыток до статуса failed
+JOB_RETRY_BASE = float(os.getenv("JOB_RETRY_BASE", "10"))  # Задержка первого повтора, дальше удваивается (сек)
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "7"))  # Хранить завершенные задачи (дней)
+
+# Массовая рассылка (/masssend)
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # Сообщений в секунду на бота (лимит Telegram ~30)
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "16"))  # Параллельных отправок
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv("BROADCAST_PER_CHAT_INTERVAL", "1"))  # Не чаще раза в N сек в один чат
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))  # Повторов после сетевой ошибки
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "5"))  # Сохранение и показ прогресса (сек)
+
+# Лента кандидатов (постраничная выдача)
+CANDIDATES_PAGE_SIZE = int(os.getenv("CANDIDATES_PAGE_SIZE", "20"))
+CANDIDATES_MAX_PAGE_SIZE = int(os.getenv("CANDIDATES_MAX_PAGE_SIZE", "100"))
+USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", "100"))  # Страница списка пользователей (/api/users, админка)
+USERS_MAX_PAGE_SIZE = int(os.getenv("USERS_MAX_PAGE_SIZE", "1000"))
+BULK_DELETE_MAX_USERS = int(os.getenv("BULK_DELETE_MAX_USERS", "1000"))  # Максимум userId в одном массовом удалении
+CANDIDATE_QUEUE_SIZE = int(os.getenv("CANDIDATE_QUEUE_SIZE", "50"))  # Сколько кандидатов догружать в очередь за раз
+CANDIDATE_QUEUE_MAX_USERS = int(os.getenv("CANDIDATE_QUEUE_MAX_USERS", "2000"))  # Очередей в памяти (LRU)
+CANDIDATE_QUEUE_TTL = float(os.getenv("CANDIDATE_QUEUE_TTL", "900"))  # Очередь неактивного пользователя сбрасывается (сек)
+PROFILE_CACHE_MAX_USERS = int(os.getenv("PROFILE_CACHE_MAX_USERS", "10000"))  # Профилей в кэше (LRU, 0 = кэш выключен)
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "60"))  # Запись кэша профиля устаревает через N сек
+PROFILE_CACHE_BACKEND = os.getenv("PROFILE_CACHE_BACKEND", "memory").lower()  # memory (в процессе) или redis (общий для воркеров)
+PROFILE_CACHE_REDIS_URL = os.getenv("PROFILE_CACHE_REDIS_URL", "redis://localhost:6379/0")  # Для PROFILE_CACHE_BACKEND=redis
 
 # ========== ПУТИ ==========
 
@@ -365,10 +435,21 @@ CORS_ORIGINS = [origin for origin in CORS_ORIGINS if origin]
 
 # Уровень логирования
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")  # Уровни отдельных модулей: "db_utils=DEBUG,routes.photos=WARNING"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # text или json (одна запись - одна строка JSON)
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")  # Доля записей ниже WARNING по модулям: "routes.users=0.01"
+LOG_QUEUE = os.getenv("LOG_QUEUE", "true").lower() == "true"  # Писать логи из отдельного потока через очередь
 
 # Логировать ли чувствительные данные (только для разработки!)
 LOG_SENSITIVE = os.getenv("LOG_SENSITIVE", "false").lower() == "true"
 
+# ========== МЕТРИКИ ==========
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"  # Эндпоинт /metrics (формат Prometheus)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # Bearer токен для /metrics (пусто = без авторизации)
+METRICS_MAX_SERIES = int(os.getenv("METRICS_MAX_SERIES", "500"))  # Максимум рядов (комбинаций меток) на метрику
+METRICS_LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.5"))  # Период замера задержки event loop (сек)
+
 # ========== ДРУГИЕ НАСТРОЙКИ ==========
 
 # Порт сервера
@@ -3,52 +3,83 @@ database.py
 Поддержка PostgreSQL для Python бэкенда
 """
 from typing import Optional
-import psycopg2  # type: ignore[reportMissingModuleSource]
-from psycopg2 import pool  # type: ignore[reportMissingModuleSource]
-from psycopg2.extras import RealDictCursor  # type: ignore[reportMissingModuleSource]
+from psycopg.conninfo import make_conninfo  # type: ignore[reportMissingModuleSource]
+from psycopg_pool import AsyncConnectionPool  # type: ignore[reportMissingModuleSource]
 from config import (
     DATABASE_URL, PGHOST, PGPORT, PGDATABASE, PGUSER, PGPASSWORD,
+    DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, DB_POOL_MAX_IDLE,
+    DB_PREPARE_THRESHOLD, DB_IDLE_IN_TRANSACTION_TIMEOUT,
     IMAGES_DIR, LOG_DIR
 )
+from db_utils import reset_connection
 
-# PostgreSQL connection pool
-pg_pool: Optional[pool.ThreadedConnectionPool] = None
+# PostgreSQL connection pool (асинхронный: запросы не блокируют event loop)
+pg_pool: Optional[AsyncConnectionPool] = None
+
+
+def get_conninfo() -> str:
+    """Строка подключения к PostgreSQL (DATABASE_URL или отдельные PG* переменные)"""
+    if DATABASE_URL:
+        return DATABASE_URL
+    return make_conninfo(
+        host=PGHOST,
+        port=PGPORT,
+        dbname=PGDATABASE,
+        user=PGUSER,
+        password=PGPASSWORD
+    )
 
 
 async def init_postgres():
     """Инициализация PostgreSQL"""
     global pg_pool
     
-    if DATABASE_URL:
-        pg_pool = pool.ThreadedConnectionPool(
-            minconn=1,
-            maxconn=10,
-            dsn=DATABASE_URL
-        )
-    else:
-        pg_pool = pool.ThreadedConnectionPool(
-            minconn=1,
-            maxconn=10,
-            host=PGHOST,
-            port=PGPORT,
-            database=PGDATABASE,
-            user=PGUSER,
-            password=PGPASSWORD
-        )
+    if pg_pool is not None:
+        # Пул уже создан (например, start.py и lifespan вызывают инициализацию дважды)
+        return
     
-    print("✅ Подключились к PostgreSQL БД")
+    # Частые запросы psycopg сам переводит в server-side prepared statements
+    connection_kwargs = {"prepare_threshold": DB_PREPARE_THRESHOLD if DB_PREPARE_THRESHOLD >= 0 else None}
+    if DB_IDLE_IN_TRANSACTION_TIMEOUT > 0:
+        # Страховка: сервер сам закроет сессию, забытую с открытой транзакцией
+        connection_kwargs["options"] = f"-c idle_in_transaction_session_timeout={int(DB_IDLE_IN_TRANSACTION_TIMEOUT * 1000)}"
+    
+    pg_pool = AsyncConnectionPool(
+        conninfo=get_conninfo(),
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        timeout=DB_POOL_TIMEOUT,
+        max_idle=DB_POOL_MAX_IDLE,
+        kwargs=connection_kwargs,
+        # Возвращенное соединение - снова не в autocommit (см. db_utils.transaction)
+        reset=reset_connection,
+        name="seliger",
+        open=False
+    )
+    await pg_pool.open(wait=True)
+    
+    print(f"✅ Подключились к PostgreSQL БД (пул: {DB_POOL_MIN_SIZE}..{DB_POOL_MAX_SIZE}, таймаут {DB_POOL_TIMEOUT} сек)")
     await create_postgres_tables()
 
 
+async def close_postgres():
+    """Закрытие пула соединений PostgreSQL"""
+    global pg_pool
+    
+    if pg_pool is not None:
+        await pg_pool.close()
+        pg_pool = None
+        print("✅ Пул соединений PostgreSQL закрыт")
+
+
 async def create_postgres_tables():
     """Создание таблиц в PostgreSQL"""
-    conn = pg_pool.getconn()
+    conn = await pg_pool.getconn()
     try:
         cur = conn.cursor()
-        conn.autocommit = False
         
         # Таблица users
-        cur.execute("""
+        await cur.execute("""
             CREATE TABLE IF NOT EXISTS users (
                 id SERIAL PRIMARY KEY,
                 "userId" TEXT UNIQUE,
@@ -85,7 +116,7 @@ async def create_postgres_tables():
         
         # Добавляем колонку hideAge, если её нет (для существующих БД)
         try:
-            cur.execute("""
+            await cur.execute("""
                 ALTER TABLE users 
                 ADD COLUMN IF NOT EXISTS "hideAge" INTEGER DEFAULT 0;
             """)
@@ -93,8 +124,15 @@ async def create_postgres_tables():
         except Exception as e:
             print(f"⚠️ Ошибка при добавлении колонки hideAge (возможно, уже существует): {e}")
         
+        # Частичный индекс для ленты кандидатов: только активные пользователи с фото,
+        # (gender, id) дает и фильтр по полу, и keyset-пагинацию по id
+        await cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_users_candidates ON users(gender, id)
+            WHERE blocked = 0 AND "needPhoto" = 0;
+        """)
+        
         # Таблица dislikes
-        cur.execute("""
+        await cur.execute("""
             CREATE TABLE IF NOT EXISTS dislikes (
                 id SERIAL PRIMARY KEY,
                 from_user TEXT NOT NULL,
@@ -104,8 +142,163 @@ async def create_postgres_tables():
             );
         """)
         
+        # Таблица связей между пользователями (лайки, дизлайки, мэтчи)
+        # Заменяет JSONB массивы likes/dislikes/matches в users
+        await cur.execute("""
+            CREATE TABLE IF NOT EXISTS user_edges (
+                from_user TEXT NOT NULL,
+                to_user TEXT NOT NULL,
+                kind TEXT NOT NULL CHECK(kind IN ('like', 'dislike', 'match')),
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                PRIMARY KEY (from_user, kind, to_user)
+            );
+        """)
+        
+        # Индекс для обратного поиска (кто лайкнул пользователя)
+        await cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_user_edges_to_user ON user_edges(to_user, kind, from_user);
+        """)
+        
+        # Счетчик полученных лайков (who-liked-me) поддерживается триггером на user_edges,
+        # отдельная таблица - чтобы не переписывать широкую строку users на каждый лайк
+        await cur.execute("SELECT to_regclass('like_counts') IS NULL AS missing")
+        like_counts_missing = (await cur.fetchone())[0]
+        await cur.execute("""
+            CREATE TABLE IF NOT EXISTS like_counts (
+                user_id TEXT PRIMARY KEY,
+                received INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+        await cur.execute("""
+            CREATE OR REPLACE FUNCTION user_edges_like_count() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    IF NEW.kind = 'like' THEN
+                        INSERT INTO like_counts (user_id, received) VALUES (NEW.to_user, 1)
+                        ON CONFLICT (user_id) DO UPDATE SET received = like_counts.received + 1;
+                    END IF;
+                    RETURN NEW;
+                END IF;
+                IF OLD.kind = 'like' THEN
+                    UPDATE like_counts SET received = received - 1 WHERE user_id = OLD.to_user;
+                END IF;
+                RETURN OLD;
+            END;
+            $$;
+        """)
+        await cur.execute("DROP TRIGGER IF EXISTS trg_user_edges_like_count ON user_edges;")
+        await cur.execute("""
+            CREATE TRIGGER trg_user_edges_like_count
+            AFTER INSERT OR DELETE ON user_edges
+            FOR EACH ROW EXECUTE FUNCTION user_edges_like_count();
+        """)
+        if like_counts_missing:
+            # Первый запуск: заполняем счетчики по уже существующим лайкам
+            await cur.execute("""
+                INSERT INTO like_counts (user_id, received)
+                SELECT to_user, COUNT(*) FROM user_edges WHERE kind = 'like' GROUP BY to_user
+                ON CONFLICT (user_id) DO UPDATE SET received = EXCLUDED.received;
+            """)
+            print("✅ Счетчики полученных лайков (like_counts) заполнены")
+        
+        # Лайк + проверка взаимности + создание мэтча за один запрос.
+        # Advisory lock на пару пользователей сериализует встречные лайки,
+        # а каждый оператор функции видит уже закоммиченный лайк второй стороны
+        await cur.execute("""
+            CREATE OR REPLACE FUNCTION swipe_like(p_from TEXT, p_to TEXT)
+            RETURNS TABLE(sender_exists BOOLEAN, receiver_exists BOOLEAN, is_match BOOLEAN)
+            LANGUAGE plpgsql AS $$
+            BEGIN
+                PERFORM pg_advisory_xact_lock(hashtext(LEAST(p_from, p_to) || ':' || GREATEST(p_from, p_to)));
+
+                sender_exists := EXISTS (SELECT 1 FROM users WHERE "userId" = p_from);
+                receiver_exists := EXISTS (SELECT 1 FROM users WHERE "userId" = p_to);
+                is_match := FALSE;
+                IF NOT sender_exists OR NOT receiver_exists THEN
+                    RETURN NEXT;
+                    RETURN;
+                END IF;
+
+                INSERT INTO user_edges (from_user, to_user, kind)
+                VALUES (p_from, p_to, 'like')
+                ON CONFLICT (from_user, kind, to_user) DO NOTHING;
+
+                is_match := EXISTS (
+                    SELECT 1 FROM user_edges
+                    WHERE from_user = p_to AND kind = 'like' AND to_user = p_from
+                );
+                IF is_match THEN
+                    INSERT INTO user_edges (from_user, to_user, kind)
+                    VALUES (p_from, p_to, 'match'), (p_to, p_from, 'match')
+                    ON CONFLICT (from_user, kind, to_user) DO NOTHING;
+                END IF;
+
+                RETURN NEXT;
+            END;
+            $$;
+        """)
+        
+        # Хранилище фото по содержимому: файл /data/img/blobs/<2 символа>/<sha256>.jpg,
+        # refcount - сколько раз на него ссылаются photo1..3 и photoUrl (считает триггер на users)
+        await cur.execute("""
+            CREATE TABLE IF NOT EXISTS photo_blobs (
+                digest TEXT PRIMARY KEY,
+                refcount INTEGER NOT NULL DEFAULT 0,
+                size INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                touched_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            );
+        """)
+        await cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_photo_blobs_unreferenced ON photo_blobs(touched_at)
+            WHERE refcount <= 0;
+        """)
+        await cur.execute("""
+            CREATE OR REPLACE FUNCTION photo_blob_digest(url TEXT) RETURNS TEXT
+            LANGUAGE sql IMMUTABLE AS $$
+                SELECT substring(url FROM '^/data/img/blobs/[0-9a-f]{2}/([0-9a-f]{64})\\.jpg$')
+            $$;
+        """)
+        await cur.execute("""
+            CREATE OR REPLACE FUNCTION users_photo_blobs_refcount() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            DECLARE
+                d TEXT;
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    FOREACH d IN ARRAY ARRAY[
+                        photo_blob_digest(OLD.photo1), photo_blob_digest(OLD.photo2),
+                        photo_blob_digest(OLD.photo3), photo_blob_digest(OLD."photoUrl")
+                    ] LOOP
+                        IF d IS NOT NULL THEN
+                            UPDATE photo_blobs SET refcount = refcount - 1, touched_at = NOW() WHERE digest = d;
+                        END IF;
+                    END LOOP;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    FOREACH d IN ARRAY ARRAY[
+                        photo_blob_digest(NEW.photo1), photo_blob_digest(NEW.photo2),
+                        photo_blob_digest(NEW.photo3), photo_blob_digest(NEW."photoUrl")
+                    ] LOOP
+                        IF d IS NOT NULL THEN
+                            UPDATE photo_blobs SET refcount = refcount + 1 WHERE digest = d;
+                        END IF;
+                    END LOOP;
+                END IF;
+                RETURN NULL;
+            END;
+            $$;
+        """)
+        await cur.execute("DROP TRIGGER IF EXISTS trg_users_photo_blobs ON users;")
+        await cur.execute("""
+            CREATE TRIGGER trg_users_photo_blobs
+            AFTER INSERT OR DELETE OR UPDATE OF photo1, photo2, photo3, "photoUrl" ON users
+            FOR EACH ROW EXECUTE FUNCTION users_photo_blobs_refcount();
+        """)
+        
         # Таблица super_likes
-        cur.execute("""
+        await cur.execute("""
             CREATE TABLE IF NOT EXISTS super_likes (
                 id SERIAL PRIMARY KEY,
                 from_user TEXT NOT NULL,
@@ -117,7 +310,7 @@ async def create_postgres_tables():
         """)
         
         # Таблица visits
-        cur.execute("""
+        await cur.execute("""
             CREATE TABLE IF NOT EXISTS visits (
                 id SERIAL PRIMARY KEY,
                 "userId" TEXT NOT NULL,
@@ -127,7 +320,7 @@ async def create_postgres_tables():
         """)
         
         # Таблица badge_requests
-        cur.execute("""
+        await cur.execute("""
             CREATE TABLE IF NOT EXISTS badge_requests (
                 id SERIAL PRIMARY KEY,
                 "userId" TEXT NOT NULL,
@@ -139,7 +332,7 @@ async def create_postgres_tables():
         """)
         
         # Таблица payments для Telegram Stars
-        cur.execute("""
+        await cur.execute("""
             CREATE TABLE IF NOT EXISTS payments (
                 id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
                 payload TEXT UNIQUE NOT NULL,
@@ -155,17 +348,17 @@ async def create_postgres_tables():
         """)
         
         # Индекс для быстрого поиска по payload (для идемпотентности)
-        cur.execute("""
+        await cur.execute("""
             CREATE INDEX IF NOT EXISTS idx_payments_payload ON payments(payload);
         """)
         
         # Индекс для поиска по user_id
-        cur.execute("""
+        await cur.execute("""
             CREATE INDEX IF NOT EXISTS idx_payments_user_id ON payments(user_id);
         """)
         
         # Таблица промокодов
-        cur.execute("""
+        await cur.execute("""
             CREATE TABLE IF NOT EXISTS promo_codes (
                 id SERIAL PRIMARY KEY,
                 code TEXT UNIQUE NOT NULL,
@@ -177,7 +370,7 @@ async def create_postgres_tables():
         """)
         
         # Таблица использования промокодов (для отслеживания, кто использовал какой промокод)
-        cur.execute("""
+        await cur.execute("""
             CREATE TABLE IF NOT EXISTS promo_code_usage (
                 id SERIAL PRIMARY KEY,
                 promo_code_id INTEGER NOT NULL REFERENCES promo_codes(id) ON DELETE CASCADE,
@@ -188,29 +381,92 @@ async def create_postgres_tables():
         """)
         
         # Индексы для промокодов
-        cur.execute("""
+        await cur.execute("""
             CREATE INDEX IF NOT EXISTS idx_promo_codes_code ON promo_codes(code);
         """)
-        cur.execute("""
+        await cur.execute("""
             CREATE INDEX IF NOT EXISTS idx_promo_code_usage_user_id ON promo_code_usage(user_id);
         """)
-        cur.execute("""
+        await cur.execute("""
             CREATE INDEX IF NOT EXISTS idx_promo_code_usage_promo_code_id ON promo_code_usage(promo_code_id);
         """)
         
-        conn.commit()
+        # Фоновые задачи (services/jobs.py): воркеры берут их через FOR UPDATE SKIP LOCKED
+        await cur.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id BIGSERIAL PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload JSONB NOT NULL DEFAULT '{}',
+                status TEXT NOT NULL DEFAULT 'queued' CHECK(status IN ('queued', 'running', 'done', 'failed')),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 5,
+                run_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+                locked_by TEXT,
+                locked_until TIMESTAMP WITH TIME ZONE,
+                dedupe_key TEXT,
+                last_error TEXT,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                started_at TIMESTAMP WITH TIME ZONE,
+                finished_at TIMESTAMP WITH TIME ZONE
+            );
+        """)
+        await cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_jobs_queued ON jobs(run_at) WHERE status = 'queued';
+        """)
+        await cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs(locked_until) WHERE status = 'running';
+        """)
+        await cur.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs(dedupe_key)
+            WHERE status IN ('queued', 'running');
+        """)
+        await cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs(finished_at) WHERE status IN ('done', 'failed');
+        """)
+        
+        # Массовые рассылки (/masssend): прогресс хранится, чтобы продолжить рассылку после перезапуска
+        await cur.execute("""
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id SERIAL PRIMARY KEY,
+                text TEXT NOT NULL,
+                admin_chat_id BIGINT,
+                status_message_id BIGINT,
+                status TEXT NOT NULL DEFAULT 'running' CHECK(status IN ('running', 'done')),
+                total INTEGER NOT NULL DEFAULT 0,
+                sent INTEGER NOT NULL DEFAULT 0,
+                blocked INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                invalid INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                finished_at TIMESTAMP WITH TIME ZONE
+            );
+        """)
+        await cur.execute("""
+            CREATE TABLE IF NOT EXISTS broadcast_recipients (
+                broadcast_id INTEGER NOT NULL REFERENCES broadcasts(id) ON DELETE CASCADE,
+                user_id TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'sent', 'blocked', 'failed')),
+                PRIMARY KEY (broadcast_id, user_id)
+            );
+        """)
+        await cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_pending ON broadcast_recipients(broadcast_id, user_id)
+            WHERE status = 'pending';
+        """)
+        
+        await conn.commit()
         print("✅ Все таблицы PostgreSQL созданы или уже существуют")
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         print(f"❌ Ошибка создания таблиц PostgreSQL: {e}")
         raise
     finally:
-        pg_pool.putconn(conn)
+        await pg_pool.putconn(conn)
 
 
 async def get_db():
-    """Получить подключение к БД (PostgreSQL)"""
-    return pg_pool.getconn()
+    """Получить подключение к БД (PostgreSQL). Вернуть в пул через pg_pool.putconn()"""
+    return await pg_pool.getconn()
 
 
 async def init_database():
@@ -219,6 +475,11 @@ async def init_database():
     await init_postgres()
 
 
+async def close_database():
+    """Закрытие подключений к базе данных"""
+    await close_postgres()
+
+
 # Экспортируем константы
 __all__ = [
     "IMAGES_DIR",
@@ -226,4 +487,5 @@ __all__ = [
     "pg_pool",
     "get_db",
     "init_database",
+    "close_database",
 ]
@@ -2,10 +2,25 @@
 db_utils.py
 Утилиты для работы с базой данных (PostgreSQL)
 """
+import asyncio
 import json
 import re
-from typing import Any, Optional, List, Dict, Tuple
-from psycopg2.extras import RealDictCursor
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Optional, List, Dict, Tuple
+from psycopg import AsyncPipeline  # type: ignore[reportMissingModuleSource]
+from psycopg.pq import TransactionStatus  # type: ignore[reportMissingModuleSource]
+from psycopg.rows import dict_row  # type: ignore[reportMissingModuleSource]
+from config import (
+    DB_STATEMENT_CACHE_SIZE, DB_PREPARE_THRESHOLD, DB_LONG_TRANSACTION_SECONDS, DB_PIPELINE, LOG_SENSITIVE
+)
+import metrics
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def get_pg_pool():
@@ -30,52 +45,50 @@ def safe_json_parse(value: Any, default: Any = None) -> Any:
     return default
 
 
-def adapt_sql_for_postgres(sql: str, params: List[Any]) -> Tuple[str, List[Any]]:
+# Поля в camelCase, которые в PostgreSQL нужно брать в кавычки
+CAMEL_CASE_FIELDS = [
+    'userId', 'photoUrl', 'createdAt', 'needPhoto', 'is_pro', 'pro_end', 'pro_start',
+    'last_login', 'pushSent', 'super_likes_count', 'lookingFor', 'photoBot'
+]
+
+# Регулярки компилируются один раз при импорте модуля
+_INSERT_OR_IGNORE_RE = re.compile(r'INSERT\s+OR\s+IGNORE\s+INTO\s+(\w+)\s*\(([^)]+)\)', re.IGNORECASE)
+_INSERT_OR_IGNORE_PREFIX_RE = re.compile(r'INSERT\s+OR\s+IGNORE\s+INTO', re.IGNORECASE)
+_VALUES_RE = re.compile(r'VALUES\s*\([^)]+\)', re.IGNORECASE)
+# Поле НЕ в кавычках: (?<!") перед полем нет кавычки, \b - граница слова, (?!") после поля нет кавычки
+_CAMEL_CASE_RE = re.compile(
+    r'(?<!\")\b(' + '|'.join(re.escape(field) for field in CAMEL_CASE_FIELDS) + r')\b(?!\")'
+)
+
+# Кэш адаптированных запросов: исходный SQL -> (адаптированный SQL, кол-во параметров)
+_statement_cache: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+_statement_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _compile_sql(sql: str) -> Tuple[str, int]:
     """
-    Адаптирует SQL запрос для PostgreSQL через psycopg2:
-    - Заменяет ? на %s (psycopg2 использует %s, а не $1, $2...)
-    - Обрабатывает INSERT OR IGNORE -> INSERT ... ON CONFLICT DO NOTHING
-    - Добавляет кавычки к camelCase идентификаторам
-    
-    ВАЖНО: psycopg2 использует %s для параметров, а не $1, $2...
-    Это стандартная практика для psycopg2!
+    Переписывает SQL под PostgreSQL (без кэша).
+    Возвращает адаптированный SQL и количество параметров %s в нем.
     """
-    adapted_sql = sql
-    
-    # Заменяем ? на %s (psycopg2 использует %s для параметров)
-    # ВАЖНО: заменяем все ? на %s, psycopg2 сам обработает порядок параметров
-    adapted_sql = adapted_sql.replace('?', '%s')
-    
-    # Подсчитываем количество параметров для проверки
+    # Заменяем ? на %s (psycopg использует %s для параметров)
+    # ВАЖНО: заменяем все ? на %s, psycopg сам обработает порядок параметров
+    adapted_sql = sql.replace('?', '%s')
     param_count = adapted_sql.count('%s')
     
-    # Проверяем, что количество параметров совпадает
-    if len(params) != param_count:
-        raise ValueError(
-            f"Несоответствие количества параметров: SQL требует {param_count} (%s), "
-            f"передано {len(params)}. SQL: {sql}, adapted_sql: {adapted_sql}, params: {params}"
-        )
-    
     # Обрабатываем INSERT OR IGNORE
     if 'INSERT OR IGNORE' in adapted_sql.upper():
-        match = re.search(r'INSERT\s+OR\s+IGNORE\s+INTO\s+(\w+)\s*\(([^)]+)\)', adapted_sql, re.IGNORECASE)
+        match = _INSERT_OR_IGNORE_RE.search(adapted_sql)
         if match:
-            table = match.group(1)
             columns = [c.strip() for c in match.group(2).split(',')]
             unique_col = next((c for c in columns if 'userid' in c.lower()), columns[0])
             
             # Убираем кавычки из unique_col если есть
             unique_col = unique_col.strip('"')
             
-            adapted_sql = re.sub(
-                r'INSERT\s+OR\s+IGNORE\s+INTO',
-                'INSERT INTO',
-                adapted_sql,
-                flags=re.IGNORECASE
-            )
+            adapted_sql = _INSERT_OR_IGNORE_PREFIX_RE.sub('INSERT INTO', adapted_sql)
             
             # Находим позицию VALUES и добавляем ON CONFLICT после него
-            values_match = re.search(r'VALUES\s*\([^)]+\)', adapted_sql, re.IGNORECASE)
+            values_match = _VALUES_RE.search(adapted_sql)
             if values_match:
                 values_end = values_match.end()
                 adapted_sql = (
@@ -86,141 +99,593 @@ def adapt_sql_for_postgres(sql: str, params: List[Any]) -> Tuple[str, List[Any]]
     
     # Добавляем кавычки к camelCase идентификаторам (только если их еще нет)
     # ВАЖНО: делаем это ПОСЛЕ замены ? на %s, чтобы не затронуть параметры
-    camel_case_fields = [
-        'userId', 'photoUrl', 'createdAt', 'needPhoto', 'is_pro', 'pro_end', 'pro_start',
-        'last_login', 'pushSent', 'super_likes_count', 'lookingFor', 'photoBot'
-    ]
-    for field in camel_case_fields:
-        # Ищем поле, которое НЕ уже в кавычках
-        # Используем word boundary (\b) для точного совпадения
-        # Паттерн: поле должно быть отдельным словом, не в кавычках
-        # (?<!") - перед полем нет кавычки
-        # \b - граница слова (важно для точного совпадения)
-        # {field} - само поле
-        # \b - граница слова
-        # (?!") - после поля нет кавычки
-        pattern = rf'(?<!\")\b{re.escape(field)}\b(?!\")'
-        # Заменяем только незакавыченные вхождения
-        adapted_sql = re.sub(pattern, f'"{field}"', adapted_sql)
+    adapted_sql = _CAMEL_CASE_RE.sub(r'"\1"', adapted_sql)
+    
+    return adapted_sql, param_count
+
+
+def adapt_sql_for_postgres(sql: str, params: List[Any]) -> Tuple[str, List[Any]]:
+    """
+    Адаптирует SQL запрос для PostgreSQL через psycopg:
+    - Заменяет ? на %s (psycopg использует %s, а не $1, $2...)
+    - Обрабатывает INSERT OR IGNORE -> INSERT ... ON CONFLICT DO NOTHING
+    - Добавляет кавычки к camelCase идентификаторам
+    
+    Результат переписывания кэшируется по исходному тексту SQL (LRU,
+    DB_STATEMENT_CACHE_SIZE записей), так что каждый запрос разбирается один раз.
+    
+    ВАЖНО: psycopg использует %s для параметров, а не $1, $2...
+    Это стандартная практика для psycopg!
+    """
+    cached = _statement_cache.get(sql)
+    if cached is not None:
+        _statement_cache.move_to_end(sql)
+        _statement_cache_stats["hits"] += 1
+        adapted_sql, param_count = cached
+    else:
+        _statement_cache_stats["misses"] += 1
+        adapted_sql, param_count = _compile_sql(sql)
+        if DB_STATEMENT_CACHE_SIZE > 0:
+            _statement_cache[sql] = (adapted_sql, param_count)
+            if len(_statement_cache) > DB_STATEMENT_CACHE_SIZE:
+                _statement_cache.popitem(last=False)
+                _statement_cache_stats["evictions"] += 1
+    
+    # Проверяем, что количество параметров совпадает
+    if len(params) != param_count:
+        raise ValueError(
+            f"Несоответствие количества параметров: SQL требует {param_count} (%s), "
+            f"передано {len(params)}. SQL: {sql}, adapted_sql: {adapted_sql}, params: {params}"
+        )
     
     return adapted_sql, params
 
 
-async def db_get(sql: str, params: List[Any] = None) -> Optional[Dict[str, Any]]:
-    """Выполнить SELECT запрос и вернуть одну строку"""
+def get_statement_cache_stats() -> Dict[str, Any]:
+    """Метрики кэша адаптированных SQL запросов"""
+    hits = _statement_cache_stats["hits"]
+    misses = _statement_cache_stats["misses"]
+    total = hits + misses
+    return {
+        "size": len(_statement_cache),
+        "max_size": DB_STATEMENT_CACHE_SIZE,
+        "hits": hits,
+        "misses": misses,
+        "evictions": _statement_cache_stats["evictions"],
+        "hit_rate": round(hits / total, 3) if total else 0.0,
+        "prepare_threshold": DB_PREPARE_THRESHOLD,
+    }
+
+
+# Метка запроса для метрик: операция и первая таблица ("select users", "insert user_edges")
+# FROM func(...) (EXTRACT(EPOCH FROM ...), функции) не считается таблицей
+_STATEMENT_TABLE_RE = re.compile(
+    r'\b(?:INTO|UPDATE)\s+"?(\w+)|\bFROM\s+"?(\w+)\b(?!"?\s*\()', re.IGNORECASE
+)
+_STATEMENT_FUNCTION_RE = re.compile(r'^\s*SELECT\s+(?:\*\s+FROM\s+)?(\w+)\s*\(', re.IGNORECASE)
+
+DB_QUERY_SECONDS = metrics.histogram(
+    "db_query_duration_seconds", "Время запросов к БД по операции и таблице", ["statement"],
+    buckets=metrics.FAST_BUCKETS
+)
+DB_QUERY_ERRORS = metrics.counter("db_query_errors_total", "Ошибки запросов к БД по операции и таблице", ["statement"])
+DB_TRANSACTION_SECONDS = metrics.histogram(
+    "db_transaction_duration_seconds", "Длительность транзакций transaction()", ["mode", "outcome"]
+)
+
+
+@lru_cache(maxsize=1024)
+def statement_label(adapted_sql: str) -> str:
+    """Метка запроса с ограниченным набором значений (не текст SQL): операция и таблица или функция"""
+    words = adapted_sql.split(None, 1)
+    operation = words[0].lower() if words else "unknown"
+    match = _STATEMENT_TABLE_RE.search(adapted_sql)
+    if match:
+        return f"{operation} {(match.group(1) or match.group(2)).lower()}"
+    match = _STATEMENT_FUNCTION_RE.search(adapted_sql)
+    return f"{operation} {match.group(1).lower()}" if match else operation
+
+
+# Транзакции, открытые через transaction(): id транзакции -> (время начала, read only)
+_open_transactions: Dict[int, Tuple[float, bool]] = {}
+_transaction_stats = {
+    "read_only": 0, "read_write": 0, "commits": 0, "rollbacks": 0,
+    "long": 0, "dirty_returns": 0,
+}
+
+
+async def reset_connection(conn) -> None:
+    """
+    Callback пула (reset) при возврате соединения.
+    Незавершенную транзакцию пул откатывает сам; здесь соединение возвращается
+    в режим по умолчанию (чтения переключают его в autocommit)
+    """
+    if conn.autocommit:
+        await conn.set_autocommit(False)
+
+
+async def _check_returned(conn) -> None:
+    """Соединение уходит в пул: транзакция должна быть закрыта, иначе откатываем и считаем"""
+    status = conn.info.transaction_status
+    if status in (TransactionStatus.INTRANS, TransactionStatus.INERROR):
+        _transaction_stats["dirty_returns"] += 1
+        logger.warning(f"Соединение возвращается в пул с открытой транзакцией ({status.name}), откат")
+        await conn.rollback()
+
+
+class DbSession:
+    """
+    Запросы к БД в рамках одного HTTP запроса (или команды бота).
+
+    Считает запросы и время в БД. С reuse=True первое обращение берет соединение из пула
+    (в autocommit), и все следующие db_get/db_all/db_run/db_pipeline идут через него;
+    release() возвращает соединение в пул, но не раньше, чем закончатся запросы и transaction(),
+    которые его заняли (в том числе задачи, пережившие запрос). transaction() тоже идет через него.
+    """
+
+    def __init__(self, reuse: bool = False):
+        self.reuse = reuse
+        self.queries = 0
+        self.db_ms = 0.0
+        self.checkouts = 0
+        self._conn = None
+        self._pool_context = None
+        self._lock = asyncio.Lock()
+        # Запросы и transaction(), занявшие соединение сессии: пока они идут, release() откладывается
+        self._borrowers = 0
+        self._release_pending = False
+
+    async def connection(self):
+        """Соединение сессии (берется из пула при первом запросе)"""
+        async with self._lock:
+            if self._conn is None:
+                self._pool_context = get_pg_pool().connection()
+                conn = await self._pool_context.__aenter__()
+                await conn.set_autocommit(True)
+                self._conn = conn
+                self.checkouts += 1
+            return self._conn
+
+    async def release(self) -> None:
+        """Вернуть соединение в пул (следующий запрос возьмет новое)"""
+        async with self._lock:
+            if self._conn is None:
+                return
+            if self._borrowers:
+                # Задача, пережившая запрос, еще на соединении: его вернет конец ее запроса/транзакции
+                self._release_pending = True
+                return
+            self._release_pending = False
+            conn, pool_context = self._conn, self._pool_context
+            self._conn = self._pool_context = None
+            try:
+                await _check_returned(conn)
+            finally:
+                await pool_context.__aexit__(None, None, None)
+
+    @asynccontextmanager
+    async def borrow(self) -> AsyncIterator[Any]:
+        """Соединение сессии на время запроса или транзакции (release() дождется конца)"""
+        self._borrowers += 1
+        try:
+            yield await self.connection()
+        finally:
+            self._borrowers -= 1
+            if not self._borrowers and self._release_pending:
+                await self.release()
+
+    def record(self, elapsed: float, count: int = 1) -> None:
+        self.queries += count
+        self.db_ms += elapsed * 1000
+
+
+_current_session: ContextVar[Optional[DbSession]] = ContextVar("db_session", default=None)
+_session_stats = {"requests": 0, "queries": 0, "db_ms": 0.0, "max_queries": 0, "checkouts": 0}
+
+
+def current_session() -> Optional[DbSession]:
+    """Сессия текущего запроса (None вне db_session())"""
+    return _current_session.get()
+
+
+def begin_session(reuse: bool = False) -> DbSession:
+    """
+    Начать сессию в текущем контексте (middleware запроса).
+    Завершается end_session(); без reset контекста - его сбрасывает конец запроса
+    """
+    session = DbSession(reuse)
+    _current_session.set(session)
+    return session
+
+
+async def end_session(session: DbSession) -> None:
+    """Вернуть соединение сессии и добавить ее счетчики в общую статистику"""
+    # Задачи, запущенные из запроса и пережившие его, дальше берут соединения из пула сами
+    session.reuse = False
+    await session.release()
+    _session_stats["requests"] += 1
+    _session_stats["queries"] += session.queries
+    _session_stats["db_ms"] += session.db_ms
+    _session_stats["max_queries"] = max(_session_stats["max_queries"], session.queries)
+    _session_stats["checkouts"] += session.checkouts
+
+
+@asynccontextmanager
+async def db_session() -> AsyncIterator[DbSession]:
+    """
+    Одно соединение на все запросы блока (команда бота, фоновая задача, многошаговый сервис).
+    Внутри уже открытой сессии включает в ней переиспользование соединения
+    """
+    session = current_session()
+    if session is not None:
+        session.reuse = True
+        yield session
+        return
+    session = DbSession(reuse=True)
+    token = _current_session.set(session)
+    try:
+        yield session
+    finally:
+        _current_session.reset(token)
+        await end_session(session)
+
+
+async def use_db_session() -> AsyncIterator[DbSession]:
+    """
+    FastAPI зависимость: все запросы эндпоинта идут через одно соединение.
+    Соединение возвращается в пул, когда начинается отправка ответа (DbSessionMiddleware)
+    или при завершении зависимости
+    """
+    session = current_session()
+    if session is None:
+        # Без DbSessionMiddleware сессия живет до конца зависимости
+        session = begin_session(reuse=True)
+        try:
+            yield session
+        finally:
+            await end_session(session)
+        return
+    session.reuse = True
+    try:
+        yield session
+    finally:
+        await session.release()
+
+
+def get_session_stats() -> Dict[str, Any]:
+    """Запросы к БД на HTTP запрос: среднее и максимум с момента запуска"""
+    requests = _session_stats["requests"]
+    return {
+        **_session_stats,
+        "db_ms": round(_session_stats["db_ms"], 1),
+        "avg_queries": round(_session_stats["queries"] / requests, 2) if requests else 0.0,
+        "avg_db_ms": round(_session_stats["db_ms"] / requests, 2) if requests else 0.0,
+    }
+
+
+@asynccontextmanager
+async def _read_connection(conn=None) -> AsyncIterator[Any]:
+    """
+    Соединение для запроса: переданное (внутри transaction()), соединение сессии запроса
+    или из пула в autocommit. В autocommit SELECT не открывает транзакцию: нет лишних
+    BEGIN/COMMIT и соединение не висит "idle in transaction" со старым снимком
+    """
+    if conn is not None:
+        yield conn
+        return
+    session = current_session()
+    if session is not None and session.reuse:
+        async with session.borrow() as session_conn:
+            yield session_conn
+        return
+    pg_pool = get_pg_pool()
+    async with pg_pool.connection() as pooled:
+        await pooled.set_autocommit(True)
+        yield pooled
+
+
+def _record(started: float, adapted_sql: str, count: int = 1) -> None:
+    """Учесть запрос(ы) в метриках и в сессии текущего HTTP запроса"""
+    elapsed = time.perf_counter() - started
+    DB_QUERY_SECONDS.observe(elapsed, statement_label(adapted_sql))
+    session = current_session()
+    if session is not None:
+        session.record(elapsed, count)
+
+
+@asynccontextmanager
+async def _transaction_connection() -> AsyncIterator[Tuple[Any, bool]]:
+    """
+    Соединение для transaction(): соединение сессии запроса, если она его переиспользует,
+    иначе из пула. Второе соединение из пула, пока сессия держит свое, - hold-and-wait:
+    при насыщенном пуле запросы ждали бы соединений друг друга.
+    Второе значение - соединение взято из пула (его проверяет возврат в пул)
+    """
+    session = current_session()
+    if session is not None and session.reuse:
+        async with session.borrow() as conn:
+            yield conn, False
+        return
+    async with get_pg_pool().connection() as conn:
+        yield conn, True
+
+
+@asynccontextmanager
+async def transaction(readonly: bool = False) -> AsyncIterator[Any]:
+    """
+    Явная транзакция: COMMIT при выходе, ROLLBACK при исключении.
+    Соединение передается в db_get/db_all/db_run(conn=...) или используется напрямую (conn.cursor()).
+    Внутри сессии запроса идет на ее соединении, вложенная transaction() - точка сохранения (SAVEPOINT).
+
+    Args:
+        readonly: REPEATABLE READ, READ ONLY - все запросы видят один снимок, запись запрещена
+
+        async with transaction() as conn:
+            await db_run("UPDATE ...", [...], conn=conn)
+            await db_run("INSERT ...", [...], conn=conn)
+    """
+    async with _transaction_connection() as (conn, pooled):
+        started = time.monotonic()
+        key = object()
+        _open_transactions[id(key)] = (started, readonly)
+        _transaction_stats["read_only" if readonly else "read_write"] += 1
+        outcome = "rollback"
+        # Уровень изоляции задается только первым запросом транзакции, не в SAVEPOINT
+        outermost = conn.info.transaction_status == TransactionStatus.IDLE
+        try:
+            async with conn.transaction():
+                if readonly and outermost:
+                    await conn.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+                yield conn
+            _transaction_stats["commits"] += 1
+            outcome = "commit"
+        except BaseException:
+            _transaction_stats["rollbacks"] += 1
+            raise
+        finally:
+            del _open_transactions[id(key)]
+            elapsed = time.monotonic() - started
+            DB_TRANSACTION_SECONDS.observe(elapsed, "read_only" if readonly else "read_write", outcome)
+            if elapsed > DB_LONG_TRANSACTION_SECONDS:
+                _transaction_stats["long"] += 1
+                logger.warning(f"Долгая транзакция: {elapsed:.1f} сек ({'read only' if readonly else 'read write'})")
+            if pooled:
+                await _check_returned(conn)
+
+
+def _log_query(kind: str, adapted_sql: str, adapted_params: List[Any]) -> None:
+    """SQL запроса на DEBUG (при INFO - одна проверка уровня, без форматирования)"""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[%s] %s params=%s", kind, adapted_sql, adapted_params if LOG_SENSITIVE else len(adapted_params))
+
+
+def _log_failure(kind: str, adapted_sql: str, adapted_params: List[Any]) -> None:
+    """Ошибка запроса с traceback (значения параметров - только при LOG_SENSITIVE) и счетчик ошибок"""
+    DB_QUERY_ERRORS.inc(statement_label(adapted_sql))
+    logger.exception(
+        "[%s] Ошибка выполнения SQL: %r params=%s",
+        kind, adapted_sql, adapted_params if LOG_SENSITIVE else len(adapted_params)
+    )
+
+
+async def db_get(sql: str, params: List[Any] = None, conn=None) -> Optional[Dict[str, Any]]:
+    """Выполнить SELECT запрос и вернуть одну строку (conn - внутри transaction())"""
     if params is None:
         params = []
     
-    # Логируем для отладки
-    print(f"[db_get] SQL: {sql}, params: {params}")
-    
     adapted_sql, adapted_params = adapt_sql_for_postgres(sql, params)
-    print(f"[db_get] Adapted SQL: {adapted_sql}, adapted_params: {adapted_params}")
+    _log_query("db_get", adapted_sql, adapted_params)
     
-    pg_pool = get_pg_pool()
-    conn = pg_pool.getconn()
-    try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        # Детальное логирование перед выполнением
-        print(f"[db_get] ПЕРЕД execute:")
-        print(f"  - adapted_sql (repr): {repr(adapted_sql)}")
-        print(f"  - adapted_sql (str): {adapted_sql}")
-        print(f"  - adapted_params: {adapted_params}")
-        print(f"  - type(adapted_params): {type(adapted_params)}")
-        print(f"  - len(adapted_params): {len(adapted_params) if adapted_params else 0}")
-        print(f"  - '$1' in adapted_sql: {'$1' in adapted_sql}")
-        print(f"  - adapted_sql.count('$1'): {adapted_sql.count('$1')}")
-        
-        # psycopg2 принимает параметры как список или кортеж
-        # Пробуем передать как кортеж (может быть проблема в RealDictCursor)
-        if adapted_params:
-            # Преобразуем список в кортеж для psycopg2
-            params_tuple = tuple(adapted_params)
-            print(f"  - params_tuple: {params_tuple}")
-            print(f"  - type(params_tuple): {type(params_tuple)}")
-            cur.execute(adapted_sql, params_tuple)
-        else:
-            cur.execute(adapted_sql)
-        row = cur.fetchone()
-        return dict(row) if row else None
-    except Exception as e:
-        print(f"[db_get] Ошибка выполнения SQL: {e}")
-        print(f"[db_get] SQL (repr): {repr(adapted_sql)}")
-        print(f"[db_get] SQL (str): {adapted_sql}")
-        print(f"[db_get] Params: {adapted_params}")
-        print(f"[db_get] Type of params: {type(adapted_params)}")
-        import traceback
-        traceback.print_exc()
-        raise
-    finally:
-        pg_pool.putconn(conn)
+    async with _read_connection(conn) as conn:
+        started = time.perf_counter()
+        try:
+            cur = conn.cursor(row_factory=dict_row)
+            # Без параметров не передаем пустой список, чтобы psycopg не разбирал % в SQL
+            await cur.execute(adapted_sql, tuple(adapted_params) if adapted_params else None)
+            row = await cur.fetchone()
+            _record(started, adapted_sql)
+            return dict(row) if row else None
+        except Exception:
+            _log_failure("db_get", adapted_sql, adapted_params)
+            raise
 
 
-async def db_all(sql: str, params: List[Any] = None) -> List[Dict[str, Any]]:
-    """Выполнить SELECT запрос и вернуть все строки"""
+async def db_all(sql: str, params: List[Any] = None, conn=None) -> List[Dict[str, Any]]:
+    """Выполнить SELECT запрос и вернуть все строки (conn - внутри transaction())"""
     if params is None:
         params = []
     
     adapted_sql, adapted_params = adapt_sql_for_postgres(sql, params)
-    pg_pool = get_pg_pool()
-    conn = pg_pool.getconn()
-    try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute(adapted_sql, adapted_params)
-        rows = cur.fetchall()
+    _log_query("db_all", adapted_sql, adapted_params)
+    async with _read_connection(conn) as conn:
+        started = time.perf_counter()
+        cur = conn.cursor(row_factory=dict_row)
+        await cur.execute(adapted_sql, adapted_params or None)
+        rows = await cur.fetchall()
+        _record(started, adapted_sql)
         return [dict(row) for row in rows]
-    finally:
-        pg_pool.putconn(conn)
 
 
-async def db_run(sql: str, params: List[Any] = None) -> Dict[str, Any]:
-    """Выполнить INSERT/UPDATE/DELETE запрос"""
+async def db_pipeline(queries: List[Tuple[str, List[Any]]], conn=None) -> List[List[Dict[str, Any]]]:
+    """
+    Несколько независимых SELECT за один проход до сервера (pipeline mode psycopg):
+    запросы отправляются пачкой, результаты читаются после. При DB_PIPELINE=false или
+    без поддержки в libpq - по очереди на одном соединении.
+
+    Returns:
+        Строки каждого запроса в порядке queries
+    """
+    adapted = [adapt_sql_for_postgres(sql, params or []) for sql, params in queries]
+    async with _read_connection(conn) as conn:
+        started = time.perf_counter()
+        cursors = [conn.cursor(row_factory=dict_row) for _ in adapted]
+        if DB_PIPELINE and AsyncPipeline.is_supported():
+            async with conn.pipeline():
+                for cur, (adapted_sql, adapted_params) in zip(cursors, adapted):
+                    await cur.execute(adapted_sql, adapted_params or None)
+        else:
+            for cur, (adapted_sql, adapted_params) in zip(cursors, adapted):
+                await cur.execute(adapted_sql, adapted_params or None)
+        results = [[dict(row) for row in await cur.fetchall()] for cur in cursors]
+        _record(started, "pipeline", len(adapted))
+        return results
+
+
+async def _run_on(conn, adapted_sql: str, adapted_params: List[Any]) -> Dict[str, Any]:
+    """INSERT/UPDATE/DELETE на переданном соединении, без COMMIT"""
+    started = time.perf_counter()
+    cur = conn.cursor()
+    try:
+        await cur.execute(adapted_sql, adapted_params or None)
+    except Exception:
+        _log_failure("db_run", adapted_sql, adapted_params)
+        raise
+    _record(started, adapted_sql)
+    return {"lastID": getattr(cur, "lastrowid", None), "changes": cur.rowcount}
+
+
+async def db_run(sql: str, params: List[Any] = None, conn=None) -> Dict[str, Any]:
+    """
+    Выполнить INSERT/UPDATE/DELETE запрос.
+    Без conn - в своей транзакции с COMMIT, с conn - в транзакции вызывающего (transaction())
+    """
     if params is None:
         params = []
     
-    # Логируем для отладки
-    print(f"[db_run] SQL: {sql}, params: {params}")
-    
     adapted_sql, adapted_params = adapt_sql_for_postgres(sql, params)
-    print(f"[db_run] Adapted SQL: {adapted_sql}, adapted_params: {adapted_params}")
+    _log_query("db_run", adapted_sql, adapted_params)
+    
+    if conn is not None:
+        return await _run_on(conn, adapted_sql, adapted_params)
+    
+    session = current_session()
+    if session is not None and session.reuse:
+        # Соединение сессии в autocommit: запрос фиксируется сразу, как и с COMMIT ниже
+        async with session.borrow() as session_conn:
+            return await _run_on(session_conn, adapted_sql, adapted_params)
     
     pg_pool = get_pg_pool()
-    conn = pg_pool.getconn()
-    try:
-        cur = conn.cursor()
-        # psycopg2 принимает параметры как список или кортеж
-        if adapted_params:
-            cur.execute(adapted_sql, adapted_params)
-        else:
-            cur.execute(adapted_sql)
-        conn.commit()
-        return {"lastID": cur.lastrowid if hasattr(cur, 'lastrowid') else None, "changes": cur.rowcount}
-    except Exception as e:
-        conn.rollback()
-        print(f"[db_run] Ошибка выполнения SQL: {e}")
-        print(f"[db_run] SQL: {adapted_sql}")
-        print(f"[db_run] Params: {adapted_params}")
-        raise
-    finally:
-        pg_pool.putconn(conn)
+    async with pg_pool.connection() as conn:
+        started = time.perf_counter()
+        try:
+            cur = conn.cursor()
+            await cur.execute(adapted_sql, adapted_params or None)
+            await conn.commit()
+            _record(started, adapted_sql)
+            return {"lastID": getattr(cur, "lastrowid", None), "changes": cur.rowcount}
+        except Exception:
+            await conn.rollback()
+            _log_failure("db_run", adapted_sql, adapted_params)
+            raise
 
 
 async def db_transaction(operations: List[Tuple[str, List[Any]]]) -> None:
     """Выполнить несколько операций в транзакции"""
-    pg_pool = get_pg_pool()
-    conn = pg_pool.getconn()
-    try:
+    async with transaction() as conn:
         cur = conn.cursor()
         for sql, params in operations:
             adapted_sql, adapted_params = adapt_sql_for_postgres(sql, params)
-            # psycopg2 принимает параметры как список или кортеж
-            if adapted_params:
-                cur.execute(adapted_sql, adapted_params)
-            else:
-                cur.execute(adapted_sql)
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise
-    finally:
-        pg_pool.putconn(conn)
+            await cur.execute(adapted_sql, adapted_params or None)
+
+
+def get_transaction_stats() -> Dict[str, Any]:
+    """Транзакции этого процесса через transaction(): открытые сейчас, самая старая, итоги"""
+    now = time.monotonic()
+    ages = [now - started for started, _ in _open_transactions.values()]
+    return {
+        **_transaction_stats,
+        "open": len(ages),
+        "oldest_open_seconds": round(max(ages), 3) if ages else 0.0,
+        "long_threshold_seconds": DB_LONG_TRANSACTION_SECONDS,
+    }
+
+
+async def get_long_transactions() -> Dict[str, Any]:
+    """
+    Транзакции всех клиентов БД, открытые дольше DB_LONG_TRANSACTION_SECONDS (pg_stat_activity).
+    "idle in transaction" держат старый снимок и мешают autovacuum чистить users
+    """
+    rows = await db_all(
+        """SELECT state, COUNT(*) AS count,
+                  EXTRACT(EPOCH FROM MAX(NOW() - xact_start))::float AS oldest_seconds
+           FROM pg_stat_activity
+           WHERE datname = current_database() AND pid <> pg_backend_pid()
+             AND xact_start < NOW() - make_interval(secs => ?)
+           GROUP BY state""",
+        [DB_LONG_TRANSACTION_SECONDS]
+    )
+    by_state = {
+        row["state"] or "unknown": {"count": row["count"], "oldest_seconds": round(row["oldest_seconds"], 1)}
+        for row in rows
+    }
+    return {
+        "count": sum(item["count"] for item in by_state.values()),
+        "idle_in_transaction": sum(
+            item["count"] for state, item in by_state.items() if state.startswith("idle in transaction")
+        ),
+        "by_state": by_state,
+    }
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """
+    Метрики пула соединений: размер, занятые/свободные соединения,
+    очередь ожидания и насыщение (in_use / max_size)
+    """
+    pg_pool = get_pg_pool()
+    stats = pg_pool.get_stats()
+    max_size = stats.get("pool_max", pg_pool.max_size)
+    size = stats.get("pool_size", 0)
+    available = stats.get("pool_available", 0)
+    in_use = size - available
+    return {
+        "min_size": stats.get("pool_min", pg_pool.min_size),
+        "max_size": max_size,
+        "size": size,
+        "available": available,
+        "in_use": in_use,
+        "waiting": stats.get("requests_waiting", 0),
+        "saturation": round(in_use / max_size, 3) if max_size else 0.0,
+        "requests_total": stats.get("requests_num", 0),
+        "requests_queued": stats.get("requests_queued", 0),
+        "requests_wait_ms": stats.get("requests_wait_ms", 0),
+        "requests_timeouts": stats.get("requests_errors", 0),
+        "acquire_timeout": pg_pool.timeout,
+    }
+
+
+@metrics.collector
+def _db_metrics() -> List[metrics.Family]:
+    """Пул соединений, транзакции, кэш SQL и запросы на HTTP запрос для /metrics"""
+    pool = get_pool_stats()
+    transactions = get_transaction_stats()
+    statements = get_statement_cache_stats()
+    sessions = get_session_stats()
+    return [
+        metrics.labeled_family(
+            "db_pool_connections", "gauge", "Соединения пула БД",
+            "state", {"in_use": pool["in_use"], "available": pool["available"]}
+        ),
+        metrics.value_family("db_pool_max_connections", "gauge", "Максимальный размер пула БД", pool["max_size"]),
+        metrics.value_family("db_pool_saturation_ratio", "gauge", "Доля занятых соединений пула (in_use / max_size)", pool["saturation"]),
+        metrics.value_family("db_pool_waiting_requests", "gauge", "Запросы, ждущие соединение из пула", pool["waiting"]),
+        metrics.value_family("db_pool_requests_total", "counter", "Запросы соединений из пула", pool["requests_total"]),
+        metrics.value_family("db_pool_queued_requests_total", "counter", "Запросы соединений, попавшие в очередь", pool["requests_queued"]),
+        metrics.value_family("db_pool_wait_seconds_total", "counter", "Суммарное ожидание соединения из пула", pool["requests_wait_ms"] / 1000),
+        metrics.value_family("db_pool_timeouts_total", "counter", "Таймауты ожидания соединения из пула", pool["requests_timeouts"]),
+        metrics.value_family("db_transactions_open", "gauge", "Открытые транзакции transaction()", transactions["open"]),
+        metrics.value_family(
+            "db_transaction_oldest_open_seconds", "gauge", "Возраст самой старой открытой транзакции",
+            transactions["oldest_open_seconds"]
+        ),
+        metrics.value_family(
+            "db_dirty_returns_total", "counter", "Соединения, вернувшиеся в пул с открытой транзакцией",
+            transactions["dirty_returns"]
+        ),
+        metrics.labeled_family(
+            "db_statement_cache_total", "counter", "Обращения к кэшу адаптированных SQL",
+            "result", {"hit": statements["hits"], "miss": statements["misses"]}
+        ),
+        metrics.value_family("db_session_requests_total", "counter", "HTTP запросы с сессией БД", sessions["requests"]),
+        metrics.value_family("db_session_queries_total", "counter", "Запросы к БД из HTTP запросов", sessions["queries"]),
+    ]
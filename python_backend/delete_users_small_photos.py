@@ -11,9 +11,10 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
 
-from db_utils import db_all, db_run
+from db_utils import db_all
 from database import init_database
-from config import DATA_BASE_PATH
+from config import DATA_BASE_PATH, BULK_DELETE_MAX_USERS
+from services import users as users_service
 
 BACKUP_FILE = "deleted_users_small_photos.json"
 MIN_PHOTO_SIZE = 100 * 1024  # 100 КБ в байтах
@@ -117,7 +118,7 @@ async def save_backup(users):
     print(f"✅ Список сохранен в {BACKUP_FILE}")
 
 async def delete_users(user_ids):
-    """Удалить пользователей из БД"""
+    """Удалить пользователей со всеми связанными данными (пачками, каждая одной транзакцией)"""
     if not user_ids:
         print("⚠️ Нет пользователей для удаления")
         return 0
@@ -125,14 +126,13 @@ async def delete_users(user_ids):
     print(f"\n🗑️ Удаляю {len(user_ids)} пользователей...")
     
     deleted_count = 0
-    for i, user_id in enumerate(user_ids, 1):
+    for start in range(0, len(user_ids), BULK_DELETE_MAX_USERS):
+        batch = user_ids[start:start + BULK_DELETE_MAX_USERS]
         try:
-            await db_run('DELETE FROM users WHERE "userId" = ?', [user_id])
-            deleted_count += 1
-            if i % 10 == 0:
-                print(f"  ✅ Удалено {i}/{len(user_ids)} пользователей...")
+            deleted_count += len(await users_service.delete_users(batch))
+            print(f"  ✅ Удалено {deleted_count}/{len(user_ids)} пользователей...")
         except Exception as e:
-            print(f"  ❌ Ошибка при удалении пользователя {user_id}: {e}")
+            print(f"  ❌ Ошибка при удалении пачки из {len(batch)} пользователей: {e}")
     
     print(f"\n✅ Удалено {deleted_count} пользователей из {len(user_ids)}")
     return deleted_count
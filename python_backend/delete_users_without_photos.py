@@ -2,7 +2,7 @@
 Скрипт для поиска и удаления пользователей без фото
 1. Находит всех пользователей без фото (photo1, photo2, photo3, photoUrl, photoBot все пустые)
 2. Сохраняет список удаляемых пользователей в файл
-3. Удаляет их из БД
+3. Удаляет их из БД вместе со связанными данными (services/users.delete_users)
 
 Использование:
     python3 delete_users_without_photos.py          # с подтверждением
@@ -17,8 +17,10 @@ from pathlib import Path
 # Добавляем путь к модулям
 sys.path.insert(0, str(Path(__file__).parent))
 
-from db_utils import db_get, db_all, db_run
+from db_utils import db_all
 from database import init_database
+from config import BULK_DELETE_MAX_USERS
+from services import users as users_service
 
 BACKUP_FILE = "deleted_users_without_photos.json"
 
@@ -47,18 +49,8 @@ async def find_users_without_photos():
         )
     """
     
-    # SQL запрос без параметров - используем прямой запрос
-    from database import pg_pool
-    from psycopg2.extras import RealDictCursor
-    
-    conn = pg_pool.getconn()
-    try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute(sql)  # SQL уже адаптирован для PostgreSQL
-        rows = cur.fetchall()
-        rows = [dict(row) for row in rows]
-    finally:
-        pg_pool.putconn(conn)
+    # SQL запрос без параметров - db_all не передает параметры драйверу, % в LIKE безопасны
+    rows = await db_all(sql)
     
     users = []
     for row in rows:
@@ -91,7 +83,7 @@ async def save_backup(users):
     print(f"✅ Список сохранен в {BACKUP_FILE}")
 
 async def delete_users(user_ids):
-    """Удалить пользователей из БД"""
+    """Удалить пользователей со всеми связанными данными (пачками, каждая одной транзакцией)"""
     if not user_ids:
         print("⚠️ Нет пользователей для удаления")
         return 0
@@ -99,15 +91,13 @@ async def delete_users(user_ids):
     print(f"\n🗑️ Удаляю {len(user_ids)} пользователей...")
     
     deleted_count = 0
-    for i, user_id in enumerate(user_ids, 1):
+    for start in range(0, len(user_ids), BULK_DELETE_MAX_USERS):
+        batch = user_ids[start:start + BULK_DELETE_MAX_USERS]
         try:
-            # Удаляем пользователя
-            await db_run('DELETE FROM users WHERE "userId" = ?', [user_id])
-            deleted_count += 1
-            if i % 10 == 0:
-                print(f"  ✅ Удалено {i}/{len(user_ids)} пользователей...")
+            deleted_count += len(await users_service.delete_users(batch))
+            print(f"  ✅ Удалено {deleted_count}/{len(user_ids)} пользователей...")
         except Exception as e:
-            print(f"  ❌ Ошибка при удалении пользователя {user_id}: {e}")
+            print(f"  ❌ Ошибка при удалении пачки из {len(batch)} пользователей: {e}")
     
     print(f"\n✅ Удалено {deleted_count} пользователей из {len(user_ids)}")
     return deleted_count
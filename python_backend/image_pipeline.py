@@ -0,0 +1,243 @@
+"""
+image_pipeline.py
+Обработка загруженного фото за одно декодирование.
+
+Заголовок читается один раз (формат, размеры, EXIF ориентация) - этого достаточно
+для валидации. Пиксели декодируются тоже один раз:
+- JPEG без поворота в RGB/grayscale сохраняется как есть, а для детекции лиц
+  и вариантов декодируется сразу в уменьшенном виде (draft, масштабирование DCT);
+- остальное (HEIC, PNG, WEBP, CMYK, повернутые JPEG) декодируется в один кадр,
+  из которого получаются и JPEG для сохранения, и NumPy массив для детекции.
+Из того же кадра кодируются WebP варианты для ленты, превью и аватарок (PHOTO_VARIANTS).
+"""
+import io
+import time
+from typing import Dict, Optional, Tuple
+import numpy as np
+from PIL import Image, ImageOps
+from config import (
+    MAX_IMAGE_DIMENSION, FACE_DETECT_MAX_SIDE,
+    PHOTO_CARD_SIZE, PHOTO_THUMB_SIZE, PHOTO_AVATAR_SIZE, PHOTO_WEBP_QUALITY
+)
+import opencv_utils
+import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = metrics.histogram(
+    "image_pipeline_stage_seconds", "CPU время этапов обработки загруженного фото", ["stage"]
+)
+
+# Поддержка HEIC формата
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    logger.info("✅ Поддержка HEIC формата включена")
+except ImportError:
+    logger.warning("⚠️ pillow-heif не установлен, поддержка HEIC отключена")
+except Exception as e:
+    logger.warning(f"⚠️ Ошибка инициализации HEIC: {e}")
+
+SUPPORTED_FORMATS = ['JPEG', 'PNG', 'WEBP', 'HEIF', 'HEIC']
+JPEG_QUALITY = 90
+EXIF_ORIENTATION = 0x0112
+
+# Сигнатуры поддерживаемых форматов (первые SIGNATURE_SIZE байт файла)
+SIGNATURE_SIZE = 12
+HEIF_BRANDS = {b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis", b"mif1", b"msf1"}
+
+# Варианты фото: имя -> (длинная сторона, квадратная обрезка)
+PHOTO_VARIANTS = {
+    "card": (PHOTO_CARD_SIZE, False),     # Карточка в ленте и просмотр мэтча
+    "thumb": (PHOTO_THUMB_SIZE, False),   # Превью в профиле
+    "avatar": (PHOTO_AVATAR_SIZE, True),  # Аватар в списке мэтчей
+}
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Формат по сигнатуре в начале файла (None - не изображение или неподдерживаемый формат)"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return 'JPEG'
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return 'PNG'
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return 'WEBP'
+    if head[4:8] == b"ftyp" and head[8:12] in HEIF_BRANDS:
+        return 'HEIF'
+    return None
+
+
+class ProcessedImage:
+    """Результат обработки: байты для сохранения (JPEG) и результат проверки лица"""
+
+    def __init__(
+        self,
+        content: bytes,
+        width: int,
+        height: int,
+        face_count: int,
+        reencoded: bool,
+        variants: Optional[Dict[str, bytes]] = None,
+        timings: Optional[Dict[str, float]] = None
+    ):
+        self.content = content
+        self.width = width
+        self.height = height
+        self.face_count = face_count
+        self.reencoded = reencoded  # False - сохраняются исходные байты
+        self.variants = variants or {}  # Имя варианта -> WebP
+        # Этап -> секунды (decode, detect, variants); замеряется в процессе пула, в метрики пишет вызывающий
+        self.timings = timings or {}
+
+    @property
+    def has_face(self) -> bool:
+        return self.face_count > 0
+
+
+class ImagePipeline:
+    """Загруженное фото: заголовок читается в конструкторе, пиксели - только в run()"""
+
+    def __init__(self, content: bytes):
+        self.content = content
+        try:
+            # Image.open читает только заголовок
+            self.image = Image.open(io.BytesIO(content))
+            self.orientation = self.image.getexif().get(EXIF_ORIENTATION, 1)
+        except Exception as e:
+            raise ValueError(f"Некорректный файл изображения: {e}")
+        self.format = self.image.format
+        self.width, self.height = self.image.size
+
+    def validate(self) -> None:
+        """Проверка формата и размеров по заголовку (ValueError с текстом для клиента)"""
+        if self.format not in SUPPORTED_FORMATS:
+            raise ValueError(f"Неподдерживаемый формат изображения: {self.format}")
+        if self.width > MAX_IMAGE_DIMENSION or self.height > MAX_IMAGE_DIMENSION:
+            raise ValueError(
+                f"Изображение слишком большое. Максимальный размер: {MAX_IMAGE_DIMENSION}x{MAX_IMAGE_DIMENSION}"
+            )
+        if self.width == 0 or self.height == 0:
+            raise ValueError("Некорректное изображение")
+
+    @property
+    def needs_reencode(self) -> bool:
+        """Нужно ли перекодировать в JPEG (другой формат, цветовое пространство или EXIF поворот)"""
+        return self.format != 'JPEG' or self.image.mode not in ('RGB', 'L') or self.orientation not in (None, 1)
+
+    def decode(self, min_side: int = 0) -> Image.Image:
+        """
+        Единственное декодирование: поворот по EXIF и приведение к RGB.
+        min_side > 0 - JPEG можно декодировать уменьшенным (draft), но не меньше min_side
+        """
+        try:
+            if min_side > 0 and self.format == 'JPEG':
+                self.image.draft('RGB', (min_side, min_side))
+            frame = ImageOps.exif_transpose(self.image)
+            if frame.mode != 'RGB':
+                frame = frame.convert('RGB')
+            return frame
+        except Exception as e:
+            raise ValueError(f"Некорректный файл изображения: {e}")
+
+    @staticmethod
+    def detection_input(
+        frame: Image.Image,
+        max_side: int = FACE_DETECT_MAX_SIDE,
+        original_side: Optional[int] = None
+    ) -> Tuple[np.ndarray, float]:
+        """Grayscale массив для детекции из уже декодированного кадра (длинная сторона <= max_side)"""
+        side = max(frame.size)
+        small = frame
+        if 0 < max_side < side:
+            ratio = max_side / side
+            small = frame.resize(
+                (max(1, round(frame.width * ratio)), max(1, round(frame.height * ratio))),
+                Image.BILINEAR,
+                reducing_gap=2.0
+            )
+        # Массив создается через array interface Pillow, без промежуточных байтов
+        gray = np.asarray(small.convert('L'))
+        return gray, (original_side or side) / max(gray.shape[:2])
+
+    @staticmethod
+    def encode(frame: Image.Image) -> bytes:
+        """Сохранить кадр в JPEG"""
+        buffer = io.BytesIO()
+        frame.save(buffer, format='JPEG', quality=JPEG_QUALITY)
+        return buffer.getvalue()
+
+    def run(self, max_side: int = FACE_DETECT_MAX_SIDE) -> ProcessedImage:
+        """Декодировать, нормализовать, найти лица и подготовить байты для сохранения"""
+        started = time.perf_counter()
+        if self.needs_reencode:
+            frame = self.decode()
+            content = self.encode(frame)
+            width, height = frame.size
+        else:
+            # Исходный JPEG сохраняется как есть, а для детекции и вариантов
+            # хватает кадра, декодированного сразу в уменьшенном виде
+            content = self.content
+            width, height = self.width, self.height
+            frame = self.decode(min_side=max(max_side, PHOTO_CARD_SIZE))
+        gray, scale = self.detection_input(frame, max_side, max(width, height))
+        decoded = time.perf_counter()
+
+        face_count = 0
+        if opencv_utils.opencv_available and opencv_utils.face_cascade is not None:
+            try:
+                face_count = len(opencv_utils.detect_faces_gray(gray, scale))
+            except Exception as e:
+                # Как и раньше: ошибка детекции = лицо не найдено
+                logger.error(f"Ошибка при проверке лица через OpenCV: {e}")
+        else:
+            logger.warning("OpenCV недоступен, считаем что лица нет")
+        detected = time.perf_counter()
+
+        variants = make_variants(frame)
+        timings = {
+            "decode": decoded - started,
+            "detect": detected - decoded,
+            "variants": time.perf_counter() - detected,
+        }
+        return ProcessedImage(content, width, height, face_count, self.needs_reencode, variants, timings)
+
+
+def observe_timings(processed: ProcessedImage) -> None:
+    """Записать этапы обработки (замерены в процессе пула) в метрики этого процесса"""
+    for stage, seconds in processed.timings.items():
+        STAGE_SECONDS.observe(seconds, stage)
+
+
+def make_variants(frame: Image.Image) -> Dict[str, bytes]:
+    """Закодировать все варианты фото (WebP) из декодированного кадра"""
+    variants = {}
+    for name, (size, square) in PHOTO_VARIANTS.items():
+        if square:
+            image = ImageOps.fit(frame, (size, size), Image.LANCZOS, centering=(0.5, 0.4))
+        else:
+            image = frame.copy()
+            image.thumbnail((size, size), Image.LANCZOS, reducing_gap=2.0)
+        buffer = io.BytesIO()
+        image.save(buffer, format='WEBP', quality=PHOTO_WEBP_QUALITY, method=4)
+        variants[name] = buffer.getvalue()
+    return variants
+
+
+def process_image(content: bytes) -> ProcessedImage:
+    """Полная обработка загруженного фото (выполняется в пуле процессов services/face_detection.py)"""
+    pipeline = ImagePipeline(content)
+    pipeline.validate()
+    return pipeline.run()
+
+
+def process_image_file(path: str) -> ProcessedImage:
+    """То же для загрузки во временном файле: байты не передаются между процессами"""
+    with open(path, "rb") as f:
+        return process_image(f.read())
+
+
+def process_variants(content: bytes) -> Dict[str, bytes]:
+    """Варианты для уже сохраненного фото (ленивая генерация, в пуле процессов)"""
+    pipeline = ImagePipeline(content)
+    return make_variants(pipeline.decode(min_side=PHOTO_CARD_SIZE))
@@ -0,0 +1,138 @@
+"""
+log_config.py
+Настройка логирования: уровни (общий и по модулям), текстовый или JSON формат,
+выборочное логирование частых сообщений и запись через очередь.
+
+Обработчик на event loop только кладет запись в очередь (QueueHandler),
+в stdout пишет отдельный поток (QueueListener) - медленный stdout не тормозит запросы.
+Горячие пути (db_utils, /api/getUser, /api/candidates, проверка лица) логируют
+на DEBUG с %-аргументами: при LOG_LEVEL=INFO сообщение даже не форматируется.
+
+    LOG_LEVELS=db_utils=DEBUG,routes.photos=WARNING
+    LOG_SAMPLING=routes.users=0.01
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Optional, TextIO
+from config import LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_SAMPLING, LOG_QUEUE
+
+# Атрибуты LogRecord, которые не попадают в JSON как extra-поля
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def parse_mapping(value: str) -> Dict[str, str]:
+    """"a=1,b.c=2" -> {"a": "1", "b.c": "2"} (пустые и некорректные пары пропускаются)"""
+    result = {}
+    for item in value.split(","):
+        name, sep, setting = item.partition("=")
+        if sep and name.strip() and setting.strip():
+            result[name.strip()] = setting.strip()
+    return result
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON: время, уровень, логгер, сообщение, extra-поля и traceback"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает долю rate записей ниже WARNING для логгера (и его дочерних).
+    Предупреждения и ошибки проходят всегда
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # Длинные префиксы проверяются первыми: routes.users.x -> routes.users, а не routes
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        for name, rate in self.rates:
+            if record.name == name or record.name.startswith(name + "."):
+                return random.random() < rate
+        return True
+
+
+def setup_logging(
+    level: str = LOG_LEVEL,
+    stream: Optional[TextIO] = None,
+    use_queue: bool = LOG_QUEUE,
+    fmt: str = LOG_FORMAT
+) -> None:
+    """
+    Настроить корневой логгер (повторный вызов заменяет настройку, так делает benchmark_logging.py)
+
+    Args:
+        stream: куда писать (по умолчанию stdout)
+        use_queue: писать через очередь в отдельном потоке
+        fmt: "text" или "json"
+    """
+    global _listener
+    stop_logging()
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    sampling = {}
+    for name, rate in parse_mapping(LOG_SAMPLING).items():
+        try:
+            sampling[name] = float(rate)
+        except ValueError:
+            pass
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+
+    if use_queue:
+        log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        root_handler: logging.Handler = logging.handlers.QueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+        _listener.start()
+    else:
+        root_handler = handler
+    if sampling:
+        # Фильтр на обработчике корня: действует и на записи дочерних логгеров
+        root_handler.addFilter(SamplingFilter(sampling))
+    root.addHandler(root_handler)
+    root.setLevel(level.upper())
+
+    for name, module_level in parse_mapping(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(module_level.upper())
+
+
+def stop_logging() -> None:
+    """Дописать очередь и остановить поток записи (при завершении процесса)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -4,8 +4,11 @@ main.py
 """
 import os
 import sys
+import asyncio
+import hmac
+from typing import Optional
 from pathlib import Path
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, JSONResponse
@@ -13,7 +16,14 @@ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from dotenv import load_dotenv
-from middleware.error_handler import validation_exception_handler, http_exception_handler, general_exception_handler
+from middleware.db_session import DbSessionMiddleware
+from middleware.metrics import MetricsMiddleware
+from log_config import setup_logging
+from middleware.error_handler import (
+    validation_exception_handler, http_exception_handler, general_exception_handler,
+    pool_timeout_exception_handler, face_detection_busy_handler, upload_rejected_handler
+)
+from psycopg_pool import PoolTimeout
 from fastapi.exceptions import RequestValidationError
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import Response
@@ -23,16 +33,27 @@ import uvicorn
 # Добавляем текущую директорию в путь
 sys.path.insert(0, str(Path(__file__).parent))
 
-from database import init_database
-from db_utils import db_get
+from database import init_database, close_database
+from db_utils import (
+    db_get, get_pool_stats, get_statement_cache_stats, get_transaction_stats, get_long_transactions,
+    get_session_stats
+)
+from services import face_detection, http_clients, jobs, photo_server, profile_cache
+import metrics
+from services.face_detection import FaceDetectionBusy
+from services.upload_ingest import UploadRejected
 from config import (
     BOT_TOKEN, WEB_APP_URL, CORS_ORIGINS, LOCAL,
     RATE_LIMIT_PER_HOUR, RATE_LIMIT_PER_MINUTE,
-    IMAGES_DIR, PORT, DEBUG, ENVIRONMENT, LOG_LEVEL, MAX_FILE_SIZE, DATA_BASE_DIR
+    IMAGES_DIR, PORT, DEBUG, ENVIRONMENT, LOG_LEVEL, MAX_FILE_SIZE, DATA_BASE_DIR,
+    METRICS_ENABLED, METRICS_TOKEN
 )
 
 load_dotenv()
 
+# Уровни, формат и очередь логов (LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_QUEUE)
+setup_logging()
+
 # Lifespan для запуска/остановки бота
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -49,6 +70,31 @@ async def lifespan(app: FastAPI):
     from config import extract_data_if_needed
     extract_data_if_needed()
     
+    # Фоновый перенос лайков/дизлайков/мэтчей из JSONB в user_edges
+    from services.edges import backfill_edges_from_jsonb
+    from config import EDGES_BACKFILL_BATCH_SIZE
+    app.state.edges_backfill = asyncio.create_task(backfill_edges_from_jsonb(EDGES_BACKFILL_BATCH_SIZE))
+    
+    # Пул процессов для детекции лиц
+    face_detection.start()
+    
+    # Общие HTTP клиенты (Telegram API, загрузка фото по URL)
+    await http_clients.start()
+    
+    # Удаление фото без ссылок из хранилища
+    from services.photo_store import run_garbage_collector
+    app.state.photo_gc = asyncio.create_task(run_garbage_collector())
+    
+    # Выделенный сервер фото (PHOTO_SERVER_PORT), чтобы скачивание фото не конкурировало с API
+    photo_server.start()
+    
+    # Воркер фоновых задач (таблица jobs)
+    jobs.start()
+    
+    # Замер задержки event loop для /metrics
+    if METRICS_ENABLED:
+        app.state.loop_monitor = asyncio.create_task(metrics.monitor_event_loop())
+    
     # Запуск бота
     print("=" * 70)
     print("🤖 Запуск Telegram бота...")
@@ -69,11 +115,42 @@ async def lifespan(app: FastAPI):
     print("🛑 FASTAPI SHUTDOWN: Остановка бота...")
     print("=" * 70)
     
+    # Сначала задачи: рассылка отправляет сообщения через бота (незавершенные вернутся в очередь)
+    await jobs.stop()
+    
     try:
         from bot import stop_bot
         await stop_bot()
     except Exception as e:
         print(f"⚠️ Ошибка при остановке бота: {e}")
+    
+    # Останавливаем перенос связей, если он еще идет
+    edges_backfill = getattr(app.state, "edges_backfill", None)
+    if edges_backfill and not edges_backfill.done():
+        edges_backfill.cancel()
+    
+    # Останавливаем сборку мусора хранилища фото
+    photo_gc = getattr(app.state, "photo_gc", None)
+    if photo_gc and not photo_gc.done():
+        photo_gc.cancel()
+    
+    loop_monitor = getattr(app.state, "loop_monitor", None)
+    if loop_monitor and not loop_monitor.done():
+        loop_monitor.cancel()
+    
+    # Останавливаем выделенный сервер фото и пул детекции лиц
+    photo_server.stop()
+    face_detection.stop()
+    
+    # Закрываем соединения общих HTTP клиентов и бэкенда кэша профилей
+    await http_clients.stop()
+    await profile_cache.close()
+    
+    # Закрываем пул соединений БД
+    try:
+        await close_database()
+    except Exception as e:
+        print(f"⚠️ Ошибка при закрытии пула БД: {e}")
 
 
 # Инициализация FastAPI с lifespan
@@ -145,6 +222,13 @@ app.add_middleware(
     max_age=3600,  # Кеш preflight запросов на 1 час
 )
 
+# Сессия БД на запрос: Server-Timing с числом запросов и временем в БД (внешний слой - видит весь запрос)
+app.add_middleware(DbSessionMiddleware)
+
+# Задержка запросов по роутам для /metrics (самый внешний слой - учитывает все middleware)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Статические файлы из public/
 public_dir = Path(__file__).parent.parent / "public"
 if public_dir.exists():
@@ -168,9 +252,10 @@ async def favicon():
         return FileResponse(str(favicon_path))
     return {"detail": "Not found"}
 
-# Статические изображения
+# Фото пользователей: ETag/304, Range, WebP варианты создаются при первом запросе
 if Path(IMAGES_DIR).exists():
-    app.mount("/data/img", StaticFiles(directory=IMAGES_DIR), name="images")
+    from services.photo_server import PhotoServer
+    app.mount("/data/img", PhotoServer(IMAGES_DIR), name="images")
 # Подарки больше не используются
 
 # HTML файл (простой статический HTML)
@@ -208,6 +293,9 @@ app.include_router(payment.router, prefix="/api/payment", tags=["payment"])
 # Обработчики ошибок
 app.add_exception_handler(RequestValidationError, validation_exception_handler)
 app.add_exception_handler(HTTPException, http_exception_handler)
+app.add_exception_handler(PoolTimeout, pool_timeout_exception_handler)
+app.add_exception_handler(FaceDetectionBusy, face_detection_busy_handler)
+app.add_exception_handler(UploadRejected, upload_rejected_handler)
 app.add_exception_handler(Exception, general_exception_handler)
 
 # Инициализация БД и проверка безопасности (вызывается в lifespan)
@@ -468,6 +556,36 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/api/health/db")
+async def health_db():
+    """Состояние пула соединений БД (насыщение, очередь ожидания, таймауты), транзакций, кэша SQL, кэша профилей и пула детекции лиц"""
+    try:
+        return {
+            "status": "ok",
+            "pool": get_pool_stats(),
+            "statements": get_statement_cache_stats(),
+            "face_detection": face_detection.get_stats(),
+            "photos": photo_server.get_stats(),
+            "http": http_clients.get_stats(),
+            "jobs": jobs.get_stats(),
+            "profiles": profile_cache.get_stats(),
+            "transactions": {**get_transaction_stats(), "server": await get_long_transactions()},
+            "requests": get_session_stats()
+        }
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint(authorization: Optional[str] = Header(None)):
+    """Метрики в формате Prometheus (при METRICS_TOKEN - только с Authorization: Bearer <токен>)"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not found")
+    if METRICS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Требуется авторизация", headers={"WWW-Authenticate": "Bearer"})
+    return Response(await metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.get("/api/statsDay")
 async def stats_day():
     """Алиас для /api/stats/day (для команды бота)"""
@@ -0,0 +1,259 @@
+"""
+metrics.py
+Метрики в формате Prometheus (text exposition 0.0.4) для эндпоинта /metrics.
+
+Два способа отдать метрику:
+- счетчик/гистограмма, которые модуль обновляет на горячем пути (counter, gauge, histogram);
+- коллектор (@collector): вызывается при каждом запросе /metrics и переводит уже
+  существующие счетчики модуля (get_stats, get_pool_stats) в семейства метрик.
+
+Метки только с ограниченным набором значений (шаблон роута, тип запроса, таблица),
+не userId и не URL: у каждой метрики не больше METRICS_MAX_SERIES рядов, лишние
+значения меток сводятся в "other".
+
+    REQUESTS = metrics.counter("uploads_total", "Загрузки фото", ["result"])
+    REQUESTS.inc("face")
+
+    LATENCY = metrics.histogram("render_seconds", "Время рендера", ["page"])
+    with LATENCY.time("profile"):
+        ...
+"""
+import asyncio
+import inspect
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from config import METRICS_MAX_SERIES, METRICS_LOOP_LAG_INTERVAL
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы бакетов по умолчанию (секунды): от 5 мс до 10 сек
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Запросы к БД и задержка event loop: от 1 мс
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+OTHER = "other"
+
+
+class Family(NamedTuple):
+    """Семейство метрик от коллектора: имя, тип (counter/gauge), описание, ряды (метки, значение)"""
+    name: str
+    kind: str
+    help: str
+    samples: List[Tuple[Dict[str, Any], float]]
+
+
+def value_family(name: str, kind: str, help_text: str, value: float) -> Family:
+    """Семейство из одного ряда без меток"""
+    return Family(name, kind, help_text, [({}, value)])
+
+
+def labeled_family(name: str, kind: str, help_text: str, label: str, values: Dict[str, float]) -> Family:
+    """Семейство с одной меткой: {"hit": 10, "miss": 2} -> name{label="hit"} 10, ..."""
+    return Family(name, kind, help_text, [({label: key}, value) for key, value in values.items()])
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._overflow = False
+
+    def _key(self, label_values: Tuple[Any, ...]) -> Tuple[str, ...]:
+        if len(label_values) != len(self.labels):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labels}, передано {label_values}")
+        key = tuple(str(value) for value in label_values)
+        if key not in self._values and len(self._values) >= METRICS_MAX_SERIES:
+            # Защита от неограниченных меток: новые ряды сверх лимита сводятся в один
+            if not self._overflow:
+                self._overflow = True
+                logger.warning(f"Метрика {self.name}: больше {METRICS_MAX_SERIES} рядов, новые значения меток -> '{OTHER}'")
+            key = (OTHER,) * len(self.labels)
+        return key
+
+    def _series(self) -> Iterator[Tuple[Dict[str, str], Any]]:
+        for key, value in sorted(self._values.items()):
+            yield dict(zip(self.labels, key)), value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self._series():
+            lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+    kind = "counter"
+
+    def inc(self, *label_values: Any, amount: float = 1) -> None:
+        key = self._key(label_values)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Текущее значение (может уменьшаться)"""
+    kind = "gauge"
+
+    def set(self, value: float, *label_values: Any) -> None:
+        self._values[self._key(label_values)] = value
+
+    def inc(self, *label_values: Any, amount: float = 1) -> None:
+        key = self._key(label_values)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *label_values: Any, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram(_Metric):
+    """Распределение значений по бакетам (для p50/p99 через histogram_quantile)"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *label_values: Any) -> None:
+        key = self._key(label_values)
+        series = self._values.get(key)
+        if series is None:
+            # [счетчики бакетов (последний - +Inf), сумма, количество]
+            series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values: Any) -> Iterator[None]:
+        """Замерить время блока (в секундах), в том числе при исключении"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self._series():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels({**labels, "le": _format_value(float(bound))})
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+_metrics: Dict[str, _Metric] = {}
+_collectors: List[Callable[[], Any]] = []
+
+
+def _register(metric: _Metric) -> Any:
+    existing = _metrics.get(metric.name)
+    if existing is not None:
+        # Повторный импорт модуля (скрипты, тесты) получает ту же метрику
+        return existing
+    _metrics[metric.name] = metric
+    return metric
+
+
+def counter(name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+    return _register(Counter(name, help_text, labels))
+
+
+def gauge(name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+    return _register(Gauge(name, help_text, labels))
+
+
+def histogram(name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help_text, labels, buckets))
+
+
+def collector(fn: Callable[[], Any]) -> Callable[[], Any]:
+    """
+    Зарегистрировать коллектор: функция (или корутина) без аргументов, возвращающая список Family.
+    Вызывается только при запросе /metrics
+    """
+    _collectors.append(fn)
+    return fn
+
+
+def _render_family(family: Family) -> List[str]:
+    lines = [f"# HELP {family.name} {family.help}", f"# TYPE {family.name} {family.kind}"]
+    for labels, value in family.samples:
+        lines.append(f"{family.name}{_format_labels(labels)} {_format_value(value)}")
+    return lines
+
+
+async def render() -> str:
+    """Все метрики процесса в текстовом формате Prometheus"""
+    lines: List[str] = []
+    for metric in list(_metrics.values()):
+        lines.extend(metric.render())
+    for fn in _collectors:
+        try:
+            families = fn()
+            if inspect.isawaitable(families):
+                families = await families
+            for family in families:
+                lines.extend(_render_family(family))
+        except Exception as e:
+            # Источник недоступен (пул БД не запущен и т.п.) - остальные метрики отдаются
+            logger.warning(f"Коллектор метрик {getattr(fn, '__qualname__', fn)} не отработал: {e}")
+    return "\n".join(lines) + "\n"
+
+
+EVENT_LOOP_LAG = histogram(
+    "event_loop_lag_seconds",
+    "Задержка срабатывания таймера event loop (время, когда loop был занят синхронным кодом)",
+    buckets=FAST_BUCKETS
+)
+EVENT_LOOP_LAG_LAST = gauge("event_loop_lag_last_seconds", "Задержка event loop при последнем замере")
+
+
+@collector
+def _event_loop_metrics() -> Iterable[Family]:
+    return [value_family("event_loop_tasks", "gauge", "Задачи asyncio в event loop", len(asyncio.all_tasks()))]
+
+
+async def monitor_event_loop(interval: Optional[float] = None) -> None:
+    """
+    Фоновая задача: спит interval и меряет, насколько позже запланированного проснулась.
+    Задержка - время, на которое loop блокировал синхронный код (CPU, блокирующий I/O)
+    """
+    interval = interval or METRICS_LOOP_LAG_INTERVAL
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        EVENT_LOOP_LAG.observe(lag)
+        EVENT_LOOP_LAG_LAST.set(lag)
@@ -6,10 +6,13 @@ import re
 import hmac
 import hashlib
 import urllib.parse
+import logging
 from fastapi import HTTPException, Header, Request
 from typing import Optional, List
 from config import ADMIN_TELEGRAM_IDS, ADMIN_TOKEN, BOT_TOKEN
 
+logger = logging.getLogger(__name__)
+
 
 def validate_telegram_id(telegram_id: str) -> str:
     """
@@ -86,7 +89,7 @@ def verify_telegram_init_data(init_data: str) -> Optional[str]:
         
     except Exception as e:
         # В случае ошибки не блокируем, просто не используем initData
-        print(f"⚠️ Ошибка проверки initData: {e}")
+        logger.warning(f"⚠️ Ошибка проверки initData: {e}")
         return None
 
 
@@ -144,14 +147,14 @@ def verify_admin(request: Request, authorization: Optional[str] = Header(None))
         # Проверяем что ID в списке администраторов (безопасное сравнение)
         if telegram_user_id not in ADMIN_TELEGRAM_IDS:
             # Логируем попытку доступа (без чувствительных данных)
-            print(f"⚠️ Попытка доступа к admin endpoint с Telegram ID: {telegram_user_id[:3]}***")
+            logger.warning(f"⚠️ Попытка доступа к admin endpoint с Telegram ID: {telegram_user_id[:3]}***")
             raise HTTPException(
                 status_code=403,
                 detail="Доступ запрещен. Ваш Telegram ID не в списке администраторов"
             )
         
         # Успешная авторизация
-        print(f"✅ Admin доступ разрешен для Telegram ID: {telegram_user_id[:3]}***")
+        logger.info(f"✅ Admin доступ разрешен для Telegram ID: {telegram_user_id[:3]}***")
         return True
     
     # Проверка через токен (старый способ, для обратной совместимости)
@@ -171,7 +174,7 @@ def verify_admin(request: Request, authorization: Optional[str] = Header(None))
             
             # Безопасное сравнение токенов (защита от timing attack)
             if not hmac.compare_digest(token, ADMIN_TOKEN):
-                print("⚠️ Попытка доступа с неверным токеном")
+                logger.warning("⚠️ Попытка доступа с неверным токеном")
                 raise HTTPException(status_code=403, detail="Неверный токен")
             
             return True
@@ -180,10 +183,20 @@ def verify_admin(request: Request, authorization: Optional[str] = Header(None))
     
     # Если ничего не установлено, разрешаем доступ (только для разработки!)
     # В продакшене это должно быть обязательным
-    print("⚠️ ВНИМАНИЕ: ADMIN_TELEGRAM_IDS или ADMIN_TOKEN не установлены! Admin endpoints доступны без авторизации!")
+    logger.warning("⚠️ ВНИМАНИЕ: ADMIN_TELEGRAM_IDS или ADMIN_TOKEN не установлены! Admin endpoints доступны без авторизации!")
     return True
 
 
+def is_admin_telegram_id(telegram_id) -> bool:
+    """
+    Проверка прав администратора без HTTP запроса (команды бота вызывают сервисы напрямую)
+    Если ADMIN_TELEGRAM_IDS не установлен, достаточно проверки DEV_CHAT_ID в самой команде.
+    """
+    if not ADMIN_TELEGRAM_IDS:
+        return True
+    return str(telegram_id) in ADMIN_TELEGRAM_IDS
+
+
 def verify_admin_token(authorization: Optional[str] = Header(None)) -> bool:
     """
     Устаревшая функция для обратной совместимости
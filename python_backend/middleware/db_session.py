@@ -0,0 +1,49 @@
+"""
+middleware/db_session.py
+Сессия БД на HTTP запрос: счетчик запросов и время в БД (заголовок Server-Timing),
+возврат соединения сессии в пул, как только начинается отправка ответа
+"""
+from db_utils import begin_session, end_session
+from config import DB_REQUEST_QUERIES_WARN
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class DbSessionMiddleware:
+    """
+    Чистый ASGI middleware (не BaseHTTPMiddleware): эндпоинт выполняется в том же контексте,
+    поэтому видит сессию, а зависимость use_db_session включает в ней одно соединение на запрос
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+
+        session = begin_session()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                # Обработчик закончил: соединение больше не нужно на время отправки тела
+                await session.release()
+                if session.queries:
+                    headers = list(message.get("headers", []))
+                    headers.append((
+                        b"server-timing",
+                        f'db;dur={session.db_ms:.1f};desc="{session.queries} queries"'.encode()
+                    ))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            await end_session(session)
+            if DB_REQUEST_QUERIES_WARN and session.queries > DB_REQUEST_QUERIES_WARN:
+                logger.warning(
+                    f"{scope['method']} {scope['path']}: {session.queries} запросов к БД, {session.db_ms:.1f} мс"
+                )
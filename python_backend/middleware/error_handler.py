@@ -34,6 +34,45 @@ async def http_exception_handler(request: Request, exc):
     )
 
 
+async def pool_timeout_exception_handler(request: Request, exc: Exception):
+    """Пул соединений БД исчерпан: не удалось получить соединение за DB_POOL_TIMEOUT"""
+    logger.warning(f"Пул соединений БД исчерпан на {request.method} {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={
+            "success": False,
+            "error": "Сервер перегружен, попробуйте позже"
+        },
+        headers={"Retry-After": "1"}
+    )
+
+
+async def face_detection_busy_handler(request: Request, exc: Exception):
+    """Пул детекции лиц перегружен: очередь заполнена или проверка не уложилась в таймаут"""
+    logger.warning(f"Детекция лиц недоступна на {request.method} {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={
+            "success": False,
+            "error": "Сервер перегружен проверкой фото, попробуйте позже"
+        },
+        headers={"Retry-After": str(getattr(exc, "retry_after", 1))}
+    )
+
+
+async def upload_rejected_handler(request: Request, exc: Exception):
+    """Загрузка отклонена по ходу чтения тела: остаток тела не читается, соединение закрывается"""
+    logger.warning(f"Загрузка отклонена на {request.method} {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=getattr(exc, "status_code", status.HTTP_400_BAD_REQUEST),
+        content={
+            "success": False,
+            "error": str(exc)
+        },
+        headers={"Connection": "close"}
+    )
+
+
 async def general_exception_handler(request: Request, exc: Exception):
     """Обработка общих исключений (безопасное логирование)"""
     # Логируем без чувствительных данных
@@ -2,11 +2,14 @@
 middleware/logging.py
 Логирование подозрительной активности для безопасности
 """
+import logging
 import time
 from typing import Dict, List
 from collections import defaultdict
 from fastapi import Request
 
+logger = logging.getLogger(__name__)
+
 # Хранилище подозрительной активности (в продакшене лучше использовать Redis)
 _suspicious_activity: Dict[str, List[float]] = defaultdict(list)
 
@@ -40,13 +43,13 @@ def log_suspicious_activity(request: Request, activity_type: str, details: str =
     recent_requests = len(_suspicious_activity[client_ip])
     
     if recent_requests > MAX_REQUESTS_PER_MINUTE:
-        print(f"⚠️ [SECURITY] Подозрительная активность: IP={client_ip}, "
-              f"Тип={activity_type}, Запросов за минуту={recent_requests}, "
-              f"Детали={details}")
+        logger.warning(f"⚠️ [SECURITY] Подозрительная активность: IP={client_ip}, "
+                       f"Тип={activity_type}, Запросов за минуту={recent_requests}, "
+                       f"Детали={details}")
     
     # Логируем все подозрительные события
-    print(f"🔍 [SECURITY] {activity_type}: IP={client_ip}, "
-          f"Path={request.url.path}, Детали={details}")
+    logger.info(f"🔍 [SECURITY] {activity_type}: IP={client_ip}, "
+                f"Path={request.url.path}, Детали={details}")
 
 
 def check_rate_limit(client_ip: str, max_per_minute: int = MAX_REQUESTS_PER_MINUTE) -> bool:
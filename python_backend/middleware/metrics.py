@@ -0,0 +1,55 @@
+"""
+middleware/metrics.py
+Метрики HTTP запросов: гистограмма задержки по методу, шаблону роута и классу статуса
+"""
+import time
+import metrics
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP запроса до конца отправки ответа",
+    ["method", "route", "status"]
+)
+HTTP_REQUESTS_IN_PROGRESS = metrics.gauge("http_requests_in_progress", "HTTP запросы в обработке")
+
+
+def route_label(scope) -> str:
+    """
+    Шаблон роута ("/api/getUser", "/api/jobs/{job_id}"), а не фактический путь:
+    FastAPI кладет найденный роут в scope. Для смонтированных приложений (статика, фото) -
+    префикс монтирования, для ненайденных путей - "unmatched"
+    """
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "unmatched")
+    return scope.get("root_path") or "unmatched"
+
+
+class MetricsMiddleware:
+    """Чистый ASGI middleware (внешний слой): меряет запрос целиком, включая остальные middleware"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_PROGRESS.dec()
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started, scope["method"], route_label(scope), f"{status // 100}xx"
+            )
@@ -6,9 +6,8 @@ import re
 from pathlib import Path
 from typing import Optional
 from fastapi import HTTPException
-from PIL import Image
-import io
-from config import MAX_FILE_SIZE, MAX_IMAGE_DIMENSION
+from config import MAX_FILE_SIZE
+from image_pipeline import ImagePipeline
 
 # Разрешенные MIME типы изображений
 ALLOWED_MIME_TYPES = {
@@ -93,32 +92,19 @@ def validate_file_size(content: bytes) -> None:
 def validate_image_content(content: bytes) -> None:
     """
     Валидация содержимого изображения: проверка что это действительно изображение
+    (формат и размеры читаются из заголовка, пиксели не декодируются)
     """
     try:
         # Проверяем размер
         validate_file_size(content)
         
-        # Пытаемся открыть как изображение
-        image = Image.open(io.BytesIO(content))
-        
-        # Проверяем формат (добавлена поддержка HEIC/HEIF)
-        supported_formats = ['JPEG', 'PNG', 'WEBP', 'HEIF', 'HEIC']
-        if image.format not in supported_formats:
-            raise HTTPException(status_code=400, detail=f"Неподдерживаемый формат изображения: {image.format}")
-        
-        # Проверяем размеры (защита от слишком больших изображений)
-        if image.width > MAX_IMAGE_DIMENSION or image.height > MAX_IMAGE_DIMENSION:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Изображение слишком большое. Максимальный размер: {MAX_IMAGE_DIMENSION}x{MAX_IMAGE_DIMENSION}"
-            )
-        
-        # Проверяем что это не пустое изображение
-        if image.width == 0 or image.height == 0:
-            raise HTTPException(status_code=400, detail="Некорректное изображение")
+        # Проверяем формат (с поддержкой HEIC/HEIF) и размеры
+        ImagePipeline(content).validate()
         
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Некорректный файл изображения: {str(e)}")
 
@@ -0,0 +1,85 @@
+"""
+Перенос старых фото (/data/img/<userId>/PhotoN.jpg) в хранилище по содержимому
+1. Для каждого пользователя с локальными фото кладет файл в /data/img/blobs (photo_store.store)
+2. Переписывает photo1..3 и photoUrl (если он указывал на то же фото) на новый URL
+3. Удаляет старый файл и его варианты
+
+Повторный запуск безопасен: уже перенесенные фото пропускаются.
+
+Использование:
+    python3 migrate_photos_to_store.py
+"""
+import asyncio
+import sys
+from pathlib import Path
+from typing import Optional
+
+# Добавляем путь к модулям
+sys.path.insert(0, str(Path(__file__).parent))
+
+from db_utils import db_all, db_run
+from database import init_database
+from config import IMAGES_DIR
+from services import photo_store, photo_variants
+
+PHOTO_COLUMNS = ("photo1", "photo2", "photo3")
+
+
+def legacy_path(photo_url: str) -> Optional[Path]:
+    """Путь к старому файлу по URL или None (внешние ссылки, заглушки, хранилище)"""
+    if not photo_url or not photo_url.startswith(photo_variants.PHOTO_URL_PREFIX):
+        return None
+    if photo_store.digest_from_url(photo_url):
+        return None
+    relative = photo_url[len(photo_variants.PHOTO_URL_PREFIX):]
+    path = (Path(IMAGES_DIR) / relative).resolve()
+    if not path.is_relative_to(Path(IMAGES_DIR).resolve()) or not path.is_file():
+        return None
+    return path
+
+
+async def migrate_user(row) -> int:
+    """Перенести фото одного пользователя, вернуть количество перенесенных"""
+    migrated = 0
+    for column in PHOTO_COLUMNS:
+        photo_url = row.get(column)
+        path = legacy_path(photo_url)
+        if path is None:
+            continue
+
+        new_url = await photo_store.store(path.read_bytes())
+        await db_run(
+            f'''UPDATE users SET "{column}" = ?,
+                   "photoUrl" = CASE WHEN "photoUrl" = ? THEN ? ELSE "photoUrl" END
+               WHERE "userId" = ? AND "{column}" = ?''',
+            [new_url, photo_url, new_url, row["userId"], photo_url]
+        )
+        path.unlink(missing_ok=True)
+        photo_variants.delete_variants(path)
+        migrated += 1
+    return migrated
+
+
+async def main():
+    await init_database()
+
+    print("🔍 Ищу пользователей со старыми путями к фото...")
+    rows = await db_all(
+        """SELECT "userId", "photo1", "photo2", "photo3" FROM users
+           WHERE "photo1" LIKE '/data/img/%' OR "photo2" LIKE '/data/img/%' OR "photo3" LIKE '/data/img/%'"""
+    )
+
+    total = 0
+    for index, row in enumerate(rows, 1):
+        try:
+            total += await migrate_user(row)
+        except Exception as e:
+            print(f"❌ Ошибка переноса фото пользователя {row['userId']}: {e}")
+        if index % 100 == 0:
+            print(f"   Обработано пользователей: {index}/{len(rows)}, перенесено фото: {total}")
+
+    print(f"✅ Перенесено фото: {total} (пользователей: {len(rows)})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
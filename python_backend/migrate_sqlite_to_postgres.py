@@ -66,13 +66,13 @@ async def insert_user_to_postgres(user: Dict[str, Any]) -> bool:
         print("❌ PostgreSQL pool не инициализирован")
         return False
     
-    conn = pg_pool.getconn()
+    conn = await pg_pool.getconn()
     try:
         cur = conn.cursor()
         
         # Проверяем, существует ли пользователь
-        cur.execute('SELECT "userId" FROM users WHERE "userId" = %s', (user.get('userId'),))
-        exists = cur.fetchone()
+        await cur.execute('SELECT "userId" FROM users WHERE "userId" = %s', (user.get('userId'),))
+        exists = await cur.fetchone()
         
         if exists:
             print(f"⏭️  Пользователь {user.get('userId')} уже существует, пропускаем")
@@ -152,7 +152,7 @@ async def insert_user_to_postgres(user: Dict[str, Any]) -> bool:
             )
         """
         
-        cur.execute(insert_sql, (
+        await cur.execute(insert_sql, (
             user_id, name, username, photo_url, gender, bio, age, blocked, badge,
             need_photo, about, looking_for, warned, push_sent, is_pro,
             pro_start, pro_end, last_login, super_likes_count, hide_age,
@@ -160,18 +160,18 @@ async def insert_user_to_postgres(user: Dict[str, Any]) -> bool:
             created_at
         ))
         
-        conn.commit()
+        await conn.commit()
         print(f"✅ Пользователь {user_id} ({name}) добавлен в PostgreSQL")
         return True
         
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         print(f"❌ Ошибка вставки пользователя {user.get('userId')}: {e}")
         import traceback
         traceback.print_exc()
         return False
     finally:
-        pg_pool.putconn(conn)
+        await pg_pool.putconn(conn)
 
 
 async def migrate_users():
@@ -215,17 +215,17 @@ async def migrate_users():
             # Проверяем, был ли это пропуск существующего пользователя
             pg_pool = get_pg_pool()
             if pg_pool:
-                conn = pg_pool.getconn()
+                conn = await pg_pool.getconn()
                 try:
                     cur = conn.cursor()
-                    cur.execute('SELECT "userId" FROM users WHERE "userId" = %s', (user.get('userId'),))
-                    if cur.fetchone():
+                    await cur.execute('SELECT "userId" FROM users WHERE "userId" = %s', (user.get('userId'),))
+                    if await cur.fetchone():
                         skip_count += 1
                         success_count -= 1
                     else:
                         error_count += 1
                 finally:
-                    pg_pool.putconn(conn)
+                    await pg_pool.putconn(conn)
             else:
                 error_count += 1
     
@@ -3,39 +3,142 @@ opencv_utils.py
 Утилиты для работы с OpenCV (детекция лиц)
 """
 import cv2
+import io
+import time
 import numpy as np
-from typing import Tuple, Optional
+from PIL import Image
+from typing import List, Tuple, Optional
+from config import FACE_DETECT_MAX_SIDE
+import metrics
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Детекция в процессах пула (image_pipeline) попадает в image_pipeline_stage_seconds{stage="detect"}
+# через ProcessedImage.timings; здесь - прямые вызовы check_face_in_photo в этом процессе
+CHECK_FACE_SECONDS = metrics.histogram("opencv_check_face_seconds", "Время check_face_in_photo (декодирование и поиск лиц)")
+
 # Инициализация каскада для детекции лиц
-print("🔍 [OpenCV] Начинаем инициализацию OpenCV...")
 try:
-    print("🔍 [OpenCV] Импорт cv2 успешен, версия:", cv2.__version__)
+    logger.debug("OpenCV %s, загружаем каскады", cv2.__version__)
     cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_alt2.xml'
-    print(f"🔍 [OpenCV] Загружаем каскад: {cascade_path}")
     face_cascade = cv2.CascadeClassifier(cascade_path)
     if face_cascade.empty():
-        print("⚠️ [OpenCV] Первый каскад пустой, пробуем fallback...")
         # Fallback на другой каскад
+        logger.warning("⚠️ [OpenCV] Каскад %s пустой, пробуем fallback", cascade_path)
         fallback_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        print(f"🔍 [OpenCV] Загружаем fallback каскад: {fallback_path}")
         face_cascade = cv2.CascadeClassifier(fallback_path)
         if face_cascade.empty():
-            print("❌ [OpenCV] Fallback каскад тоже пустой!")
             raise Exception("Оба каскада пустые")
     opencv_available = True
-    print("✅ [OpenCV] OpenCV инициализирован успешно, каскад загружен")
-    print(f"✅ [OpenCV] Проверка каскада: face_cascade is not None = {face_cascade is not None}, empty() = {face_cascade.empty()}")
     logger.info("✅ OpenCV инициализирован успешно")
 except Exception as e:
     opencv_available = False
     face_cascade = None
-    print(f"❌ [OpenCV] OpenCV недоступен: {e}")
-    import traceback
-    print(f"❌ [OpenCV] Traceback: {traceback.format_exc()}")
-    logger.warning(f"⚠️ OpenCV недоступен: {e}")
+    logger.warning(f"⚠️ OpenCV недоступен: {e}", exc_info=True)
+
+
+# Флаги cv2.imread для декодирования JPEG сразу в уменьшенном виде (масштабирование DCT)
+_REDUCED_GRAYSCALE_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+] if opencv_available else []
+
+# Минимальный размер лица в пикселях исходного фото
+MIN_FACE_SIZE = 50
+# Размер окна каскада: меньше искать бессмысленно
+CASCADE_WINDOW = 20
+
+
+def _image_size(image_buffer: bytes) -> Optional[Tuple[int, int]]:
+    """Размер изображения из заголовка (без декодирования пикселей)"""
+    try:
+        with Image.open(io.BytesIO(image_buffer)) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def decode_for_detection(image_buffer: bytes, max_side: int = FACE_DETECT_MAX_SIDE) -> Tuple[Optional[np.ndarray], float]:
+    """
+    Декодировать изображение в grayscale с длинной стороной не больше max_side
+
+    JPEG декодируется сразу в 1/2, 1/4 или 1/8 размера (IMREAD_REDUCED_GRAYSCALE_*),
+    остаток доводится cv2.resize. Полноразмерный цветной кадр не создается.
+
+    Returns:
+        (grayscale изображение или None, коэффициент для пересчета координат в исходное фото)
+    """
+    nparr = np.frombuffer(image_buffer, np.uint8)
+    size = _image_size(image_buffer)
+    flag = cv2.IMREAD_GRAYSCALE
+    if size and max_side > 0:
+        long_side = max(size)
+        for factor, reduced_flag in _REDUCED_GRAYSCALE_FLAGS:
+            if long_side // factor >= max_side:
+                flag = reduced_flag
+                break
+
+    gray = cv2.imdecode(nparr, flag)
+    if gray is None or gray.size == 0:
+        return None, 1.0
+
+    original_side = max(size) if size else max(gray.shape[:2])
+    gray = downscale_gray(gray, max_side)
+    return gray, original_side / max(gray.shape[:2])
+
+
+def downscale_gray(gray: np.ndarray, max_side: int = FACE_DETECT_MAX_SIDE) -> np.ndarray:
+    """Уменьшить grayscale изображение до длинной стороны max_side (0 - без изменений)"""
+    side = max(gray.shape[:2])
+    if max_side <= 0 or side <= max_side:
+        return gray
+    ratio = max_side / side
+    return cv2.resize(gray, None, fx=ratio, fy=ratio, interpolation=cv2.INTER_AREA)
+
+
+def detect_faces(image_buffer: bytes, max_side: int = FACE_DETECT_MAX_SIDE) -> List[Tuple[int, int, int, int]]:
+    """
+    Найти лица на уменьшенной копии изображения
+
+    Args:
+        image_buffer: Байты изображения
+        max_side: Длинная сторона изображения для детекции (0 - исходный размер)
+
+    Returns:
+        Список (x, y, w, h) в координатах исходного изображения
+    """
+    gray, scale = decode_for_detection(image_buffer, max_side)
+    if gray is None:
+        raise ValueError("Не удалось декодировать изображение")
+    return detect_faces_gray(gray, scale)
+
+
+def detect_faces_gray(gray: np.ndarray, scale: float = 1.0) -> List[Tuple[int, int, int, int]]:
+    """
+    Найти лица на уже декодированном grayscale изображении
+
+    Args:
+        gray: Grayscale изображение (uint8)
+        scale: Во сколько раз исходное фото больше gray
+
+    Returns:
+        Список (x, y, w, h) в координатах исходного изображения
+    """
+    # Минимальный размер лица задан для исходного фото - пересчитываем для уменьшенного
+    min_face = max(CASCADE_WINDOW, int(round(MIN_FACE_SIZE / scale)))
+    faces = face_cascade.detectMultiScale(
+        gray,
+        scaleFactor=1.1,  # Масштаб для поиска (меньше = точнее, но медленнее)
+        minNeighbors=3,   # Минимум соседей для подтверждения (меньше = больше ложных срабатываний, но находит больше лиц)
+        minSize=(min_face, min_face),
+        flags=cv2.CASCADE_SCALE_IMAGE
+    )
+    return [
+        (int(x * scale), int(y * scale), int(w * scale), int(h * scale))
+        for (x, y, w, h) in faces
+    ]
 
 
 def check_face_in_photo(image_buffer: bytes) -> Tuple[bool, int]:
@@ -48,126 +151,25 @@ def check_face_in_photo(image_buffer: bytes) -> Tuple[bool, int]:
     Returns:
         Tuple[bool, int]: (успех, количество лиц)
     """
-    import time
     start_time = time.time()
     
-    print("=" * 80)
-    print(f"🔍 [OpenCV] ========== НАЧАЛО ПРОВЕРКИ ЛИЦА ==========")
-    print(f"🔍 [OpenCV] Размер буфера: {len(image_buffer)} байт")
-    print(f"🔍 [OpenCV] opencv_available: {opencv_available}")
-    print(f"🔍 [OpenCV] face_cascade is None: {face_cascade is None}")
-    
-    if face_cascade is not None:
-        print(f"🔍 [OpenCV] face_cascade.empty(): {face_cascade.empty()}")
-    
     if not opencv_available or face_cascade is None:
-        print("❌ [OpenCV] OpenCV недоступен, НЕ пропускаем проверку - возвращаем False")
         logger.warning("OpenCV недоступен, возвращаем False для проверки лица")
-        print("=" * 80)
         return False, 0  # Возвращаем False, чтобы требовать фото с лицом
     
     try:
-        print("🔍 [OpenCV] Шаг 1: Декодируем изображение из буфера...")
-        # Декодируем изображение из буфера
-        nparr = np.frombuffer(image_buffer, np.uint8)
-        print(f"🔍 [OpenCV] nparr создан, размер: {len(nparr)} элементов")
-        
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        decode_time = time.time() - start_time
-        print(f"🔍 [OpenCV] Декодирование заняло: {decode_time:.3f} сек")
-        
-        if img is None:
-            print("❌ [OpenCV] cv2.imdecode вернул None - изображение не декодировано")
-            logger.error("Не удалось декодировать изображение из буфера")
-            print("=" * 80)
-            return False, 0  # Возвращаем False при ошибке декодирования
-        
-        if img.size == 0:
-            print("❌ [OpenCV] Размер изображения = 0")
-            logger.error("Размер изображения = 0")
-            print("=" * 80)
-            return False, 0
-        
-        print(f"🔍 [OpenCV] Изображение декодировано успешно")
-        print(f"🔍 [OpenCV] Размер изображения (shape): {img.shape}")
-        print(f"🔍 [OpenCV] Тип данных: {img.dtype}")
-        print(f"🔍 [OpenCV] Размер в пикселях: {img.shape[0]}x{img.shape[1]}")
-        
-        # Конвертируем в grayscale
-        print("🔍 [OpenCV] Шаг 2: Конвертируем в grayscale...")
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        print(f"🔍 [OpenCV] Grayscale создан, размер: {gray.shape}")
-        print(f"🔍 [OpenCV] Диапазон значений: min={gray.min()}, max={gray.max()}")
-        
-        # Детектируем лица
-        print("🔍 [OpenCV] Шаг 3: Начинаем детекцию лиц...")
-        print(f"🔍 [OpenCV] Параметры детекции:")
-        print(f"  - scaleFactor: 1.1")
-        print(f"  - minNeighbors: 3")
-        print(f"  - minSize: (50, 50)")
-        print(f"  - flags: CASCADE_SCALE_IMAGE")
-        print(f"🔍 [OpenCV] Размер изображения для детекции: {gray.shape[1]}x{gray.shape[0]}")
-        
-        detect_start = time.time()
-        faces = face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,  # Масштаб для поиска (меньше = точнее, но медленнее)
-            minNeighbors=3,   # Минимум соседей для подтверждения (меньше = больше ложных срабатываний, но находит больше лиц)
-            minSize=(50, 50), # Минимальный размер лица в пикселях (увеличено для лучшей точности)
-            flags=cv2.CASCADE_SCALE_IMAGE
-        )
-        detect_time = time.time() - detect_start
-        print(f"🔍 [OpenCV] Детекция заняла: {detect_time:.3f} сек")
-        
+        faces = detect_faces(image_buffer)
         face_count = len(faces)
-        print(f"🔍 [OpenCV] Результат detectMultiScale: {type(faces)}")
-        print(f"🔍 [OpenCV] Количество найденных лиц: {face_count}")
-        
-        if face_count > 0:
-            print(f"🔍 [OpenCV] Координаты найденных лиц:")
-            for i, (x, y, w, h) in enumerate(faces):
-                print(f"  Лицо {i+1}: x={x}, y={y}, width={w}, height={h}")
-                print(f"    Размер: {w}x{h} пикселей")
-                print(f"    Позиция: ({x}, {y})")
-        else:
-            print("⚠️ [OpenCV] Лица не найдены!")
-            print(f"🔍 [OpenCV] Попробуем с более мягкими параметрами...")
-            # Пробуем с более мягкими параметрами для отладки
-            faces_soft = face_cascade.detectMultiScale(
-                gray,
-                scaleFactor=1.05,
-                minNeighbors=2,
-                minSize=(30, 30),
-                flags=cv2.CASCADE_SCALE_IMAGE
-            )
-            print(f"🔍 [OpenCV] С мягкими параметрами найдено: {len(faces_soft)} лиц")
-            if len(faces_soft) > 0:
-                print(f"🔍 [OpenCV] Координаты (мягкие параметры):")
-                for i, (x, y, w, h) in enumerate(faces_soft):
-                    print(f"  Лицо {i+1}: x={x}, y={y}, width={w}, height={h}")
-        
         total_time = time.time() - start_time
-        print(f"🔍 [OpenCV] Общее время проверки: {total_time:.3f} сек")
-        
-        logger.info(f"OpenCV: найдено лиц: {face_count}")
+        CHECK_FACE_SECONDS.observe(total_time)
+        logger.debug("OpenCV: найдено лиц: %d за %.3f сек (буфер %d байт)", face_count, total_time, len(image_buffer))
         
         if face_count == 0:
-            print("⚠️ [OpenCV] ========== РЕЗУЛЬТАТ: ЛИЦО НЕ НАЙДЕНО ==========")
-            print("=" * 80)
             return False, 0
-        
-        print(f"✅ [OpenCV] ========== РЕЗУЛЬТАТ: ЛИЦО НАЙДЕНО ({face_count} шт.) ==========")
-        print("=" * 80)
         return True, face_count
         
     except Exception as e:
-        print(f"❌ [OpenCV] ========== ОШИБКА ПРИ ПРОВЕРКЕ ЛИЦА ==========")
-        print(f"❌ [OpenCV] Ошибка: {e}")
         logger.error(f"Ошибка при проверке лица через OpenCV: {e}")
-        import traceback
-        print(f"❌ [OpenCV] Traceback:")
-        print(traceback.format_exc())
-        print("=" * 80)
         return False, 0  # Возвращаем False при ошибке, чтобы требовать фото с лицом
 
 
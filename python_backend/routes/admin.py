@@ -8,6 +8,17 @@ from pydantic import BaseModel
 from db_utils import db_get, db_all, db_run
 from middleware.auth import verify_admin
 from middleware.security import validate_user_id
+from services import badges, candidate_queue, jobs, maintenance, pro, profile_cache, user_listing
+from services.admin_help import ADMIN_HELP
+from services.badges import InvalidBadge
+from services import users as users_service
+from services.users import UserNotFound
+from utils.cursor import encode_cursor, decode_cursor
+from config import USERS_PAGE_SIZE, USERS_MAX_PAGE_SIZE, BULK_DELETE_MAX_USERS
+from fastapi.responses import StreamingResponse
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -40,24 +51,38 @@ async def get_user_data_for_badge(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[get-user-data-for-badge] Ошибка: {e}")
+        logger.exception(f"[get-user-data-for-badge] Ошибка: {e}")
         raise HTTPException(status_code=500, detail="Ошибка получения данных пользователя")
 
 
 @router.get("/get-all-users-for-admin")
 async def get_all_users_for_admin(
     request: Request,
+    fields: Optional[str] = Query(None, description="Поля через запятую (по умолчанию все, кроме JSONB массивов)"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (nextCursor)"),
+    limit: int = Query(USERS_PAGE_SIZE, ge=1, le=USERS_MAX_PAGE_SIZE, description="Размер страницы"),
+    format: str = Query("json", pattern="^(json|ndjson)$", description="json - страница, ndjson - поток всех пользователей"),
     authorization: Optional[str] = Header(None)
 ):
-    """Получить всех пользователей (админ, требует авторизации)"""
+    """Получить пользователей постранично или NDJSON потоком (админ, требует авторизации)"""
     verify_admin(request, authorization)
     try:
-        users = await db_all("SELECT * FROM users")
-        return {"success": True, "users": users}
+        columns = user_listing.parse_fields(fields, user_listing.ADMIN_FIELDS)
+        after_id = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if format == "ndjson":
+        return StreamingResponse(user_listing.stream_ndjson(columns, after_id), media_type="application/x-ndjson")
+    
+    try:
+        users, last_id = await user_listing.get_users_page(columns, after_id, limit)
+        next_cursor = encode_cursor(last_id) if last_id is not None else None
+        return {"success": True, "users": users, "nextCursor": next_cursor}
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[get-all-users-for-admin] Ошибка: {e}")
+        logger.exception(f"[get-all-users-for-admin] Ошибка: {e}")
         raise HTTPException(status_code=500, detail="Ошибка получения пользователей")
 
 
@@ -78,15 +103,16 @@ async def search_users_for_admin(
     
     try:
         search_term = f"%{query}%"
+        columns = ", ".join(f'"{field}"' for field in user_listing.ADMIN_FIELDS)
         users = await db_all(
-            'SELECT * FROM users WHERE name LIKE ? OR username LIKE ? OR "userId" LIKE ?',
-            [search_term, search_term, search_term]
+            f'SELECT {columns} FROM users WHERE name LIKE ? OR username LIKE ? OR "userId" LIKE ? ORDER BY id LIMIT ?',
+            [search_term, search_term, search_term, USERS_MAX_PAGE_SIZE]
         )
         return {"success": True, "users": users}
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[search-users-for-admin] Ошибка: {e}")
+        logger.exception(f"[search-users-for-admin] Ошибка: {e}")
         raise HTTPException(status_code=500, detail="Ошибка поиска пользователей")
 
 
@@ -130,11 +156,14 @@ async def update_user_for_admin(
         result = await db_run(sql, params)
         if result.get("changes", 0) == 0:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
+        await profile_cache.invalidate(userId)
+        # Карточка в лентах других пользователей (имя, описание, возраст, бейдж), блокировка и пол
+        await candidate_queue.on_user_changed(userId)
         return {"success": True, "message": "Данные пользователя обновлены"}
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[update-user-for-admin] Ошибка: {e}")
+        logger.exception(f"[update-user-for-admin] Ошибка: {e}")
         raise HTTPException(status_code=500, detail="Ошибка обновления пользователя")
 
 
@@ -154,17 +183,50 @@ async def delete_user_for_admin(
         # Валидация userId
         userId = validate_user_id(userId)
         
-        result = await db_run('DELETE FROM users WHERE "userId" = ?', [userId])
-        if result.get("changes", 0) == 0:
-            raise HTTPException(status_code=404, detail="Пользователь не найден")
+        await users_service.delete_user(userId)
         return {"success": True, "message": "Пользователь удален"}
+    except UserNotFound:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[delete-user-for-admin] Ошибка: {e}")
+        logger.exception(f"[delete-user-for-admin] Ошибка: {e}")
         raise HTTPException(status_code=500, detail="Ошибка удаления пользователя")
 
 
+@router.post("/delete-users-for-admin")
+async def delete_users_for_admin(
+    request: Request,
+    data: Dict = Body(...),
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Массовое удаление пользователей со всеми связанными данными (админ, требует авторизации).
+    До BULK_DELETE_MAX_USERS id удаляются сразу одной транзакцией, больше - фоновой задачей.
+    """
+    verify_admin(request, authorization)
+    userIds = data.get("userIds")
+    if not isinstance(userIds, list) or not userIds:
+        raise HTTPException(status_code=400, detail="userIds (список) обязателен")
+    
+    userIds = list(dict.fromkeys(validate_user_id(str(userId)) for userId in userIds))
+    try:
+        if len(userIds) > BULK_DELETE_MAX_USERS:
+            job_id = await users_service.enqueue_delete_users(userIds)
+            return {"success": True, "queued": len(userIds), "jobId": job_id}
+        
+        deleted = await users_service.delete_users(userIds)
+        deleted_set = set(deleted)
+        return {
+            "success": True,
+            "deleted": deleted,
+            "notFound": [userId for userId in userIds if userId not in deleted_set]
+        }
+    except Exception as e:
+        logger.exception(f"[delete-users-for-admin] Ошибка: {e}")
+        raise HTTPException(status_code=500, detail="Ошибка массового удаления пользователей")
+
+
 @router.post("/send-message-for-admin")
 async def send_message_for_admin(
     request: Request,
@@ -188,12 +250,12 @@ async def send_message_for_admin(
     
     try:
         # TODO: Реализовать отправку через Telegram Bot API
-        print(f"Сообщение для {userId}: {message}")
+        logger.info("Сообщение для %s: %s", userId, message)
         return {"success": True, "message": "Сообщение отправлено (симуляция)."}
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[send-message-for-admin] Ошибка: {e}")
+        logger.exception(f"[send-message-for-admin] Ошибка: {e}")
         raise HTTPException(status_code=500, detail="Ошибка отправки сообщения")
 
 
@@ -209,30 +271,16 @@ async def update_badge(
         # Валидация
         userId = validate_user_id(data.userId)
         
-        # Извлекаем букву бейджа из URL, если передан URL (например, "/label/S.svg" -> "S")
-        badge_value = data.badge
-        if badge_value.startswith("/label/") and badge_value.endswith(".svg"):
-            # Извлекаем букву из пути: "/label/S.svg" -> "S"
-            badge_value = badge_value.replace("/label/", "").replace(".svg", "").upper()
-        elif "/" in badge_value or "." in badge_value:
-            # Если это похоже на путь, но не стандартный формат, пытаемся извлечь последнюю часть
-            badge_value = badge_value.split("/")[-1].replace(".svg", "").upper()
-        
-        # Валидация badge (только разрешенные значения)
-        allowed_badges = {"", "L", "P", "S", "DN", "LV", "VERIFIED", "PREMIUM", "ADMIN"}
-        badge_value_upper = badge_value.upper()
-        if badge_value_upper not in allowed_badges:
-            raise HTTPException(status_code=400, detail=f"Недопустимый бейдж: {badge_value}. Разрешенные значения: {', '.join(allowed_badges)}")
-        
-        # Сохраняем в верхнем регистре для консистентности
-        result = await db_run('UPDATE users SET badge = ? WHERE "userId" = ?', [badge_value_upper, userId])
-        if result.get("changes", 0) == 0:
-            raise HTTPException(status_code=404, detail="Пользователь не найден")
+        await badges.update_badge(userId, data.badge)
         return {"success": True, "message": f"Бейдж для пользователя {userId} обновлен."}
+    except InvalidBadge as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UserNotFound:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[updateBadge] Ошибка: {e}")
+        logger.exception(f"[updateBadge] Ошибка: {e}")
         raise HTTPException(status_code=500, detail="Ошибка обновления бейджа")
 
 
@@ -241,40 +289,60 @@ async def extract_data(
     request: Request,
     authorization: Optional[str] = Header(None)
 ):
-    """Распаковать данные из архива (админ, требует авторизации)"""
+    """Распаковать данные из архива в фоне (админ, требует авторизации)"""
     verify_admin(request, authorization)
     try:
-        from config import extract_data_if_needed
-        from pathlib import Path
-        
         # Проверяем наличие архива
-        tmp_dir = Path("/tmp")
-        archives = sorted(tmp_dir.glob("data-backup-*.tar.gz"), key=lambda p: p.stat().st_mtime, reverse=True)
-        
-        if not archives:
+        archive_path = maintenance.latest_data_archive()
+        if archive_path is None:
             return {"success": False, "message": "Архивы данных не найдены в /tmp"}
         
-        archive_path = archives[0]
-        
-        # Вызываем функцию распаковки
-        extract_data_if_needed()
-        
-        # Проверяем результат
-        from config import IMAGES_DIR
-        img_dir = Path(IMAGES_DIR)
-        img_count = sum(1 for _ in img_dir.rglob('*') if _.is_file()) if img_dir.exists() else 0
-        
+        # Распаковка идет фоновой задачей; статус - GET /api/jobs/{jobId}
+        job_id = await jobs.enqueue("extract_data", dedupe_key="extract_data")
         return {
             "success": True,
-            "message": f"Данные распакованы из {archive_path.name}",
+            "message": f"Распаковка {archive_path.name} поставлена в очередь",
             "archive": str(archive_path),
-            "images_count": img_count
+            "jobId": job_id
         }
     except Exception as e:
-        print(f"[extract-data] Ошибка: {e}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Ошибка распаковки данных: {str(e)}")
+        logger.exception(f"[extract-data] Ошибка: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка постановки распаковки в очередь: {str(e)}")
+
+
+@router.post("/regenerate-photo-variants")
+async def regenerate_photo_variants(
+    request: Request,
+    authorization: Optional[str] = Header(None)
+):
+    """Перегенерировать превью/WebP всех фото в фоне (админ, требует авторизации)"""
+    verify_admin(request, authorization)
+    job_id = await jobs.enqueue("regenerate_photo_variants", {}, dedupe_key="regenerate_photo_variants")
+    return {"success": True, "jobId": job_id}
+
+
+@router.get("/jobs")
+async def get_jobs_stats(
+    request: Request,
+    authorization: Optional[str] = Header(None)
+):
+    """Состояние очереди фоновых задач (админ, требует авторизации)"""
+    verify_admin(request, authorization)
+    return {"success": True, "queue": await jobs.get_queue_stats(), "workers": jobs.get_stats()}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: int,
+    request: Request,
+    authorization: Optional[str] = Header(None)
+):
+    """Статус фоновой задачи по id (админ, требует авторизации)"""
+    verify_admin(request, authorization)
+    job = await jobs.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return {"success": True, "job": job}
 
 
 @router.get("/pro-stats")
@@ -285,46 +353,9 @@ async def get_pro_stats(
     """Получить статистику PRO пользователей (админ, требует авторизации)"""
     verify_admin(request, authorization)
     try:
-        from datetime import datetime
-        
-        # Всего пользователей с is_pro = 1
-        total_pro_row = await db_get('SELECT COUNT(*) AS count FROM users WHERE is_pro = 1')
-        total_pro = total_pro_row.get("count", 0) if total_pro_row else 0
-        
-        # Активные PRO (с неистекшим сроком)
-        now = datetime.now().isoformat()
-        active_pro_row = await db_get(
-            'SELECT COUNT(*) AS count FROM users WHERE is_pro = 1 AND "pro_end" > ?',
-            [now]
-        )
-        active_pro = active_pro_row.get("count", 0) if active_pro_row else 0
-        
-        # Истекшие PRO
-        expired_pro = total_pro - active_pro
-        
-        # Всего пользователей
-        total_users_row = await db_get('SELECT COUNT(*) AS count FROM users')
-        total_users = total_users_row.get("count", 0) if total_users_row else 0
-        
-        # Процент PRO от общего числа
-        pro_percentage = round((total_pro / total_users * 100) if total_users > 0 else 0, 2)
-        active_pro_percentage = round((active_pro / total_users * 100) if total_users > 0 else 0, 2)
-        
-        return {
-            "success": True,
-            "stats": {
-                "total_pro": total_pro,
-                "active_pro": active_pro,
-                "expired_pro": expired_pro,
-                "total_users": total_users,
-                "pro_percentage": pro_percentage,
-                "active_pro_percentage": active_pro_percentage
-            }
-        }
+        return {"success": True, "stats": await pro.get_pro_stats()}
     except Exception as e:
-        print(f"[pro-stats] Ошибка: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"[pro-stats] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка получения статистики PRO: {str(e)}")
 
 
@@ -336,193 +367,7 @@ async def admin_help(
     """Получить список всех доступных команд для администратора"""
     verify_admin(request, authorization)
     
-    help_text = {
-        "title": "📋 Список команд для администратора",
-        "description": "Доступные команды бота и API эндпоинты",
-        "bot_commands": [
-            {
-                "command": "/start",
-                "description": "Начать работу с ботом",
-                "usage": "/start [buy_pro_menu]",
-                "example": "/start или /start buy_pro_menu"
-            },
-            {
-                "command": "/grantpro",
-                "description": "Выдать PRO подписку пользователю",
-                "usage": "/grantpro <userId> <days>",
-                "example": "/grantpro 307954967 30"
-            },
-            {
-                "command": "/addbadge",
-                "description": "Выдать бейдж пользователю",
-                "usage": "/addbadge <userId> <badge>",
-                "example": "/addbadge 307954967 S",
-                "note": "Доступные бейджи: L, P, S, DN, LV, VERIFIED, PREMIUM, ADMIN"
-            },
-            {
-                "command": "/stats",
-                "description": "Получить статистику приложения",
-                "usage": "/stats",
-                "example": "/stats"
-            },
-            {
-                "command": "/prostats",
-                "description": "Получить статистику PRO пользователей",
-                "usage": "/prostats",
-                "example": "/prostats",
-                "note": "Показывает общее количество PRO, активных PRO, истекших PRO и проценты"
-            },
-            {
-                "command": "/delete_user",
-                "description": "Удалить пользователя",
-                "usage": "/delete_user <userId>",
-                "example": "/delete_user 307954967"
-            },
-            {
-                "command": "/clear_photos",
-                "description": "Очистить фотографии пользователя",
-                "usage": "/clear_photos <userId>",
-                "example": "/clear_photos 307954967"
-            },
-            {
-                "command": "/masssend",
-                "description": "Массовая рассылка сообщений всем пользователям",
-                "usage": "/masssend <сообщение>",
-                "example": "/masssend Привет всем пользователям!"
-            },
-            {
-                "command": "/stats_users",
-                "description": "Получить статистику пользователей по полу",
-                "usage": "/stats_users",
-                "example": "/stats_users"
-            },
-            {
-                "command": "/sendto",
-                "description": "Отправить сообщение конкретному пользователю",
-                "usage": "/sendto <userId> <сообщение>",
-                "example": "/sendto 307954967 Привет! Это тестовое сообщение."
-            }
-        ],
-        "api_endpoints": [
-            {
-                "method": "GET",
-                "endpoint": "/api/admin/get-all-users-for-admin",
-                "description": "Получить всех пользователей",
-                "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>"
-            },
-            {
-                "method": "GET",
-                "endpoint": "/api/admin/search-users-for-admin?query=<query>",
-                "description": "Поиск пользователей по имени, username или userId",
-                "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
-                "example": "/api/admin/search-users-for-admin?query=Иван"
-            },
-            {
-                "method": "GET",
-                "endpoint": "/api/admin/get-user-data-for-badge?userId=<userId>",
-                "description": "Получить данные пользователя для заявки на бейдж",
-                "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
-                "example": "/api/admin/get-user-data-for-badge?userId=307954967"
-            },
-            {
-                "method": "POST",
-                "endpoint": "/api/admin/update-user-for-admin",
-                "description": "Обновить данные пользователя",
-                "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
-                "body": {
-                    "userId": "string (обязательно)",
-                    "name": "string (опционально)",
-                    "username": "string (опционально)",
-                    "bio": "string (опционально)",
-                    "age": "number (опционально)",
-                    "gender": "string (опционально)",
-                    "badge": "string (опционально)",
-                    "blocked": "boolean (опционально)",
-                    "is_pro": "boolean (опционально)",
-                    "pro_start": "string (опционально)",
-                    "pro_end": "string (опционально)",
-                    "warned": "boolean (опционально)",
-                    "pushSent": "boolean (опционально)"
-                },
-                "example": {
-                    "userId": "307954967",
-                    "name": "Новое имя",
-                    "badge": "S"
-                }
-            },
-            {
-                "method": "POST",
-                "endpoint": "/api/admin/delete-user-for-admin",
-                "description": "Удалить пользователя",
-                "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
-                "body": {
-                    "userId": "string (обязательно)"
-                },
-                "example": {
-                    "userId": "307954967"
-                }
-            },
-            {
-                "method": "POST",
-                "endpoint": "/api/admin/send-message-for-admin",
-                "description": "Отправить сообщение пользователю",
-                "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
-                "body": {
-                    "userId": "string (обязательно)",
-                    "message": "string (обязательно, макс. 4096 символов)"
-                },
-                "example": {
-                    "userId": "307954967",
-                    "message": "Привет!"
-                }
-            },
-            {
-                "method": "POST",
-                "endpoint": "/api/admin/updateBadge",
-                "description": "Обновить бейдж пользователя",
-                "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
-                "body": {
-                    "userId": "string (обязательно)",
-                    "badge": "string (обязательно: L, P, S, DN, LV, VERIFIED, PREMIUM, ADMIN или пустая строка)"
-                },
-                "example": {
-                    "userId": "307954967",
-                    "badge": "S"
-                }
-            },
-            {
-                "method": "POST",
-                "endpoint": "/api/admin/extract-data",
-                "description": "Распаковать данные из архива",
-                "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
-                "note": "Ищет последний архив data-backup-*.tar.gz в /tmp и распаковывает его"
-            },
-            {
-                "method": "GET",
-                "endpoint": "/api/admin/pro-stats",
-                "description": "Получить статистику PRO пользователей",
-                "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
-                "returns": {
-                    "total_pro": "Общее количество пользователей с PRO",
-                    "active_pro": "Количество активных PRO (с неистекшим сроком)",
-                    "expired_pro": "Количество истекших PRO",
-                    "total_users": "Общее количество пользователей",
-                    "pro_percentage": "Процент PRO от общего числа",
-                    "active_pro_percentage": "Процент активных PRO от общего числа"
-                },
-                "example": "/api/admin/pro-stats"
-            }
-        ],
-        "authorization": {
-            "methods": [
-                "Bearer Token: Authorization: Bearer <ADMIN_TOKEN>",
-                "Telegram ID: X-Telegram-User-Id: <telegram_id> (должен быть в ADMIN_TELEGRAM_IDS)"
-            ],
-            "note": "Для использования API эндпоинтов требуется авторизация через один из методов выше"
-        }
-    }
-    
     return {
         "success": True,
-        "help": help_text
+        "help": ADMIN_HELP
     }
@@ -6,7 +6,11 @@ from fastapi import APIRouter, Query, HTTPException, Body
 from typing import List, Dict, Optional
 from pydantic import BaseModel
 from db_utils import db_get, db_run, safe_json_parse
+from services import candidate_queue, profile_cache
 import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -24,11 +28,11 @@ async def get_goals(userId: str = Query(..., description="ID пользоват
         raise HTTPException(status_code=400, detail="userId обязателен")
     
     try:
-        row = await db_get("SELECT goals FROM users WHERE userId = ?", [userId])
+        row = await profile_cache.get_profile(userId)
         goals_arr = safe_json_parse(row.get("goals") if row else None, [])
         return {"success": True, "goals": goals_arr}
     except Exception as e:
-        print(f"GET /api/goals error: {e}")
+        logger.exception(f"GET /api/goals error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -46,9 +50,11 @@ async def update_goals(data: Dict = Body(...)):
     try:
         goals_str = json.dumps(goals)
         await db_run("UPDATE users SET goals = ? WHERE userId = ?", [goals_str, userId])
+        await profile_cache.invalidate(userId)
+        await candidate_queue.on_user_changed(userId)
         return {"success": True, "goals": goals}
     except Exception as e:
-        print(f"POST /api/goals error: {e}")
+        logger.exception(f"POST /api/goals error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -63,6 +69,8 @@ async def update_goals_advanced(data: UpdateGoalsRequest):
             # Заменить весь массив
             goals_str = json.dumps(data.goals)
             await db_run("UPDATE users SET goals = ? WHERE userId = ?", [goals_str, data.userId])
+            await profile_cache.invalidate(data.userId)
+            await candidate_queue.on_user_changed(data.userId)
             return {"success": True, "goals": data.goals}
         elif data.goal:
             # Добавить одну цель
@@ -72,12 +80,14 @@ async def update_goals_advanced(data: UpdateGoalsRequest):
                 goals_arr.append(data.goal)
             goals_str = json.dumps(goals_arr)
             await db_run("UPDATE users SET goals = ? WHERE userId = ?", [goals_str, data.userId])
+            await profile_cache.invalidate(data.userId)
+            await candidate_queue.on_user_changed(data.userId)
             return {"success": True, "goals": goals_arr}
         else:
             raise HTTPException(status_code=400, detail="Параметр goals должен быть массивом или goal строкой")
     except HTTPException:
         raise
     except Exception as e:
-        print(f"POST /api/updateGoals error: {e}")
+        logger.exception(f"POST /api/updateGoals error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -5,12 +5,18 @@ routes/likes.py
 from fastapi import APIRouter, Query, HTTPException, Body
 from typing import Dict, List
 from pydantic import BaseModel
-from db_utils import db_get, db_all, db_run, safe_json_parse
+from db_utils import db_get
 from utils.photo_url import normalize_photo_url
-import json
+from services import edges, candidate_queue, profile_cache
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Поля профиля в ответе /api/likesMade
+LIKED_USER_FIELDS = ("userId", "username", "photo1", "photo2", "photo3", "bio", "age", "name")
+
 
 class LikeRequest(BaseModel):
     fromUser: str
@@ -33,36 +39,14 @@ async def like_user(data: LikeRequest):
     if not data.toUser:
         raise HTTPException(status_code=400, detail="toUser обязателен")
     
-    # Получаем данные отправителя
-    from_user_row = await db_get("SELECT likes, matches FROM users WHERE userId = ?", [data.fromUser])
-    if not from_user_row:
+    # Лайк, проверка взаимности и мэтч - один атомарный запрос к БД
+    result = await edges.like(data.fromUser, data.toUser)
+    if not result["sender_exists"]:
         raise HTTPException(status_code=404, detail="Отправитель не найден")
-    
-    likes = safe_json_parse(from_user_row.get("likes"), [])
-    matches = safe_json_parse(from_user_row.get("matches"), [])
-    
-    # Добавляем лайк, если его еще нет
-    if data.toUser not in likes:
-        likes.append(data.toUser)
-        await db_run("UPDATE users SET likes = ? WHERE userId = ?", [json.dumps(likes), data.fromUser])
-    
-    # Проверяем взаимный лайк
-    to_user_row = await db_get("SELECT likes, matches FROM users WHERE userId = ?", [data.toUser])
-    if not to_user_row:
+    if not result["receiver_exists"]:
         raise HTTPException(status_code=404, detail="Получатель не найден")
-    
-    likes2 = safe_json_parse(to_user_row.get("likes"), [])
-    matches2 = safe_json_parse(to_user_row.get("matches"), [])
-    is_match = False
-    
-    if data.fromUser in likes2:
-        is_match = True
-        if data.toUser not in matches:
-            matches.append(data.toUser)
-            await db_run("UPDATE users SET matches = ? WHERE userId = ?", [json.dumps(matches), data.fromUser])
-        if data.fromUser not in matches2:
-            matches2.append(data.fromUser)
-            await db_run("UPDATE users SET matches = ? WHERE userId = ?", [json.dumps(matches2), data.toUser])
+    is_match = result["is_match"]
+    candidate_queue.on_swipe(data.fromUser, data.toUser)
     
     return {"success": True, "match": is_match}
 
@@ -73,14 +57,11 @@ async def dislike_user(data: DislikeRequest):
     if not data.toUser:
         raise HTTPException(status_code=400, detail="toUser обязателен")
     
-    from_user_row = await db_get("SELECT dislikes FROM users WHERE userId = ?", [data.fromUser])
-    if not from_user_row:
+    if not await profile_cache.get_profile(data.fromUser):
         raise HTTPException(status_code=404, detail="Отправитель не найден")
     
-    dislikes = safe_json_parse(from_user_row.get("dislikes"), [])
-    if data.toUser not in dislikes:
-        dislikes.append(data.toUser)
-        await db_run("UPDATE users SET dislikes = ? WHERE userId = ?", [json.dumps(dislikes), data.fromUser])
+    await edges.add_edge(data.fromUser, data.toUser, edges.KIND_DISLIKE)
+    candidate_queue.on_swipe(data.fromUser, data.toUser)
     
     return {"success": True}
 
@@ -91,30 +72,13 @@ async def remove_like(data: LikeRequest):
     if not data.toUser:
         raise HTTPException(status_code=400, detail="toUser обязателен")
     
-    from_user_row = await db_get("SELECT likes, matches FROM users WHERE userId = ?", [data.fromUser])
-    if not from_user_row:
+    if not await profile_cache.get_profile(data.fromUser):
         raise HTTPException(status_code=404, detail="Отправитель не найден")
     
-    likes = safe_json_parse(from_user_row.get("likes"), [])
-    matches = safe_json_parse(from_user_row.get("matches"), [])
-    
-    # Удаляем лайк, если он есть
-    if data.toUser in likes:
-        likes.remove(data.toUser)
-        await db_run("UPDATE users SET likes = ? WHERE userId = ?", [json.dumps(likes), data.fromUser])
-    
-    # Удаляем из matches, если есть взаимный лайк
-    if data.toUser in matches:
-        matches.remove(data.toUser)
-        await db_run("UPDATE users SET matches = ? WHERE userId = ?", [json.dumps(matches), data.fromUser])
-        
-        # Также удаляем из matches у получателя
-        to_user_row = await db_get("SELECT matches FROM users WHERE userId = ?", [data.toUser])
-        if to_user_row:
-            matches2 = safe_json_parse(to_user_row.get("matches"), [])
-            if data.fromUser in matches2:
-                matches2.remove(data.fromUser)
-                await db_run("UPDATE users SET matches = ? WHERE userId = ?", [json.dumps(matches2), data.toUser])
+    # Удаляем лайк и мэтч (у обоих пользователей), если он был
+    await edges.remove_edge(data.fromUser, data.toUser, edges.KIND_LIKE)
+    await edges.remove_match(data.fromUser, data.toUser)
+    candidate_queue.on_unswipe(data.fromUser)
     
     return {"success": True}
 
@@ -125,16 +89,11 @@ async def remove_dislike(data: DislikeRequest):
     if not data.toUser:
         raise HTTPException(status_code=400, detail="toUser обязателен")
     
-    from_user_row = await db_get("SELECT dislikes FROM users WHERE userId = ?", [data.fromUser])
-    if not from_user_row:
+    if not await profile_cache.get_profile(data.fromUser):
         raise HTTPException(status_code=404, detail="Отправитель не найден")
     
-    dislikes = safe_json_parse(from_user_row.get("dislikes"), [])
-    
-    # Удаляем дизлайк, если он есть
-    if data.toUser in dislikes:
-        dislikes.remove(data.toUser)
-        await db_run("UPDATE users SET dislikes = ? WHERE userId = ?", [json.dumps(dislikes), data.fromUser])
+    await edges.remove_edge(data.fromUser, data.toUser, edges.KIND_DISLIKE)
+    candidate_queue.on_unswipe(data.fromUser)
     
     return {"success": True}
 
@@ -158,52 +117,42 @@ async def superlike_user(data: SuperlikeRequest):
 @router.get("/likesReceived")
 async def get_likes_received(userId: str = Query(..., description="ID пользователя")):
     """Получить список пользователей, которые лайкнули текущего пользователя"""
-    # Находим всех пользователей, у которых в likes есть userId текущего пользователя
-    # Используем jsonb_array_elements_text для развертывания массива и проверки наличия значения
+    # Входящие лайки ищутся по индексу user_edges(to_user, kind, from_user)
     try:
-        sql = """
-            SELECT "userId"
-            FROM users
-            WHERE EXISTS (
-                SELECT 1
-                FROM jsonb_array_elements_text(likes::jsonb) AS elem
-                WHERE elem = %s
-            )
-        """
-        rows = await db_all(sql, [userId])
-        
-        if not rows:
+        users = await edges.get_sources(userId, edges.KIND_LIKE)
+        if not users:
             return {"success": True, "count": 0, "users": []}
         
-        # Извлекаем userId из результатов
-        users = [str(row["userId"]) for row in rows]
         count = len(users)
         return {"success": True, "count": count, "users": users}
     except Exception as e:
-        print(f"[GET /api/likesReceived] Ошибка: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"[GET /api/likesReceived] Ошибка: {e}")
         return {"success": True, "count": 0, "users": []}
 
 
+@router.get("/likesReceivedCount")
+async def get_likes_received_count(userId: str = Query(..., description="ID пользователя")):
+    """Количество лайков, полученных пользователем (без списка, одно чтение счетчика)"""
+    try:
+        count = await edges.count_likes_received(userId)
+        return {"success": True, "count": count}
+    except Exception as e:
+        logger.error(f"[GET /api/likesReceivedCount] Ошибка: {e}")
+        return {"success": True, "count": 0}
+
+
 @router.get("/likesMade")
 async def get_likes_made(userId: str = Query(..., description="ID пользователя")):
     """Получить список пользователей, которым поставил лайк текущий пользователь"""
-    user_row = await db_get("SELECT likes FROM users WHERE userId = ?", [userId])
-    if not user_row:
-        return {"success": True, "likes": []}
-    
-    liked_user_ids = safe_json_parse(user_row.get("likes"), [])
+    liked_user_ids = await edges.get_targets(userId, edges.KIND_LIKE)
     if not liked_user_ids:
         return {"success": True, "likes": []}
     
-    placeholders = ",".join(["?"] * len(liked_user_ids))
-    sql = f"""
-        SELECT userId, username, photo1, photo2, photo3, bio, age, name
-        FROM users
-        WHERE userId IN ({placeholders})
-    """
-    rows = await db_all(sql, liked_user_ids)
+    profiles = await profile_cache.get_profiles(liked_user_ids)
+    rows = [
+        {field: profile.get(field) for field in LIKED_USER_FIELDS}
+        for profile in profiles.values()
+    ]
     
     # Нормализуем URL фотографий
     for row in rows:
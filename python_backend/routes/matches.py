@@ -5,45 +5,38 @@ routes/matches.py
 from fastapi import APIRouter, Query, HTTPException, Body
 from typing import Dict, List
 from pydantic import BaseModel
-from db_utils import db_get, db_all, db_run, safe_json_parse
 from utils.photo_url import normalize_photo_url
-import json
+from services import edges, profile_cache
+from services.photo_variants import variant_url
 
 router = APIRouter()
 
 
+def _avatar(row: Dict) -> str:
+    """Аватар: photo1, если он задан, иначе photoUrl (как COALESCE(photo1, photoUrl))"""
+    return row["photo1"] if row.get("photo1") is not None else row.get("photoUrl")
+
+
 @router.get("/matches")
 async def get_matches(userId: str = Query(..., description="ID пользователя")):
     """Получить список совпадений пользователя"""
-    user_row = await db_get("SELECT matches FROM users WHERE userId = ?", [userId])
-    
-    if not user_row:
-        return {"success": True, "data": []}
-    
-    matches_arr = safe_json_parse(user_row.get("matches"), [])
+    matches_arr = await edges.get_targets(userId, edges.KIND_MATCH)
     if not matches_arr:
         return {"success": True, "data": []}
     
-    # Получаем информацию о пользователях из matches
-    placeholders = ",".join(["?"] * len(matches_arr))
-    sql = f"""
-        SELECT userId, userId AS id, name, username,
-               COALESCE(photo1, photoUrl) AS avatar
-        FROM users
-        WHERE userId IN ({placeholders})
-    """
-    rows = await db_all(sql, matches_arr)
+    # Профили из кэша, промахи - одним запросом
+    profiles = await profile_cache.get_profiles(matches_arr)
     
     data = [
         {
-            "id": row["id"],
+            "id": row["userId"],
             "userId": row["userId"],
             "name": row.get("name", ""),
             "username": row.get("username", ""),
-            "avatar": normalize_photo_url(row.get("avatar") or "/img/logo.svg"),
+            "avatar": variant_url(normalize_photo_url(_avatar(row) or "/img/logo.svg"), "avatar"),
             "mutual": True
         }
-        for row in rows
+        for row in profiles.values()
     ]
     
     return {"success": True, "data": data}
@@ -58,19 +51,8 @@ async def delete_match(data: Dict[str, str] = Body(...)):
     if not userId or not matchId:
         raise HTTPException(status_code=400, detail="userId и matchId обязательны")
     
-    async def update_matches(owner_id: str, id_to_remove: str):
-        """Обновить список matches для пользователя"""
-        row = await db_get("SELECT matches FROM users WHERE userId = ?", [owner_id])
-        if not row:
-            return
-        
-        matches = safe_json_parse(row.get("matches"), [])
-        new_matches = [m for m in matches if str(m) != str(id_to_remove)]
-        await db_run("UPDATE users SET matches = ? WHERE userId = ?", [json.dumps(new_matches), owner_id])
-    
     # Удаляем match у обоих пользователей
-    await update_matches(userId, matchId)
-    await update_matches(matchId, userId)
+    await edges.remove_match(userId, matchId)
     
     return {"success": True, "message": "Мэтч удален"}
 
@@ -2,77 +2,75 @@
 routes/photos.py
 Роуты для загрузки и обработки фотографий
 """
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Body, Request
-from typing import Optional, Dict
-import aiofiles
+from fastapi import APIRouter, HTTPException, Body, Request
+from typing import Dict
 from pathlib import Path
-import httpx
-import io
-from PIL import Image
 from db_utils import db_get, db_run
-from opencv_utils import check_face_in_photo, is_meme_or_fake
-from config import IMAGES_DIR, HTTP_TIMEOUT, HTTP_MAX_REDIRECTS
+from opencv_utils import is_meme_or_fake
+from services import candidate_queue, face_detection, http_clients, photo_store, photo_variants, profile_cache, upload_ingest
+from services.face_detection import FaceDetectionBusy
+from services.upload_ingest import SpooledUpload, UploadRejected
+from image_pipeline import ProcessedImage, observe_timings
+from config import IMAGES_DIR
 from middleware.security import (
     validate_user_id,
     validate_photo_index,
     sanitize_filename,
-    validate_image_content,
     sanitize_path,
     validate_url
 )
 from slowapi import Limiter
 from slowapi.util import get_remote_address
+import metrics
+import logging
 
-# Поддержка HEIC формата
-try:
-    from pillow_heif import register_heif_opener
-    register_heif_opener()
-    print("✅ Поддержка HEIC формата включена")
-except ImportError:
-    print("⚠️ pillow-heif не установлен, поддержка HEIC отключена")
-except Exception as e:
-    print(f"⚠️ Ошибка инициализации HEIC: {e}")
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+UPLOAD_RESULTS = metrics.counter("photo_uploads_total", "Обработанные загрузки фото по результату", ["result"])
+UPLOAD_BYTES = metrics.histogram(
+    "photo_upload_bytes", "Размер загруженных файлов",
+    buckets=(64 * 1024, 256 * 1024, 1024 ** 2, 2 * 1024 ** 2, 5 * 1024 ** 2, 10 * 1024 ** 2, 20 * 1024 ** 2)
+)
+
+# URL нового фото меняется вместе с содержимым: photoUrl, указывавший на старое фото слота, переезжает на новое
+PHOTO_URL_FOLLOWS_SLOT = '"photoUrl" = CASE WHEN "photoUrl" = "{column}" THEN ? ELSE "photoUrl" END'
+
+
+async def process_upload(path: str) -> ProcessedImage:
+    """Декодировать фото из временного файла один раз, привести к JPEG и проверить лицо (в пуле процессов)"""
+    UPLOAD_BYTES.observe(Path(path).stat().st_size)
+    try:
+        processed = await face_detection.process_image_file(path)
+    except ValueError as e:
+        UPLOAD_RESULTS.inc("invalid")
+        raise HTTPException(status_code=400, detail=str(e))
+    except FaceDetectionBusy:
+        UPLOAD_RESULTS.inc("busy")
+        raise
+    observe_timings(processed)
+    UPLOAD_RESULTS.inc("face" if processed.has_face else "no_face")
+    return processed
+
 
 @router.post("/upload")
 @router.post("/uploadPhoto")  # Алиас для совместимости с ботом
-async def upload_photo(
-    file: UploadFile = File(...),
-    userId: str = Form(...),
-    photoIndex: Optional[str] = Form(None)
-):
-    """Загрузить фотографию (с валидацией безопасности)"""
-    print(f"🔵 [PHOTOS] /api/upload вызван: userId={userId}, photoIndex={photoIndex}, filename={file.filename}")
+async def upload_photo(request: Request):
+    """Загрузить фотографию (multipart: file, userId, photoIndex; с валидацией безопасности)"""
+    upload = SpooledUpload()
     try:
+        # Читаем тело потоком во временный файл: размер, формат и размеры проверяются по ходу чтения
+        form = await upload_ingest.read_multipart(request, upload)
+        userId = form.get("userId")
+        photoIndex = form.get("photoIndex") or None
+        logger.debug("[PHOTOS] /api/upload: userId=%s, photoIndex=%s, size=%s", userId, photoIndex, upload.size)
+        if not userId:
+            raise HTTPException(status_code=400, detail="userId required")
+        
         # Валидация входных данных
         userId = validate_user_id(userId)
         photoIndex = validate_photo_index(photoIndex)
-        print(f"🔵 [PHOTOS] Валидация пройдена: userId={userId}, photoIndex={photoIndex}")
-        
-        # Читаем содержимое файла
-        content = await file.read()
-        
-        # Конвертируем HEIC в JPEG если нужно
-        try:
-            image = Image.open(io.BytesIO(content))
-            if image.format == 'HEIF' or image.format == 'HEIC' or (file.filename and file.filename.lower().endswith(('.heic', '.heif'))):
-                print(f"🔍 [PHOTOS] Обнаружен HEIC файл, конвертируем в JPEG...")
-                # Конвертируем в RGB (HEIC может быть в других цветовых пространствах)
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
-                # Сохраняем как JPEG
-                jpeg_buffer = io.BytesIO()
-                image.save(jpeg_buffer, format='JPEG', quality=90)
-                content = jpeg_buffer.getvalue()
-                print(f"✅ [PHOTOS] HEIC успешно конвертирован в JPEG, размер: {len(content)} байт")
-        except Exception as e:
-            print(f"⚠️ [PHOTOS] Ошибка при обработке изображения (возможно, не HEIC): {e}")
-            # Продолжаем с оригинальным контентом
-        
-        # Валидация файла
-        validate_image_content(content)
         
         # Проверяем, нужно ли загрузить в photo1 (если photo1 пустой или photoUrl дефолтный)
         row = await db_get('SELECT "photo1", "photoUrl" FROM users WHERE "userId" = ?', [userId])
@@ -83,35 +81,20 @@ async def upload_photo(
         default_photo_urls = ["/img/logo.svg", "/img/avatar.svg", ""]
         if not photoIndex or (not photo1 and (not photoUrl or photoUrl in default_photo_urls)):
             photoIndex = "1"
-            print(f"🔍 [PHOTOS] photo1 пустой или photoUrl дефолтный, загружаем в photo1")
         
-        # Определяем имя файла безопасно
-        if photoIndex:
-            filename = f"Photo{photoIndex}.jpg"
-        else:
-            filename = sanitize_filename(file.filename) or "Photo1.jpg"
-            photoIndex = "1"
-        
-        # Создаем безопасный путь
-        file_path = sanitize_path(Path(IMAGES_DIR), userId, filename)
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        # Сохраняем файл
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(content)
+        # Декодируем фото (HEIC/PNG/WEBP -> JPEG) и проверяем лицо через OpenCV
+        # в пуле процессов, до записи файла: при перегрузке пула старое фото не перезаписывается
+        processed = await process_upload(upload.path)
+        has_face, face_count = processed.has_face, processed.face_count
+        logger.debug("[PHOTOS] userId=%s: has_face=%s, face_count=%d", userId, has_face, face_count)
         
-        # Проверяем лицо через OpenCV
-        print(f"🔍 [PHOTOS] Проверяем лицо через OpenCV для userId={userId}, photoIndex={photoIndex}")
-        has_face, face_count = check_face_in_photo(content)
-        print(f"🔍 [PHOTOS] Результат проверки: has_face={has_face}, face_count={face_count}")
+        # Сохраняем файл в хранилище (имя = хэш содержимого, одинаковые фото хранятся один раз)
+        photo_url = await photo_store.store(processed.content, processed.variants)
         
         # Обновляем БД (безопасно, используя параметризованный запрос)
         column = f"photo{photoIndex}"
-        photo_url = f"/data/img/{userId}/{filename}"
         need_photo = 0 if has_face else 1
         
-        print(f"🔍 [PHOTOS] Обновляем БД: {column}={photo_url}, needPhoto={need_photo}")
-        
         # Если загружаем в photo1 и лицо найдено, обновляем также photoUrl
         update_fields = [f'"{column}" = ?', 'needPhoto = ?']
         update_params = [photo_url, need_photo]
@@ -119,12 +102,16 @@ async def upload_photo(
         if photoIndex == "1" and has_face:
             update_fields.append('"photoUrl" = ?')
             update_params.append(photo_url)
-            print(f"🔍 [PHOTOS] Также обновляем photoUrl, так как загружаем в photo1 с лицом")
+        else:
+            update_fields.append(PHOTO_URL_FOLLOWS_SLOT.format(column=column))
+            update_params.append(photo_url)
         
         update_params.append(userId)
         sql = f'UPDATE users SET {", ".join(update_fields)} WHERE "userId" = ?'
         await db_run(sql, update_params)
-        print(f"✅ [PHOTOS] БД обновлена. needPhoto установлен в {need_photo}")
+        await profile_cache.invalidate(userId)
+        await candidate_queue.on_user_changed(userId)
+        logger.info("✅ [PHOTOS] %s=%s для %s, needPhoto=%d", column, photo_url, userId, need_photo)
         
         return {
             "success": True,
@@ -133,13 +120,13 @@ async def upload_photo(
             "faceCount": face_count,
             "needPhoto": need_photo
         }
-    except HTTPException:
+    except (HTTPException, FaceDetectionBusy, UploadRejected):
         raise
     except Exception as e:
-        print(f"❌ [PHOTOS] Ошибка загрузки фото: {e}")
-        import traceback
-        print(f"❌ [PHOTOS] Traceback: {traceback.format_exc()}")
+        logger.exception(f"❌ [PHOTOS] Ошибка загрузки фото: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка загрузки фотографии: {str(e)}")
+    finally:
+        upload.close()
 
 
 @router.post("/uploadUrl")
@@ -167,20 +154,17 @@ async def upload_photo_from_url(request: Request):
     if not userId or not fileUrl:
         raise HTTPException(status_code=400, detail="userId and fileUrl required")
     
+    upload = SpooledUpload()
     try:
         # Валидация входных данных
         userId = validate_user_id(userId)
         fileUrl = validate_url(fileUrl)
         photoIndex = validate_photo_index(photoIndex) if photoIndex else None
         
-        # Скачиваем изображение (с таймаутом и ограничением размера)
-        async with httpx.AsyncClient(timeout=HTTP_TIMEOUT, max_redirects=HTTP_MAX_REDIRECTS) as client:
-            response = await client.get(fileUrl)
+        # Скачиваем изображение потоком во временный файл (общий клиент: таймауты и keep-alive пул)
+        async with http_clients.get(http_clients.FETCH).stream("GET", fileUrl) as response:
             response.raise_for_status()
-            image_buffer = response.content
-            
-            # Валидация размера и содержимого
-            validate_image_content(image_buffer)
+            await upload_ingest.read_stream(response.aiter_bytes(), upload, response.headers.get("content-length"))
         
         # Получаем текущие слоты из БД
         row = await db_get('SELECT "photo1", "photo2", "photo3" FROM users WHERE "userId" = ?', [userId])
@@ -188,68 +172,54 @@ async def upload_photo_from_url(request: Request):
         p2 = (row.get("photo2") or "").strip() if row else ""
         p3 = (row.get("photo3") or "").strip() if row else ""
         
-        # Определяем имя файла и слот безопасно
+        # Определяем слот
         if photoIndex:
             column = f"photo{photoIndex}"
-            filename = f"Photo{photoIndex}.jpg"
         elif fileUniqueId:
             # Санитизируем fileUniqueId
             fileUniqueId = sanitize_filename(fileUniqueId.replace('.jpg', '').replace('.jpeg', ''))
             # Определяем свободный слот
             if not p1:
                 column = "photo1"
-                filename = "Photo1.jpg"
             elif not p2:
                 column = "photo2"
-                filename = "Photo2.jpg"
             elif not p3:
                 column = "photo3"
-                filename = "Photo3.jpg"
             else:
                 # Все слоты заняты, используем первый
                 column = "photo1"
-                filename = "Photo1.jpg"
         else:
             # Автоматически определяем свободный слот
             if not p1:
                 column = "photo1"
-                filename = "Photo1.jpg"
             elif not p2:
                 column = "photo2"
-                filename = "Photo2.jpg"
             elif not p3:
                 column = "photo3"
-                filename = "Photo3.jpg"
             else:
                 # Все слоты заняты, используем первый
                 column = "photo1"
-                filename = "Photo1.jpg"
-        
-        # Создаем безопасный путь
-        file_path = sanitize_path(Path(IMAGES_DIR), userId, filename)
-        file_path.parent.mkdir(parents=True, exist_ok=True)
         
-        # Сохраняем файл
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(image_buffer)
-        
-        # Проверяем лицо через OpenCV
-        print(f"🔍 [PHOTOS] Проверяем лицо через OpenCV для userId={userId}, photoIndex={photoIndex} (uploadUrl)")
-        has_face, face_count = check_face_in_photo(image_buffer)
-        print(f"🔍 [PHOTOS] Результат проверки (uploadUrl): has_face={has_face}, face_count={face_count}")
+        # Декодируем фото (HEIC/PNG/WEBP -> JPEG) и проверяем лицо через OpenCV (в пуле процессов, до записи файла)
+        processed = await process_upload(upload.path)
+        has_face, face_count = processed.has_face, processed.face_count
+        logger.debug("[PHOTOS] uploadUrl userId=%s: has_face=%s, face_count=%d", userId, has_face, face_count)
         
         if not has_face:
-            # Удаляем файл если лицо не найдено
-            if file_path.exists():
-                file_path.unlink()
+            # Лицо не найдено - файл не сохраняем
             raise HTTPException(status_code=400, detail="Лицо не обнаружено. Загрузите другое фото.", needPhoto=1)
         
+        # Сохраняем файл в хранилище (имя = хэш содержимого)
+        photo_url = await photo_store.store(processed.content, processed.variants)
+        
         # Обновляем БД (безопасно, используя параметризованный запрос)
-        photo_url = f"/data/img/{userId}/{filename}"
         await db_run(
-            f'UPDATE users SET "{column}" = ?, needPhoto = ? WHERE "userId" = ?',
-            [photo_url, 0, userId]
+            f'''UPDATE users SET "{column}" = ?, needPhoto = ?, {PHOTO_URL_FOLLOWS_SLOT.format(column=column)}
+               WHERE "userId" = ?''',
+            [photo_url, 0, photo_url, userId]
         )
+        await profile_cache.invalidate(userId)
+        await candidate_queue.on_user_changed(userId)
         
         return {
             "success": True,
@@ -257,68 +227,51 @@ async def upload_photo_from_url(request: Request):
             "hasFace": has_face,
             "faceCount": face_count
         }
-    except HTTPException:
+    except (HTTPException, FaceDetectionBusy, UploadRejected):
         raise
     except Exception as e:
-        print(f"Ошибка загрузки фото по URL: {e}")
+        logger.error(f"Ошибка загрузки фото по URL: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        upload.close()
 
 
 @router.post("/uploadBase64")
-async def upload_photo_base64(data: Dict = Body(...)):
-    """Загрузить фотографию из Base64 (с валидацией безопасности)"""
-    import base64
-    userId = data.get("userId")
-    base64_data = data.get("base64")
-    photoIndex = data.get("photoIndex")
-    
-    if not userId or not base64_data:
-        raise HTTPException(status_code=400, detail="userId and base64 required")
-    
+async def upload_photo_base64(request: Request):
+    """Загрузить фотографию из Base64 (JSON: userId, base64, photoIndex; с валидацией безопасности)"""
+    upload = SpooledUpload()
     try:
+        # Base64 декодируется потоком во временный файл, JSON целиком в память не читается
+        data = await upload_ingest.read_base64_json(request, upload)
+        userId = data.get("userId")
+        photoIndex = data.get("photoIndex")
+        if not userId:
+            raise HTTPException(status_code=400, detail="userId and base64 required")
+        
         # Валидация входных данных
         userId = validate_user_id(userId)
         photoIndex = validate_photo_index(photoIndex) if photoIndex else "1"
         
-        # Декодируем Base64
-        if "," in base64_data:
-            base64_data = base64_data.split(",")[1]
+        # Декодируем фото (HEIC/PNG/WEBP -> JPEG) и проверяем лицо через OpenCV (в пуле процессов, до записи файла)
+        processed = await process_upload(upload.path)
+        has_face, face_count = processed.has_face, processed.face_count
+        logger.debug("[PHOTOS] uploadBase64 userId=%s: has_face=%s, face_count=%d", userId, has_face, face_count)
         
-        try:
-            image_buffer = base64.b64decode(base64_data, validate=True)
-        except Exception:
-            raise HTTPException(status_code=400, detail="Некорректный Base64")
-        
-        # Валидация файла
-        validate_image_content(image_buffer)
-        
-        # Определяем имя файла безопасно
-        filename = f"Photo{photoIndex}.jpg"
-        
-        # Создаем безопасный путь
-        file_path = sanitize_path(Path(IMAGES_DIR), userId, filename)
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        # Сохраняем файл
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(image_buffer)
-        
-        # Проверяем лицо через OpenCV
-        print(f"🔍 [PHOTOS] Проверяем лицо через OpenCV для userId={userId}, photoIndex={photoIndex} (uploadBase64)")
-        has_face, face_count = check_face_in_photo(image_buffer)
-        print(f"🔍 [PHOTOS] Результат проверки (uploadBase64): has_face={has_face}, face_count={face_count}")
+        # Сохраняем файл в хранилище (имя = хэш содержимого)
+        photo_url = await photo_store.store(processed.content, processed.variants)
         
         # Обновляем БД (безопасно)
         column = f"photo{photoIndex}"
-        photo_url = f"/data/img/{userId}/{filename}"
         need_photo = 0 if has_face else 1
         
-        print(f"🔍 [PHOTOS] Обновляем БД (uploadBase64): {column}={photo_url}, needPhoto={need_photo}")
         await db_run(
-            f'UPDATE users SET "{column}" = ?, needPhoto = ? WHERE "userId" = ?',
-            [photo_url, need_photo, userId]
+            f'''UPDATE users SET "{column}" = ?, needPhoto = ?, {PHOTO_URL_FOLLOWS_SLOT.format(column=column)}
+               WHERE "userId" = ?''',
+            [photo_url, need_photo, photo_url, userId]
         )
-        print(f"✅ [PHOTOS] БД обновлена (uploadBase64). needPhoto установлен в {need_photo}")
+        await profile_cache.invalidate(userId)
+        await candidate_queue.on_user_changed(userId)
+        logger.info("✅ [PHOTOS] %s=%s для %s (uploadBase64), needPhoto=%d", column, photo_url, userId, need_photo)
         
         return {
             "success": True,
@@ -326,11 +279,13 @@ async def upload_photo_base64(data: Dict = Body(...)):
             "hasFace": has_face,
             "faceCount": face_count
         }
-    except HTTPException:
+    except (HTTPException, FaceDetectionBusy, UploadRejected):
         raise
     except Exception as e:
-        print(f"Ошибка загрузки фото из Base64: {e}")
+        logger.error(f"Ошибка загрузки фото из Base64: {e}")
         raise HTTPException(status_code=500, detail="Ошибка загрузки фотографии")
+    finally:
+        upload.close()
 
 
 @router.post("/deletePhoto")
@@ -355,21 +310,25 @@ async def delete_photo(data: Dict = Body(...)):
         
         photo_url = row.get(column)
         
-        # Удаляем файл, если он существует (безопасно)
-        if photo_url:
+        # Старое фото (/data/img/<userId>/PhotoN.jpg) удаляем сразу; файл из хранилища
+        # удалит сборщик мусора, когда на него не останется ссылок
+        if photo_url and not photo_store.digest_from_url(photo_url):
             filename = sanitize_filename(Path(photo_url).name)
             file_path = sanitize_path(Path(IMAGES_DIR), userId, filename)
             if file_path.exists():
                 file_path.unlink()
+            photo_variants.delete_variants(file_path)
         
         # Очищаем поле в БД (безопасно)
         await db_run(f'UPDATE users SET "{column}" = \'\' WHERE "userId" = ?', [userId])
+        await profile_cache.invalidate(userId)
+        await candidate_queue.on_user_changed(userId)
         
         return {"success": True}
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Ошибка удаления фото: {e}")
+        logger.error(f"Ошибка удаления фото: {e}")
         raise HTTPException(status_code=500, detail="Ошибка удаления фотографии")
 
 
@@ -395,20 +354,9 @@ async def clear_photos(data: Dict = Body(...)):
         raise HTTPException(status_code=400, detail="userId required")
     
     try:
-        # Удаляем директорию
-        user_dir = Path(IMAGES_DIR) / userId
-        if user_dir.exists():
-            import shutil
-            shutil.rmtree(user_dir)
-        
-        # Очищаем БД
-        await db_run(
-            "UPDATE users SET photo1 = '', photo2 = '', photo3 = '' WHERE userId = ?",
-            [userId]
-        )
-        
+        await photo_store.clear_user_photos(userId)
         return {"success": True}
     except Exception as e:
-        print(f"Ошибка очистки фото: {e}")
+        logger.error(f"Ошибка очистки фото: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -4,9 +4,12 @@ routes/push.py
 """
 from fastapi import APIRouter, Query, HTTPException, Body
 from typing import Optional, Dict
-import httpx
 from db_utils import db_run
+from services import http_clients
 from config import BOT_TOKEN
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -33,7 +36,7 @@ async def send_push(data: Dict = Body(...)):
         )
         return {"success": True}
     except Exception as e:
-        print(f"[sendPush] Ошибка: {e}")
+        logger.exception(f"[sendPush] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -49,9 +52,9 @@ async def special_push(data: Dict = Body(...)):
         raise HTTPException(status_code=500, detail="BOT_TOKEN not configured")
     
     try:
-        async with httpx.AsyncClient() as client:
+        async with http_clients.session(http_clients.TELEGRAM) as client:
             response = await client.post(
-                f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage",
+                http_clients.telegram_url(BOT_TOKEN, "sendMessage"),
                 json={
                     "chat_id": candidateId,
                     "text": message,
@@ -66,7 +69,7 @@ async def special_push(data: Dict = Body(...)):
             
             return {"success": True, "result": result.get("result")}
     except Exception as e:
-        print(f"[specialPush] Ошибка: {e}")
+        logger.exception(f"[specialPush] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -101,9 +104,9 @@ async def show_pro_menu(data: Dict = Body(...)):
             "• Расширенная статистика"
         )
         
-        async with httpx.AsyncClient() as client:
+        async with http_clients.session(http_clients.TELEGRAM) as client:
             response = await client.post(
-                f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage",
+                http_clients.telegram_url(BOT_TOKEN, "sendMessage"),
                 json={
                     "chat_id": userId,
                     "text": message_text,
@@ -116,9 +119,9 @@ async def show_pro_menu(data: Dict = Body(...)):
             if not result.get("ok"):
                 raise Exception(f"Telegram API error: {result}")
             
-            print(f"✅ [showProMenu] Меню PRO отправлено пользователю {userId}")
+            logger.info("✅ [showProMenu] Меню PRO отправлено пользователю %s", userId)
             return {"success": True, "result": result.get("result")}
     except Exception as e:
-        print(f"❌ [showProMenu] Ошибка: {e}")
+        logger.exception(f"❌ [showProMenu] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -3,8 +3,12 @@ routes/stats.py
 Роуты для статистики
 """
 from fastapi import APIRouter
-from db_utils import db_get, db_all, safe_json_parse
+from db_utils import db_get, db_all
+from services import stats as stats_service
 from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -36,17 +40,19 @@ async def get_stats():
         no_photo = total - with_photo
         
         # Топ-5 по количеству лайков
-        likes_rows = await db_all("SELECT userId, name, likes FROM users")
-        top5 = []
-        for row in likes_rows:
-            likes = safe_json_parse(row.get("likes"), [])
-            top5.append({
-                "userId": row.get("userId"),
-                "name": row.get("name", ""),
-                "count": len(likes) if isinstance(likes, list) else 0
-            })
-        top5.sort(key=lambda x: x["count"], reverse=True)
-        top5 = top5[:5]
+        likes_rows = await db_all(
+            """SELECT u.userId, u.name, COUNT(*) AS cnt
+               FROM user_edges e
+               JOIN users u ON u.userId = e.from_user
+               WHERE e.kind = 'like'
+               GROUP BY u.userId, u.name
+               ORDER BY cnt DESC
+               LIMIT 5"""
+        )
+        top5 = [
+            {"userId": row.get("userId"), "name": row.get("name", ""), "count": row.get("cnt", 0)}
+            for row in likes_rows
+        ]
         
         # Визиты за сегодня - считаем уникальных посетителей по visitorId (telegramID)
         visits_row = await db_get(
@@ -65,7 +71,7 @@ async def get_stats():
             "top5": top5
         }
     except Exception as e:
-        print(f"/api/stats error: {e}")
+        logger.exception(f"/api/stats error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -73,15 +79,10 @@ async def get_stats():
 async def get_stats_day():
     """Получить статистику за день (визиты за 24 часа) - считаем уникальных посетителей по visitorId (telegramID)"""
     try:
-        # Используем интервал 24 часа вместо DATE для более точного подсчета
-        row = await db_get(
-            'SELECT COUNT(DISTINCT "visitorId") AS "dayCount" FROM visits WHERE timestamp >= NOW() - INTERVAL \'24 hours\'',
-            []
-        )
-        visits_24h = row.get("dayCount", 0) if row else 0
+        visits_24h = await stats_service.count_visits_24h()
         return {"success": True, "visits24h": visits_24h}
     except Exception as e:
-        print(f"/api/stats/day error: {e}")
+        logger.exception(f"/api/stats/day error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -89,34 +90,13 @@ async def get_stats_day():
 async def get_stats_users():
     """Получить распределение пользователей по полу"""
     try:
-        # Получаем общее количество пользователей
-        total_row = await db_get("SELECT COUNT(*) AS count FROM users")
-        total_users = total_row.get("count", 0) if total_row else 0
-        
-        # Получаем распределение по полу (обрабатываем NULL и пустые строки)
-        rows = await db_all("""
-            SELECT 
-                CASE 
-                    WHEN gender IS NULL OR gender = '' THEN 'Не указан'
-                    ELSE gender
-                END AS name,
-                COUNT(*) AS count 
-            FROM users 
-            GROUP BY 
-                CASE 
-                    WHEN gender IS NULL OR gender = '' THEN 'Не указан'
-                    ELSE gender
-                END
-        """)
-        
+        result = await stats_service.get_users_by_gender()
         return {
             "success": True,
-            "data": rows,
-            "total": total_users
+            "data": result["data"],
+            "total": result["total"]
         }
     except Exception as e:
-        print(f"/api/stats/users error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"/api/stats/users error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
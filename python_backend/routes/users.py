@@ -2,16 +2,26 @@
 routes/users.py
 Роуты для управления пользователями
 """
-from fastapi import APIRouter, Query, HTTPException, Body, Request
+from fastapi import APIRouter, Depends, Query, HTTPException, Body, Request
+from fastapi.responses import StreamingResponse
 from typing import Optional, List, Dict, Any
 from pydantic import BaseModel, Field
-from db_utils import db_get, db_all, db_run, safe_json_parse
+from db_utils import db_get, db_all, db_run, use_db_session
 from middleware.security import validate_user_id
 from middleware.auth import get_telegram_user_id
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from utils.photo_url import normalize_photo_url, normalize_photos_list
+from utils.cursor import encode_cursor, decode_cursor
+from services import edges, candidate_queue, user_listing, profile_cache
+from services import users as users_service
+from services.users import UserNotFound
+from services.photo_variants import variant_url, variant_urls
+from config import CANDIDATES_PAGE_SIZE, CANDIDATES_MAX_PAGE_SIZE, USERS_PAGE_SIZE, USERS_MAX_PAGE_SIZE
 import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -37,21 +47,40 @@ class UserUpdate(BaseModel):
     age: Optional[int] = None
 
 
+def _normalize_listing_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Нормализует photoUrl в строке списка пользователей"""
+    if row.get("photoUrl"):
+        row["photoUrl"] = normalize_photo_url(row["photoUrl"])
+    return row
+
+
 @router.get("/users")
-async def get_all_users():
-    """Получить список всех пользователей (ограниченные данные для безопасности)"""
+async def get_all_users(
+    fields: Optional[str] = Query(None, description="Поля через запятую (по умолчанию все публичные)"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (nextCursor)"),
+    limit: int = Query(USERS_PAGE_SIZE, ge=1, le=USERS_MAX_PAGE_SIZE, description="Размер страницы"),
+    format: str = Query("json", pattern="^(json|ndjson)$", description="json - страница, ndjson - поток всех пользователей")
+):
+    """Получить список пользователей постранично (только публичные данные)"""
     try:
-        # Возвращаем только публичные данные (без чувствительной информации)
-        rows = await db_all(
-            'SELECT "userId", name, username, age, bio, "photoUrl", gender, badge FROM users'
+        columns = user_listing.parse_fields(fields, user_listing.PUBLIC_FIELDS)
+        after_id = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if format == "ndjson":
+        return StreamingResponse(
+            user_listing.stream_ndjson(columns, after_id, _normalize_listing_row),
+            media_type="application/x-ndjson"
         )
-        # Нормализуем photoUrl для всех пользователей
-        for row in rows:
-            if row.get("photoUrl"):
-                row["photoUrl"] = normalize_photo_url(row["photoUrl"])
-        return {"success": True, "data": rows}
+    
+    try:
+        rows, last_id = await user_listing.get_users_page(columns, after_id, limit)
+        rows = [_normalize_listing_row(row) for row in rows]
+        next_cursor = encode_cursor(last_id) if last_id is not None else None
+        return {"success": True, "data": rows, "nextCursor": next_cursor}
     except Exception as e:
-        print(f"[GET /api/users] Ошибка: {e}")
+        logger.error(f"[GET /api/users] Ошибка: {e}")
         return {"success": False, "data": [], "error": "Ошибка получения пользователей"}
 
 
@@ -69,18 +98,20 @@ async def get_user(userId: str = Query(..., description="ID пользовате
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[GET /api/user] Ошибка: {e}")
+        logger.error(f"[GET /api/user] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/getUser")
+@router.get("/getUser", dependencies=[Depends(use_db_session)])
 async def get_user_frontend(userId: str = Query(..., description="ID пользователя")):
     """Получить данные пользователя (для фронтенда)"""
     if not userId:
         raise HTTPException(status_code=400, detail="userId required")
     
     try:
-        row = await db_get("SELECT * FROM users WHERE userId = ?", [userId])
+        # Профиль - из кэша, лайки/дизлайки/мэтчи (user_edges) - из БД;
+        # при промахе кэша оба чтения идут одним pipeline на одном соединении
+        row, (edge_rows,) = await profile_cache.get_profile_with(userId, [edges.user_edges_query(userId)])
         if not row:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -125,20 +156,22 @@ async def get_user_frontend(userId: str = Query(..., description="ID польз
                     now = datetime.now(end_date.tzinfo) if hasattr(end_date, 'tzinfo') and end_date.tzinfo else datetime.now(timezone.utc)
                     if end_date < now:
                         is_pro = 0
-                        print(f"[getUser] Pro срок истек для userId={userId}, pro_end={pro_end}, now={now}")
+                        logger.debug("[getUser] Pro срок истек для userId=%s, pro_end=%s", userId, pro_end)
             except Exception as e:
-                print(f"[getUser] Ошибка проверки Pro срока для userId={userId}: {e}")
+                logger.warning(f"[getUser] Ошибка проверки Pro срока для userId={userId}: {e}")
         
         # Формируем данные для фронтенда
         # В БД колонка называется superLikesCount (camelCase), не super_likes_count!
         super_likes_camel = row.get("superLikesCount")
         super_likes_snake = row.get("super_likes_count")
         super_likes_final = super_likes_camel if super_likes_camel is not None else (super_likes_snake if super_likes_snake is not None else 0)
-        print(f"[getUser] 🔵 superLikesCount для userId={userId}: camel={super_likes_camel}, snake={super_likes_snake}, final={super_likes_final}")
-        print(f"[getUser] 🔵 row keys: {list(row.keys())}")
-        print(f"[getUser] 🔵 'superLikesCount' in row: {'superLikesCount' in row}")
-        print(f"[getUser] 🔵 row.get('superLikesCount'): {row.get('superLikesCount')}")
-        print(f"[getUser] 🔵 type(row.get('superLikesCount')): {type(row.get('superLikesCount'))}")
+        logger.debug(
+            "[getUser] superLikesCount для userId=%s: camel=%s, snake=%s, final=%s",
+            userId, super_likes_camel, super_likes_snake, super_likes_final
+        )
+        
+        # Лайки/дизлайки/мэтчи хранятся в user_edges
+        user_edges = edges.group_user_edges(edge_rows)
         
         user_data = {
             "userId": row.get("userId"),
@@ -155,20 +188,26 @@ async def get_user_frontend(userId: str = Query(..., description="ID польз
             "photo2": normalize_photo_url(row.get("photo2", "")),
             "photo3": normalize_photo_url(row.get("photo3", "")),
             "badge": row.get("badge", ""),
-            "likes": safe_json_parse(row.get("likes", "[]")),
-            "dislikes": safe_json_parse(row.get("dislikes", "[]")),
-            "matches": safe_json_parse(row.get("matches", "[]")),
+            "likes": user_edges["likes"],
+            "dislikes": user_edges["dislikes"],
+            "matches": user_edges["matches"],
             "is_pro": is_pro,
             "pro_end": pro_end,
             "needPhoto": need_photo,
             "hideAge": row.get("hideAge", 0),
+            # Уменьшенные WebP копии (photos/photo1..3 остаются оригиналами: профиль сохраняет их обратно)
+            "photoVariants": {
+                "card": variant_urls(photos, "card"),
+                "thumb": variant_urls(photos, "thumb"),
+                "avatar": variant_url(normalize_photo_url(row.get("photoUrl", "")), "avatar"),
+            },
         }
         
         return {"success": True, "data": user_data}
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[GET /api/getUser] Ошибка: {e}")
+        logger.error(f"[GET /api/getUser] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -182,17 +221,17 @@ async def join_user(user: UserCreate, request: Request):
         # Определяем userId: если передан в запросе - используем его, иначе - Telegram ID
         if user.userId:
             final_user_id = user.userId
-            print(f"[POST /api/join] userId передан в запросе: {final_user_id}")
+            logger.debug("[POST /api/join] userId передан в запросе: %s", final_user_id)
         elif telegram_id:
             final_user_id = telegram_id
-            print(f"[POST /api/join] userId не передан, используем Telegram ID: {final_user_id}")
+            logger.debug("[POST /api/join] userId не передан, используем Telegram ID: %s", final_user_id)
         else:
             raise HTTPException(
                 status_code=400, 
                 detail="userId обязателен. Передайте userId в теле запроса или Telegram ID через заголовки/initData"
             )
         
-        print(f"[POST /api/join] Регистрация пользователя: userId={final_user_id}, telegram_id={telegram_id}, name={user.name}")
+        logger.info(f"[POST /api/join] Регистрация пользователя: userId={final_user_id}, telegram_id={telegram_id}, name={user.name}")
         
         # Проверяем, существует ли пользователь
         # Используем ? - функция adapt_sql_for_postgres преобразует в $1, $2...
@@ -200,7 +239,7 @@ async def join_user(user: UserCreate, request: Request):
         existing = await db_get('SELECT "userId" FROM users WHERE "userId" = ?', [final_user_id])
         
         if existing:
-            print(f"[POST /api/join] Пользователь уже существует: {final_user_id}")
+            logger.debug("[POST /api/join] Пользователь уже существует: %s", final_user_id)
             return {"success": True, "message": "User already exists"}
         
         # Создаём нового пользователя
@@ -213,14 +252,14 @@ async def join_user(user: UserCreate, request: Request):
             [final_user_id, user.name or "", user.username or "", user.photoUrl or "", user.gender or ""]
         )
         
-        print(f"[POST /api/join] Пользователь успешно зарегистрирован: {final_user_id}")
+        await candidate_queue.on_user_changed(final_user_id)
+        
+        logger.info(f"[POST /api/join] Пользователь успешно зарегистрирован: {final_user_id}")
         return {"success": True, "message": "User registered", "userId": final_user_id}
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[POST /api/join] Ошибка: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"[POST /api/join] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -236,103 +275,56 @@ async def update_gender(data: UserUpdate):
             "UPDATE users SET gender = ?, needPhoto = ? WHERE userId = ?",
             [data.gender, 1, data.userId]
         )
+        await profile_cache.invalidate(data.userId)
+        await candidate_queue.on_user_changed(data.userId)
         
         # TODO: Проверка фото через OpenCV (будет добавлено позже)
         
         return {"success": True, "needPhoto": 1}
     except Exception as e:
-        print(f"[POST /api/updateGender] Ошибка: {e}")
+        logger.error(f"[POST /api/updateGender] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/delete_user")
 async def delete_user(data: Dict[str, str] = Body(...)):
-    """Удалить пользователя и все связанные данные"""
+    """Удалить пользователя и все связанные данные (фоновой задачей, ответ сразу)"""
     userId = data.get("userId")
     if not userId:
         raise HTTPException(status_code=400, detail="userId required")
     
     try:
-        from pathlib import Path
-        from config import IMAGES_DIR
-        import shutil
-        
-        # 1. Удаляем фотографии пользователя из файловой системы
-        user_photo_dir = Path(IMAGES_DIR) / str(userId)
-        if user_photo_dir.exists() and user_photo_dir.is_dir():
-            try:
-                shutil.rmtree(user_photo_dir)
-                print(f"[POST /api/delete_user] Удалена папка с фотографиями: {user_photo_dir}")
-            except Exception as e:
-                print(f"[POST /api/delete_user] Ошибка удаления папки с фотографиями: {e}")
-        
-        # 2. Удаляем записи из visits (где пользователь был посетителем или кого посетили)
-        await db_run('DELETE FROM visits WHERE "userId" = ? OR "visitorId" = ?', [userId, userId])
-        print(f"[POST /api/delete_user] Удалены записи из visits для userId={userId}")
-        
-        # 3. Удаляем записи из promo_code_usage
-        await db_run('DELETE FROM promo_code_usage WHERE user_id = ?', [userId])
-        print(f"[POST /api/delete_user] Удалены записи из promo_code_usage для userId={userId}")
-        
-        # 4. Удаляем пользователя из likes/dislikes/matches других пользователей
-        # Получаем всех пользователей, у которых есть этот userId в likes/dislikes/matches
-        all_users = await db_all('SELECT "userId", likes, dislikes, matches FROM users WHERE "userId" != ?', [userId])
-        
-        for user_row in all_users:
-            user_id = user_row.get("userId")
-            likes = safe_json_parse(user_row.get("likes", "[]"), [])
-            dislikes = safe_json_parse(user_row.get("dislikes", "[]"), [])
-            matches = safe_json_parse(user_row.get("matches", "[]"), [])
-            
-            updated = False
-            if userId in likes:
-                likes.remove(userId)
-                updated = True
-            if userId in dislikes:
-                dislikes.remove(userId)
-                updated = True
-            if userId in matches:
-                matches.remove(userId)
-                updated = True
-            
-            if updated:
-                await db_run(
-                    'UPDATE users SET likes = ?, dislikes = ?, matches = ? WHERE "userId" = ?',
-                    [json.dumps(likes), json.dumps(dislikes), json.dumps(matches), user_id]
-                )
-        
-        print(f"[POST /api/delete_user] Удален userId={userId} из likes/dislikes/matches других пользователей")
-        
-        # 5. Удаляем самого пользователя
-        result = await db_run('DELETE FROM users WHERE "userId" = ?', [userId])
-        if result["changes"] == 0:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        print(f"[POST /api/delete_user] Пользователь userId={userId} успешно удален")
-        return {"success": True}
-    except HTTPException:
-        raise
+        job_id = await users_service.enqueue_delete_user(userId)
+        logger.info(f"[POST /api/delete_user] Удаление userId={userId} поставлено в очередь (задача #{job_id})")
+        return {"success": True, "jobId": job_id}
+    except UserNotFound:
+        raise HTTPException(status_code=404, detail="User not found")
     except Exception as e:
-        print(f"[POST /api/delete_user] Ошибка: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"[POST /api/delete_user] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/candidates")
+@router.get("/candidates", dependencies=[Depends(use_db_session)])
 async def get_candidates(
     userId: str = Query(..., description="ID пользователя"),
-    oppositeGender: str = Query(..., description="Противоположный пол")
+    oppositeGender: str = Query(..., description="Противоположный пол"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (nextCursor)"),
+    limit: int = Query(CANDIDATES_PAGE_SIZE, ge=1, le=CANDIDATES_MAX_PAGE_SIZE, description="Размер страницы")
 ):
-    """Получить кандидатов для свайпа"""
+    """Получить страницу кандидатов для свайпа"""
     if not userId or not oppositeGender:
         raise HTTPException(status_code=400, detail="oppositeGender and userId required")
     
+    try:
+        after_id = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     try:
         # Проверяем needPhoto текущего пользователя (как в get_user_frontend - проверяем наличие фото)
-        user_row = await db_get('SELECT "needPhoto", photo1, photo2, photo3, "photoUrl" FROM users WHERE "userId" = ?', [userId])
+        user_row = await profile_cache.get_profile(userId)
         if not user_row:
-            return {"success": True, "data": []}
+            return {"success": True, "data": [], "nextCursor": None}
         
         # Проверяем наличие фотографий (как в get_user_frontend)
         photos = []
@@ -352,44 +344,20 @@ async def get_candidates(
             else:
                 need_photo = 1
         
-        print(f"[GET /api/candidates] needPhoto текущего пользователя (после проверки фото): {need_photo}")
         if need_photo == 1:
-            print(f"[GET /api/candidates] Пользователь не имеет фото, возвращаем пустой массив")
-            return {"success": True, "data": []}
-        
-        # Получаем likes/dislikes текущего пользователя
-        user_row = await db_get("SELECT likes, dislikes FROM users WHERE userId = ?", [userId])
-        liked = safe_json_parse(user_row.get("likes") if user_row else None, [])
-        disliked = safe_json_parse(user_row.get("dislikes") if user_row else None, [])
+            logger.debug("[GET /api/candidates] У %s нет фото, возвращаем пустой массив", userId)
+            return {"success": True, "data": [], "nextCursor": None}
         
-        # Преобразуем в строки для сравнения (userId может быть строкой или числом)
-        liked_ids = set(str(uid) for uid in liked)
-        disliked_ids = set(str(uid) for uid in disliked)
+        # Лайкнутые/дизлайкнутые исключаются в SQL (анти-join с user_edges)
+        # Страница берется из предвычисленной очереди пользователя
+        rows, last_id = await candidate_queue.get_page(userId, oppositeGender, after_id, limit)
+        next_cursor = encode_cursor(last_id) if last_id is not None else None
         
-        print(f"[GET /api/candidates] userId={userId}, oppositeGender={oppositeGender}")
-        print(f"[GET /api/candidates] liked: {liked_ids}, disliked: {disliked_ids}")
-        
-        # Получаем всех пользователей противоположного пола
-        # Примечание: needPhoto может быть строкой или числом, поэтому используем CAST
-        rows = await db_all(
-            """SELECT "userId", name, username, gender, bio, age, photo1, photo2, photo3, "photoUrl", badge
-               FROM users
-               WHERE gender = ? AND "userId" != ? AND blocked = 0 AND "needPhoto" = 0""",
-            [oppositeGender, userId]
-        )
-        
-        print(f"[GET /api/candidates] Найдено пользователей в БД: {len(rows)}")
-        if rows:
-            print(f"[GET /api/candidates] Пример первого пользователя: {rows[0]}")
-        
-        # Фильтруем лайкнутых/дизлайкнутых (сравниваем как строки)
-        filtered = [row for row in rows if str(row["userId"]) not in liked_ids and str(row["userId"]) not in disliked_ids]
-        
-        print(f"[GET /api/candidates] После фильтрации: {len(filtered)}")
+        logger.debug("[GET /api/candidates] userId=%s, oppositeGender=%s, кандидатов на странице: %d", userId, oppositeGender, len(rows))
         
         # Обрабатываем каждого пользователя
         data = []
-        for row in filtered:
+        for row in rows:
             photos = []
             if row.get("photo1") and row["photo1"].strip():
                 photos.append(normalize_photo_url(row["photo1"]))
@@ -412,13 +380,14 @@ async def get_candidates(
                 "gender": row.get("gender", ""),
                 "bio": row.get("bio", ""),
                 "age": row.get("age", 0),
-                "photos": photos,
+                "photos": variant_urls(photos, "card"),  # Размер карточки
+                "photosFull": photos,
                 "badge": row.get("badge", "")
             })
         
-        return {"success": True, "data": data}
+        return {"success": True, "data": data, "nextCursor": next_cursor}
     except Exception as e:
-        print(f"[GET /api/candidates] Ошибка: {e}")
+        logger.error(f"[GET /api/candidates] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -432,7 +401,7 @@ async def check_user(userId: str = Query(..., description="ID пользоват
         row = await db_get("SELECT 1 FROM users WHERE userId = ?", [userId])
         return {"success": True, "exists": bool(row)}
     except Exception as e:
-        print(f"[GET /api/check] Ошибка: {e}")
+        logger.error(f"[GET /api/check] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -452,7 +421,7 @@ async def record_visit(data: Dict[str, str] = Body(...)):
         )
         return {"success": True}
     except Exception as e:
-        print(f"[POST /api/visit] Ошибка: {e}")
+        logger.error(f"[POST /api/visit] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -469,11 +438,13 @@ async def update_age(data: Dict[str, Any] = Body(...)):
         result = await db_run("UPDATE users SET age = ? WHERE userId = ?", [age, userId])
         if result.get("changes", 0) == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        await profile_cache.invalidate(userId)
+        await candidate_queue.on_user_changed(userId)
         return {"success": True}
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[POST /api/updateAge] Ошибка: {e}")
+        logger.error(f"[POST /api/updateAge] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -488,9 +459,11 @@ async def update_bio(data: Dict[str, str] = Body(...)):
     
     try:
         await db_run("UPDATE users SET bio = ? WHERE userId = ?", [bio, userId])
+        await profile_cache.invalidate(userId)
+        await candidate_queue.on_user_changed(userId)
         return {"success": True}
     except Exception as e:
-        print(f"[POST /api/updateBio] Ошибка: {e}")
+        logger.error(f"[POST /api/updateBio] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -519,9 +492,11 @@ async def update_photo_url(data: Dict[str, str] = Body(...)):
             "UPDATE users SET photoUrl = ?, needPhoto = ? WHERE userId = ?",
             [photoUrl, needPhoto, userId]
         )
+        await profile_cache.invalidate(userId)
+        await candidate_queue.on_user_changed(userId)
         return {"success": True, "needPhoto": needPhoto}
     except Exception as e:
-        print(f"[POST /api/updatePhotoUrl] Ошибка: {e}")
+        logger.error(f"[POST /api/updatePhotoUrl] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -541,9 +516,11 @@ async def update_photo(data: Dict[str, str] = Body(...)):
     
     try:
         await db_run(f"UPDATE users SET {slot} = ? WHERE userId = ?", [photoUrl, userId])
+        await profile_cache.invalidate(userId)
+        await candidate_queue.on_user_changed(userId)
         return {"success": True, "updatedSlot": slot, "photoUrl": photoUrl}
     except Exception as e:
-        print(f"[POST /api/updatePhoto] Ошибка: {e}")
+        logger.error(f"[POST /api/updatePhoto] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -616,9 +593,12 @@ async def update_profile(data: Dict[str, Any] = Body(...)):
     
     try:
         await db_run(sql, params)
+        await profile_cache.invalidate(userId)
+        # Пол, фото, описание и возраст - в карточке и в выборе очередей кандидатов
+        await candidate_queue.on_user_changed(userId)
         return {"success": True, "message": "Profile updated successfully"}
     except Exception as e:
-        print(f"[POST /api/updateProfile] Ошибка: {e}")
+        logger.error(f"[POST /api/updateProfile] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -638,9 +618,7 @@ async def get_last_login(userId: str):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[GET /api/last-login/{userId}] Ошибка: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"[GET /api/last-login/{userId}] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -657,9 +635,10 @@ async def update_last_login(data: Dict[str, str] = Body(...)):
     try:
         # В БД колонка называется lastLogin (camelCase), нужны кавычки для PostgreSQL!
         await db_run('UPDATE users SET "lastLogin" = ? WHERE "userId" = ?', [last_login, userId])
+        await profile_cache.invalidate(userId)
         return {"success": True, "message": "Last login time updated"}
     except Exception as e:
-        print(f"[POST /api/last-login] Ошибка: {e}")
+        logger.error(f"[POST /api/last-login] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -680,7 +659,7 @@ async def request_badge(data: Dict[str, str] = Body(...)):
         )
         return {"success": True, "message": "Request submitted"}
     except Exception as e:
-        print(f"[POST /api/request-badge] Ошибка: {e}")
+        logger.error(f"[POST /api/request-badge] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -691,7 +670,7 @@ async def get_badge_requests():
         rows = await db_all("SELECT * FROM badge_requests WHERE status = ? ORDER BY createdAt DESC", ["pending"])
         return {"success": True, "data": rows}
     except Exception as e:
-        print(f"[GET /api/get-badge-requests] Ошибка: {e}")
+        logger.error(f"[GET /api/get-badge-requests] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -709,6 +688,8 @@ async def approve_badge(data: Dict[str, int] = Body(...)):
         
         # Обновляем бейдж пользователя
         await db_run("UPDATE users SET badge = ? WHERE userId = ?", [request["badge_type"], request["userId"]])
+        await profile_cache.invalidate(request["userId"])
+        await candidate_queue.on_user_changed(request["userId"])
         # Обновляем статус заявки
         await db_run("UPDATE badge_requests SET status = ? WHERE id = ?", ["approved", requestId])
         
@@ -716,7 +697,7 @@ async def approve_badge(data: Dict[str, int] = Body(...)):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[POST /api/approve-badge] Ошибка: {e}")
+        logger.error(f"[POST /api/approve-badge] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -738,6 +719,6 @@ async def reject_badge(data: Dict[str, int] = Body(...)):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[POST /api/reject-badge] Ошибка: {e}")
+        logger.error(f"[POST /api/reject-badge] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
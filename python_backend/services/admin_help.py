@@ -0,0 +1,225 @@
+"""
+services/admin_help.py
+Справка по командам бота и API эндпоинтам администратора (/admin_help в боте и GET /api/admin_help)
+"""
+
+ADMIN_HELP = {
+    "title": "📋 Список команд для администратора",
+    "description": "Доступные команды бота и API эндпоинты",
+    "bot_commands": [
+        {
+            "command": "/start",
+            "description": "Начать работу с ботом",
+            "usage": "/start [buy_pro_menu]",
+            "example": "/start или /start buy_pro_menu"
+        },
+        {
+            "command": "/grantpro",
+            "description": "Выдать PRO подписку пользователю",
+            "usage": "/grantpro <userId> <days>",
+            "example": "/grantpro 307954967 30"
+        },
+        {
+            "command": "/addbadge",
+            "description": "Выдать бейдж пользователю",
+            "usage": "/addbadge <userId> <badge>",
+            "example": "/addbadge 307954967 S",
+            "note": "Доступные бейджи: L, P, S, DN, LV, VERIFIED, PREMIUM, ADMIN"
+        },
+        {
+            "command": "/stats",
+            "description": "Получить статистику приложения",
+            "usage": "/stats",
+            "example": "/stats"
+        },
+        {
+            "command": "/prostats",
+            "description": "Получить статистику PRO пользователей",
+            "usage": "/prostats",
+            "example": "/prostats",
+            "note": "Показывает общее количество PRO, активных PRO, истекших PRO и проценты"
+        },
+        {
+            "command": "/delete_user",
+            "description": "Удалить пользователя",
+            "usage": "/delete_user <userId>",
+            "example": "/delete_user 307954967"
+        },
+        {
+            "command": "/clear_photos",
+            "description": "Очистить фотографии пользователя",
+            "usage": "/clear_photos <userId>",
+            "example": "/clear_photos 307954967"
+        },
+        {
+            "command": "/masssend",
+            "description": "Массовая рассылка сообщений всем пользователям",
+            "usage": "/masssend <сообщение>",
+            "example": "/masssend Привет всем пользователям!"
+        },
+        {
+            "command": "/stats_users",
+            "description": "Получить статистику пользователей по полу",
+            "usage": "/stats_users",
+            "example": "/stats_users"
+        },
+        {
+            "command": "/sendto",
+            "description": "Отправить сообщение конкретному пользователю",
+            "usage": "/sendto <userId> <сообщение>",
+            "example": "/sendto 307954967 Привет! Это тестовое сообщение."
+        }
+    ],
+    "api_endpoints": [
+        {
+            "method": "GET",
+            "endpoint": "/api/admin/get-all-users-for-admin?fields=<поля>&cursor=<курсор>&format=<json|ndjson>",
+            "description": "Пользователи постранично (nextCursor) или NDJSON потоком, fields - нужные колонки",
+            "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
+            "example": "/api/admin/get-all-users-for-admin?fields=userId,name&format=ndjson"
+        },
+        {
+            "method": "GET",
+            "endpoint": "/api/admin/search-users-for-admin?query=<query>",
+            "description": "Поиск пользователей по имени, username или userId",
+            "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
+            "example": "/api/admin/search-users-for-admin?query=Иван"
+        },
+        {
+            "method": "GET",
+            "endpoint": "/api/admin/get-user-data-for-badge?userId=<userId>",
+            "description": "Получить данные пользователя для заявки на бейдж",
+            "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
+            "example": "/api/admin/get-user-data-for-badge?userId=307954967"
+        },
+        {
+            "method": "POST",
+            "endpoint": "/api/admin/update-user-for-admin",
+            "description": "Обновить данные пользователя",
+            "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
+            "body": {
+                "userId": "string (обязательно)",
+                "name": "string (опционально)",
+                "username": "string (опционально)",
+                "bio": "string (опционально)",
+                "age": "number (опционально)",
+                "gender": "string (опционально)",
+                "badge": "string (опционально)",
+                "blocked": "boolean (опционально)",
+                "is_pro": "boolean (опционально)",
+                "pro_start": "string (опционально)",
+                "pro_end": "string (опционально)",
+                "warned": "boolean (опционально)",
+                "pushSent": "boolean (опционально)"
+            },
+            "example": {
+                "userId": "307954967",
+                "name": "Новое имя",
+                "badge": "S"
+            }
+        },
+        {
+            "method": "POST",
+            "endpoint": "/api/admin/delete-user-for-admin",
+            "description": "Удалить пользователя",
+            "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
+            "body": {
+                "userId": "string (обязательно)"
+            },
+            "example": {
+                "userId": "307954967"
+            }
+        },
+        {
+            "method": "POST",
+            "endpoint": "/api/admin/delete-users-for-admin",
+            "description": "Массовое удаление пользователей со всеми связанными данными",
+            "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
+            "body": {
+                "userIds": "list[string] (обязательно)"
+            },
+            "note": "До BULK_DELETE_MAX_USERS id - сразу (deleted, notFound), больше - фоновой задачей (jobId)",
+            "example": {
+                "userIds": ["307954967", "123456789"]
+            }
+        },
+        {
+            "method": "POST",
+            "endpoint": "/api/admin/send-message-for-admin",
+            "description": "Отправить сообщение пользователю",
+            "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
+            "body": {
+                "userId": "string (обязательно)",
+                "message": "string (обязательно, макс. 4096 символов)"
+            },
+            "example": {
+                "userId": "307954967",
+                "message": "Привет!"
+            }
+        },
+        {
+            "method": "POST",
+            "endpoint": "/api/admin/updateBadge",
+            "description": "Обновить бейдж пользователя",
+            "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
+            "body": {
+                "userId": "string (обязательно)",
+                "badge": "string (обязательно: L, P, S, DN, LV, VERIFIED, PREMIUM, ADMIN или пустая строка)"
+            },
+            "example": {
+                "userId": "307954967",
+                "badge": "S"
+            }
+        },
+        {
+            "method": "POST",
+            "endpoint": "/api/admin/extract-data",
+            "description": "Распаковать данные из архива",
+            "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
+            "note": "Ищет последний архив data-backup-*.tar.gz в /tmp и ставит распаковку в очередь, возвращает jobId"
+        },
+        {
+            "method": "POST",
+            "endpoint": "/api/admin/regenerate-photo-variants",
+            "description": "Перегенерировать превью и WebP всех фото в фоне",
+            "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
+            "note": "Возвращает jobId, статус - /api/admin/jobs/<jobId>"
+        },
+        {
+            "method": "GET",
+            "endpoint": "/api/admin/jobs",
+            "description": "Очередь фоновых задач: число задач по типу и статусу, метрики воркера",
+            "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
+            "example": "/api/admin/jobs"
+        },
+        {
+            "method": "GET",
+            "endpoint": "/api/admin/jobs/<jobId>",
+            "description": "Статус фоновой задачи (queued, running, done, failed), попытки и последняя ошибка",
+            "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
+            "example": "/api/admin/jobs/42"
+        },
+        {
+            "method": "GET",
+            "endpoint": "/api/admin/pro-stats",
+            "description": "Получить статистику PRO пользователей",
+            "headers": "Authorization: Bearer <token> или X-Telegram-User-Id: <telegram_id>",
+            "returns": {
+                "total_pro": "Общее количество пользователей с PRO",
+                "active_pro": "Количество активных PRO (с неистекшим сроком)",
+                "expired_pro": "Количество истекших PRO",
+                "total_users": "Общее количество пользователей",
+                "pro_percentage": "Процент PRO от общего числа",
+                "active_pro_percentage": "Процент активных PRO от общего числа"
+            },
+            "example": "/api/admin/pro-stats"
+        }
+    ],
+    "authorization": {
+        "methods": [
+            "Bearer Token: Authorization: Bearer <ADMIN_TOKEN>",
+            "Telegram ID: X-Telegram-User-Id: <telegram_id> (должен быть в ADMIN_TELEGRAM_IDS)"
+        ],
+        "note": "Для использования API эндпоинтов требуется авторизация через один из методов выше"
+    }
+}
@@ -0,0 +1,43 @@
+"""
+services/badges.py
+Бейджи пользователей: разбор значения и сохранение
+"""
+from db_utils import db_run
+from services import candidate_queue, profile_cache
+from services.users import UserNotFound
+
+ALLOWED_BADGES = {"", "L", "P", "S", "DN", "LV", "VERIFIED", "PREMIUM", "ADMIN"}
+
+
+class InvalidBadge(ValueError):
+    """Бейдж не из ALLOWED_BADGES"""
+
+
+def normalize_badge(badge: str) -> str:
+    """
+    Значение бейджа в верхнем регистре. Принимает букву ("S") или путь к иконке ("/label/S.svg").
+    Недопустимое значение - InvalidBadge.
+    """
+    badge_value = badge
+    if badge_value.startswith("/label/") and badge_value.endswith(".svg"):
+        # "/label/S.svg" -> "S"
+        badge_value = badge_value.replace("/label/", "").replace(".svg", "")
+    elif "/" in badge_value or "." in badge_value:
+        # Похоже на путь, но не стандартный формат - берем последнюю часть
+        badge_value = badge_value.split("/")[-1].replace(".svg", "")
+
+    badge_value = badge_value.upper()
+    if badge_value not in ALLOWED_BADGES:
+        raise InvalidBadge(f"Недопустимый бейдж: {badge_value}. Разрешенные значения: {', '.join(ALLOWED_BADGES)}")
+    return badge_value
+
+
+async def update_badge(user_id: str, badge: str) -> str:
+    """Сохранить бейдж пользователя, вернуть сохраненное значение"""
+    badge_value = normalize_badge(badge)
+    result = await db_run('UPDATE users SET badge = ? WHERE "userId" = ?', [badge_value, user_id])
+    if result.get("changes", 0) == 0:
+        raise UserNotFound(user_id)
+    await profile_cache.invalidate(user_id)
+    await candidate_queue.on_user_changed(user_id)
+    return badge_value
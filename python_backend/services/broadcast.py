@@ -0,0 +1,383 @@
+"""
+services/broadcast.py
+Массовая рассылка (/masssend).
+
+Раньше бот отправлял сообщения строго по одному с паузой 0.05 сек, поэтому рассылка
+на десятки тысяч пользователей шла часами и вставала на каждом медленном ответе Telegram.
+
+Здесь:
+- сообщения отправляют BROADCAST_CONCURRENCY воркеров параллельно;
+- общий темп задает TokenBucket (BROADCAST_RATE сообщений в секунду на бота, лимит Telegram ~30/сек),
+  в один чат - не чаще раза в BROADCAST_PER_CHAT_INTERVAL сек (ChatLimiter);
+- RetryAfter (flood control) ставит на паузу весь bucket на указанное Telegram время,
+  сетевые ошибки повторяются с экспоненциальной задержкой (до BROADCAST_MAX_RETRIES раз);
+- рассылка выполняется фоновой задачей (services/jobs.py), получатели и их статусы хранятся
+  в broadcast_recipients: после перезапуска задача продолжает с неотправленных. Результаты
+  пишутся в БД пачками, поэтому при падении процесса последние несколько секунд отправок могут повториться;
+- прогресс (отправлено, скорость, сколько осталось) обновляется в сообщении администратору.
+"""
+import asyncio
+import random
+import time
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from db_utils import db_get, db_all, db_run, get_pg_pool
+from services import jobs
+from config import (
+    BROADCAST_RATE, BROADCAST_CONCURRENCY, BROADCAST_PER_CHAT_INTERVAL,
+    BROADCAST_MAX_RETRIES, BROADCAST_PROGRESS_INTERVAL
+)
+import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Статусы получателя
+PENDING = "pending"
+SENT = "sent"
+BLOCKED = "blocked"
+FAILED = "failed"
+
+JOB_KIND = "broadcast"
+
+# Сколько получателей читать из БД за раз
+RECIPIENTS_BATCH_SIZE = 1000
+# Задержка перед повтором после сетевой ошибки: 1, 2, 4... сек (не больше BACKOFF_MAX)
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+
+class TokenBucket:
+    """
+    Ограничение темпа: rate токенов в секунду, не больше capacity подряд.
+    pause() останавливает выдачу токенов (RetryAfter от Telegram).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        until = time.monotonic() + seconds
+        if until > self._paused_until:
+            self._paused_until = until
+            self._tokens = 0.0
+            self._updated = until
+
+    async def acquire(self) -> None:
+        # Под блокировкой: ожидающие получают токены по очереди
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ChatLimiter:
+    """Не чаще одного сообщения в interval секунд в один чат"""
+
+    # Выше этого числа чатов забываем те, в которые уже можно писать
+    MAX_TRACKED = 10000
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next: Dict[int, float] = {}
+
+    async def acquire(self, chat_id: int) -> None:
+        now = time.monotonic()
+        if len(self._next) > self.MAX_TRACKED:
+            self._next = {chat: ready for chat, ready in self._next.items() if ready > now}
+        ready = self._next.get(chat_id, 0.0)
+        self._next[chat_id] = max(now, ready) + self.interval
+        if ready > now:
+            await asyncio.sleep(ready - now)
+
+
+# Лимиты Telegram действуют на бота, поэтому общие для всех рассылок
+_bucket = TokenBucket(BROADCAST_RATE)
+_chats = ChatLimiter(BROADCAST_PER_CHAT_INTERVAL)
+_stats = {"sent": 0, "blocked": 0, "failed": 0, "retry_after": 0, "retries": 0}
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+async def _deliver(bot, chat_id: int, text: str) -> str:
+    """Отправить одно сообщение с учетом лимитов, вернуть статус получателя"""
+    attempt = 0
+    while True:
+        await _chats.acquire(chat_id)
+        await _bucket.acquire()
+        try:
+            await bot.send_message(chat_id=chat_id, text=text)
+            return SENT
+        except RetryAfter as e:
+            # Flood control: Telegram сам говорит, сколько ждать - останавливаем всю рассылку
+            _stats["retry_after"] += 1
+            _bucket.pause(_retry_after_seconds(e))
+        except Forbidden:
+            # Пользователь заблокировал бота или удалил аккаунт
+            return BLOCKED
+        except BadRequest as e:
+            return BLOCKED if "chat not found" in str(e).lower() else FAILED
+        except NetworkError as e:
+            attempt += 1
+            if attempt > BROADCAST_MAX_RETRIES:
+                logger.warning(f"Рассылка: не удалось отправить {chat_id}: {e}")
+                return FAILED
+            _stats["retries"] += 1
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+        except Exception as e:
+            logger.warning(f"Рассылка: ошибка отправки {chat_id}: {e}")
+            return FAILED
+
+
+async def _create(text: str, admin_chat_id: int) -> Optional[Tuple[int, int, int]]:
+    """
+    Создать рассылку и список получателей (все пользователи с числовым userId)
+
+    Returns:
+        (id рассылки, получателей, невалидных userId) или None, если получателей нет
+    """
+    pg_pool = get_pg_pool()
+    async with pg_pool.connection() as conn:
+        try:
+            cur = conn.cursor()
+            await cur.execute(
+                "INSERT INTO broadcasts (text, admin_chat_id) VALUES (%s, %s) RETURNING id",
+                (text, admin_chat_id)
+            )
+            (broadcast_id,) = await cur.fetchone()
+            await cur.execute(
+                """INSERT INTO broadcast_recipients (broadcast_id, user_id)
+                   SELECT %s, "userId" FROM users WHERE "userId" ~ '^[0-9]+$'
+                   ON CONFLICT DO NOTHING""",
+                (broadcast_id,)
+            )
+            total = cur.rowcount
+            if total <= 0:
+                await conn.rollback()
+                return None
+            await cur.execute("""SELECT COUNT(*) FROM users WHERE "userId" IS NULL OR "userId" !~ '^[0-9]+$'""")
+            (invalid,) = await cur.fetchone()
+            await cur.execute(
+                "UPDATE broadcasts SET total = %s, invalid = %s WHERE id = %s",
+                (total, invalid, broadcast_id)
+            )
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+    return broadcast_id, total, invalid
+
+
+async def _flush(broadcast_id: int, results: List[Tuple[str, str]]) -> None:
+    """Записать статусы отправленных получателей и счетчики рассылки одной транзакцией"""
+    if not results:
+        return
+    batch = results[:]
+    del results[:len(batch)]
+    counts = {SENT: 0, BLOCKED: 0, FAILED: 0}
+    for _, status in batch:
+        counts[status] += 1
+
+    pg_pool = get_pg_pool()
+    async with pg_pool.connection() as conn:
+        try:
+            cur = conn.cursor()
+            await cur.execute(
+                """UPDATE broadcast_recipients r SET status = u.status
+                   FROM unnest(%s::text[], %s::text[]) AS u(user_id, status)
+                   WHERE r.broadcast_id = %s AND r.user_id = u.user_id""",
+                ([user_id for user_id, _ in batch], [status for _, status in batch], broadcast_id)
+            )
+            await cur.execute(
+                "UPDATE broadcasts SET sent = sent + %s, blocked = blocked + %s, failed = failed + %s WHERE id = %s",
+                (counts[SENT], counts[BLOCKED], counts[FAILED], broadcast_id)
+            )
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            # Не записалось (в том числе при отмене задачи) - вернем в очередь на следующую запись
+            results.extend(batch)
+            raise
+
+
+def _progress_text(row: Dict[str, Any], rate: float) -> str:
+    done = row["sent"] + row["blocked"] + row["failed"]
+    text = (
+        f"📤 Рассылка #{row['id']} в процессе...\n"
+        f"✅ Отправлено: {row['sent']}/{row['total']}\n"
+        f"🚫 Заблокировали бота: {row['blocked']}\n"
+        f"❌ Ошибок: {row['failed']}\n"
+    )
+    if rate > 0:
+        remaining = max(0, row["total"] - done)
+        text += f"⚡ {rate:.1f} сообщ./сек, осталось ~{int(remaining / rate // 60)} мин"
+    return text
+
+
+def _final_text(row: Dict[str, Any]) -> str:
+    text = (
+        f"✅ Рассылка завершена!\n\n"
+        f"📊 Статистика:\n"
+        f"✅ Успешно отправлено: {row['sent']}\n"
+    )
+    if row["blocked"] > 0:
+        text += f"🚫 Заблокировали бота: {row['blocked']}\n"
+    if row["failed"] > 0:
+        text += f"❌ Ошибок: {row['failed']}\n"
+    if row["invalid"] > 0:
+        text += f"⚠️ Невалидных ID: {row['invalid']}\n"
+    return text
+
+
+async def _show(bot, row: Dict[str, Any], text: str) -> None:
+    """Обновить сообщение с прогрессом у администратора (ошибки не прерывают рассылку)"""
+    if not row.get("admin_chat_id") or not row.get("status_message_id"):
+        return
+    try:
+        await _chats.acquire(row["admin_chat_id"])
+        await bot.edit_message_text(text, chat_id=row["admin_chat_id"], message_id=row["status_message_id"])
+    except Exception as e:
+        logger.debug(f"Рассылка #{row['id']}: не удалось обновить прогресс: {e}")
+
+
+async def run(bot, broadcast_id: int) -> None:
+    """Отправить рассылку всем получателям в статусе pending (задача JOB_KIND)"""
+    row = await db_get("SELECT * FROM broadcasts WHERE id = ?", [broadcast_id])
+    if not row or row["status"] != "running":
+        return
+    text = row["text"]
+    results: List[Tuple[str, str]] = []
+    queue: asyncio.Queue = asyncio.Queue(maxsize=BROADCAST_CONCURRENCY * 4)
+    started = time.monotonic()
+    delivered = 0
+
+    async def produce() -> None:
+        # Keyset по user_id: каждая пачка - короткий запрос, память не растет с числом получателей
+        after = ""
+        while True:
+            batch = await db_all(
+                """SELECT user_id FROM broadcast_recipients
+                   WHERE broadcast_id = ? AND status = ? AND user_id > ?
+                   ORDER BY user_id LIMIT ?""",
+                [broadcast_id, PENDING, after, RECIPIENTS_BATCH_SIZE]
+            )
+            for recipient in batch:
+                await queue.put(recipient["user_id"])
+            if len(batch) < RECIPIENTS_BATCH_SIZE:
+                break
+            after = batch[-1]["user_id"]
+        for _ in range(BROADCAST_CONCURRENCY):
+            await queue.put(None)
+
+    async def work() -> None:
+        nonlocal delivered
+        while True:
+            user_id = await queue.get()
+            if user_id is None:
+                return
+            status = await _deliver(bot, int(user_id), text)
+            _stats[status] += 1
+            delivered += 1
+            results.append((user_id, status))
+
+    async def report() -> None:
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
+            try:
+                await _flush(broadcast_id, results)
+            except Exception as e:
+                logger.error(f"Рассылка #{broadcast_id}: ошибка записи прогресса: {e}")
+                continue
+            current = await db_get("SELECT * FROM broadcasts WHERE id = ?", [broadcast_id])
+            await _show(bot, current, _progress_text(current, delivered / (time.monotonic() - started)))
+
+    logger.info(f"Рассылка #{broadcast_id}: старт ({row['total']} получателей, отправлено ранее: {row['sent'] + row['blocked'] + row['failed']})")
+    reporter = asyncio.create_task(report())
+    workers = [asyncio.create_task(work()) for _ in range(BROADCAST_CONCURRENCY)]
+    try:
+        await produce()
+        await asyncio.gather(*workers)
+    finally:
+        for task in (reporter, *workers):
+            task.cancel()
+        await asyncio.gather(reporter, *workers, return_exceptions=True)
+        # И при остановке приложения (CancelledError): отправленное не должно уйти повторно при следующем запуске задачи
+        await _flush(broadcast_id, results)
+
+    await db_run("UPDATE broadcasts SET status = 'done', finished_at = NOW() WHERE id = ?", [broadcast_id])
+    row = await db_get("SELECT * FROM broadcasts WHERE id = ?", [broadcast_id])
+    await _show(bot, row, _final_text(row))
+    logger.info(
+        f"Рассылка #{broadcast_id} завершена: успешно={row['sent']}, заблокировали={row['blocked']}, "
+        f"ошибок={row['failed']}, невалидных={row['invalid']}, за {time.monotonic() - started:.0f} сек"
+    )
+
+
+async def start(bot, text: str, admin_chat_id: int) -> Optional[int]:
+    """
+    Запустить рассылку в фоне (команда бота сразу возвращается)
+
+    Returns:
+        id рассылки или None, если получателей нет
+    """
+    created = await _create(text, admin_chat_id)
+    if created is None:
+        return None
+    broadcast_id, total, _ = created
+    status_message = await bot.send_message(
+        chat_id=admin_chat_id,
+        text=f"📤 Начинаю рассылку #{broadcast_id} сообщения {total} пользователям...\n⏳ Отправлено: 0/{total}"
+    )
+    await db_run(
+        "UPDATE broadcasts SET status_message_id = ? WHERE id = ?",
+        [status_message.message_id, broadcast_id]
+    )
+    await jobs.enqueue(JOB_KIND, {"broadcastId": broadcast_id}, dedupe_key=f"{JOB_KIND}:{broadcast_id}")
+    return broadcast_id
+
+
+def register_job(bot) -> None:
+    """Зарегистрировать обработчик задачи рассылки (при старте бота: задаче нужен объект бота)"""
+    async def handler(payload: Dict[str, Any]) -> None:
+        await run(bot, payload["broadcastId"])
+
+    jobs.register(JOB_KIND, handler, concurrency=1)
+
+
+def get_stats() -> Dict[str, Any]:
+    """Счетчики отправок с момента запуска процесса"""
+    return dict(_stats)
+
+
+@metrics.collector
+def _broadcast_metrics():
+    return [
+        metrics.labeled_family(
+            "broadcast_messages_total", "counter", "Сообщения рассылок по результату",
+            "result", {key: _stats[key] for key in ("sent", "blocked", "failed")}
+        ),
+        metrics.labeled_family(
+            "broadcast_throttled_total", "counter", "Ответы Telegram RetryAfter и повторы отправки",
+            "reason", {key: _stats[key] for key in ("retry_after", "retries")}
+        ),
+    ]
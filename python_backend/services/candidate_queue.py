@@ -0,0 +1,227 @@
+"""
+services/candidate_queue.py
+Предвычисленные очереди кандидатов для активных пользователей.
+
+Очередь хранит следующие карточки ленты (по возрастанию users.id) и догружается
+из БД в фоне. Вместо пересчета колоды на каждый запрос очереди точечно
+обновляются событиями: регистрация, изменение профиля и фото, блокировка, лайк/дизлайк.
+Очереди живут в памяти процесса, источник истины - БД (services/candidates.py).
+"""
+import asyncio
+import contextvars
+import time
+from collections import OrderedDict
+from itertools import islice
+from typing import Any, Dict, List, Optional, Tuple
+from db_utils import db_get
+from services import candidates
+from config import CANDIDATE_QUEUE_SIZE, CANDIDATE_QUEUE_MAX_USERS, CANDIDATE_QUEUE_TTL
+import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CandidateQueue:
+    """Очередь кандидатов одного пользователя для одного пола"""
+
+    def __init__(self, user_id: str, gender: str, start_after: int = 0):
+        self.user_id = user_id
+        self.gender = gender
+        self.items: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # userId -> строка кандидата
+        self.start_after = start_after   # Очередь покрывает id в диапазоне (start_after, loaded_until]
+        self.loaded_until = start_after
+        self.exhausted = False           # После loaded_until в БД кандидатов нет
+        self.generation = 0              # Меняется при reset, чтобы не принять устаревшую догрузку
+        self.touched = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.refill_task: Optional[asyncio.Task] = None
+
+    def reset(self, start_after: int) -> None:
+        """Начать очередь заново с указанной позиции"""
+        self.items.clear()
+        self.generation += 1
+        self.start_after = start_after
+        self.loaded_until = start_after
+        self.exhausted = False
+
+    def advance(self, after_id: int) -> None:
+        """Выбросить уже выданных клиенту кандидатов (id <= after_id)"""
+        while self.items:
+            first = next(iter(self.items.values()))
+            if first["id"] > after_id:
+                break
+            self.items.popitem(last=False)
+        self.start_after = max(self.start_after, after_id)
+
+    async def refill(self) -> None:
+        """Догрузить следующую порцию кандидатов из БД"""
+        async with self.lock:
+            if self.exhausted:
+                return
+            generation = self.generation
+            rows, last_id = await candidates.get_candidate_page(
+                self.user_id, self.gender, self.loaded_until, CANDIDATE_QUEUE_SIZE
+            )
+            if generation != self.generation:
+                return
+            for row in rows:
+                self.items[str(row["userId"])] = row
+            if rows:
+                self.loaded_until = rows[-1]["id"]
+            self.exhausted = last_id is None
+
+
+# (userId, пол кандидатов) -> очередь, в порядке последнего обращения
+_queues: "OrderedDict[Tuple[str, str], CandidateQueue]" = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "refills": 0, "invalidations": 0}
+
+
+def _get_queue(user_id: str, gender: str, after_id: int) -> CandidateQueue:
+    """Получить очередь пользователя (создать, если нет), с LRU и TTL вытеснением"""
+    key = (str(user_id), gender)
+    now = time.monotonic()
+    queue = _queues.get(key)
+    if queue is not None and now - queue.touched > CANDIDATE_QUEUE_TTL:
+        queue = None
+    if queue is None:
+        _stats["misses"] += 1
+        queue = CandidateQueue(str(user_id), gender, after_id)
+        _queues[key] = queue
+        while len(_queues) > CANDIDATE_QUEUE_MAX_USERS:
+            _queues.popitem(last=False)
+    else:
+        _stats["hits"] += 1
+    _queues.move_to_end(key)
+    queue.touched = now
+    return queue
+
+
+def _schedule_refill(queue: CandidateQueue) -> None:
+    """Запустить фоновую догрузку, если она еще не идет"""
+    if queue.exhausted or (queue.refill_task and not queue.refill_task.done()):
+        return
+    _stats["refills"] += 1
+    # Пустой контекст: догрузка переживает запрос и не должна идти через соединение его сессии БД
+    queue.refill_task = asyncio.create_task(queue.refill(), context=contextvars.Context())
+
+
+async def get_page(
+    user_id: str,
+    gender: str,
+    after_id: int = 0,
+    limit: int = 20
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    Страница кандидатов из очереди пользователя (тот же контракт, что у candidates.get_candidate_page)
+
+    Returns:
+        (строки кандидатов, id последнего кандидата или None, если лента закончилась)
+    """
+    queue = _get_queue(user_id, gender, after_id)
+
+    # Клиент вернулся назад или перескочил вперед - очередь строится заново с его позиции
+    if after_id < queue.start_after or after_id > queue.loaded_until:
+        queue.reset(after_id)
+    queue.advance(after_id)
+
+    if len(queue.items) < limit and not queue.exhausted:
+        await queue.refill()
+
+    rows = list(islice(queue.items.values(), limit))
+    has_more = len(queue.items) > limit or not queue.exhausted
+
+    # Готовим следующую страницу заранее
+    if len(queue.items) - len(rows) < limit:
+        _schedule_refill(queue)
+
+    last_id = rows[-1]["id"] if has_more and rows else None
+    return rows, last_id
+
+
+def on_swipe(user_id: str, target_id: str) -> None:
+    """Пользователь лайкнул/дизлайкнул кандидата - убрать его из очередей пользователя"""
+    for (owner, _), queue in _queues.items():
+        if owner == str(user_id):
+            queue.items.pop(str(target_id), None)
+
+
+def on_unswipe(user_id: str) -> None:
+    """Лайк/дизлайк отменен - кандидат снова доступен, очереди пользователя строятся заново"""
+    for key in [key for key in _queues if key[0] == str(user_id)]:
+        del _queues[key]
+        _stats["invalidations"] += 1
+
+
+def on_user_removed(user_id: str) -> None:
+    """Пользователь удален или больше не кандидат - убрать его из всех очередей"""
+    user_id = str(user_id)
+    for key in [key for key in _queues if key[0] == user_id]:
+        del _queues[key]
+    for queue in _queues.values():
+        if queue.items.pop(user_id, None) is not None:
+            _stats["invalidations"] += 1
+
+
+async def on_user_changed(user_id: str) -> None:
+    """
+    Профиль изменился (регистрация, фото, пол, описание, блокировка).
+    Если пользователь теперь кандидат - в очередях его пола карточка заменяется свежей
+    или подхватывается при догрузке, иначе он убирается из всех очередей.
+    """
+    user_id = str(user_id)
+    try:
+        row = await db_get(
+            f'SELECT {candidates.CANDIDATE_COLUMNS}, u.blocked, u."needPhoto" FROM users u WHERE u."userId" = ?',
+            [user_id]
+        )
+        if not row or row.pop("blocked") != 0 or row.pop("needPhoto") != 0:
+            on_user_removed(user_id)
+            return
+
+        for key in list(_queues):
+            queue = _queues[key]
+            if queue.gender != row.get("gender"):
+                # Пол мог измениться - в очередях другого пола пользователю не место
+                queue.items.pop(user_id, None)
+                continue
+            if queue.user_id == user_id:
+                continue
+            if user_id in queue.items:
+                # Уже в очереди - заменяем карточку (фото, описание, возраст), место в очереди то же
+                queue.items[user_id] = dict(row)
+                continue
+            if row["id"] > queue.loaded_until:
+                # Попадет в очередь при следующей догрузке
+                queue.exhausted = False
+            elif row["id"] > queue.start_after:
+                # Оказался внутри уже загруженного диапазона - пересобираем очередь
+                del _queues[key]
+                _stats["invalidations"] += 1
+    except Exception as e:
+        logger.error(f"❌ [CANDIDATES] Ошибка обновления очередей для userId={user_id}: {e}")
+
+
+def get_queue_stats() -> Dict[str, Any]:
+    """Метрики очередей кандидатов"""
+    return {
+        "queues": len(_queues),
+        "max_queues": CANDIDATE_QUEUE_MAX_USERS,
+        "queued_candidates": sum(len(queue.items) for queue in _queues.values()),
+        **_stats,
+    }
+
+
+@metrics.collector
+def _candidate_queue_metrics():
+    return [
+        metrics.value_family("candidate_queues", "gauge", "Очереди кандидатов в памяти (пользователь, пол)", len(_queues)),
+        metrics.value_family(
+            "candidate_queue_items", "gauge", "Кандидаты во всех очередях",
+            sum(len(queue.items) for queue in _queues.values())
+        ),
+        metrics.labeled_family(
+            "candidate_queue_events_total", "counter", "Обращения к очередям кандидатов",
+            "event", dict(_stats)
+        ),
+    ]
@@ -0,0 +1,45 @@
+"""
+services/candidates.py
+Лента кандидатов для свайпа: исключение лайкнутых/дизлайкнутых в SQL
+и постраничная выдача по keyset-курсору (users.id)
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from db_utils import db_all
+
+# Колонки, нужные карточке кандидата
+CANDIDATE_COLUMNS = 'u.id, u."userId", u.name, u.username, u.gender, u.bio, u.age, u.photo1, u.photo2, u.photo3, u."photoUrl", u.badge'
+
+
+async def get_candidate_page(
+    user_id: str,
+    gender: str,
+    after_id: int = 0,
+    limit: int = 20
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    Получить страницу кандидатов после after_id
+
+    Использует частичный индекс idx_users_candidates (gender, id) WHERE blocked = 0 AND "needPhoto" = 0
+    и анти-join с user_edges по первичному ключу (from_user, kind, to_user).
+
+    Returns:
+        (строки кандидатов, id последнего кандидата или None, если лента закончилась)
+    """
+    rows = await db_all(
+        f"""SELECT {CANDIDATE_COLUMNS}
+            FROM users u
+            WHERE u.gender = ? AND u.blocked = 0 AND u."needPhoto" = 0
+              AND u.id > ? AND u."userId" != ?
+              AND NOT EXISTS (
+                  SELECT 1 FROM user_edges e
+                  WHERE e.from_user = ? AND e.kind IN ('like', 'dislike') AND e.to_user = u."userId"
+              )
+            ORDER BY u.id
+            LIMIT ?""",
+        [gender, after_id, user_id, user_id, limit + 1]
+    )
+    # Берем на одну строку больше, чтобы понять, есть ли следующая страница
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    last_id = rows[-1]["id"] if has_more and rows else None
+    return rows, last_id
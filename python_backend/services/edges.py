@@ -0,0 +1,250 @@
+"""
+services/edges.py
+Хранилище связей между пользователями (лайки, дизлайки, мэтчи).
+Каждая связь - отдельная строка user_edges (from_user, to_user, kind)
+вместо JSONB массивов likes/dislikes/matches в таблице users.
+"""
+import asyncio
+from typing import Any, Dict, List, Tuple
+from db_utils import db_get, db_all, db_run, get_pg_pool, transaction
+import logging
+
+logger = logging.getLogger(__name__)
+
+KIND_LIKE = "like"
+KIND_DISLIKE = "dislike"
+KIND_MATCH = "match"
+
+# Старые JSONB колонки users, из которых переносятся связи
+LEGACY_COLUMNS = {
+    KIND_LIKE: "likes",
+    KIND_DISLIKE: "dislikes",
+    KIND_MATCH: "matches",
+}
+
+# Пока перенос из JSONB не завершен, удаления чистят и старые колонки
+_backfill_done = False
+
+
+async def add_edge(from_user: str, to_user: str, kind: str) -> bool:
+    """Добавить связь (idempotent). Возвращает True, если связь новая"""
+    result = await db_run(
+        """INSERT INTO user_edges (from_user, to_user, kind) VALUES (?, ?, ?)
+           ON CONFLICT (from_user, kind, to_user) DO NOTHING""",
+        [str(from_user), str(to_user), kind]
+    )
+    return result["changes"] > 0
+
+
+async def like(from_user: str, to_user: str) -> Dict[str, bool]:
+    """
+    Лайк с проверкой взаимности и созданием мэтча за один запрос (функция swipe_like в БД)
+
+    Returns:
+        Dict с sender_exists, receiver_exists и is_match
+    """
+    # swipe_like пишет (лайк, мэтч) - вызываем в транзакции на запись, а не на пути чтения (autocommit)
+    async with transaction() as conn:
+        row = await db_get(
+            "SELECT sender_exists, receiver_exists, is_match FROM swipe_like(?, ?)",
+            [str(from_user), str(to_user)],
+            conn=conn
+        )
+    return {
+        "sender_exists": bool(row and row.get("sender_exists")),
+        "receiver_exists": bool(row and row.get("receiver_exists")),
+        "is_match": bool(row and row.get("is_match")),
+    }
+
+
+async def remove_edge(from_user: str, to_user: str, kind: str) -> bool:
+    """Удалить связь. Возвращает True, если связь была"""
+    result = await db_run(
+        "DELETE FROM user_edges WHERE from_user = ? AND kind = ? AND to_user = ?",
+        [str(from_user), kind, str(to_user)]
+    )
+    if not _backfill_done:
+        # Иначе перенос из JSONB вернет только что удаленную связь
+        column = LEGACY_COLUMNS[kind]
+        await db_run(
+            f"""UPDATE users SET {column} = {column} - ?::text
+                WHERE userId = ? AND jsonb_typeof({column}) = 'array'
+                  AND {column} @> jsonb_build_array(?::text)""",
+            [str(to_user), str(from_user), str(to_user)]
+        )
+    return result["changes"] > 0
+
+
+async def has_edge(from_user: str, to_user: str, kind: str) -> bool:
+    """Есть ли связь from_user -> to_user"""
+    row = await db_get(
+        "SELECT 1 AS found FROM user_edges WHERE from_user = ? AND kind = ? AND to_user = ?",
+        [str(from_user), kind, str(to_user)]
+    )
+    return row is not None
+
+
+async def add_match(user_a: str, user_b: str) -> None:
+    """Создать мэтч (две направленные связи одним запросом)"""
+    await db_run(
+        """INSERT INTO user_edges (from_user, to_user, kind) VALUES (?, ?, ?), (?, ?, ?)
+           ON CONFLICT (from_user, kind, to_user) DO NOTHING""",
+        [str(user_a), str(user_b), KIND_MATCH, str(user_b), str(user_a), KIND_MATCH]
+    )
+
+
+async def remove_match(user_a: str, user_b: str) -> bool:
+    """Удалить мэтч у обоих пользователей. Возвращает True, если мэтч был"""
+    removed_a = await remove_edge(user_a, user_b, KIND_MATCH)
+    removed_b = await remove_edge(user_b, user_a, KIND_MATCH)
+    return removed_a or removed_b
+
+
+async def get_targets(from_user: str, kind: str) -> List[str]:
+    """Кому пользователь поставил связь kind (в порядке создания)"""
+    rows = await db_all(
+        "SELECT to_user FROM user_edges WHERE from_user = ? AND kind = ? ORDER BY created_at",
+        [str(from_user), kind]
+    )
+    return [row["to_user"] for row in rows]
+
+
+async def get_sources(to_user: str, kind: str) -> List[str]:
+    """Кто поставил пользователю связь kind (в порядке создания)"""
+    rows = await db_all(
+        "SELECT from_user FROM user_edges WHERE to_user = ? AND kind = ? ORDER BY created_at",
+        [str(to_user), kind]
+    )
+    return [row["from_user"] for row in rows]
+
+
+async def count_likes_received(to_user: str) -> int:
+    """Сколько лайков получил пользователь (счетчик like_counts, поддерживается триггером)"""
+    row = await db_get("SELECT received FROM like_counts WHERE user_id = ?", [str(to_user)])
+    return row.get("received", 0) if row else 0
+
+
+def user_edges_query(user_id: str) -> Tuple[str, List[Any]]:
+    """Запрос всех исходящих связей пользователя (для db_pipeline вместе с другими чтениями)"""
+    return "SELECT to_user, kind FROM user_edges WHERE from_user = ? ORDER BY created_at", [str(user_id)]
+
+
+async def get_user_edges(user_id: str) -> Dict[str, List[str]]:
+    """Все исходящие связи пользователя одним запросом: likes, dislikes, matches"""
+    return group_user_edges(await db_all(*user_edges_query(user_id)))
+
+
+def group_user_edges(rows: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Строки user_edges_query -> {"likes": [...], "dislikes": [...], "matches": [...]}"""
+    result: Dict[str, List[str]] = {column: [] for column in LEGACY_COLUMNS.values()}
+    for row in rows:
+        column = LEGACY_COLUMNS.get(row["kind"])
+        if column:
+            result[column].append(row["to_user"])
+    return result
+
+
+async def delete_users_edges(cur, user_ids: List[str]) -> int:
+    """
+    Удалить все связи (входящие и исходящие) набора пользователей в транзакции вызывающего.
+    Пока перенос из JSONB не завершен, их id вычищаются и из старых колонок остальных пользователей,
+    иначе перенос вернул бы связи с удаленными.
+
+    Args:
+        cur: курсор соединения, в транзакции которого идет удаление
+    """
+    await cur.execute(
+        "DELETE FROM user_edges WHERE from_user = ANY(%s) OR to_user = ANY(%s)",
+        (user_ids, user_ids)
+    )
+    deleted = cur.rowcount
+    if not _backfill_done:
+        await cur.execute(
+            """UPDATE users SET
+                   likes = CASE WHEN jsonb_typeof(likes) = 'array' THEN likes - %s::text[] ELSE likes END,
+                   dislikes = CASE WHEN jsonb_typeof(dislikes) = 'array' THEN dislikes - %s::text[] ELSE dislikes END,
+                   matches = CASE WHEN jsonb_typeof(matches) = 'array' THEN matches - %s::text[] ELSE matches END
+               WHERE likes ?| %s::text[] OR dislikes ?| %s::text[] OR matches ?| %s::text[]""",
+            (user_ids,) * 6
+        )
+    return deleted
+
+
+async def backfill_edges_from_jsonb(batch_size: int = 500, pause: float = 0.05) -> int:
+    """
+    Онлайн-перенос связей из JSONB колонок users в user_edges.
+
+    Пользователи обрабатываются пачками: в одной транзакции связи вставляются
+    в user_edges, а JSONB массивы обнуляются. Строки блокируются с SKIP LOCKED,
+    поэтому перенос не мешает работе приложения и безопасен при повторном запуске.
+
+    Returns:
+        Количество перенесенных пользователей
+    """
+    global _backfill_done
+
+    pg_pool = get_pg_pool()
+    last_id = 0
+    migrated = 0
+    try:
+        while True:
+            async with pg_pool.connection() as conn:
+                cur = conn.cursor()
+                await cur.execute(
+                    """
+                    WITH batch AS (
+                        SELECT id, "userId", likes, dislikes, matches
+                        FROM users
+                        WHERE id > %s
+                          AND (likes <> '[]'::jsonb OR dislikes <> '[]'::jsonb OR matches <> '[]'::jsonb)
+                        ORDER BY id
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    ),
+                    inserted AS (
+                        INSERT INTO user_edges (from_user, to_user, kind)
+                        SELECT b."userId", e.to_user, e.kind
+                        FROM batch b
+                        CROSS JOIN LATERAL (
+                            SELECT value AS to_user, 'like' AS kind
+                            FROM jsonb_array_elements_text(CASE WHEN jsonb_typeof(b.likes) = 'array' THEN b.likes ELSE '[]'::jsonb END)
+                            UNION ALL
+                            SELECT value, 'dislike'
+                            FROM jsonb_array_elements_text(CASE WHEN jsonb_typeof(b.dislikes) = 'array' THEN b.dislikes ELSE '[]'::jsonb END)
+                            UNION ALL
+                            SELECT value, 'match'
+                            FROM jsonb_array_elements_text(CASE WHEN jsonb_typeof(b.matches) = 'array' THEN b.matches ELSE '[]'::jsonb END)
+                        ) e
+                        WHERE b."userId" IS NOT NULL AND e.to_user IS NOT NULL AND e.to_user <> ''
+                        ON CONFLICT (from_user, kind, to_user) DO NOTHING
+                    )
+                    UPDATE users u
+                    SET likes = '[]'::jsonb, dislikes = '[]'::jsonb, matches = '[]'::jsonb
+                    FROM batch b
+                    WHERE u.id = b.id
+                    RETURNING u.id
+                    """,
+                    (last_id, batch_size)
+                )
+                ids = [row[0] for row in await cur.fetchall()]
+                await conn.commit()
+
+            if not ids:
+                break
+            migrated += len(ids)
+            last_id = max(ids)
+            logger.info(f"[EDGES] Перенесено пользователей: {migrated}")
+            # Даем отработать обычным запросам между пачками
+            await asyncio.sleep(pause)
+
+        # Строки, заблокированные во время прохода, подхватит следующий запуск
+        remaining = await db_get(
+            """SELECT COUNT(*) AS cnt FROM users
+               WHERE likes <> '[]'::jsonb OR dislikes <> '[]'::jsonb OR matches <> '[]'::jsonb"""
+        )
+        _backfill_done = not remaining or remaining.get("cnt", 0) == 0
+        logger.info(f"✅ [EDGES] Перенос связей из JSONB завершен: {migrated} пользователей, осталось {0 if _backfill_done else remaining.get('cnt')}")
+    except Exception as e:
+        # Не роняем приложение: перенос продолжится при следующем запуске
+        logger.error(f"❌ [EDGES] Ошибка переноса связей из JSONB: {e}")
+    return migrated
@@ -0,0 +1,200 @@
+"""
+services/face_detection.py
+Детекция лиц в отдельном пуле процессов.
+
+Декодирование фото и detectMultiScale занимают сотни миллисекунд CPU и держат GIL,
+поэтому в обработчике загрузки они останавливали весь event loop. Здесь обработка
+фото (image_pipeline.process_image) выполняется в ProcessPoolExecutor: загрузки разных
+пользователей идут параллельно на всех ядрах, а остальные запросы API не ждут OpenCV.
+
+Число заданий в работе и в очереди ограничено (FACE_DETECT_WORKERS + FACE_DETECT_MAX_QUEUE).
+При переполнении или таймауте выбрасывается FaceDetectionBusy - клиент получает 503 с Retry-After.
+"""
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, TypeVar
+from image_pipeline import (
+    ProcessedImage,
+    process_image as _process_image,
+    process_image_file as _process_image_file,
+    process_variants as _process_variants
+)
+from config import FACE_DETECT_WORKERS, FACE_DETECT_MAX_QUEUE, FACE_DETECT_TIMEOUT
+import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class FaceDetectionBusy(Exception):
+    """Пул детекции лиц перегружен или не успел обработать фото"""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_in_flight = 0  # Заданий в работе и в очереди пула
+_stats = {"completed": 0, "rejected": 0, "timeouts": 0, "errors": 0, "restarts": 0}
+
+POOL_JOB_SECONDS = metrics.histogram(
+    "face_detection_job_duration_seconds",
+    "Время задания в пуле детекции лиц (очередь пула + обработка) по типу задания",
+    ["task"]
+)
+
+
+def _init_worker() -> None:
+    """Инициализация процесса пула: каскад загружается один раз на процесс"""
+    import cv2
+    from log_config import setup_logging
+    # spawn не наследует настройку логирования; пишем напрямую, поток очереди тут не нужен
+    setup_logging(use_queue=False)
+    import image_pipeline  # noqa: F401 - загружает каскад и HEIC при импорте
+    # Параллелизм дает сам пул, внутренние потоки OpenCV только конкурируют за ядра
+    cv2.setNumThreads(1)
+
+
+def _create_executor() -> ProcessPoolExecutor:
+    # spawn, а не fork: процесс приложения уже держит потоки пула БД и event loop
+    return ProcessPoolExecutor(
+        max_workers=FACE_DETECT_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker
+    )
+
+
+def start() -> None:
+    """Создать пул процессов (вызывается в lifespan)"""
+    global _executor
+    if _executor is None:
+        _executor = _create_executor()
+        logger.info(f"✅ Пул детекции лиц запущен: {FACE_DETECT_WORKERS} процессов, очередь {FACE_DETECT_MAX_QUEUE}")
+
+
+def stop() -> None:
+    """Остановить пул процессов, отменив задания из очереди"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _restart(broken: ProcessPoolExecutor) -> None:
+    """Пересоздать пул после падения процесса-воркера (один раз на сломанный пул)"""
+    global _executor
+    if _executor is not broken:
+        return
+    broken.shutdown(wait=False, cancel_futures=True)
+    _executor = _create_executor()
+    _stats["restarts"] += 1
+
+
+async def process_image(image_buffer: bytes) -> ProcessedImage:
+    """
+    Обработать загруженное фото (декодирование, нормализация, поиск лиц, варианты) в пуле процессов
+
+    Returns:
+        ProcessedImage: JPEG для сохранения, количество лиц и WebP варианты
+
+    Raises:
+        ValueError: файл не удалось декодировать
+        FaceDetectionBusy: очередь заполнена или проверка не уложилась в FACE_DETECT_TIMEOUT
+    """
+    return await _run(_process_image, image_buffer)
+
+
+async def process_image_file(path: str) -> ProcessedImage:
+    """process_image для загрузки во временном файле (services/upload_ingest.py): файл читает процесс пула"""
+    return await _run(_process_image_file, path)
+
+
+async def make_variants(image_buffer: bytes) -> Dict[str, bytes]:
+    """Создать WebP варианты уже сохраненного фото в пуле процессов (те же ограничения очереди)"""
+    return await _run(_process_variants, image_buffer)
+
+
+async def _run(job_fn: Callable[[Any], T], payload: Any) -> T:
+    """Выполнить задание в пуле с ограничением очереди и таймаутом"""
+    global _in_flight
+    if _executor is None:
+        # Пул не запущен (скрипты вне приложения) - хотя бы не блокируем event loop
+        return await asyncio.to_thread(job_fn, payload)
+
+    if _in_flight >= FACE_DETECT_WORKERS + FACE_DETECT_MAX_QUEUE:
+        _stats["rejected"] += 1
+        raise FaceDetectionBusy("Очередь проверки фото переполнена")
+
+    loop = asyncio.get_running_loop()
+    executor = _executor
+
+    def release() -> None:
+        global _in_flight
+        _in_flight -= 1
+
+    def on_done(_: Future) -> None:
+        # Вызывается из потока пула; после остановки приложения loop уже закрыт
+        try:
+            loop.call_soon_threadsafe(release)
+        except RuntimeError:
+            pass
+
+    # Слот освобождается, когда задание действительно завершилось в пуле
+    # (или было снято из очереди), а не когда клиент перестал ждать
+    _in_flight += 1
+    started = time.perf_counter()
+    try:
+        job = executor.submit(job_fn, payload)
+    except BrokenProcessPool:
+        _in_flight -= 1
+        _restart(executor)
+        _stats["errors"] += 1
+        raise FaceDetectionBusy("Пул проверки фото перезапускается")
+    job.add_done_callback(on_done)
+
+    try:
+        result = await asyncio.wait_for(asyncio.wrap_future(job), FACE_DETECT_TIMEOUT)
+    except asyncio.TimeoutError:
+        _stats["timeouts"] += 1
+        logger.warning(f"⚠️ Проверка лица не уложилась в {FACE_DETECT_TIMEOUT} сек")
+        raise FaceDetectionBusy("Проверка фото заняла слишком много времени", retry_after=int(FACE_DETECT_TIMEOUT) or 1)
+    except BrokenProcessPool:
+        _restart(executor)
+        _stats["errors"] += 1
+        raise FaceDetectionBusy("Пул проверки фото перезапускается")
+    _stats["completed"] += 1
+    POOL_JOB_SECONDS.observe(time.perf_counter() - started, job_fn.__name__.lstrip("_"))
+    return result
+
+
+def get_stats() -> Dict[str, Any]:
+    """Метрики пула детекции лиц"""
+    return {
+        "running": _executor is not None,
+        "workers": FACE_DETECT_WORKERS,
+        "max_queue": FACE_DETECT_MAX_QUEUE,
+        "in_flight": _in_flight,
+        **_stats,
+    }
+
+
+@metrics.collector
+def _face_detection_metrics():
+    return [
+        metrics.value_family("face_detection_in_flight", "gauge", "Задания детекции лиц в работе и в очереди пула", _in_flight),
+        metrics.value_family(
+            "face_detection_queue_capacity", "gauge", "Предел заданий в работе и в очереди",
+            FACE_DETECT_WORKERS + FACE_DETECT_MAX_QUEUE
+        ),
+        metrics.labeled_family(
+            "face_detection_jobs_total", "counter", "Задания детекции лиц по исходу",
+            "outcome", {key: _stats[key] for key in ("completed", "rejected", "timeouts", "errors")}
+        ),
+        metrics.value_family("face_detection_restarts_total", "counter", "Перезапуски пула после падения воркера", _stats["restarts"]),
+    ]
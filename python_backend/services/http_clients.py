@@ -0,0 +1,144 @@
+"""
+services/http_clients.py
+Общие HTTP клиенты на время жизни приложения.
+
+Раньше каждый вызов Telegram API и скачивание фото по URL создавали
+новый httpx.AsyncClient, то есть заново открывали TCP и TLS соединение. Здесь клиенты
+создаются один раз в lifespan (start/stop) и держат соединения открытыми (keep-alive, HTTP/2).
+
+Клиент на каждый upstream: лимиты соединений httpx задаются на клиент, поэтому так они
+действуют как лимиты на хост.
+- TELEGRAM - api.telegram.org (routes/push.py);
+- FETCH - скачивание фото по URL (произвольные хосты).
+"""
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+import httpx
+from config import (
+    HTTP_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_MAX_REDIRECTS,
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY, HTTP2_ENABLED,
+    TELEGRAM_MAX_CONNECTIONS
+)
+import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM = "telegram"
+FETCH = "fetch"
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+
+# HTTP/2 требует пакет h2 (httpx[http2]), без него клиенты работают по HTTP/1.1
+try:
+    import h2  # noqa: F401
+    http2_available = True
+except ImportError:
+    http2_available = False
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def _create(name: str) -> httpx.AsyncClient:
+    stats = _stats.setdefault(name, {"requests": 0, "responses_2xx": 0, "responses_4xx": 0, "responses_5xx": 0})
+
+    async def on_request(request: httpx.Request) -> None:
+        stats["requests"] += 1
+
+    async def on_response(response: httpx.Response) -> None:
+        key = f"responses_{response.status_code // 100}xx"
+        if key in stats:
+            stats[key] += 1
+
+    max_connections = TELEGRAM_MAX_CONNECTIONS if name == TELEGRAM else HTTP_MAX_CONNECTIONS
+    return httpx.AsyncClient(
+        http2=HTTP2_ENABLED and http2_available,
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(HTTP_MAX_KEEPALIVE, max_connections),
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        ),
+        max_redirects=HTTP_MAX_REDIRECTS,
+        event_hooks={"request": [on_request], "response": [on_response]}
+    )
+
+
+async def start() -> None:
+    """Создать клиенты (вызывается в lifespan)"""
+    for name in (TELEGRAM, FETCH):
+        if name not in _clients:
+            _clients[name] = _create(name)
+    logger.info(f"✅ HTTP клиенты созданы (HTTP/2: {'да' if HTTP2_ENABLED and http2_available else 'нет'})")
+
+
+async def stop() -> None:
+    """Закрыть клиенты и их соединения"""
+    while _clients:
+        _, client = _clients.popitem()
+        await client.aclose()
+
+
+def get(name: str) -> httpx.AsyncClient:
+    """
+    Общий клиент по имени. Вне приложения (скрипты)
+    клиент создается при первом обращении.
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _clients[name] = _create(name)
+    return client
+
+
+@asynccontextmanager
+async def session(name: str) -> AsyncIterator[httpx.AsyncClient]:
+    """Общий клиент для блока async with (в отличие от httpx.AsyncClient() не закрывается на выходе)"""
+    yield get(name)
+
+
+def telegram_url(bot_token: str, method: str) -> str:
+    return f"{TELEGRAM_API_URL}/bot{bot_token}/{method}"
+
+
+def _pool_stats(client: httpx.AsyncClient) -> Dict[str, int]:
+    """Соединения пула httpcore (внутренний API, поэтому через getattr)"""
+    pool = getattr(client._transport, "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    requests = list(getattr(pool, "_requests", []) or [])
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {
+        "connections": len(connections),
+        "idle": idle,
+        "active": len(connections) - idle,
+        "waiting": sum(1 for request in requests if getattr(request, "connection", None) is None),
+    }
+
+
+def get_stats() -> Dict[str, Any]:
+    """Метрики пулов: соединения (всего/простаивают/заняты), запросы и ответы по классам статусов"""
+    stats: Dict[str, Any] = {"http2": HTTP2_ENABLED and http2_available}
+    for name, counters in _stats.items():
+        client = _clients.get(name)
+        pool = _pool_stats(client) if client is not None and not client.is_closed else {}
+        stats[name] = {**counters, **pool}
+    return stats
+
+
+@metrics.collector
+def _http_client_metrics():
+    requests, responses, connections = [], [], []
+    for name, counters in _stats.items():
+        requests.append(({"client": name}, counters["requests"]))
+        for status in ("2xx", "4xx", "5xx"):
+            responses.append(({"client": name, "status": status}, counters[f"responses_{status}"]))
+        client = _clients.get(name)
+        if client is not None and not client.is_closed:
+            pool = _pool_stats(client)
+            for state in ("idle", "active", "waiting"):
+                connections.append(({"client": name, "state": state}, pool[state]))
+    return [
+        metrics.Family("http_client_requests_total", "counter", "Запросы общих HTTP клиентов", requests),
+        metrics.Family("http_client_responses_total", "counter", "Ответы upstream по классу статуса", responses),
+        metrics.Family("http_client_connections", "gauge", "Соединения пулов HTTP клиентов (waiting - запросы без соединения)", connections),
+    ]
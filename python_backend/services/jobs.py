@@ -0,0 +1,376 @@
+"""
+services/jobs.py
+Фоновые задачи в PostgreSQL (таблица jobs).
+
+Долгие операции (рассылки, удаление пользователя, пересоздание вариантов фото, распаковка
+архива данных) раньше выполнялись прямо в обработчике запроса или команды бота и терялись
+при перезапуске. Теперь обработчик ставит задачу (enqueue) и сразу отвечает.
+
+- Задачу берет воркер через SELECT ... FOR UPDATE SKIP LOCKED: несколько процессов
+  (uvicorn workers, реплики) разбирают очередь без двойного выполнения.
+- Взятая задача арендуется на JOB_LEASE_SECONDS, аренда продлевается, пока задача выполняется.
+  Если процесс упал, после истечения аренды задачу возьмет другой воркер.
+- Ошибка - повтор с экспоненциальной задержкой (JOB_RETRY_BASE * 2^n), после max_attempts - failed.
+- run_at / delay - отложенный запуск, dedupe_key - не ставить задачу, если такая же уже ждет.
+- JOB_CONCURRENCY задач одновременно на процесс, для отдельного типа - concurrency в @job.
+
+Обработчик регистрируется декоратором в модуле сервиса:
+
+    @jobs.job("delete_user")
+    async def delete_user_job(payload): ...
+
+Нужна только PostgreSQL, поэтому подсистему можно проверить на локальной базе (benchmark_jobs.py).
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from db_utils import db_get, db_all, db_run, get_pg_pool
+from config import (
+    JOB_CONCURRENCY, JOB_POLL_INTERVAL, JOB_LEASE_SECONDS,
+    JOB_MAX_ATTEMPTS, JOB_RETRY_BASE, JOB_RETENTION_DAYS
+)
+import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Задержка повтора не больше часа
+RETRY_MAX_DELAY = 3600
+# Завершенные задачи старше JOB_RETENTION_DAYS удаляются раз в столько секунд
+CLEANUP_INTERVAL = 3600
+
+Handler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+JOB_SECONDS = metrics.histogram("job_duration_seconds", "Время выполнения фоновой задачи по типу", ["kind"])
+
+
+class _JobType:
+    def __init__(self, kind: str, handler: Handler, concurrency: int, max_attempts: int):
+        self.kind = kind
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.running = 0
+        self.stats = {
+            "enqueued": 0, "started": 0, "succeeded": 0, "failed": 0, "retried": 0,
+            "total_ms": 0.0, "max_ms": 0.0,
+        }
+
+
+_types: Dict[str, _JobType] = {}
+_running: Dict[int, asyncio.Task] = {}
+_worker_id = f"{socket.gethostname()}:{os.getpid()}"
+_wakeup: Optional[asyncio.Event] = None
+_loop_task: Optional[asyncio.Task] = None
+_lease_task: Optional[asyncio.Task] = None
+
+
+def job(kind: str, concurrency: int = 0, max_attempts: int = JOB_MAX_ATTEMPTS):
+    """
+    Декоратор обработчика задачи kind
+
+    Args:
+        concurrency: сколько задач этого типа выполнять одновременно в процессе (0 - без отдельного лимита)
+        max_attempts: попыток до статуса failed
+    """
+    def register(handler: Handler) -> Handler:
+        _types[kind] = _JobType(kind, handler, concurrency, max_attempts)
+        return handler
+    return register
+
+
+def register(kind: str, handler: Handler, concurrency: int = 0, max_attempts: int = JOB_MAX_ATTEMPTS) -> None:
+    """Зарегистрировать обработчик без декоратора (например, замыкание с объектом бота)"""
+    job(kind, concurrency, max_attempts)(handler)
+
+
+async def enqueue(
+    kind: str,
+    payload: Optional[Dict[str, Any]] = None,
+    run_at: Optional[datetime] = None,
+    delay: float = 0,
+    dedupe_key: Optional[str] = None,
+    max_attempts: Optional[int] = None
+) -> int:
+    """
+    Поставить задачу в очередь
+
+    Args:
+        run_at / delay: не запускать раньше указанного времени / через delay секунд
+        dedupe_key: если задача с таким ключом уже ждет или выполняется, новая не создается
+
+    Returns:
+        id задачи (существующей, если сработал dedupe_key)
+    """
+    job_type = _types.get(kind)
+    if max_attempts is None:
+        max_attempts = job_type.max_attempts if job_type else JOB_MAX_ATTEMPTS
+    pg_pool = get_pg_pool()
+    async with pg_pool.connection() as conn:
+        cur = conn.cursor()
+        row = None
+        while row is None:
+            await cur.execute(
+                """INSERT INTO jobs (kind, payload, run_at, max_attempts, dedupe_key)
+                   VALUES (%s, %s::jsonb, COALESCE(%s::timestamptz, NOW()) + make_interval(secs => %s), %s, %s)
+                   ON CONFLICT (dedupe_key) WHERE status IN ('queued', 'running') DO NOTHING
+                   RETURNING id""",
+                (kind, json.dumps(payload or {}, ensure_ascii=False, default=str), run_at, delay, max_attempts, dedupe_key)
+            )
+            row = await cur.fetchone()
+            if row is not None:
+                if job_type:
+                    job_type.stats["enqueued"] += 1
+                break
+            # Такая задача уже ждет или выполняется (если успела завершиться - вставляем заново)
+            await cur.execute(
+                "SELECT id FROM jobs WHERE dedupe_key = %s AND status IN ('queued', 'running')",
+                (dedupe_key,)
+            )
+            row = await cur.fetchone()
+        await conn.commit()
+    if _wakeup is not None and not delay and run_at is None:
+        _wakeup.set()
+    return row[0]
+
+
+async def get_job(job_id: int) -> Optional[Dict[str, Any]]:
+    """Задача по id (статус, попытки, последняя ошибка, время выполнения)"""
+    return await db_get(
+        """SELECT id, kind, payload, status, attempts, max_attempts, run_at, last_error,
+                  created_at, started_at, finished_at
+           FROM jobs WHERE id = ?""",
+        [job_id]
+    )
+
+
+def _free_kinds() -> List[str]:
+    """Зарегистрированные типы, у которых есть свободные места"""
+    return [
+        job_type.kind for job_type in _types.values()
+        if not job_type.concurrency or job_type.running < job_type.concurrency
+    ]
+
+
+async def _claim(limit: int) -> List[Dict[str, Any]]:
+    """Взять до limit готовых задач (и задач с истекшей арендой) в аренду"""
+    kinds = _free_kinds()
+    if not kinds or limit <= 0:
+        return []
+    pg_pool = get_pg_pool()
+    async with pg_pool.connection() as conn:
+        cur = conn.cursor()
+        await cur.execute(
+            """UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_by = %s,
+                      locked_until = NOW() + make_interval(secs => %s), started_at = NOW()
+               WHERE id IN (
+                   SELECT id FROM jobs
+                   WHERE kind = ANY(%s)
+                     AND ((status = 'queued' AND run_at <= NOW())
+                          OR (status = 'running' AND locked_until < NOW()))
+                   ORDER BY run_at
+                   LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+               )
+               RETURNING id, kind, payload, attempts, max_attempts""",
+            (_worker_id, JOB_LEASE_SECONDS, kinds, limit)
+        )
+        rows = await cur.fetchall()
+        await conn.commit()
+    claimed = [
+        {"id": row[0], "kind": row[1], "payload": row[2], "attempts": row[3], "max_attempts": row[4]}
+        for row in rows
+    ]
+    # Лимит типа мог быть превышен пачкой: лишние задачи возвращаем в очередь
+    accepted = []
+    for claimed_job in claimed:
+        job_type = _types[claimed_job["kind"]]
+        if job_type.concurrency and job_type.running >= job_type.concurrency:
+            await _release(claimed_job)
+            continue
+        job_type.running += 1
+        accepted.append(claimed_job)
+    return accepted
+
+
+async def _finish(claimed_job: Dict[str, Any], assignments: str, params: List[Any], outcome: str) -> None:
+    """
+    Записать итог задачи, только если она еще в нашей аренде: после долгой остановки event loop
+    аренда могла истечь, и задачу (attempts + 1) уже взял другой воркер - его состояние не трогаем
+    """
+    result = await db_run(
+        f"""UPDATE jobs SET {assignments}, locked_by = NULL, locked_until = NULL
+            WHERE id = ? AND locked_by = ? AND attempts = ?""",
+        [*params, claimed_job["id"], _worker_id, claimed_job["attempts"]]
+    )
+    if not result.get("changes"):
+        logger.warning(
+            f"Задача #{claimed_job['id']} ({claimed_job['kind']}): аренда потеряна, итог '{outcome}' не записан"
+        )
+
+
+async def _release(claimed_job: Dict[str, Any]) -> None:
+    """Вернуть задачу в очередь без траты попытки (остановка процесса, лимит типа)"""
+    await _finish(claimed_job, "status = 'queued', attempts = GREATEST(attempts - 1, 0)", [], "released")
+
+
+async def _execute(claimed_job: Dict[str, Any]) -> None:
+    job_id = claimed_job["id"]
+    job_type = _types[claimed_job["kind"]]
+    job_type.stats["started"] += 1
+    started = time.perf_counter()
+    try:
+        await job_type.handler(claimed_job["payload"] or {})
+    except asyncio.CancelledError:
+        await _release(claimed_job)
+        raise
+    except Exception as e:
+        attempts = claimed_job["attempts"]
+        error = f"{type(e).__name__}: {e}"[:2000]
+        if attempts < claimed_job["max_attempts"]:
+            delay = min(RETRY_MAX_DELAY, JOB_RETRY_BASE * 2 ** (attempts - 1))
+            job_type.stats["retried"] += 1
+            logger.warning(f"Задача #{job_id} ({job_type.kind}) ошибка, повтор через {delay:.0f} сек: {error}")
+            await _finish(
+                claimed_job, "status = 'queued', run_at = NOW() + make_interval(secs => ?), last_error = ?",
+                [delay, error], "retry"
+            )
+        else:
+            job_type.stats["failed"] += 1
+            logger.error(f"Задача #{job_id} ({job_type.kind}) не выполнена после {attempts} попыток: {error}")
+            await _finish(claimed_job, "status = 'failed', last_error = ?, finished_at = NOW()", [error], "failed")
+    else:
+        job_type.stats["succeeded"] += 1
+        await _finish(claimed_job, "status = 'done', finished_at = NOW()", [], "done")
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        JOB_SECONDS.observe(elapsed_ms / 1000, job_type.kind)
+        job_type.stats["total_ms"] += elapsed_ms
+        job_type.stats["max_ms"] = max(job_type.stats["max_ms"], elapsed_ms)
+        job_type.running -= 1
+        _running.pop(job_id, None)
+        if _wakeup is not None:
+            _wakeup.set()
+
+
+async def _extend_leases() -> None:
+    """Продлевать аренду выполняющихся задач, пока они идут (рассылка может длиться часами)"""
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        if not _running:
+            continue
+        try:
+            await db_run(
+                """UPDATE jobs SET locked_until = NOW() + make_interval(secs => ?)
+                   WHERE id = ANY(?) AND locked_by = ?""",
+                [JOB_LEASE_SECONDS, list(_running), _worker_id]
+            )
+        except Exception as e:
+            logger.error(f"Ошибка продления аренды задач: {e}")
+
+
+async def _cleanup() -> None:
+    deleted = await db_run(
+        "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < NOW() - make_interval(days => ?)",
+        [JOB_RETENTION_DAYS]
+    )
+    if deleted.get("changes"):
+        logger.info(f"Удалено старых задач: {deleted['changes']}")
+
+
+async def _poll() -> None:
+    """Цикл воркера: брать задачи, пока есть свободные места, иначе ждать JOB_POLL_INTERVAL или enqueue"""
+    last_cleanup = 0.0
+    while True:
+        _wakeup.clear()
+        try:
+            for claimed_job in await _claim(JOB_CONCURRENCY - len(_running)):
+                _running[claimed_job["id"]] = asyncio.create_task(_execute(claimed_job))
+            if time.monotonic() - last_cleanup > CLEANUP_INTERVAL:
+                last_cleanup = time.monotonic()
+                await _cleanup()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка воркера задач: {e}")
+        try:
+            await asyncio.wait_for(_wakeup.wait(), JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start() -> None:
+    """Запустить воркер (вызывается в lifespan)"""
+    global _wakeup, _loop_task, _lease_task
+    if _loop_task is not None:
+        return
+    _wakeup = asyncio.Event()
+    _loop_task = asyncio.create_task(_poll())
+    _lease_task = asyncio.create_task(_extend_leases())
+    logger.info(f"✅ Воркер задач запущен ({_worker_id}, до {JOB_CONCURRENCY} задач одновременно)")
+
+
+async def stop() -> None:
+    """Остановить воркер: выполняющиеся задачи отменяются и возвращаются в очередь"""
+    global _loop_task, _lease_task
+    for task in (_loop_task, _lease_task):
+        if task is not None:
+            task.cancel()
+    _loop_task = _lease_task = None
+    tasks = list(_running.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def get_queue_stats() -> List[Dict[str, Any]]:
+    """Задачи в БД по типу и статусу (сколько ждет, выполняется, упало)"""
+    return await db_all(
+        """SELECT kind, status, COUNT(*) AS count,
+                  MIN(run_at) FILTER (WHERE status = 'queued') AS oldest_run_at
+           FROM jobs GROUP BY kind, status ORDER BY kind, status"""
+    )
+
+
+def get_stats() -> Dict[str, Any]:
+    """Метрики воркера этого процесса по типам задач с момента запуска"""
+    kinds = {}
+    for job_type in _types.values():
+        finished = job_type.stats["succeeded"] + job_type.stats["failed"] + job_type.stats["retried"]
+        kinds[job_type.kind] = {
+            **job_type.stats,
+            "running": job_type.running,
+            "avg_ms": round(job_type.stats["total_ms"] / finished, 1) if finished else 0.0,
+        }
+    return {"worker": _worker_id, "running": len(_running), "concurrency": JOB_CONCURRENCY, "kinds": kinds}
+
+
+@metrics.collector
+async def _jobs_metrics():
+    """Очередь из таблицы jobs (один запрос на опрос /metrics) и счетчики воркера этого процесса"""
+    depth, oldest = [], []
+    now = datetime.now(timezone.utc)
+    for row in await get_queue_stats():
+        depth.append(({"kind": row["kind"], "status": row["status"]}, row["count"]))
+        if row["oldest_run_at"] is not None:
+            oldest.append(({"kind": row["kind"]}, max(0.0, (now - row["oldest_run_at"]).total_seconds())))
+    outcomes = [
+        ({"kind": job_type.kind, "outcome": outcome}, job_type.stats[outcome])
+        for job_type in _types.values()
+        for outcome in ("succeeded", "failed", "retried")
+    ]
+    return [
+        metrics.Family("jobs_queue_depth", "gauge", "Задачи в таблице jobs по типу и статусу", depth),
+        metrics.Family("jobs_oldest_queued_seconds", "gauge", "Сколько ждет самая старая задача в очереди (от run_at)", oldest),
+        metrics.Family("jobs_processed_total", "counter", "Задачи, выполненные воркером этого процесса", outcomes),
+        metrics.value_family("jobs_running", "gauge", "Задачи, выполняемые сейчас в этом процессе", len(_running)),
+    ]
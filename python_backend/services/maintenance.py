@@ -0,0 +1,25 @@
+"""
+services/maintenance.py
+Служебные фоновые задачи администратора
+"""
+import asyncio
+from pathlib import Path
+from typing import Optional
+from config import extract_data_if_needed
+from services import jobs
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def latest_data_archive() -> Optional[Path]:
+    """Самый свежий архив данных в /tmp (data-backup-*.tar.gz) или None"""
+    archives = sorted(Path("/tmp").glob("data-backup-*.tar.gz"), key=lambda p: p.stat().st_mtime, reverse=True)
+    return archives[0] if archives else None
+
+
+@jobs.job("extract_data", concurrency=1, max_attempts=1)
+async def extract_data_job(payload) -> None:
+    """Распаковать архив данных (tar читается в потоке, чтобы не блокировать event loop)"""
+    await asyncio.to_thread(extract_data_if_needed)
+    logger.info("✅ Распаковка данных завершена")
@@ -6,6 +6,7 @@ import uuid
 from datetime import datetime, timezone
 from typing import Optional, Dict, Any
 from db_utils import db_get, db_run
+from services import profile_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -185,6 +186,7 @@ async def process_successful_payment(
                 [new_end, user_id]
             )
             logger.info(f"✅ [PAYMENT] PRO выдана: user_id={user_id}, days={days}, pro_end={new_end}, superLikesCount kept: {current_super_likes}")
+        await profile_cache.invalidate(user_id)
         
         return {
             "success": True,
@@ -194,9 +196,7 @@ async def process_successful_payment(
             "amount": amount
         }
     except Exception as e:
-        logger.error(f"❌ [PAYMENT] Ошибка выдачи PRO: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ [PAYMENT] Ошибка выдачи PRO: {e}")
         return {
             "success": False,
             "error": "grant_pro_failed",
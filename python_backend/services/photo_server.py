@@ -0,0 +1,425 @@
+"""
+services/photo_server.py
+Отдача фото пользователей (/data/img).
+
+StaticFiles на каждый запрос ходит в пул потоков за stat и открытием файла и читает
+файл кусками через тот же пул, поэтому фото конкурируют с API за event loop и потоки.
+Здесь путь проверяется и stat выполняется сразу (на локальном диске это микросекунды), а ответ:
+- 304 по If-None-Match / If-Modified-Since;
+- 206 по Range (один диапазон, с учетом If-Range);
+- Cache-Control: immutable для хранилища (blobs/), PHOTO_CACHE_MAX_AGE для старых путей;
+- <имя>.avif рядом с файлом отдается клиентам с Accept: image/avif (PHOTO_SERVE_AVIF);
+- отсутствующий WebP вариант создается из оригинала при первом запросе.
+
+PhotoServer - ASGI приложение для /data/img в основном сервере. Тело отправляется через
+расширение http.response.zerocopysend (os.sendfile на стороне сервера), если оно есть,
+иначе читается в потоке.
+
+Выделенный сервер (PHOTO_SERVER_PORT > 0) работает в отдельном потоке со своим event loop
+и отдает тело через loop.sendfile (os.sendfile): скачивание фото не задерживает API.
+"""
+import asyncio
+import email.utils
+import functools
+import os
+import stat
+import threading
+from http import HTTPStatus
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+from config import IMAGES_DIR, PHOTO_CACHE_MAX_AGE, PHOTO_SERVE_AVIF, PHOTO_SERVER_PORT
+from services import photo_variants
+from services.photo_store import BLOBS_DIR_NAME, IMMUTABLE_CACHE_CONTROL
+import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024  # Чтение без sendfile
+KEEPALIVE_TIMEOUT = 15.0  # Выделенный сервер: простой соединения между запросами (сек)
+MAX_HEADERS = 100
+
+CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+}
+AVIF_SOURCES = (".jpg", ".jpeg", ".png", ".webp")
+
+Headers = List[Tuple[str, str]]
+Generate = Callable[[Path], Awaitable[bool]]
+
+_stats = {"ok": 0, "partial": 0, "not_modified": 0, "not_found": 0, "generated": 0, "sendfile": 0, "bytes": 0}
+
+
+class PhotoFile:
+    """Найденный файл и зависящие от него заголовки"""
+
+    def __init__(self, path: str, stat_result: os.stat_result, relative_path: str, alternate: bool = False):
+        self.path = path
+        self.size = stat_result.st_size
+        self.mtime = int(stat_result.st_mtime)
+        self.last_modified = email.utils.formatdate(self.mtime, usegmt=True)
+        stem, extension = os.path.splitext(os.path.basename(path))
+        self.content_type = CONTENT_TYPES.get(extension.lower(), "application/octet-stream")
+        if relative_path.startswith(BLOBS_DIR_NAME + "/"):
+            # Имя файла хранилища - digest содержимого: файл не меняется, ETag сильный
+            self.etag = f'"{stem}-avif"' if alternate else f'"{stem}"'
+            self.cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            self.etag = f'"{stat_result.st_mtime_ns:x}-{self.size:x}"'
+            self.cache_control = f"public, max-age={PHOTO_CACHE_MAX_AGE}"
+
+
+def _stat_file(path: str) -> Optional[os.stat_result]:
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
+    return stat_result if stat.S_ISREG(stat_result.st_mode) else None
+
+
+def resolve(directory: str, url_path: str, accept: str = "") -> Tuple[Optional[PhotoFile], bool]:
+    """
+    Найти файл по пути запроса (относительно directory)
+
+    Returns:
+        (файл или None, зависит ли ответ от Accept)
+    """
+    relative = unquote(url_path).lstrip("/")
+    parts = relative.split("/")
+    # Скрытые файлы - недописанные временные (write_atomic), ".." - выход за directory
+    if not relative or "\x00" in relative or "\\" in relative or any(not part or part.startswith(".") for part in parts):
+        return None, False
+    full_path = os.path.join(directory, *parts)
+
+    vary = PHOTO_SERVE_AVIF and os.path.splitext(relative)[1].lower() in AVIF_SOURCES
+    if vary and "image/avif" in accept:
+        alternate_path = os.path.splitext(full_path)[0] + ".avif"
+        stat_result = _stat_file(alternate_path)
+        if stat_result is not None:
+            return PhotoFile(alternate_path, stat_result, relative, alternate=True), vary
+
+    stat_result = _stat_file(full_path)
+    if stat_result is None:
+        return None, vary
+    return PhotoFile(full_path, stat_result, relative), vary
+
+
+def _parse_http_date(value: str) -> Optional[int]:
+    try:
+        return int(email.utils.parsedate_to_datetime(value).timestamp())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _not_modified(photo: PhotoFile, headers: Dict[str, str]) -> bool:
+    """Условный GET: If-None-Match важнее If-Modified-Since"""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or photo.etag in tags or f"W/{photo.etag}" in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        since = _parse_http_date(if_modified_since)
+        return since is not None and photo.mtime <= since
+    return False
+
+
+def _if_range_matches(photo: PhotoFile, if_range: Optional[str]) -> bool:
+    """If-Range: диапазон отдается, только если файл не изменился (сильное сравнение ETag)"""
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"'):
+        return if_range == photo.etag
+    return _parse_http_date(if_range) == photo.mtime
+
+
+def _parse_range(value: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    bytes=a-b / bytes=a- / bytes=-n -> (начало, конец включительно)
+    None - заголовок игнорируется (ошибка синтаксиса или несколько диапазонов)
+
+    Raises:
+        ValueError: диапазон за пределами файла (416)
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_text, separator, end_text = spec.strip().partition("-")
+    if not separator or not (start_text or end_text):
+        return None
+    if not (start_text or "0").isdigit() or not (end_text or "0").isdigit():
+        return None
+
+    if not start_text:
+        suffix = int(end_text)
+        if suffix == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - suffix), size - 1
+    start = int(start_text)
+    if end_text and int(end_text) < start:
+        return None
+    if start >= size:
+        raise ValueError("range start beyond end of file")
+    end = int(end_text) if end_text else size - 1
+    return start, min(end, size - 1)
+
+
+async def prepare(
+    directory: str,
+    method: str,
+    url_path: str,
+    headers: Dict[str, str],
+    generate: Generate = photo_variants.ensure_variants
+) -> Tuple[int, Headers, Optional[PhotoFile], int, int]:
+    """
+    Ответ на запрос фото без тела
+
+    Returns:
+        (статус, заголовки, файл для тела или None, смещение, длина)
+    """
+    if method not in ("GET", "HEAD"):
+        return 405, [("allow", "GET, HEAD"), ("content-length", "0")], None, 0, 0
+
+    photo, vary = resolve(directory, url_path, headers.get("accept", ""))
+    if photo is None:
+        original = photo_variants.find_original(Path(directory), unquote(url_path).lstrip("/"))
+        if original is not None and await generate(original):
+            _stats["generated"] += 1
+            photo, vary = resolve(directory, url_path, headers.get("accept", ""))
+    if photo is None:
+        _stats["not_found"] += 1
+        return 404, [("content-type", "text/plain; charset=utf-8"), ("content-length", "9")], None, 0, 0
+
+    response_headers = [
+        ("etag", photo.etag),
+        ("last-modified", photo.last_modified),
+        ("cache-control", photo.cache_control),
+        ("accept-ranges", "bytes"),
+    ]
+    if vary:
+        response_headers.append(("vary", "Accept"))
+    if _not_modified(photo, headers):
+        _stats["not_modified"] += 1
+        return 304, response_headers, None, 0, 0
+
+    response_headers.append(("content-type", photo.content_type))
+    range_header = headers.get("range")
+    if range_header and _if_range_matches(photo, headers.get("if-range")):
+        try:
+            byte_range = _parse_range(range_header, photo.size)
+        except ValueError:
+            response_headers += [("content-range", f"bytes */{photo.size}"), ("content-length", "0")]
+            return 416, response_headers, None, 0, 0
+        if byte_range is not None:
+            start, end = byte_range
+            count = end - start + 1
+            response_headers += [("content-range", f"bytes {start}-{end}/{photo.size}"), ("content-length", str(count))]
+            _stats["partial"] += 1
+            return 206, response_headers, photo, start, count
+
+    response_headers.append(("content-length", str(photo.size)))
+    _stats["ok"] += 1
+    return 200, response_headers, photo, 0, photo.size
+
+
+def _read(path: str, offset: int, count: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(count)
+
+
+class PhotoServer:
+    """ASGI приложение для /data/img (замена StaticFiles)"""
+
+    def __init__(self, directory: str = IMAGES_DIR):
+        self.directory = os.path.realpath(directory)
+
+    async def __call__(self, scope, receive, send) -> None:
+        assert scope["type"] == "http"
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        # Starlette новее 0.33 передает в смонтированное приложение полный путь
+        if root_path and path.startswith(root_path + "/"):
+            path = path[len(root_path):]
+        headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+
+        status, response_headers, photo, offset, count = await prepare(self.directory, scope["method"], path, headers)
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in response_headers],
+        })
+        if scope["method"] == "HEAD" or photo is None:
+            body = b"Not Found" if status == 404 and scope["method"] != "HEAD" else b""
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        extensions = scope.get("extensions") or {}
+        _stats["bytes"] += count
+        if "http.response.zerocopysend" in extensions:
+            with open(photo.path, "rb") as f:
+                _stats["sendfile"] += 1
+                await send({"type": "http.response.zerocopysend", "file": f, "offset": offset, "count": count})
+            return
+        if "http.response.pathsend" in extensions and count == photo.size:
+            await send({"type": "http.response.pathsend", "path": photo.path})
+            return
+
+        # Обычные фото (варианты - десятки КБ) читаются за один переход в поток
+        position, remaining = offset, count
+        while True:
+            chunk = await asyncio.to_thread(_read, photo.path, position, min(remaining, CHUNK_SIZE))
+            position += len(chunk)
+            remaining -= len(chunk)
+            more_body = remaining > 0 and len(chunk) > 0
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            if not more_body:
+                return
+
+
+async def _handle_connection(
+    directory: str,
+    generate: Generate,
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter
+) -> None:
+    """Соединение выделенного сервера: HTTP/1.1 с keep-alive, только GET/HEAD"""
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            request_line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT)
+            if not request_line:
+                return
+            try:
+                method, target, version = request_line.decode("latin-1").split()
+            except ValueError:
+                writer.write(b"HTTP/1.1 400 Bad Request\r\ncontent-length: 0\r\nconnection: close\r\n\r\n")
+                return
+
+            headers: Dict[str, str] = {}
+            for _ in range(MAX_HEADERS):
+                line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            else:
+                writer.write(b"HTTP/1.1 431 Request Header Fields Too Large\r\ncontent-length: 0\r\nconnection: close\r\n\r\n")
+                return
+            keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+            # Те же URL, что и в основном сервере: /data/img/...
+            path = target.split("?", 1)[0]
+            if path.startswith(photo_variants.PHOTO_URL_PREFIX):
+                path = path[len(photo_variants.PHOTO_URL_PREFIX) - 1:]
+            status, response_headers, photo, offset, count = await prepare(directory, method, path, headers, generate)
+
+            head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+            head += [f"{name}: {value}" for name, value in response_headers]
+            head.append("connection: keep-alive" if keep_alive else "connection: close")
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+            if method == "HEAD" or photo is None:
+                if status == 404 and method != "HEAD":
+                    writer.write(b"Not Found")
+            else:
+                _stats["bytes"] += count
+                _stats["sendfile"] += 1
+                with open(photo.path, "rb") as f:
+                    # os.sendfile: файл уходит в сокет без копирования через Python
+                    await loop.sendfile(writer.transport, f, offset, count)
+            await writer.drain()
+            if not keep_alive:
+                return
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, ConnectionError):
+        # Простой, обрыв соединения или слишком длинная строка запроса
+        pass
+    except Exception as e:
+        logger.error(f"❌ [PHOTOS] Ошибка выделенного сервера фото: {e}")
+    finally:
+        writer.close()
+
+
+async def serve(
+    directory: str = IMAGES_DIR,
+    host: str = "0.0.0.0",
+    port: int = PHOTO_SERVER_PORT,
+    generate: Generate = photo_variants.ensure_variants
+) -> None:
+    """Выделенный сервер фото (работает до отмены)"""
+    handler = functools.partial(_handle_connection, os.path.realpath(directory), generate)
+    server = await asyncio.start_server(handler, host, port, reuse_address=True)
+    async with server:
+        await server.serve_forever()
+
+
+_thread: Optional[threading.Thread] = None
+_thread_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread_task: Optional["asyncio.Task[None]"] = None
+
+
+def start(port: int = PHOTO_SERVER_PORT) -> None:
+    """Запустить выделенный сервер в отдельном потоке (вызывается в lifespan)"""
+    global _thread, _thread_loop, _thread_task
+    if port <= 0 or _thread is not None:
+        return
+    app_loop = asyncio.get_running_loop()
+
+    async def generate(original: Path) -> bool:
+        # Варианты создает пул процессов приложения, его очередь живет в основном loop
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(photo_variants.ensure_variants(original), app_loop)
+        )
+
+    def run() -> None:
+        global _thread_task
+        # SelectorEventLoop, а не uvloop: в uvloop нет loop.sendfile
+        loop = _thread_loop
+        asyncio.set_event_loop(loop)
+        _thread_task = loop.create_task(serve(port=port, generate=generate))
+        try:
+            loop.run_until_complete(_thread_task)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"❌ [PHOTOS] Выделенный сервер фото остановлен: {e}")
+        finally:
+            loop.close()
+
+    _thread_loop = asyncio.SelectorEventLoop()
+    _thread = threading.Thread(target=run, name="photo-server", daemon=True)
+    _thread.start()
+    logger.info(f"✅ Выделенный сервер фото запущен на порту {port}")
+
+
+def stop() -> None:
+    """Остановить выделенный сервер"""
+    global _thread, _thread_loop, _thread_task
+    if _thread is None:
+        return
+    if _thread_task is not None and not _thread_loop.is_closed():
+        _thread_loop.call_soon_threadsafe(_thread_task.cancel)
+    _thread.join(timeout=5)
+    _thread = _thread_loop = _thread_task = None
+
+
+def get_stats() -> Dict[str, int]:
+    """Счетчики ответов на запросы фото"""
+    return {"dedicated_port": PHOTO_SERVER_PORT if _thread is not None else 0, **_stats}
+
+
+@metrics.collector
+def _photo_server_metrics():
+    return [
+        metrics.labeled_family(
+            "photo_responses_total", "counter", "Ответы на запросы фото",
+            "result", {key: _stats[key] for key in ("ok", "partial", "not_modified", "not_found")}
+        ),
+        metrics.value_family("photo_variants_generated_total", "counter", "Варианты фото, созданные при первом запросе", _stats["generated"]),
+        metrics.value_family("photo_sent_bytes_total", "counter", "Отправленные байты фото", _stats["bytes"]),
+    ]
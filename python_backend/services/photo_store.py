@@ -0,0 +1,164 @@
+"""
+services/photo_store.py
+Хранилище фото по содержимому (content-addressed).
+
+Файл называется по SHA-256 своих байтов: /data/img/blobs/ab/<digest>.jpg.
+Повторная загрузка того же фото и одно фото в нескольких слотах или у нескольких
+пользователей хранятся один раз. URL меняется вместе с содержимым, поэтому файл
+отдается с Cache-Control: immutable и ETag = digest (services/photo_server.py).
+
+Ссылки (photo1..3 и photoUrl) считает триггер trg_users_photo_blobs в photo_blobs.refcount,
+файлы без ссылок удаляет collect_garbage() (периодически, из lifespan).
+"""
+import asyncio
+import hashlib
+import re
+import shutil
+from pathlib import Path
+from typing import Dict, Optional
+from db_utils import db_all, db_run, transaction
+from services import candidate_queue, jobs, photo_variants, profile_cache
+from config import IMAGES_DIR, PHOTO_GC_INTERVAL, PHOTO_GC_GRACE
+import logging
+
+logger = logging.getLogger(__name__)
+
+BLOBS_DIR_NAME = "blobs"
+# Фото за одну задачу пересоздания вариантов (дальше задача ставит продолжение)
+REGENERATE_BATCH_SIZE = 200
+BLOB_EXTENSION = ".jpg"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_BLOB_URL_RE = re.compile(r"^/data/img/blobs/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})\.jpg$")
+
+
+def content_digest(content: bytes) -> str:
+    """SHA-256 содержимого (hex)"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def blob_path(digest: str) -> Path:
+    """Путь к файлу: IMAGES_DIR/blobs/<первые 2 символа>/<digest>.jpg"""
+    return Path(IMAGES_DIR) / BLOBS_DIR_NAME / digest[:2] / f"{digest}{BLOB_EXTENSION}"
+
+
+def blob_url(digest: str) -> str:
+    """URL файла для photo1..3 / photoUrl"""
+    return f"/data/img/{BLOBS_DIR_NAME}/{digest[:2]}/{digest}{BLOB_EXTENSION}"
+
+
+def digest_from_url(photo_url: Optional[str]) -> Optional[str]:
+    """digest из URL хранилища или None для старых путей (/data/img/<userId>/Photo1.jpg) и внешних ссылок"""
+    match = _BLOB_URL_RE.match(photo_url or "")
+    return match.group("digest") if match else None
+
+
+async def store(content: bytes, variants: Optional[Dict[str, bytes]] = None) -> str:
+    """
+    Сохранить фото (и его варианты) в хранилище
+
+    Returns:
+        URL фото. Ссылку учитывает триггер, когда URL записывается в users.
+    """
+    digest = content_digest(content)
+
+    # Строка создается (или "трогается") до записи файла: сборщик мусора не удалит
+    # файл, пока пользователь еще не успел на него сослаться
+    await db_run(
+        """INSERT INTO photo_blobs (digest, size) VALUES (?, ?)
+           ON CONFLICT (digest) DO UPDATE SET touched_at = NOW()""",
+        [digest, len(content)]
+    )
+
+    path = blob_path(digest)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        await photo_variants.write_atomic(path, content)
+    for name, variant_content in (variants or {}).items():
+        if not photo_variants.variant_path(path, name).exists():
+            await photo_variants.write_atomic(photo_variants.variant_path(path, name), variant_content)
+    return blob_url(digest)
+
+
+def remove_legacy_dir(user_id: str) -> None:
+    """Удалить папку старых фото пользователя (/data/img/<userId>), файлы хранилища не трогает"""
+    user_dir = Path(IMAGES_DIR) / str(user_id)
+    if user_dir.is_dir() and user_dir.name != BLOBS_DIR_NAME:
+        shutil.rmtree(user_dir)
+
+
+async def clear_user_photos(user_id: str) -> None:
+    """Очистить photo1..3 пользователя (ссылки на файлы хранилища снимет триггер)"""
+    remove_legacy_dir(user_id)
+    await db_run(
+        "UPDATE users SET photo1 = '', photo2 = '', photo3 = '' WHERE userId = ?",
+        [user_id]
+    )
+    await profile_cache.invalidate(user_id)
+    await candidate_queue.on_user_changed(user_id)
+
+
+def _remove_files(digest: str) -> None:
+    """Удалить файл и его варианты"""
+    path = blob_path(digest)
+    path.unlink(missing_ok=True)
+    photo_variants.delete_variants(path)
+
+
+async def collect_garbage(grace_seconds: float = PHOTO_GC_GRACE) -> int:
+    """
+    Удалить фото, на которые больше никто не ссылается (дольше grace_seconds)
+
+    Returns:
+        Количество удаленных фото
+    """
+    async with transaction() as conn:
+        cur = conn.cursor()
+        await cur.execute(
+            """DELETE FROM photo_blobs
+               WHERE refcount <= 0 AND touched_at < NOW() - make_interval(secs => %s)
+               RETURNING digest""",
+            (grace_seconds,)
+        )
+        rows = await cur.fetchall()
+        # Файлы удаляются до коммита: параллельная загрузка того же фото ждет
+        # блокировку строки и после коммита запишет файл заново
+        for (digest,) in rows:
+            _remove_files(digest)
+    return len(rows)
+
+
+async def run_garbage_collector(interval: float = PHOTO_GC_INTERVAL) -> None:
+    """Фоновая сборка мусора хранилища (задача из lifespan)"""
+    while True:
+        try:
+            removed = await collect_garbage()
+            if removed:
+                logger.info(f"🧹 [PHOTOS] Удалено фото без ссылок: {removed}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ [PHOTOS] Ошибка сборки мусора хранилища фото: {e}")
+        await asyncio.sleep(interval)
+
+
+@jobs.job("regenerate_photo_variants", concurrency=1)
+async def regenerate_variants_job(payload) -> None:
+    """
+    Пересоздать варианты (card/thumb/avatar) всех фото хранилища, например после смены PHOTO_*_SIZE.
+    Одна задача обрабатывает REGENERATE_BATCH_SIZE фото и ставит следующую с курсора,
+    поэтому прерванная работа продолжается с последней пачки.
+    """
+    after = payload.get("after", "")
+    rows = await db_all(
+        "SELECT digest FROM photo_blobs WHERE refcount > 0 AND digest > ? ORDER BY digest LIMIT ?",
+        [after, REGENERATE_BATCH_SIZE]
+    )
+    for row in rows:
+        await photo_variants.generate_variants(blob_path(row["digest"]))
+    if len(rows) == REGENERATE_BATCH_SIZE:
+        # Ключ по курсору: повтор этой пачки (ретрай, истекшая аренда) не поставит вторую цепочку
+        last = rows[-1]["digest"]
+        await jobs.enqueue("regenerate_photo_variants", {"after": last}, dedupe_key=f"regenerate_photo_variants:{last}")
+    else:
+        logger.info("✅ [PHOTOS] Варианты фото пересозданы")
@@ -0,0 +1,120 @@
+"""
+services/photo_variants.py
+Варианты фото профиля (карточка, превью, аватар) в WebP.
+
+Варианты лежат рядом с оригиналом: /data/img/blobs/ab/<digest>.jpg ->
+/data/img/blobs/ab/<digest>_card.webp (для старых фото - /data/img/<userId>/Photo1_card.webp). При загрузке они кодируются из того же
+декодированного кадра (image_pipeline), а для фото, загруженных раньше, -
+при первом запросе варианта (services/photo_server.py).
+"""
+import asyncio
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
+import aiofiles
+from image_pipeline import PHOTO_VARIANTS
+from services import face_detection
+import logging
+
+logger = logging.getLogger(__name__)
+
+VARIANT_EXTENSION = ".webp"
+PHOTO_URL_PREFIX = "/data/img/"
+ORIGINAL_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+# <директория>/<имя оригинала>_<вариант>.webp (относительно IMAGES_DIR)
+VARIANT_PATH_RE = re.compile(
+    r"^(?P<dir>(?:[\w-]+/)+)(?P<stem>[\w-]+)_(?P<variant>" + "|".join(PHOTO_VARIANTS) + r")\.webp$"
+)
+
+# Оригинал -> задача генерации, чтобы параллельные запросы не кодировали одно и то же
+_pending: Dict[Path, "asyncio.Task[bool]"] = {}
+
+
+def variant_filename(filename: str, variant: str) -> str:
+    """Photo1.jpg -> Photo1_card.webp"""
+    stem = filename.rsplit(".", 1)[0]
+    return f"{stem}_{variant}{VARIANT_EXTENSION}"
+
+
+def variant_path(file_path: Path, variant: str) -> Path:
+    """Путь к варианту рядом с оригиналом"""
+    return file_path.with_name(variant_filename(file_path.name, variant))
+
+
+def variant_url(photo_url: str, variant: str) -> str:
+    """
+    URL варианта для локального фото (/data/img/...).
+    Остальные URL (Telegram userpic, заглушки /img/*.svg, внешние ссылки) возвращаются без изменений.
+    """
+    if not photo_url or not photo_url.startswith(PHOTO_URL_PREFIX):
+        return photo_url
+    head, _, filename = photo_url.rpartition("/")
+    if not filename.lower().endswith(ORIGINAL_EXTENSIONS):
+        return photo_url
+    return f"{head}/{variant_filename(filename, variant)}"
+
+
+def variant_urls(photo_urls: List[str], variant: str) -> List[str]:
+    """URL варианта для каждого фото из списка"""
+    return [variant_url(url, variant) for url in photo_urls]
+
+
+async def write_atomic(path: Path, content: bytes) -> None:
+    """Записать файл через временный, чтобы клиент не получил недописанный вариант"""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    async with aiofiles.open(tmp_path, "wb") as f:
+        await f.write(content)
+    os.replace(tmp_path, path)
+
+
+async def save_variants(file_path: Path, variants: Dict[str, bytes]) -> None:
+    """Сохранить варианты рядом с оригиналом (перезаписывая старые)"""
+    for name, content in variants.items():
+        await write_atomic(variant_path(file_path, name), content)
+
+
+def delete_variants(file_path: Path) -> None:
+    """Удалить варианты фото"""
+    for name in PHOTO_VARIANTS:
+        variant_path(file_path, name).unlink(missing_ok=True)
+
+
+async def generate_variants(original: Path) -> bool:
+    """Создать (или пересоздать) все варианты для сохраненного оригинала"""
+    if not original.is_file():
+        return False
+    async with aiofiles.open(original, "rb") as f:
+        content = await f.read()
+    try:
+        variants = await face_detection.make_variants(content)
+    except ValueError as e:
+        logger.warning(f"⚠️ Не удалось создать варианты для {original}: {e}")
+        return False
+    await save_variants(original, variants)
+    return True
+
+
+async def ensure_variants(original: Path) -> bool:
+    """Создать варианты оригинала, если их еще нет (одна генерация на файл одновременно)"""
+    task = _pending.get(original)
+    if task is None:
+        task = asyncio.create_task(generate_variants(original))
+        _pending[original] = task
+        task.add_done_callback(lambda _: _pending.pop(original, None))
+    # shield: отключившийся клиент не отменяет генерацию для остальных
+    return await asyncio.shield(task)
+
+
+def find_original(directory: Path, variant_relative_path: str) -> Optional[Path]:
+    """Оригинал для пути варианта (относительно directory) или None"""
+    match = VARIANT_PATH_RE.match(variant_relative_path)
+    if not match:
+        return None
+    parent = directory / match.group("dir")
+    for extension in ORIGINAL_EXTENSIONS:
+        original = parent / f"{match.group('stem')}{extension}"
+        if original.is_file():
+            return original
+    return None
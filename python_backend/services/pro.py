@@ -0,0 +1,156 @@
+"""
+services/pro.py
+PRO-подписка: выдача, продление и промокоды.
+Вызывается и из роутов (routes/pro.py), и напрямую из команд бота.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+from db_utils import db_get, db_run, db_session, transaction
+from services import profile_cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Сколько суперлайков выдается вместе с PRO, если у пользователя их нет
+PRO_SUPER_LIKES = 3
+
+
+def _super_likes(row: Optional[Dict[str, Any]]) -> int:
+    """superLikesCount из строки БД (значение может быть строкой или None)"""
+    try:
+        return int((row or {}).get("superLikesCount") or 0)
+    except (ValueError, TypeError):
+        return 0
+
+
+async def extend_pro(user_id: str, days: int, now: Optional[datetime] = None) -> str:
+    """
+    Продлить PRO на days дней от текущего pro_end (или от now, если подписка истекла)
+    и выдать PRO_SUPER_LIKES суперлайков, если их 0
+
+    Returns:
+        Новый pro_end (ISO)
+    """
+    now = now or datetime.now()
+    # В БД колонка называется superLikesCount (camelCase)!
+    row = await db_get('SELECT "pro_end", "superLikesCount" FROM users WHERE "userId" = ?', [user_id])
+
+    base_time = now
+    if row and row.get("pro_end"):
+        try:
+            existing = datetime.fromisoformat(row["pro_end"].replace("Z", "+00:00"))
+            if existing > now:
+                base_time = existing
+        except (ValueError, TypeError):
+            pass
+
+    new_end = (base_time + timedelta(days=days)).isoformat()
+
+    current_super_likes = _super_likes(row)
+    if current_super_likes == 0:
+        await db_run(
+            'UPDATE users SET is_pro = 1, "pro_end" = ?, "superLikesCount" = ? WHERE "userId" = ?',
+            [new_end, PRO_SUPER_LIKES, user_id]
+        )
+        logger.info(f"PRO для {user_id} до {new_end}, superLikesCount = {PRO_SUPER_LIKES}")
+    else:
+        await db_run('UPDATE users SET is_pro = 1, "pro_end" = ? WHERE "userId" = ?', [new_end, user_id])
+        logger.info(f"PRO для {user_id} до {new_end}, superLikesCount без изменений: {current_super_likes}")
+    await profile_cache.invalidate(user_id)
+    return new_end
+
+
+async def activate_promo_code(user_id: str, promo_code: str) -> Dict[str, Any]:
+    """
+    Активировать промокод
+
+    Returns:
+        {"success": True, "days", "pro_end", "superLikesCount", "message"}
+        или {"success": False, "error"} (промокод не найден, неактивен, истек или уже использован)
+    """
+    # Команда бота не идет через HTTP: одно соединение на все запросы активации берем здесь
+    async with db_session():
+        return await _activate_promo_code(user_id, promo_code)
+
+
+async def _activate_promo_code(user_id: str, promo_code: str) -> Dict[str, Any]:
+    promo_code = promo_code.strip().upper()
+
+    # Проверяем существование промокода и его активность
+    promo_row = await db_get(
+        'SELECT id, days, is_active, expires_at FROM promo_codes WHERE code = ?',
+        [promo_code]
+    )
+    if not promo_row:
+        return {"success": False, "error": "Промокод не найден"}
+    if not promo_row.get("is_active"):
+        return {"success": False, "error": "Промокод неактивен"}
+
+    # Проверяем срок действия промокода
+    expires_at = promo_row.get("expires_at")
+    if expires_at:
+        if isinstance(expires_at, str):
+            expires_at = datetime.fromisoformat(expires_at.replace("Z", "+00:00"))
+        if expires_at < datetime.now(timezone.utc):
+            return {"success": False, "error": "Промокод истек"}
+
+    promo_code_id = promo_row["id"]
+    days = promo_row["days"]
+
+    # Проверяем, не использовал ли пользователь этот промокод ранее
+    usage_row = await db_get(
+        'SELECT id FROM promo_code_usage WHERE promo_code_id = ? AND user_id = ?',
+        [promo_code_id, user_id]
+    )
+    if usage_row:
+        return {"success": False, "error": "Вы уже использовали этот промокод"}
+
+    new_end = await extend_pro(user_id, days, datetime.now(timezone.utc))
+
+    # Записываем использование промокода
+    await db_run(
+        'INSERT INTO promo_code_usage (promo_code_id, user_id) VALUES (?, ?)',
+        [promo_code_id, user_id]
+    )
+
+    final_super_likes = _super_likes(
+        await db_get('SELECT "superLikesCount" FROM users WHERE "userId" = ?', [user_id])
+    )
+    logger.info(f"Промокод {promo_code} активирован: user_id={user_id}, days={days}, pro_end={new_end}")
+
+    return {
+        "success": True,
+        "days": days,
+        "pro_end": new_end,
+        "superLikesCount": final_super_likes,
+        "message": f"✅ Промокод активирован! PRO подписка продлена на {days} дней."
+    }
+
+
+async def get_pro_stats() -> Dict[str, Any]:
+    """Статистика PRO: всего, активных, истекших и доля от всех пользователей"""
+    # Три подсчета в одном снимке (REPEATABLE READ), чтобы доли сходились между собой
+    async with transaction(readonly=True) as conn:
+        # Всего пользователей с is_pro = 1
+        total_pro_row = await db_get('SELECT COUNT(*) AS count FROM users WHERE is_pro = 1', conn=conn)
+        total_pro = total_pro_row.get("count", 0) if total_pro_row else 0
+
+        # Активные PRO (с неистекшим сроком)
+        active_pro_row = await db_get(
+            'SELECT COUNT(*) AS count FROM users WHERE is_pro = 1 AND "pro_end" > ?',
+            [datetime.now().isoformat()],
+            conn=conn
+        )
+        active_pro = active_pro_row.get("count", 0) if active_pro_row else 0
+
+        total_users_row = await db_get('SELECT COUNT(*) AS count FROM users', conn=conn)
+        total_users = total_users_row.get("count", 0) if total_users_row else 0
+
+    return {
+        "total_pro": total_pro,
+        "active_pro": active_pro,
+        "expired_pro": total_pro - active_pro,
+        "total_users": total_users,
+        "pro_percentage": round((total_pro / total_users * 100) if total_users > 0 else 0, 2),
+        "active_pro_percentage": round((active_pro / total_users * 100) if total_users > 0 else 0, 2)
+    }
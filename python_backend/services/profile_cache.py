@@ -0,0 +1,320 @@
+"""
+services/profile_cache.py
+Кэш профилей (строк таблицы users) по userId: read-through, LRU + TTL, сброс при записи.
+
+/api/getUser (фронтенд запрашивает его многократно), лента, мэтчи, лайки и PRO
+каждый раз перечитывали одну и ту же строку users. Теперь строка берется из кэша,
+при промахе - из БД (для списков одним запросом на все промахи). Каждый путь записи
+в users вызывает invalidate(), и следующий запрос читает свежую строку.
+
+Лайки/дизлайки/мэтчи в кэш не входят: они хранятся в user_edges и читаются отдельно,
+поэтому старые JSONB колонки likes/dislikes/matches из строки убираются.
+
+Бэкенд выбирается PROFILE_CACHE_BACKEND:
+- memory - в памяти процесса (по умолчанию; приложение запускается одним процессом);
+- redis - общий кэш для нескольких воркеров/инстансов: сброс в одном виден всем.
+Другой бэкенд подключается через set_backend() (методы как у MemoryBackend).
+"""
+import json
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from db_utils import db_all, db_pipeline
+from config import PROFILE_CACHE_MAX_USERS, PROFILE_CACHE_TTL, PROFILE_CACHE_BACKEND, PROFILE_CACHE_REDIS_URL
+import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROFILE_QUERY = "SELECT * FROM users WHERE userId = ?"
+
+# Старые колонки связей: источник истины - user_edges
+_EDGE_COLUMNS = ("likes", "dislikes", "matches")
+
+Row = Dict[str, Any]
+
+
+class MemoryBackend:
+    """LRU + TTL в памяти процесса"""
+
+    name = "memory"
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[float, Row]]" = OrderedDict()  # userId -> (истекает, строка)
+
+    async def get_many(self, keys: List[str]) -> Dict[str, Row]:
+        now = time.monotonic()
+        found = {}
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if entry[0] <= now:
+                del self._entries[key]
+                continue
+            self._entries.move_to_end(key)
+            found[key] = entry[1]
+        return found
+
+    async def set_many(self, rows: Dict[str, Row]) -> None:
+        expires = time.monotonic() + self.ttl
+        for key, row in rows.items():
+            self._entries[key] = (expires, row)
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete_many(self, keys: List[str]) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def close(self) -> None:
+        self._entries.clear()
+
+    def size(self) -> Optional[int]:
+        return len(self._entries)
+
+
+def _encode(value: Any) -> Any:
+    """JSON для значений, которые json не умеет (pro_end, createdAt - datetime из PostgreSQL)"""
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    return str(value)
+
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    if "__date__" in obj:
+        return date.fromisoformat(obj["__date__"])
+    return obj
+
+
+class RedisBackend:
+    """
+    Общий кэш в Redis (пакет redis): строка - JSON с TTL (EX), вытеснение - политикой
+    maxmemory самого Redis. ImportError, если пакет не установлен
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, ttl: float, prefix: str = "profile:"):
+        import redis.asyncio as redis_asyncio
+        self.ttl = max(1, int(ttl))
+        self.prefix = prefix
+        self.evictions = 0
+        self._client = redis_asyncio.from_url(url)
+
+    async def get_many(self, keys: List[str]) -> Dict[str, Row]:
+        values = await self._client.mget([self.prefix + key for key in keys])
+        return {
+            key: json.loads(value, object_hook=_decode)
+            for key, value in zip(keys, values) if value is not None
+        }
+
+    async def set_many(self, rows: Dict[str, Row]) -> None:
+        async with self._client.pipeline(transaction=False) as pipe:
+            for key, row in rows.items():
+                pipe.set(self.prefix + key, json.dumps(row, default=_encode), ex=self.ttl)
+            await pipe.execute()
+
+    async def delete_many(self, keys: List[str]) -> None:
+        await self._client.delete(*[self.prefix + key for key in keys])
+
+    async def close(self) -> None:
+        await self._client.close()
+
+    def size(self) -> Optional[int]:
+        # Размер общего кэша знает только Redis (DBSIZE по всем ключам), в метрики не идет
+        return None
+
+
+def _create_backend():
+    if PROFILE_CACHE_MAX_USERS <= 0:
+        return None
+    if PROFILE_CACHE_BACKEND == "redis":
+        try:
+            return RedisBackend(PROFILE_CACHE_REDIS_URL, PROFILE_CACHE_TTL)
+        except ImportError:
+            logger.warning("⚠️ PROFILE_CACHE_BACKEND=redis, но пакет redis не установлен - кэш профилей в памяти процесса")
+    return MemoryBackend(PROFILE_CACHE_MAX_USERS, PROFILE_CACHE_TTL)
+
+
+_backend = _create_backend()
+_stats = {"hits": 0, "misses": 0, "loads": 0, "invalidations": 0, "stale_skips": 0, "errors": 0}
+
+# Защита от гонки "прочитали старую строку из БД - ее изменили и сбросили - записали старую в кэш":
+# пока идут загрузки, сброшенные userId запоминаются с номером сброса
+_generation = 0
+_loads_in_flight = 0
+_invalidated: Dict[str, int] = {}
+
+
+def set_backend(backend) -> None:
+    """Подключить другой бэкенд (None - кэш выключен)"""
+    global _backend
+    _backend = backend
+
+
+async def _cached(keys: List[str]) -> Dict[str, Row]:
+    """Строки из кэша; ошибка бэкенда (Redis недоступен) - как промах, запрос идет в БД"""
+    found: Dict[str, Row] = {}
+    if _backend is not None:
+        try:
+            found = await _backend.get_many(keys)
+        except Exception as e:
+            _stats["errors"] += 1
+            logger.warning(f"Кэш профилей недоступен: {e}")
+    _stats["hits"] += len(found)
+    _stats["misses"] += len(keys) - len(found)
+    return found
+
+
+def _begin_load() -> int:
+    global _loads_in_flight
+    _loads_in_flight += 1
+    return _generation
+
+
+def _end_load() -> None:
+    global _loads_in_flight
+    _loads_in_flight -= 1
+    if _loads_in_flight == 0:
+        _invalidated.clear()
+
+
+async def _store(rows: Dict[str, Row], generation: int) -> None:
+    """Положить загруженные строки, кроме сброшенных после начала загрузки"""
+    fresh = {key: row for key, row in rows.items() if _invalidated.get(key, -1) <= generation}
+    _stats["stale_skips"] += len(rows) - len(fresh)
+    _stats["loads"] += len(rows)
+    if _backend is None or not fresh:
+        return
+    try:
+        await _backend.set_many(fresh)
+    except Exception as e:
+        _stats["errors"] += 1
+        logger.warning(f"Не удалось записать в кэш профилей: {e}")
+
+
+def _profile(row: Row) -> Row:
+    return {key: value for key, value in row.items() if key not in _EDGE_COLUMNS}
+
+
+async def get_profiles(user_ids: Iterable[str]) -> Dict[str, Row]:
+    """
+    Профили набора пользователей: из кэша, промахи - одним запросом к БД.
+    Несуществующих userId в результате нет. Строки - копии, их можно менять
+    """
+    keys = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+    if not keys:
+        return {}
+    found = await _cached(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        generation = _begin_load()
+        try:
+            rows = await db_all("SELECT * FROM users WHERE userId = ANY(?)", [missing])
+            loaded = {str(row["userId"]): _profile(row) for row in rows}
+            await _store(loaded, generation)
+        finally:
+            _end_load()
+        found.update(loaded)
+    return {key: dict(found[key]) for key in keys if key in found}
+
+
+async def get_profile(user_id: str) -> Optional[Row]:
+    """Профиль пользователя (None - такого нет)"""
+    return (await get_profiles([user_id])).get(str(user_id))
+
+
+async def get_profile_with(
+    user_id: str,
+    queries: List[Tuple[str, List[Any]]]
+) -> Tuple[Optional[Row], List[List[Row]]]:
+    """
+    Профиль и другие чтения того же запроса (/api/getUser): при промахе строка users
+    читается одним db_pipeline вместе с queries, при попадании выполняются только queries
+
+    Returns:
+        (профиль или None, строки каждого из queries)
+    """
+    user_id = str(user_id)
+    found = await _cached([user_id])
+    if user_id in found:
+        return dict(found[user_id]), (await db_pipeline(queries) if queries else [])
+
+    generation = _begin_load()
+    try:
+        results = await db_pipeline([(PROFILE_QUERY, [user_id]), *queries])
+        row = _profile(results[0][0]) if results[0] else None
+        if row is not None:
+            await _store({user_id: row}, generation)
+    finally:
+        _end_load()
+    return (dict(row) if row is not None else None), results[1:]
+
+
+async def invalidate(*user_ids: str) -> None:
+    """Профили изменились в БД - сбросить их (вызывается после каждой записи в users)"""
+    global _generation
+    keys = [str(user_id) for user_id in user_ids if user_id]
+    if not keys:
+        return
+    _generation += 1
+    if _loads_in_flight:
+        for key in keys:
+            _invalidated[key] = _generation
+    _stats["invalidations"] += len(keys)
+    if _backend is None:
+        return
+    try:
+        await _backend.delete_many(keys)
+    except Exception as e:
+        # Запись останется до истечения PROFILE_CACHE_TTL
+        _stats["errors"] += 1
+        logger.error(f"❌ Не удалось сбросить кэш профилей {keys}: {e}")
+
+
+async def close() -> None:
+    """Закрыть соединение бэкенда (в lifespan)"""
+    if _backend is not None:
+        await _backend.close()
+
+
+def get_stats() -> Dict[str, Any]:
+    """Метрики кэша профилей: попадания, промахи, сбросы, доля попаданий"""
+    hits, misses = _stats["hits"], _stats["misses"]
+    return {
+        "backend": _backend.name if _backend is not None else "off",
+        "size": _backend.size() if _backend is not None else 0,
+        "max_size": PROFILE_CACHE_MAX_USERS,
+        "ttl": PROFILE_CACHE_TTL,
+        "evictions": _backend.evictions if _backend is not None else 0,
+        **_stats,
+        "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+    }
+
+
+@metrics.collector
+def _profile_cache_metrics():
+    stats = get_stats()
+    families = [
+        metrics.labeled_family(
+            "profile_cache_requests_total", "counter", "Обращения к кэшу профилей",
+            "result", {"hit": stats["hits"], "miss": stats["misses"]}
+        ),
+        metrics.value_family("profile_cache_invalidations_total", "counter", "Сброшенные профили", stats["invalidations"]),
+        metrics.value_family("profile_cache_evictions_total", "counter", "Профили, вытесненные по LRU", stats["evictions"]),
+        metrics.value_family("profile_cache_errors_total", "counter", "Ошибки бэкенда кэша профилей", stats["errors"]),
+    ]
+    if stats["size"] is not None:
+        families.append(metrics.value_family("profile_cache_entries", "gauge", "Профили в кэше процесса", stats["size"]))
+    return families
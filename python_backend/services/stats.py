@@ -0,0 +1,43 @@
+"""
+services/stats.py
+Статистика для админки и команд бота (/stats, /stats_users)
+"""
+from typing import Any, Dict, List
+from db_utils import db_get, db_all
+
+
+async def count_visits_24h() -> int:
+    """Уникальные посетители (visitorId = telegramID) за последние 24 часа"""
+    row = await db_get(
+        'SELECT COUNT(DISTINCT "visitorId") AS "dayCount" FROM visits WHERE timestamp >= NOW() - INTERVAL \'24 hours\'',
+        []
+    )
+    return row.get("dayCount", 0) if row else 0
+
+
+async def get_users_by_gender() -> Dict[str, Any]:
+    """
+    Распределение пользователей по полу
+
+    Returns:
+        {"data": [{"name": пол или "Не указан", "count"}], "total": всего пользователей}
+    """
+    total_row = await db_get("SELECT COUNT(*) AS count FROM users")
+    total_users = total_row.get("count", 0) if total_row else 0
+
+    # NULL и пустые строки считаем как "Не указан"
+    rows: List[Dict[str, Any]] = await db_all("""
+        SELECT
+            CASE
+                WHEN gender IS NULL OR gender = '' THEN 'Не указан'
+                ELSE gender
+            END AS name,
+            COUNT(*) AS count
+        FROM users
+        GROUP BY
+            CASE
+                WHEN gender IS NULL OR gender = '' THEN 'Не указан'
+                ELSE gender
+            END
+    """)
+    return {"data": rows, "total": total_users}
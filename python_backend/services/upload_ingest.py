@@ -0,0 +1,367 @@
+"""
+services/upload_ingest.py
+Потоковый прием загружаемых фото.
+
+Раньше тело запроса целиком читалось в память (file.read(), base64 из JSON), и только
+потом проверялся размер. Здесь тело читается кусками:
+- Content-Length больше допустимого - 413 до чтения тела;
+- превышение MAX_FILE_SIZE во время чтения - 413 сразу, остаток тела не читается;
+- сигнатура, формат и размеры проверяются по первым килобайтам (UPLOAD_SNIFF_BYTES);
+- байты пишутся во временный файл, а не в память, и обрабатываются пулом процессов из файла.
+"""
+import asyncio
+import base64
+import binascii
+import json
+import os
+import tempfile
+from typing import Any, AsyncIterator, Dict, Optional
+import multipart
+from multipart.multipart import parse_options_header
+from image_pipeline import ImagePipeline, SIGNATURE_SIZE, sniff_format
+from config import MAX_FILE_SIZE, UPLOAD_SNIFF_BYTES
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_FIELD_SIZE = 16 * 1024  # Обычные поля формы и JSON (userId, photoIndex)
+FORM_OVERHEAD = 64 * 1024  # Поля и заголовки частей сверх самого файла
+DATA_URL_PREFIX_LIMIT = 256  # data:image/jpeg;base64,
+
+
+class UploadRejected(Exception):
+    """Загрузка отклонена до конца чтения тела (клиенту - status_code с текстом)"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _too_large() -> UploadRejected:
+    return UploadRejected(f"Файл слишком большой. Максимальный размер: {MAX_FILE_SIZE // (1024 * 1024)} MB", 413)
+
+
+def _check_content_length(content_length: Optional[str], limit: int) -> None:
+    """Отклонить заведомо большое тело по Content-Length, не читая его"""
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        raise _too_large()
+
+
+class SpooledUpload:
+    """Загружаемый файл: пишется во временный файл, размер и заголовок проверяются по ходу чтения"""
+
+    def __init__(self, limit: int = MAX_FILE_SIZE):
+        self.limit = limit
+        self.size = 0
+        self.head = bytearray()
+        self.header_checked = False
+        self.file = tempfile.NamedTemporaryFile(prefix="upload_", delete=False)
+        self.path = self.file.name
+
+    async def write(self, data: bytes) -> None:
+        if not data:
+            return
+        self.size += len(data)
+        if self.size > self.limit:
+            raise _too_large()
+        if not self.header_checked:
+            self.head += data[:UPLOAD_SNIFF_BYTES - len(self.head)]
+            self._check_header()
+        await asyncio.to_thread(self.file.write, data)
+
+    def _check_header(self, complete: bool = False) -> None:
+        """Проверить сигнатуру, формат и размеры по уже полученному началу файла"""
+        if len(self.head) < SIGNATURE_SIZE and not complete:
+            return
+        if sniff_format(bytes(self.head[:SIGNATURE_SIZE])) is None:
+            raise UploadRejected("Неподдерживаемый формат изображения")
+        try:
+            pipeline = ImagePipeline(bytes(self.head))
+        except ValueError as e:
+            if complete:
+                raise UploadRejected(str(e))
+            # Заголовок еще не пришел целиком (например, большой EXIF в JPEG);
+            # после UPLOAD_SNIFF_BYTES формат и размеры проверит полная обработка
+            self.header_checked = len(self.head) >= UPLOAD_SNIFF_BYTES
+            return
+        try:
+            pipeline.validate()
+        except ValueError as e:
+            raise UploadRejected(str(e))
+        self.header_checked = True
+
+    async def finish(self) -> str:
+        """Тело дочитано: закрыть файл и вернуть путь к нему"""
+        await asyncio.to_thread(self.file.close)
+        if self.size == 0:
+            raise UploadRejected("Файл пустой")
+        if not self.header_checked:
+            self._check_header(complete=True)
+        return self.path
+
+    def close(self) -> None:
+        """Удалить временный файл"""
+        self.file.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def read_stream(chunks: AsyncIterator[bytes], upload: SpooledUpload, content_length: Optional[str] = None) -> str:
+    """Записать тело (ответ при загрузке по URL) в upload, вернуть путь к файлу"""
+    _check_content_length(content_length, upload.limit)
+    async for chunk in chunks:
+        await upload.write(chunk)
+    return await upload.finish()
+
+
+async def read_multipart(request, upload: SpooledUpload, file_field: str = "file") -> Dict[str, str]:
+    """
+    Разобрать multipart/form-data потоком: часть file_field пишется в upload,
+    остальные поля возвращаются словарем
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadRejected("Ожидается multipart/form-data")
+    _check_content_length(request.headers.get("content-length"), upload.limit + FORM_OVERHEAD)
+
+    # Парсер вызывает колбэки синхронно; события обрабатываются после каждого куска
+    events = []
+
+    def event(kind: str):
+        def callback(data: bytes = b"", start: int = 0, end: int = 0) -> None:
+            events.append((kind, data[start:end]))
+        return callback
+
+    kinds = ("part_begin", "part_data", "part_end", "header_field", "header_value", "header_end")
+    parser = multipart.MultipartParser(boundary, {f"on_{kind}": event(kind) for kind in kinds})
+
+    fields: Dict[str, str] = {}
+    fields_size = 0
+    name, is_file, file_seen = "", False, False
+    header_field, header_value, value = b"", b"", bytearray()
+    async for chunk in request.stream():
+        parser.write(chunk)
+        for kind, data in events:
+            if kind == "part_begin":
+                name, is_file, value = "", False, bytearray()
+            elif kind == "header_field":
+                header_field += data
+            elif kind == "header_value":
+                header_value += data
+            elif kind == "header_end":
+                if header_field.lower() == b"content-disposition":
+                    _, options = parse_options_header(header_value)
+                    name = options.get(b"name", b"").decode("utf-8", errors="replace")
+                    is_file = name == file_field
+                header_field, header_value = b"", b""
+            elif kind == "part_data":
+                if is_file:
+                    await upload.write(data)
+                else:
+                    fields_size += len(data)
+                    if fields_size > FORM_OVERHEAD:
+                        raise UploadRejected("Слишком много данных в полях формы")
+                    value += data
+            elif kind == "part_end":
+                if is_file:
+                    file_seen = True
+                elif name:
+                    fields[name] = value.decode("utf-8", errors="replace")
+        events.clear()
+    parser.finalize()
+
+    if not file_seen:
+        raise UploadRejected(f"{file_field} required")
+    await upload.finish()
+    return fields
+
+
+class _Base64Decoder:
+    """Потоковое декодирование base64 (с префиксом data:...;base64, или без него) в upload"""
+
+    def __init__(self, upload: SpooledUpload):
+        self.upload = upload
+        self.pending = b""
+        self.prefix_checked = False
+
+    async def feed(self, data: bytes) -> None:
+        self.pending += data
+        if not self.prefix_checked:
+            # Префикс data URL отрезается по первой запятой (в base64 запятых нет)
+            comma = self.pending.find(b",", 0, DATA_URL_PREFIX_LIMIT + 1)
+            if comma < 0 and len(self.pending) <= DATA_URL_PREFIX_LIMIT:
+                return
+            if comma >= 0:
+                self.pending = self.pending[comma + 1:]
+            self.prefix_checked = True
+        usable = len(self.pending) - len(self.pending) % 4
+        if usable:
+            await self._decode(self.pending[:usable])
+            self.pending = self.pending[usable:]
+
+    async def finish(self) -> None:
+        if not self.prefix_checked:
+            comma = self.pending.find(b",")
+            if comma >= 0:
+                self.pending = self.pending[comma + 1:]
+            self.prefix_checked = True
+        if self.pending:
+            await self._decode(self.pending)
+            self.pending = b""
+
+    async def _decode(self, data: bytes) -> None:
+        try:
+            decoded = base64.b64decode(data, validate=True)
+        except (binascii.Error, ValueError):
+            raise UploadRejected("Некорректный Base64")
+        await self.upload.write(decoded)
+
+
+class _JsonObjectScanner:
+    """
+    Потоковый разбор плоского JSON объекта {"ключ": значение, ...}.
+    Строка под ключом stream_key передается в decoder по кускам, остальные значения
+    (строки, числа, true/false/null) собираются целиком и ограничены MAX_FIELD_SIZE.
+    """
+
+    def __init__(self, stream_key: str, decoder: _Base64Decoder):
+        self.stream_key = stream_key
+        self.decoder = decoder
+        self.fields: Dict[str, Any] = {}
+        self.streamed = False
+        self.state = "start"
+        self.key = ""
+        self.raw = bytearray()
+        self.escape = False
+
+    def _collect(self, data: bytes) -> None:
+        self.raw += data
+        if len(self.raw) > MAX_FIELD_SIZE:
+            raise UploadRejected("Слишком длинное поле JSON")
+
+    @staticmethod
+    def _loads(data: bytes) -> Any:
+        try:
+            return json.loads(data)
+        except ValueError:
+            raise UploadRejected("Некорректный JSON")
+
+    async def feed(self, data: bytes) -> None:
+        i, n = 0, len(data)
+        while i < n:
+            if self.state in ("key", "string", "stream"):
+                i = await self._feed_string(data, i)
+                continue
+            if self.state == "literal":
+                ends = [pos for pos in (data.find(b",", i), data.find(b"}", i)) if pos >= 0]
+                end = min(ends) if ends else n
+                self._collect(data[i:end])
+                i = end
+                if end < n:
+                    self.fields[self.key] = self._loads(bytes(self.raw).strip())
+                    self.state = "comma"
+                continue
+
+            byte = data[i:i + 1]
+            i += 1
+            if byte in (b" ", b"\t", b"\r", b"\n"):
+                continue
+            if self.state == "start" and byte == b"{":
+                self.state = "key_or_end"
+            elif self.state in ("key_or_end", "next_key") and byte == b'"':
+                self.state, self.raw = "key", bytearray()
+            elif self.state == "key_or_end" and byte == b"}":
+                self.state = "done"
+            elif self.state == "colon" and byte == b":":
+                self.state = "value"
+            elif self.state == "value":
+                self.raw = bytearray()
+                if byte != b'"':
+                    self.state = "literal"
+                    self._collect(byte)
+                elif self.key == self.stream_key and not self.streamed:
+                    self.state = "stream"
+                else:
+                    self.state = "string"
+            elif self.state == "comma" and byte == b",":
+                self.state = "next_key"
+            elif self.state == "comma" and byte == b"}":
+                self.state = "done"
+            else:
+                raise UploadRejected("Некорректный JSON")
+
+    async def _feed_string(self, data: bytes, i: int) -> int:
+        """Продолжить строку с позиции i, вернуть позицию после обработанной части"""
+        n = len(data)
+        while i < n:
+            if self.escape:
+                escaped = data[i:i + 1]
+                i += 1
+                self.escape = False
+                if self.state != "stream":
+                    self._collect(b"\\" + escaped)
+                elif escaped == b"/":
+                    await self.decoder.feed(b"/")
+                else:
+                    # В base64 может быть экранирован только "/"
+                    raise UploadRejected("Некорректный Base64")
+                continue
+
+            quote, backslash = data.find(b'"', i), data.find(b"\\", i)
+            end = min(pos for pos in (quote, backslash, n) if pos >= 0)
+            if self.state == "stream":
+                await self.decoder.feed(data[i:end])
+            else:
+                self._collect(data[i:end])
+            if end == n:
+                return n
+            i = end + 1
+            if end == backslash:
+                self.escape = True
+                continue
+
+            # Закрывающая кавычка
+            if self.state == "key":
+                self.key = self._loads(b'"' + bytes(self.raw) + b'"')
+                self.state = "colon"
+            elif self.state == "string":
+                self.fields[self.key] = self._loads(b'"' + bytes(self.raw) + b'"')
+                self.state = "comma"
+            else:
+                await self.decoder.finish()
+                self.streamed = True
+                self.state = "comma"
+            return i
+        return i
+
+    def finish(self) -> Dict[str, Any]:
+        if self.state != "done":
+            raise UploadRejected("Некорректный JSON")
+        return self.fields
+
+
+async def read_base64_json(request, upload: SpooledUpload, file_field: str = "base64") -> Dict[str, Any]:
+    """
+    Разобрать JSON объект потоком: строка file_field декодируется из base64 в upload,
+    остальные поля возвращаются словарем
+    """
+    # base64 длиннее исходных байт на треть
+    limit = upload.limit * 4 // 3 + FORM_OVERHEAD
+    _check_content_length(request.headers.get("content-length"), limit)
+
+    scanner = _JsonObjectScanner(file_field, _Base64Decoder(upload))
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise _too_large()
+        await scanner.feed(chunk)
+    fields = scanner.finish()
+
+    if not scanner.streamed:
+        raise UploadRejected(f"userId and {file_field} required")
+    await upload.finish()
+    return fields
@@ -0,0 +1,91 @@
+"""
+services/user_listing.py
+Постраничная выдача пользователей с проекцией колонок.
+Keyset-пагинация по users.id: каждая страница - отдельный короткий запрос,
+поэтому память не растет с размером таблицы, а соединение не держится долго.
+"""
+import json
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+from db_utils import db_all
+
+# Публичные поля (GET /api/users)
+PUBLIC_FIELDS = ["userId", "name", "username", "age", "bio", "photoUrl", "gender", "badge"]
+
+# Поля для админки (без старых JSONB массивов likes/dislikes/matches)
+ADMIN_FIELDS = [
+    "id", "userId", "name", "username", "photoUrl", "gender", "bio",
+    "photo1", "photo2", "photo3", "photoBot", "age", "blocked", "badge",
+    "createdAt", "needPhoto", "goals", "about", "lookingFor", "warned", "pushSent",
+    "is_pro", "pro_start", "pro_end", "last_login", "super_likes_count", "hideAge"
+]
+
+# Сколько строк читать из БД за один запрос при потоковой выдаче
+STREAM_BATCH_SIZE = 500
+
+
+def parse_fields(fields: Optional[str], allowed: List[str]) -> List[str]:
+    """
+    Разбирает параметр fields ("userId,name") по белому списку колонок.
+    Пустой параметр - все разрешенные поля. Неизвестное поле - ValueError.
+    """
+    if not fields:
+        return list(allowed)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise ValueError(f"Неизвестные поля: {', '.join(unknown)}. Доступны: {', '.join(allowed)}")
+    # Убираем дубликаты, сохраняя порядок
+    return list(dict.fromkeys(requested))
+
+
+async def get_users_page(
+    fields: List[str],
+    after_id: int = 0,
+    limit: int = 100
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    Страница пользователей после after_id (только колонки fields)
+
+    Returns:
+        (строки, id последней строки или None, если это последняя страница)
+    """
+    # Колонки берутся только из белого списка (parse_fields), поэтому их можно подставить в SQL
+    columns = ", ".join(f'"{field}"' for field in fields if field != "id")
+    rows = await db_all(
+        f"SELECT id AS _cursor_id{', ' + columns if columns else ''} FROM users WHERE id > ? ORDER BY id LIMIT ?",
+        [after_id, limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    last_id = rows[-1]["_cursor_id"] if has_more and rows else None
+    for row in rows:
+        cursor_id = row.pop("_cursor_id")
+        if "id" in fields:
+            row["id"] = cursor_id
+    return rows, last_id
+
+
+async def iter_users(
+    fields: List[str],
+    after_id: int = 0,
+    batch_size: int = STREAM_BATCH_SIZE
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Все пользователи после after_id пачками по batch_size"""
+    while True:
+        rows, last_id = await get_users_page(fields, after_id, batch_size)
+        if rows:
+            yield rows
+        if last_id is None:
+            break
+        after_id = last_id
+
+
+async def stream_ndjson(
+    fields: List[str],
+    after_id: int = 0,
+    transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+) -> AsyncIterator[str]:
+    """NDJSON поток пользователей: одна JSON-строка на пользователя"""
+    async for batch in iter_users(fields, after_id):
+        lines: Iterable[Dict[str, Any]] = (transform(row) if transform else row for row in batch)
+        yield "".join(json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in lines)
@@ -0,0 +1,88 @@
+"""
+services/users.py
+Операции над профилями пользователей, общие для роутов и команд бота
+"""
+from typing import Iterable, List
+from db_utils import db_get, transaction
+from config import BULK_DELETE_MAX_USERS
+from services import candidate_queue, edges, jobs, photo_store, profile_cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class UserNotFound(LookupError):
+    """Пользователя с таким userId нет"""
+
+
+async def delete_users(user_ids: Iterable[str]) -> List[str]:
+    """
+    Удалить набор пользователей и все связанные данные одной транзакцией:
+    визиты, промокоды, суперлайки, заявки на бейдж, лайки/дизлайки/мэтчи (входящие и исходящие).
+    Каждая таблица чистится одним запросом по массиву id, независимо от числа пользователей.
+
+    Returns:
+        userId, которые действительно были удалены
+    """
+    user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+    if not user_ids:
+        return []
+
+    async with transaction() as conn:
+        cur = conn.cursor()
+        await cur.execute('DELETE FROM visits WHERE "userId" = ANY(%s) OR "visitorId" = ANY(%s)', (user_ids, user_ids))
+        await cur.execute("DELETE FROM promo_code_usage WHERE user_id = ANY(%s)", (user_ids,))
+        await cur.execute("DELETE FROM super_likes WHERE from_user = ANY(%s) OR to_user = ANY(%s)", (user_ids, user_ids))
+        await cur.execute('DELETE FROM badge_requests WHERE "userId" = ANY(%s)', (user_ids,))
+        await cur.execute("DELETE FROM dislikes WHERE from_user = ANY(%s) OR to_user = ANY(%s)", (user_ids, user_ids))
+        await edges.delete_users_edges(cur, user_ids)
+        await cur.execute("DELETE FROM like_counts WHERE user_id = ANY(%s)", (user_ids,))
+        await cur.execute('DELETE FROM users WHERE "userId" = ANY(%s) RETURNING "userId"', (user_ids,))
+        deleted = [row[0] for row in await cur.fetchall()]
+
+    await profile_cache.invalidate(*deleted)
+    # Файлы хранилища удалит сборщик мусора, когда пропадут ссылки; старые папки - сразу
+    for user_id in deleted:
+        try:
+            photo_store.remove_legacy_dir(user_id)
+        except OSError as e:
+            logger.warning(f"Ошибка удаления папки с фотографиями {user_id}: {e}")
+        candidate_queue.on_user_removed(user_id)
+    logger.info(f"Удалено пользователей: {len(deleted)} из {len(user_ids)}")
+    return deleted
+
+
+async def delete_user(user_id: str) -> None:
+    """Удалить пользователя и все связанные данные (UserNotFound - такого нет)"""
+    if not await delete_users([user_id]):
+        raise UserNotFound(user_id)
+
+
+@jobs.job("delete_user")
+async def delete_user_job(payload) -> None:
+    """Фоновая задача удаления (POST /api/delete_user, /delete_user в боте)"""
+    try:
+        await delete_user(payload["userId"])
+    except UserNotFound:
+        # Уже удален (повтор задачи после сбоя)
+        pass
+
+
+async def enqueue_delete_user(user_id: str) -> int:
+    """Поставить удаление пользователя в очередь, вернуть id задачи (UserNotFound - удалять некого)"""
+    if not await db_get('SELECT 1 AS found FROM users WHERE "userId" = ?', [user_id]):
+        raise UserNotFound(user_id)
+    return await jobs.enqueue("delete_user", {"userId": user_id}, dedupe_key=f"delete_user:{user_id}")
+
+
+@jobs.job("delete_users")
+async def delete_users_job(payload) -> None:
+    """Фоновое массовое удаление: пачками по BULK_DELETE_MAX_USERS, каждая в своей транзакции"""
+    user_ids = payload["userIds"]
+    for start in range(0, len(user_ids), BULK_DELETE_MAX_USERS):
+        await delete_users(user_ids[start:start + BULK_DELETE_MAX_USERS])
+
+
+async def enqueue_delete_users(user_ids: List[str]) -> int:
+    """Поставить массовое удаление в очередь, вернуть id задачи"""
+    return await jobs.enqueue("delete_users", {"userIds": list(user_ids)})
@@ -15,8 +15,9 @@ from pathlib import Path
 # Добавляем путь к модулям
 sys.path.insert(0, str(Path(__file__).parent))
 
-from db_utils import db_get, db_all, db_run
+from db_utils import db_get, db_all
 from database import init_database
+from services import edges
 
 TARGET_USER_ID = "307954967"
 BACKUP_FILE = "likes_backup_307954967.json"
@@ -28,13 +29,10 @@ async def get_current_likes(user_id: str):
     
     # Получаем всех пользователей, которые лайкнули этого пользователя
     sql = """
-        SELECT "userId", name, username
-        FROM users
-        WHERE EXISTS (
-            SELECT 1
-            FROM jsonb_array_elements_text(likes::jsonb) AS elem
-            WHERE elem = ?
-        )
+        SELECT u."userId", u.name, u.username
+        FROM user_edges e
+        JOIN users u ON u."userId" = e.from_user
+        WHERE e.to_user = ? AND e.kind = 'like'
     """
     rows = await db_all(sql, [user_id])
     
@@ -60,41 +58,17 @@ async def get_all_users():
 
 async def get_user_likes(user_id: str):
     """Получить список лайков пользователя (кого он лайкнул)"""
-    user_row = await db_get('SELECT likes FROM users WHERE "userId" = ?', [user_id])
-    if not user_row:
-        return []
-    
-    import json
-    likes_str = user_row.get("likes", "[]")
-    if isinstance(likes_str, str):
-        likes = json.loads(likes_str)
-    else:
-        likes = likes_str if isinstance(likes_str, list) else []
-    
-    return likes
+    return await edges.get_targets(user_id, edges.KIND_LIKE)
 
 async def add_like_to_user(from_user_id: str, to_user_id: str):
     """Добавить лайк от одного пользователя другому"""
-    # Получаем текущие лайки
-    user_row = await db_get('SELECT likes FROM users WHERE "userId" = ?', [from_user_id])
+    user_row = await db_get('SELECT "userId" FROM users WHERE "userId" = ?', [from_user_id])
     if not user_row:
         print(f"⚠️ Пользователь {from_user_id} не найден")
         return False
     
-    import json
-    likes_str = user_row.get("likes", "[]")
-    if isinstance(likes_str, str):
-        likes = json.loads(likes_str)
-    else:
-        likes = likes_str if isinstance(likes_str, list) else []
-    
     # Добавляем лайк, если его еще нет
-    if to_user_id not in likes:
-        likes.append(to_user_id)
-        await db_run('UPDATE users SET likes = ? WHERE "userId" = ?', [json.dumps(likes), from_user_id])
-        return True
-    
-    return False
+    return await edges.add_edge(from_user_id, to_user_id, edges.KIND_LIKE)
 
 async def save_backup(liked_by_users):
     """Сохранить текущее состояние в файл"""
@@ -118,21 +92,9 @@ async def create_rollback_script(users_to_add_likes):
     rollback_commands.append("")
     
     for user_id in users_to_add_likes:
-        # Получаем текущие лайки пользователя
-        user_row = await db_get('SELECT likes FROM users WHERE "userId" = ?', [user_id])
-        if user_row:
-            import json
-            likes_str = user_row.get("likes", "[]")
-            if isinstance(likes_str, str):
-                likes = json.loads(likes_str)
-            else:
-                likes = likes_str if isinstance(likes_str, list) else []
-            
-            # Удаляем TARGET_USER_ID из лайков
-            if TARGET_USER_ID in likes:
-                likes.remove(TARGET_USER_ID)
-                likes_json = json.dumps(likes).replace("'", "''")  # Экранируем кавычки для SQL
-                rollback_commands.append(f"UPDATE users SET likes = '{likes_json}' WHERE \"userId\" = '{user_id}';")
+        rollback_commands.append(
+            f"DELETE FROM user_edges WHERE from_user = '{user_id}' AND to_user = '{TARGET_USER_ID}' AND kind = 'like';"
+        )
     
     with open(ROLLBACK_FILE, 'w', encoding='utf-8') as f:
         f.write('\n'.join(rollback_commands))
@@ -0,0 +1,30 @@
+"""
+utils/cursor.py
+Непрозрачные курсоры для keyset-пагинации по users.id
+"""
+import base64
+from typing import Optional
+
+CURSOR_VERSION = "c1"
+
+
+def encode_cursor(last_id: int) -> str:
+    """Курсор из id последней строки страницы"""
+    return base64.urlsafe_b64encode(f"{CURSOR_VERSION}:{last_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    """
+    Разбирает курсор, полученный от encode_cursor.
+    Пустой курсор - начало списка. Некорректный курсор - ValueError.
+    """
+    if not cursor:
+        return 0
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        version, last_id = base64.urlsafe_b64decode(padded.encode()).decode().split(":", 1)
+        if version != CURSOR_VERSION:
+            raise ValueError(version)
+        return int(last_id)
+    except Exception:
+        raise ValueError("Некорректный cursor")